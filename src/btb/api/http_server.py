@@ -0,0 +1,267 @@
+﻿from __future__ import annotations
+
+import asyncio
+import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from sqlalchemy import select
+
+from btb.api import serialize
+from btb.core import instrument
+from btb.db.connection import get_readonly_engine, get_readonly_session
+from btb.db.schema import (
+    Book,
+    FairPrice,
+    Game,
+    LimitsSnapshot,
+    OddsMarket,
+    Player,
+    PropsMarket,
+    RosterSpell,
+    StatsPlayerGame,
+    TableVersion,
+    TeamMatchupSplit,
+)
+from btb.research.queries_props import get_player_prop_research
+from btb.research.reports_explain import render_prop_report
+from btb.research.slate_reports import slate_games
+
+# status, content type, body
+Response = Tuple[int, str, bytes]
+
+_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+_JSON = "application/json"
+_MAX_HEADERS = 100
+
+# every table a response is built from
+_VERSION_TABLES = tuple(
+    t.__tablename__
+    for t in (OddsMarket, PropsMarket, StatsPlayerGame, FairPrice, TeamMatchupSplit, Player, Game, RosterSpell, LimitsSnapshot)
+)
+
+
+class BadRequest(Exception):
+    pass
+
+
+def data_version(session) -> str:
+    """
+    Cheap fingerprint of the data behind the responses: the write-transaction
+    counters of their tables, which also move on in-place UPDATEs.
+    """
+    versions = dict(session.execute(select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(_VERSION_TABLES))).all())
+    return ".".join(str(versions.get(name, 0)) for name in _VERSION_TABLES)
+
+
+def _json(status: int, payload: Any) -> Response:
+    return status, _JSON, serialize.dumps(payload)
+
+
+def _param(params: Dict[str, str], name: str) -> str:
+    v = params.get(name)
+    if not v:
+        raise BadRequest(f"missing query parameter: {name}")
+    return v
+
+
+def _date_param(params: Dict[str, str], name: str = "date") -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(_param(params, name))
+    except ValueError:
+        raise BadRequest(f"{name} must be YYYY-MM-DD")
+
+
+def _int_param(params: Dict[str, str], name: str, required: bool = True) -> Optional[int]:
+    if not required and not params.get(name):
+        return None
+    try:
+        return int(_param(params, name))
+    except ValueError:
+        raise BadRequest(f"{name} must be an integer")
+
+
+class ResearchAPI:
+    """
+    Asyncio HTTP front end for research bundles, reports, slates and odds history.
+
+    The event loop only parses requests and writes responses; every DB query runs in
+    a bounded thread pool over the pooled read-only engine. Responses carry an ETag
+    derived from the data version, so a matching If-None-Match is answered 304
+    without running the query.
+    """
+
+    def __init__(self, workers: int = 8, max_pending: int = 256) -> None:
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="btb-api")
+        get_readonly_engine(pool_size=workers)
+        self._pending: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.not_modified = 0
+        self.routes: Dict[str, Callable[[Any, Dict[str, str]], Response]] = {
+            "/health": self._health,
+            "/bundle": self._bundle,
+            "/report": self._report,
+            "/slate": self._slate,
+            "/odds-history": self._odds_history,
+        }
+
+    # ---- blocking handlers (thread pool) ----
+    def _health(self, session, params: Dict[str, str]) -> Response:
+        return _json(200, {"ok": True, "requests": self.requests, "not_modified": self.not_modified, "json": serialize.BACKEND})
+
+    def _bundle(self, session, params: Dict[str, str]) -> Response:
+        bundle = get_player_prop_research(_param(params, "player"), _date_param(params), session=session)
+        return _json(200 if bundle.get("ok") else 404, bundle)
+
+    def _report(self, session, params: Dict[str, str]) -> Response:
+        bundle = get_player_prop_research(_param(params, "player"), _date_param(params), session=session)
+        if not bundle.get("ok"):
+            return _json(404, bundle)
+        return 200, "text/markdown; charset=utf-8", render_prop_report(bundle).encode("utf-8")
+
+    def _slate(self, session, params: Dict[str, str]) -> Response:
+        day = _date_param(params)
+        bundles = [get_player_prop_research(name, day, session=session, player_id=pid, game_id=gid) for pid, name, gid in slate_games(day, session)]
+        return _json(200, {"ok": True, "date": day.isoformat(), "players": bundles})
+
+    def _odds_history(self, session, params: Dict[str, str]) -> Response:
+        game_id = _int_param(params, "game_id")
+        scope = params.get("scope") or "odds"
+        book = params.get("book")
+        if scope == "odds":
+            q = select(Book.code, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line, OddsMarket.price, OddsMarket.collected_ts).join(Book, Book.id == OddsMarket.book_id).where(OddsMarket.game_id == game_id)
+            if params.get("market_type"):
+                q = q.where(OddsMarket.market_type == params["market_type"])
+            if book:
+                q = q.where(Book.code == book)
+            q = q.order_by(Book.code, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.collected_ts)
+        elif scope == "props":
+            q = select(Book.code, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line, PropsMarket.price, PropsMarket.collected_ts).join(Book, Book.id == PropsMarket.book_id).where(PropsMarket.game_id == game_id)
+            player_id = _int_param(params, "player_id", required=False)
+            if player_id is not None:
+                q = q.where(PropsMarket.player_id == player_id)
+            if params.get("prop_type"):
+                q = q.where(PropsMarket.prop_type == params["prop_type"])
+            if book:
+                q = q.where(Book.code == book)
+            q = q.order_by(Book.code, PropsMarket.prop_type, PropsMarket.side, PropsMarket.collected_ts)
+        else:
+            raise BadRequest("scope must be odds or props")
+
+        rows = [
+            {"book": b, "market_type": mt, "outcome": oc if scope == "odds" else (oc or "over"), "line": line, "price": price, "collected_ts": ts}
+            for b, mt, oc, line, price, ts in session.execute(q)
+        ]
+        return _json(200, {"ok": True, "game_id": game_id, "scope": scope, "rows": rows})
+
+    def handle(self, path: str, params: Dict[str, str], if_none_match: Optional[str]) -> Tuple[Response, Optional[str]]:
+        """Run one request against a read-only session; returns the response and its ETag."""
+        if path == "/metrics":
+            # process counters, not data: never cached, no session needed
+            return (200, "text/plain; version=0.0.4; charset=utf-8", instrument.prometheus_text().encode("utf-8")), None
+        handler = self.routes.get(path)
+        if handler is None:
+            return _json(404, {"ok": False, "error": f"no such endpoint: {path}", "reason_code": "NOT_FOUND"}), None
+        session = get_readonly_session()
+        try:
+            key = f"{data_version(session)}|{path}?{sorted(params.items())}"
+            etag = '"' + hashlib.sha1(key.encode("utf-8")).hexdigest()[:24] + '"'
+            if path != "/health" and if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+                self.not_modified += 1
+                return (304, _JSON, b""), etag
+            try:
+                resp = handler(session, params)
+            except BadRequest as e:
+                return _json(400, {"ok": False, "error": str(e), "reason_code": "BAD_REQUEST"}), None
+            return resp, (etag if resp[0] == 200 and path != "/health" else None)
+        except Exception as e:
+            return _json(500, {"ok": False, "error": f"{type(e).__name__}: {e}", "reason_code": "INTERNAL"}), None
+        finally:
+            session.close()
+
+    # ---- event loop side ----
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Dict[str, str]]]:
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, target, version = line.decode("latin-1").strip().split(" ", 2)
+        except ValueError:
+            return None
+        headers: Dict[str, str] = {}
+        for _ in range(_MAX_HEADERS):
+            h = await reader.readline()
+            if h in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = h.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return method.upper(), target, version, headers
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                req = await self._read_request(reader)
+                if req is None:
+                    break
+                method, target, version, headers = req
+                self.requests += 1
+                etag = None
+                if method not in ("GET", "HEAD"):
+                    resp = _json(405, {"ok": False, "error": "only GET/HEAD", "reason_code": "METHOD_NOT_ALLOWED"})
+                else:
+                    url = urlsplit(target)
+                    params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                    async with self._pending:
+                        resp, etag = await loop.run_in_executor(self.pool, self.handle, url.path, params, headers.get("if-none-match"))
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(_format_response(resp, etag, keep_alive, include_body=method != "HEAD"))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8765) -> asyncio.AbstractServer:
+        self._pending = asyncio.Semaphore(self.max_pending)
+        return await asyncio.start_server(self._client, host, port)
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _format_response(resp: Response, etag: Optional[str], keep_alive: bool, include_body: bool = True) -> bytes:
+    status, ctype, body = resp
+    lines: List[str] = [
+        f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}",
+        f"Content-Type: {ctype}",
+        f"Content-Length: {len(body)}",
+        "Cache-Control: no-cache",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if etag:
+        lines.append(f"ETag: {etag}")
+    head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+    return head + body if include_body and status != 304 else head
+
+
+def run_api(host: str = "127.0.0.1", port: int = 8765, workers: int = 8) -> None:
+    api = ResearchAPI(workers=workers)
+
+    async def _main() -> None:
+        server = await api.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(_main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
@@ -0,0 +1,46 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+from typing import Any
+
+try:  # optional: pip install btb[fast]
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+try:  # optional: pip install btb[fast]
+    import msgpack
+except ImportError:  # pragma: no cover - depends on environment
+    msgpack = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def dumps(obj: Any, pretty: bool = False) -> bytes:
+    """UTF-8 JSON bytes; orjson when installed, stdlib json otherwise."""
+    if orjson is not None:
+        opts = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        return orjson.dumps(obj, default=_default, option=opts)
+    if pretty:
+        return json.dumps(obj, default=_default, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def packb(obj: Any) -> bytes:
+    """MessagePack bytes (dates as ISO strings, like dumps). Raises RuntimeError without msgpack."""
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed (pip install btb[fast])")
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
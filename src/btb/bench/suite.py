@@ -0,0 +1,212 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+import platform
+import random
+import time
+import tracemalloc
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from btb.api import serialize
+from btb.bench.synthetic import SyntheticConfig, SyntheticLeague
+from btb.core.timing import latency_summary
+from btb.db import connection
+from btb.db.schema import Base, Game, Player, PropsMarket, Season
+
+# rows handled by one call, from (args, return value)
+RowCounter = Callable[[Any, Any], int]
+
+
+class _Recorder:
+    def __init__(self, trace_memory: bool) -> None:
+        self.trace_memory = trace_memory
+        self.results: Dict[str, Dict[str, Any]] = {}
+
+    def run(self, name: str, calls: Iterable[Tuple[Callable[..., Any], tuple]], rows: Optional[RowCounter] = None) -> None:
+        """Time every call; latencies per call, throughput per second, peak traced memory for the stage."""
+        lat: List[float] = []
+        n_rows = 0
+        if self.trace_memory:
+            tracemalloc.start()
+        t_stage = time.perf_counter()
+        for fn, args in calls:
+            t0 = time.perf_counter()
+            out = fn(*args)
+            lat.append((time.perf_counter() - t0) * 1000.0)
+            if rows is not None:
+                n_rows += rows(args, out)
+        total_s = time.perf_counter() - t_stage
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.results[name] = {
+            "calls": len(lat),
+            "rows": n_rows if rows is not None else None,
+            "total_s": round(total_s, 4),
+            "calls_per_s": round(len(lat) / total_s, 2) if total_s > 0 else None,
+            "rows_per_s": round(n_rows / total_s, 2) if rows is not None and total_s > 0 else None,
+            "latency_ms": latency_summary(lat),
+            "peak_mem_kb": round(peak / 1024.0, 1) if peak is not None else None,
+        }
+
+
+def _research_sample(session, n: int, seed: int) -> List[Tuple[str, datetime.date]]:
+    pairs = session.execute(
+        select(Player.full_name, Game.game_date)
+        .join(PropsMarket, PropsMarket.player_id == Player.id)
+        .join(Game, Game.id == PropsMarket.game_id)
+        .distinct()
+        .order_by(Game.game_date, Player.full_name)
+    ).all()
+    rng = random.Random(seed)
+    return [(str(a), b) for a, b in (rng.sample(pairs, n) if len(pairs) > n else pairs)]
+
+
+def run_benchmarks(
+    cfg: SyntheticConfig,
+    db_path: str = "bench.db",
+    out_path: Optional[str] = "bench_results.json",
+    research_samples: int = 200,
+    trace_memory: bool = True,
+) -> Dict[str, Any]:
+    """
+    Ingest a synthetic league into a scratch database and benchmark the hot paths.
+
+    Stages: stats, odds and props ingest, the full-season matchup refresh, then
+    get_player_prop_research and render_prop_report over a sampled set of
+    (player, date) pairs. The scratch database is recreated on every run and the
+    configured database is restored afterwards. With trace_memory on, latencies
+    include tracemalloc overhead (compare runs with the same setting).
+    """
+    # imported late: they resolve the engine through btb.db.connection at call time
+    from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
+    from btb.data_sources.props_normalize import normalize_props_fixture
+    from btb.data_sources.stats_normalize import normalize_stats_fixture
+    from btb.research.matchup_aggregates import refresh_matchup_aggregates
+    from btb.research.prop_probability import get_fit_cache
+    from btb.research.queries_props import get_player_prop_research
+    from btb.research.reports_explain import render_prop_report
+
+    Path(db_path).unlink(missing_ok=True)
+    previous = connection.set_database_path(db_path)
+    get_fit_cache().invalidate()
+    rec = _Recorder(trace_memory)
+    league = SyntheticLeague(cfg)
+    t0 = time.perf_counter()
+    try:
+        Base.metadata.create_all(connection.get_engine())
+
+        rec.run(
+            "normalize_stats_fixture",
+            ((normalize_stats_fixture, (p,)) for p in league.stats_payloads()),
+            rows=lambda args, out: out["stats_created"],
+        )
+        rec.run(
+            "normalize_the_odds_api_odds",
+            ((normalize_the_odds_api_odds, (p,)) for p in league.odds_payloads()),
+            rows=lambda args, out: out["markets_created"],
+        )
+        rec.run(
+            "normalize_props_fixture",
+            ((normalize_props_fixture, (p,)) for p in league.props_payloads()),
+            rows=lambda args, out: out["props_created"],
+        )
+
+        session = connection.get_session()
+        years = [y for (y,) in session.execute(select(Season.year_start).order_by(Season.year_start))]
+        sample = _research_sample(session, research_samples, cfg.seed)
+        session.close()
+
+        rec.run(
+            "matchup_refresh_full_season",
+            ((refresh_matchup_aggregates, ([y],)) for y in years),
+            rows=lambda args, out: out["rows"],
+        )
+
+        bundles: List[Dict[str, Any]] = []
+
+        def _bundle(name: str, day: datetime.date) -> Dict[str, Any]:
+            b = get_player_prop_research(name, day)
+            bundles.append(b)
+            return b
+
+        rec.run(
+            "get_player_prop_research",
+            ((_bundle, pair) for pair in sample),
+            rows=lambda args, out: len(out.get("props") or []),
+        )
+        rec.run("render_prop_report", ((render_prop_report, (b,)) for b in bundles))
+    finally:
+        connection.set_database_path(previous)
+        get_fit_cache().invalidate()
+
+    results = {
+        "meta": {
+            "generated_ts": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+            "elapsed_s": round(time.perf_counter() - t0, 3),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "json": serialize.BACKEND,
+            "trace_memory": trace_memory,
+            "research_samples": research_samples,
+            "config": asdict(cfg),
+        },
+        "benchmarks": rec.results,
+    }
+    if out_path:
+        Path(out_path).write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return results
+
+
+# metric path -> True when larger is better
+_COMPARED = {
+    ("latency_ms", "p50"): False,
+    ("latency_ms", "p95"): False,
+    ("latency_ms", "p99"): False,
+    ("rows_per_s",): True,
+    ("calls_per_s",): True,
+    ("peak_mem_kb",): False,
+}
+
+
+def _metric(entry: Dict[str, Any], path: Tuple[str, ...]) -> Optional[float]:
+    cur: Any = entry
+    for key in path:
+        cur = cur.get(key) if isinstance(cur, dict) else None
+    return float(cur) if isinstance(cur, (int, float)) else None
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10) -> Dict[str, Any]:
+    """Relative change per benchmark metric; changes worse than `threshold` are listed as regressions."""
+    out: Dict[str, Any] = {"threshold": threshold, "benchmarks": {}, "regressions": []}
+    if baseline.get("meta", {}).get("config") != current.get("meta", {}).get("config"):
+        out["warning"] = "runs used different generator configs"
+    for name, cur in (current.get("benchmarks") or {}).items():
+        base = (baseline.get("benchmarks") or {}).get(name)
+        if base is None:
+            continue
+        deltas: Dict[str, float] = {}
+        for path, higher_better in _COMPARED.items():
+            b = _metric(base, path)
+            c = _metric(cur, path)
+            if b is None or c is None or b == 0:
+                continue
+            change = (c - b) / b
+            label = ".".join(path)
+            deltas[label] = round(change, 4)
+            if (change < -threshold) if higher_better else (change > threshold):
+                out["regressions"].append({"benchmark": name, "metric": label, "baseline": b, "current": c, "change": round(change, 4)})
+        out["benchmarks"][name] = deltas
+    return out
+
+
+def compare_files(baseline_path: str, current_path: str, threshold: float = 0.10) -> Dict[str, Any]:
+    base = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    cur = json.loads(Path(current_path).read_text(encoding="utf-8"))
+    return compare_results(base, cur, threshold)
@@ -0,0 +1,299 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+import math
+import random
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from btb.data_sources.arenas import ARENAS
+
+_FIRST = ["Jalen", "Marcus", "Tyrese", "Devin", "Malik", "Caleb", "Isaiah", "Jordan", "Darius", "Cam",
+          "Andre", "Miles", "Trey", "Keegan", "Jaden", "Scottie", "Evan", "Aaron", "Derrick", "Nikola"]
+_LAST = ["Walker", "Brooks", "Hayes", "Mitchell", "Porter", "Grant", "Reed", "Coleman", "Bridges", "Fox",
+         "Barnes", "Turner", "Holmes", "Murray", "Allen", "Green", "Ellis", "Young", "Harris", "Vucevic"]
+_POSITIONS = ["G", "G", "F", "F", "C", "G", "F", "C", "G", "F", "F", "G", "C", "F", "G"]
+_PROP_EXPR = {
+    "points": lambda s: s["points"],
+    "rebounds": lambda s: s["rebounds"],
+    "assists": lambda s: s["assists"],
+    "threes": lambda s: s["threes_made"],
+    "pra": lambda s: s["points"] + s["rebounds"] + s["assists"],
+}
+
+
+@dataclass
+class SyntheticConfig:
+    seasons: int = 1
+    first_season: int = 2010
+    teams: int = 30
+    games_per_team: int = 82
+    players_per_team: int = 10
+    books: int = 4
+    snapshots_per_game: int = 4
+    snapshot_interval_min: int = 60
+    prop_players_per_team: int = 4
+    prop_types: Tuple[str, ...] = ("points", "rebounds", "assists")
+    pbp_events_per_game: int = 0
+    seed: int = 7
+
+
+@dataclass
+class _Player:
+    name: str
+    position: str
+    minutes: float
+    pts_rate: float  # per minute
+    reb_rate: float
+    ast_rate: float
+    three_share: float  # threes made per point
+
+
+@dataclass
+class _Game:
+    external_id: str
+    tipoff: datetime.datetime
+    home: str
+    away: str
+    stats: Dict[str, Dict[str, Any]]  # player -> box line
+    home_strength: float
+
+
+def _round_half(x: float) -> float:
+    return math.floor(x) + 0.5
+
+
+def _price_pair(p_first: float, margin: float) -> Tuple[float, float]:
+    p1 = min(0.97, max(0.03, p_first)) * (1.0 + margin)
+    p2 = (1.0 - min(0.97, max(0.03, p_first))) * (1.0 + margin)
+    return round(1.0 / p1, 2), round(1.0 / p2, 2)
+
+
+class SyntheticLeague:
+    """
+    Deterministic synthetic league: rosters, schedule and box scores per season.
+
+    Everything derives from the config seed, so two runs with the same config
+    produce identical payloads. Payload iterators yield one normalizer input at a
+    time and never materialise more than a season.
+    """
+
+    def __init__(self, cfg: SyntheticConfig) -> None:
+        self.cfg = cfg
+        names = sorted(ARENAS)
+        self.team_names = [names[i] if i < len(names) else f"Synthetic Team {i + 1}" for i in range(cfg.teams)]
+        self.book_keys = [f"synbook{i + 1}" for i in range(cfg.books)]
+
+    def _rosters(self, rng: random.Random) -> Dict[str, List[_Player]]:
+        rosters: Dict[str, List[_Player]] = {}
+        for ti, team in enumerate(self.team_names):
+            roster = []
+            for pi in range(self.cfg.players_per_team):
+                role = 1.0 - pi / max(1, self.cfg.players_per_team)  # starters first
+                pos = _POSITIONS[pi % len(_POSITIONS)]
+                roster.append(_Player(
+                    name=f"{_FIRST[(ti * 7 + pi) % len(_FIRST)]} {_LAST[(ti * 3 + pi * 11) % len(_LAST)]} {ti + 1:02d}{pi + 1:02d}",
+                    position=pos,
+                    minutes=12.0 + 24.0 * role + rng.uniform(-2.0, 2.0),
+                    pts_rate=rng.uniform(0.35, 0.75) * (0.8 + 0.4 * role),
+                    reb_rate=rng.uniform(0.12, 0.22) * (1.6 if pos == "C" else 1.0),
+                    ast_rate=rng.uniform(0.05, 0.15) * (1.6 if pos == "G" else 1.0),
+                    three_share=rng.uniform(0.03, 0.12) * (0.3 if pos == "C" else 1.0),
+                ))
+            rosters[team] = roster
+        return rosters
+
+    def season(self, season_index: int) -> List[_Game]:
+        cfg = self.cfg
+        year = cfg.first_season + season_index
+        rng = random.Random(cfg.seed * 1009 + year)
+        rosters = self._rosters(rng)
+        strength = {t: rng.gauss(0.0, 4.0) for t in self.team_names}
+
+        total = cfg.teams * cfg.games_per_team // 2
+        days = max(1, min(165, total))
+        start = datetime.datetime(year, 10, 22, 23, 30)
+        games: List[_Game] = []
+        n = 0
+        for d in range(days):
+            todays = total // days + (1 if d < total % days else 0)
+            order = self.team_names[:]
+            rng.shuffle(order)
+            for k in range(min(todays, len(order) // 2)):
+                home, away = order[2 * k], order[2 * k + 1]
+                n += 1
+                tip = start + datetime.timedelta(days=d, minutes=30 * (k % 4))
+                box: Dict[str, Dict[str, Any]] = {}
+                for team in (home, away):
+                    pace = rng.gauss(99.0, 3.0)
+                    for p in rosters[team]:
+                        mins = max(0.0, rng.gauss(p.minutes, 4.0))
+                        scale = pace / 99.0
+                        pts = max(0, int(round(rng.gauss(p.pts_rate * mins * scale, 4.0))))
+                        box[p.name] = {
+                            "player": p.name,
+                            "team": team,
+                            "position": p.position,
+                            "minutes": round(mins, 1),
+                            "points": pts,
+                            "rebounds": max(0, int(round(rng.gauss(p.reb_rate * mins, 2.0)))),
+                            "assists": max(0, int(round(rng.gauss(p.ast_rate * mins, 1.5)))),
+                            "threes_made": min(pts // 3, max(0, int(round(rng.gauss(p.three_share * pts, 1.0))))),
+                            "pace": round(pace, 1),
+                        }
+                games.append(_Game(
+                    external_id=f"syn_{year}_{n:05d}",
+                    tipoff=tip,
+                    home=home,
+                    away=away,
+                    stats=box,
+                    home_strength=strength[home] - strength[away] + 2.5,
+                ))
+        return games
+
+    # ---- payloads in the shapes each normalizer accepts ----
+    def stats_payloads(self) -> Iterator[Dict[str, Any]]:
+        """normalize_stats_fixture payloads, one per game day."""
+        for si in range(self.cfg.seasons):
+            by_day: Dict[datetime.date, List[_Game]] = {}
+            for g in self.season(si):
+                by_day.setdefault(g.tipoff.date(), []).append(g)
+            for day in sorted(by_day):
+                yield {
+                    "league": "NBA",
+                    "games": [
+                        {
+                            "external_id": g.external_id,
+                            "commence_time": g.tipoff.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            "home_team": g.home,
+                            "away_team": g.away,
+                            "players": list(g.stats.values()),
+                        }
+                        for g in by_day[day]
+                    ],
+                }
+
+    def odds_payloads(self) -> Iterator[List[Dict[str, Any]]]:
+        """normalize_the_odds_api_odds payloads: one per (game day, snapshot)."""
+        cfg = self.cfg
+        for si in range(cfg.seasons):
+            rng = random.Random(cfg.seed * 7919 + si)
+            by_day: Dict[datetime.date, List[_Game]] = {}
+            for g in self.season(si):
+                by_day.setdefault(g.tipoff.date(), []).append(g)
+            for day in sorted(by_day):
+                for snap in range(cfg.snapshots_per_game):
+                    events = []
+                    for g in by_day[day]:
+                        spread = -round(g.home_strength * 2) / 2 + rng.choice((-0.5, 0.0, 0.0, 0.5)) * snap
+                        total = _round_half(218.0 + rng.gauss(0.0, 6.0))
+                        p_home = 1.0 / (1.0 + math.exp(spread / 6.5))
+                        books = []
+                        for bi, key in enumerate(self.book_keys):
+                            margin = 0.03 + 0.01 * (bi % 3)
+                            drift = rng.gauss(0.0, 0.01)
+                            ml_home, ml_away = _price_pair(p_home + drift, margin)
+                            sp_home, sp_away = _price_pair(0.5 + drift, margin)
+                            ov, un = _price_pair(0.5 - drift, margin)
+                            books.append({
+                                "key": key,
+                                "title": key.title(),
+                                "markets": [
+                                    {"key": "h2h", "outcomes": [{"name": g.home, "price": ml_home}, {"name": g.away, "price": ml_away}]},
+                                    {"key": "spreads", "outcomes": [
+                                        {"name": g.home, "price": sp_home, "point": spread},
+                                        {"name": g.away, "price": sp_away, "point": -spread},
+                                    ]},
+                                    {"key": "totals", "outcomes": [
+                                        {"name": "Over", "price": ov, "point": total},
+                                        {"name": "Under", "price": un, "point": total},
+                                    ]},
+                                ],
+                            })
+                        events.append({
+                            "id": g.external_id,
+                            "commence_time": g.tipoff.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            "home_team": g.home,
+                            "away_team": g.away,
+                            "bookmakers": books,
+                        })
+                    yield events
+
+    def props_payloads(self) -> Iterator[Dict[str, Any]]:
+        """normalize_props_fixture payloads, one per (game, book), over and under quoted."""
+        cfg = self.cfg
+        for si in range(cfg.seasons):
+            rng = random.Random(cfg.seed * 104729 + si)
+            for g in self.season(si):
+                players = [p for p in g.stats.values() if p["team"] == g.home][: cfg.prop_players_per_team]
+                players += [p for p in g.stats.values() if p["team"] == g.away][: cfg.prop_players_per_team]
+                for bi, key in enumerate(self.book_keys):
+                    props = []
+                    for p in players:
+                        for pt in cfg.prop_types:
+                            # lines sit near the realised value plus noise (books are not clairvoyant)
+                            line = _round_half(max(0.0, _PROP_EXPR[pt](p) + rng.gauss(0.0, 3.0)))
+                            over, under = _price_pair(0.5 + rng.gauss(0.0, 0.03), 0.04 + 0.01 * (bi % 2))
+                            props.append({"player": p["player"], "prop_type": pt, "side": "over", "line": line, "price": over})
+                            props.append({"player": p["player"], "prop_type": pt, "side": "under", "line": line, "price": under})
+                    yield {
+                        "league": "NBA",
+                        "game": {
+                            "id": g.external_id,
+                            "commence_time": g.tipoff.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                            "home_team": g.home,
+                            "away_team": g.away,
+                        },
+                        "book": {"key": key, "title": key.title()},
+                        "props": props,
+                    }
+
+    def pbp_payloads(self) -> Iterator[Dict[str, Any]]:
+        """Play-by-play events shaped like play_by_play_events rows (no normalizer consumes these yet)."""
+        cfg = self.cfg
+        if cfg.pbp_events_per_game <= 0:
+            return
+        for si in range(cfg.seasons):
+            rng = random.Random(cfg.seed * 15485863 + si)
+            for g in self.season(si):
+                names = {t: [p["player"] for p in g.stats.values() if p["team"] == t] for t in (g.home, g.away)}
+                events = []
+                for i in range(cfg.pbp_events_per_game):
+                    team = g.home if rng.random() < 0.5 else g.away
+                    kind = rng.choice(("2pt_make", "2pt_miss", "3pt_make", "3pt_miss", "ft_make", "rebound", "turnover", "foul"))
+                    secs = 2880 * i // cfg.pbp_events_per_game
+                    period = min(4, secs // 720 + 1)
+                    left = 720 - secs % 720
+                    events.append({
+                        "event_index": i,
+                        "period": period,
+                        "clock": f"{left // 60:02d}:{left % 60:02d}",
+                        "team": team,
+                        "player_primary": rng.choice(names[team]),
+                        "event_type": kind,
+                        "points": {"2pt_make": 2, "3pt_make": 3, "ft_make": 1}.get(kind),
+                    })
+                yield {"game_id": g.external_id, "events": events}
+
+
+def write_payloads(cfg: SyntheticConfig, out_dir: str) -> Dict[str, Any]:
+    """Write every payload as JSON files under out_dir/{stats,odds,props,pbp}/ for the ingest commands."""
+    league = SyntheticLeague(cfg)
+    root = Path(out_dir)
+    counts: Dict[str, int] = {}
+    for kind, payloads in (
+        ("stats", league.stats_payloads()),
+        ("odds", league.odds_payloads()),
+        ("props", league.props_payloads()),
+        ("pbp", league.pbp_payloads()),
+    ):
+        d = root / kind
+        n = 0
+        for n, payload in enumerate(payloads, start=1):
+            d.mkdir(parents=True, exist_ok=True)
+            (d / f"{kind}_{n:06d}.json").write_text(json.dumps(payload), encoding="utf-8")
+        counts[kind] = n
+    (root / "config.json").write_text(json.dumps(asdict(cfg), indent=2), encoding="utf-8")
+    return {"dir": str(root), "files": counts}
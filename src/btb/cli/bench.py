@@ -0,0 +1,71 @@
+﻿from __future__ import annotations
+
+import typer
+
+from btb.bench.suite import compare_files, run_benchmarks
+from btb.bench.synthetic import SyntheticConfig, write_payloads
+
+app = typer.Typer(help="Synthetic data and performance benchmarks")
+
+
+def _config(seasons: int, teams: int, games_per_team: int, books: int, snapshots: int, prop_players: int, pbp_events: int, seed: int) -> SyntheticConfig:
+    return SyntheticConfig(
+        seasons=seasons,
+        teams=teams,
+        games_per_team=games_per_team,
+        books=books,
+        snapshots_per_game=snapshots,
+        prop_players_per_team=prop_players,
+        pbp_events_per_game=pbp_events,
+        seed=seed,
+    )
+
+
+@app.command("generate")
+def generate(
+    out_dir: str = typer.Argument(..., help="Directory for the payload files"),
+    seasons: int = typer.Option(1, "--seasons"),
+    teams: int = typer.Option(30, "--teams"),
+    games_per_team: int = typer.Option(82, "--games-per-team"),
+    books: int = typer.Option(4, "--books"),
+    snapshots: int = typer.Option(4, "--snapshots", help="Odds snapshots per game"),
+    prop_players: int = typer.Option(4, "--prop-players", help="Players per team with props"),
+    pbp_events: int = typer.Option(0, "--pbp-events", help="Play-by-play events per game"),
+    seed: int = typer.Option(7, "--seed"),
+) -> None:
+    """Write deterministic synthetic odds/props/stats/PBP payloads as JSON files."""
+    cfg = _config(seasons, teams, games_per_team, books, snapshots, prop_players, pbp_events, seed)
+    typer.echo(write_payloads(cfg, out_dir))
+
+
+@app.command("run")
+def run(
+    out: str = typer.Option("bench_results.json", "--out", help="Results JSON"),
+    db: str = typer.Option("bench.db", "--db", help="Scratch SQLite file (recreated)"),
+    seasons: int = typer.Option(1, "--seasons"),
+    teams: int = typer.Option(30, "--teams"),
+    games_per_team: int = typer.Option(82, "--games-per-team"),
+    books: int = typer.Option(4, "--books"),
+    snapshots: int = typer.Option(4, "--snapshots", help="Odds snapshots per game"),
+    prop_players: int = typer.Option(4, "--prop-players", help="Players per team with props"),
+    samples: int = typer.Option(200, "--samples", help="(player, date) pairs for the research benchmarks"),
+    no_memory: bool = typer.Option(False, "--no-memory", help="Skip tracemalloc (faster, no peak memory)"),
+    seed: int = typer.Option(7, "--seed"),
+) -> None:
+    """Ingest a synthetic league into a scratch DB and benchmark ingest and research."""
+    cfg = _config(seasons, teams, games_per_team, books, snapshots, prop_players, 0, seed)
+    results = run_benchmarks(cfg, db_path=db, out_path=out, research_samples=samples, trace_memory=not no_memory)
+    typer.echo(results["benchmarks"])
+
+
+@app.command("compare")
+def compare(
+    baseline: str = typer.Argument(..., help="Earlier results JSON"),
+    current: str = typer.Argument(..., help="Newer results JSON"),
+    threshold: float = typer.Option(0.10, "--threshold", help="Relative change counted as a regression"),
+) -> None:
+    """Diff two results files; exits 1 when a metric regressed past the threshold."""
+    result = compare_files(baseline, current, threshold)
+    typer.echo(result)
+    if result["regressions"]:
+        raise typer.Exit(code=1)
@@ -0,0 +1,106 @@
+﻿from __future__ import annotations
+
+import json
+import os
+import socket
+import sys
+from typing import Any, Dict, List, Optional
+
+# commands that always run in the calling process
+LOCAL_ONLY = {"server", "init-db"}
+# settings read from the environment (btb.core.config); a command runs on the server
+# only when the caller's values match the server's. BTB_SOCKET/BTB_NO_SERVER only
+# steer this forwarding.
+ENV_PREFIX = "BTB_"
+ENV_NAMES = {"THE_ODDS_API_KEY"}
+CLIENT_ONLY_ENV = {"BTB_SOCKET", "BTB_NO_SERVER"}
+
+
+def socket_path() -> str:
+    return os.environ.get("BTB_SOCKET") or ".btb.sock"
+
+
+def settings_env(environ: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """The environment variables that change how a command runs."""
+    environ = os.environ if environ is None else environ
+    return {
+        k: v for k, v in environ.items()
+        if (k in ENV_NAMES or k.startswith(ENV_PREFIX)) and k not in CLIENT_ONLY_ENV
+    }
+
+
+def run_request(argv: List[str]) -> Dict[str, Any]:
+    return {"op": "run", "argv": argv, "cwd": os.getcwd(), "env": settings_env()}
+
+
+def _connect(path: str, timeout: Optional[float]) -> socket.socket:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _exchange(sock: socket.socket, payload: Dict[str, Any]) -> Dict[str, Any]:
+    with sock, sock.makefile("rb") as fh:
+        sock.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        line = fh.readline()
+    if not line:
+        raise ConnectionError("warm server closed the connection")
+    return json.loads(line)
+
+
+def request(payload: Dict[str, Any], path: Optional[str] = None, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Send one request to the warm server and return its reply."""
+    return _exchange(_connect(path or socket_path(), timeout), payload)
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """
+    Run argv on the warm server; returns its exit code, or None to run locally.
+
+    Only a failure to connect, or a server whose cwd or settings environment differs
+    from the caller's, falls back - once the command has run it is not retried
+    locally, so writes are never applied twice.
+    """
+    if os.environ.get("BTB_NO_SERVER") or not argv or argv[0] in LOCAL_ONLY:
+        return None
+    path = socket_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        sock = _connect(path, None)
+    except OSError:
+        return None
+    try:
+        resp = _exchange(sock, run_request(argv))
+    except (OSError, ValueError) as e:
+        sys.stderr.write(f"btb: warm server failed mid-request: {e}\n")
+        return 1
+    if resp.get("fallback"):
+        return None
+    sys.stdout.write(resp.get("stdout") or "")
+    sys.stderr.write(resp.get("stderr") or "")
+    return int(resp.get("exit_code") or 0)
+
+
+def main() -> None:
+    """
+    Console entry point: forward to a running warm server (`btb server start`), else
+    run the CLI in-process. This module is stdlib-only so a forwarded call never pays
+    for importing Typer, SQLAlchemy or the schema.
+    """
+    code = forward(sys.argv[1:])
+    if code is None:
+        from btb.cli.main import main as cli_main
+
+        cli_main()
+        return
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
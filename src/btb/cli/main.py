@@ -2,13 +2,16 @@
 
 import typer
 
-from btb.cli import phase1_research
+from btb.cli import bench, phase1_research, server
 from btb.db.connection import get_engine
 from btb.db.schema import Base
+from btb.db.upgrade import add_missing_columns
 
 app = typer.Typer(help="BTB CLI", add_completion=False)
 
 app.add_typer(phase1_research.app, name="phase1")
+app.add_typer(server.app, name="server")
+app.add_typer(bench.app, name="bench")
 
 
 @app.callback(invoke_without_command=True)
@@ -29,6 +32,9 @@ def init_db() -> None:
     """Initialize SQLite database and create tables."""
     engine = get_engine()
     Base.metadata.create_all(engine)
+    added = add_missing_columns(engine)
+    if added:
+        typer.echo(f"Added columns: {', '.join(added)}")
     typer.echo("Database initialized.")
 
 
@@ -0,0 +1,164 @@
+﻿from __future__ import annotations
+
+import sys
+from enum import Enum
+from typing import IO, Any, Iterable, Optional
+
+import typer
+
+from btb.api import serialize
+
+
+class OutputFormat(str, Enum):
+    text = "text"
+    json = "json"
+    ndjson = "ndjson"
+    msgpack = "msgpack"
+
+
+FORMATS = tuple(f.value for f in OutputFormat)
+
+
+def check_format(fmt: str, path: Optional[str] = None) -> str:
+    """The plain format name; raises typer.BadParameter when it cannot be written to path (None = stdout)."""
+    fmt = fmt.value if isinstance(fmt, OutputFormat) else fmt
+    if fmt not in FORMATS:
+        raise typer.BadParameter(f"--format must be one of {', '.join(FORMATS)}")
+    if fmt == "msgpack" and serialize.msgpack is None:
+        raise typer.BadParameter("msgpack output needs the msgpack package (pip install btb[fast])")
+    if fmt == "msgpack" and path is None and not hasattr(sys.stdout, "buffer"):
+        # stdout without a binary buffer, e.g. captured by the warm server
+        raise typer.BadParameter("msgpack output to a text stream needs --output")
+    return fmt
+
+
+def _validate(ctx: typer.Context, param: typer.CallbackParam, value: Any) -> Any:
+    # option callbacks run while the command line is parsed, so an unusable
+    # --format fails with a usage error before the command does any work
+    params = {**ctx.params, param.name: value}
+    if "out_fmt" in params and "out_path" in params:
+        check_format(params["out_fmt"], params["out_path"])
+    # typer re-converts the returned value from its str(), so hand back the plain name
+    return value.value if isinstance(value, OutputFormat) else value
+
+
+def format_option(default: OutputFormat = OutputFormat.text) -> Any:
+    return typer.Option(default, "--format", callback=_validate, help="text (dict repr), json, ndjson or msgpack")
+
+
+# shared by the phase1 commands (parameters named out_fmt / out_path)
+FORMAT_OPTION = format_option()
+OUTPUT_OPTION = typer.Option(None, "--output", callback=_validate, help="Write to this file instead of stdout")
+
+
+class Emitter:
+    """
+    Writes command results as they are produced.
+
+    record() streams one item: a JSON array element, an NDJSON line or a msgpack
+    object, flushed right away so a consumer can start on the first while the rest
+    are still being built. document() writes a whole result as one value.
+    """
+
+    def __init__(self, fmt: str = "text", path: Optional[str] = None) -> None:
+        self.fmt = check_format(fmt, path)
+        self.path = path
+        self.count = 0
+        self._streaming = False
+        self._fh: Optional[IO[bytes]] = open(path, "wb") if path else None
+        # stdout without a binary buffer (e.g. captured by the warm server) gets decoded text
+        self._text = None if self._fh is not None or hasattr(sys.stdout, "buffer") else sys.stdout
+
+    def begin_stream(self) -> None:
+        """Mark the output as a stream of records (so json writes "[]" when none come)."""
+        self._streaming = True
+
+    def _write(self, data: bytes) -> None:
+        if self._text is not None:
+            self._text.write(data.decode("utf-8"))
+            self._text.flush()
+            return
+        fh = self._fh or sys.stdout.buffer
+        fh.write(data)
+        fh.flush()
+
+    def _encode(self, obj: Any) -> bytes:
+        if self.fmt == "msgpack":
+            return serialize.packb(obj)
+        return serialize.dumps(obj)
+
+    def record(self, obj: Any) -> None:
+        if self.fmt == "text":
+            typer.echo(obj, file=self._text_target())
+        elif self.fmt == "json":
+            self._write((b"[" if not self.count else b",\n") + self._encode(obj))
+        elif self.fmt == "ndjson":
+            self._write(self._encode(obj) + b"\n")
+        else:
+            self._write(self._encode(obj))
+        self.count += 1
+
+    def document(self, obj: Any) -> None:
+        if self.fmt == "text":
+            typer.echo(obj, file=self._text_target())
+        elif self.fmt == "msgpack":
+            self._write(self._encode(obj))
+        else:
+            self._write(self._encode(obj) + b"\n")
+
+    def _text_target(self) -> Optional[IO[str]]:
+        if self._fh is None:
+            return None  # typer.echo's own stdout handling
+        return _BytesText(self._fh)
+
+    def close(self) -> None:
+        """End a streamed JSON array (an empty stream is "[]")."""
+        if self.fmt == "json" and (self.count or self._streaming):
+            self._write(b"]\n" if self.count else b"[]\n")
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def __enter__(self) -> "Emitter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class _BytesText:
+    """Minimal text view over a binary file for typer.echo."""
+
+    def __init__(self, fh: IO[bytes]) -> None:
+        self.fh = fh
+
+    def write(self, s: str) -> int:
+        return self.fh.write(s.encode("utf-8"))
+
+    def flush(self) -> None:
+        self.fh.flush()
+
+
+def emit(result: Any, fmt: str = "text", path: Optional[str] = None) -> None:
+    """Write one command result (the phase1 replacement for typer.echo(result))."""
+    with Emitter(fmt, path) as out:
+        out.document(result)
+
+
+def emit_status(result: Any, fmt: str = "text") -> None:
+    """
+    Write a side result to stderr, for commands whose stdout carries a record
+    stream: the dict repr for text, otherwise one JSON line (stderr is a text
+    stream, so a msgpack summary is written as JSON too).
+    """
+    fmt = check_format(fmt, "-")
+    typer.echo(result if fmt == "text" else serialize.dumps(result).decode("utf-8"), err=True)
+
+
+def stream(records: Iterable[Any], fmt: str = "text", path: Optional[str] = None) -> int:
+    """Write records as the iterable yields them. Returns how many were written."""
+    with Emitter(fmt, path) as out:
+        out.begin_stream()
+        for rec in records:
+            out.record(rec)
+        return out.count
@@ -1,11 +1,15 @@
 ﻿from __future__ import annotations
 
 import datetime
+import sys
+import time
+
 import typer
 
-from btb.research import queries_props
+from btb.research import alt_ladders, backtest_props, bet_settlement, clv_engine, fair_prices, limits, line_movement, matchup_aggregates, price_board, queries_props, roster, same_game_multi, slate_reports, stake_optimizer
+from btb.cli import output
 from btb.research.reports_explain import render_prop_report
-from btb.data_sources import odds_registry, props_registry, stats_registry
+from btb.data_sources import bet_slips, limits_import, odds_registry, props_registry, schedule_context, stats_registry
 
 app = typer.Typer(help="Phase 1: research backbone commands")
 
@@ -14,53 +18,322 @@ app = typer.Typer(help="Phase 1: research backbone commands")
 def ingest_odds(
     league: str = typer.Argument("NBA"),
     date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
 ) -> None:
     target_date = datetime.date.fromisoformat(date)
     result = odds_registry.ingest_day_main_markets(league, target_date)
-    typer.echo(result)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("ingest-event-odds")
+def ingest_event_odds(
+    league: str = typer.Argument("NBA"),
+    date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    prop_market: list[str] = typer.Option(None, "--prop-market", help="Player-prop market key (repeatable, e.g. player_points_alternate); default points/rebounds/assists/threes/PRA and their alt lines"),
+    batch_size: int = typer.Option(10, "--batch-size", min=1, help="Events per normalize/commit batch"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    target_date = datetime.date.fromisoformat(date)
+    result = odds_registry.ingest_event_odds(league, target_date, prop_markets=prop_market or None, batch_size=batch_size)
+    output.emit(result, out_fmt, out_path)
 
 
 @app.command("ingest-odds-fixture")
 def ingest_odds_fixture(
     path: str = typer.Argument(..., help="Path to odds JSON fixture"),
     league: str = typer.Option("NBA", "--league"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
 ) -> None:
     result = odds_registry.ingest_odds_from_fixture(path, league=league)
-    typer.echo(result)
+    output.emit(result, out_fmt, out_path)
 
 
 @app.command("ingest-props-fixture")
 def ingest_props_fixture(
     path: str = typer.Argument(..., help="Path to props JSON fixture"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
 ) -> None:
     result = props_registry.ingest_props_from_fixture(path)
-    typer.echo(result)
+    output.emit(result, out_fmt, out_path)
 
 
 @app.command("ingest-stats-fixture")
 def ingest_stats_fixture(
     path: str = typer.Argument(..., help="Path to stats JSON fixture"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
 ) -> None:
     result = stats_registry.ingest_stats_from_fixture(path)
-    typer.echo(result)
+    output.emit(result, out_fmt, out_path)
 
 
 @app.command("player-prop-research")
 def player_prop_research(
     player_name: str = typer.Argument(...),
     game_date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
 ) -> None:
     target_date = datetime.date.fromisoformat(game_date)
     bundle = queries_props.get_player_prop_research(player_name, target_date)
-    typer.echo(bundle)
+    output.emit(bundle, out_fmt, out_path)
 
 
 @app.command("report-prop")
 def report_prop(
     player_name: str = typer.Argument(...),
     game_date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
 ) -> None:
     target_date = datetime.date.fromisoformat(game_date)
     bundle = queries_props.get_player_prop_research(player_name, target_date)
     report = render_prop_report(bundle)
-    typer.echo(report)
+    if out_fmt == output.OutputFormat.text:
+        output.emit(report, out_fmt, out_path)
+    else:
+        output.emit({"ok": bool(bundle.get("ok")), "player": player_name, "date": game_date, "markdown": report}, out_fmt, out_path)
+
+
+@app.command("report-slate")
+def report_slate(
+    game_date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    out_dir: str = typer.Option("reports", "--out", help="Reports are written to <out>/<date>/"),
+    workers: int = typer.Option(1, "--workers", help="Worker processes"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    target_date = datetime.date.fromisoformat(game_date)
+    result = slate_reports.render_slate(target_date, out_dir=out_dir, workers=workers)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("slate-research")
+def slate_research(
+    game_date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    out_fmt: output.OutputFormat = output.format_option(output.OutputFormat.ndjson),
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    target_date = datetime.date.fromisoformat(game_date)
+    # bundles are written as each player's is built
+    output.stream(slate_reports.iter_slate_bundles(target_date), out_fmt, out_path)
+
+
+@app.command("size-slate")
+def size_slate(
+    game_date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    bankroll: float = typer.Option(1000.0, "--bankroll"),
+    kelly: float = typer.Option(0.25, "--kelly", help="Fraction of full Kelly"),
+    max_exposure: float = typer.Option(0.25, "--max-exposure", help="Total stake as a fraction of bankroll"),
+    max_game_exposure: float = typer.Option(0.10, "--max-game-exposure", help="Stake per game as a fraction of bankroll"),
+    max_bet: float = typer.Option(0.05, "--max-bet", help="Single stake as a fraction of bankroll"),
+    min_stake: float = typer.Option(1.0, "--min-stake"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    limits = stake_optimizer.StakeLimits(
+        bankroll=bankroll,
+        kelly_fraction=kelly,
+        max_exposure=max_exposure,
+        max_game_exposure=max_game_exposure,
+        max_bet_fraction=max_bet,
+        min_stake=min_stake,
+    )
+    result = stake_optimizer.optimize_slate(datetime.date.fromisoformat(game_date), limits)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("price-sgm")
+def price_sgm(
+    market: list[int] = typer.Option(..., "--market", help="props_markets id of a leg (repeatable)"),
+    price: float = typer.Option(None, "--price", help="The book's offered multi price"),
+    draws: int = typer.Option(None, "--draws", help="Monte Carlo draws (default depends on backend)"),
+    seed: int = typer.Option(0, "--seed"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = same_game_multi.price_market_multi(market, offered_price=price, draws=draws, seed=seed)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("backtest-props")
+def backtest_props_cmd(
+    season: list[int] = typer.Option(None, "--season", help="Season start year (repeatable); default all"),
+    window: int = typer.Option(5, "--window", help="Recent-form window in games"),
+    workers: int = typer.Option(1, "--workers", help="Worker processes (one season per task)"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = backtest_props.run_props_backtest(season or None, window=window, workers=workers)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("import-bets")
+def import_bets_cmd(
+    path: str = typer.Argument(..., help="Bet-slip export (CSV or JSON)"),
+    fmt: str = typer.Option(None, "--input-format", help="csv/json; default from the file extension"),
+    book: str = typer.Option(None, "--book", help="Book code for rows without a book column"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = bet_slips.import_bet_slips(path, fmt=fmt, default_book=book)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("settle-bets")
+def settle_bets_cmd(
+    batch_size: int = typer.Option(bet_settlement.BATCH_SIZE, "--batch-size", help="Bets graded per bulk update"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = bet_settlement.settle_bets(batch_size=batch_size)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("import-limits")
+def import_limits_cmd(
+    path: str = typer.Argument(..., help="Limit observations (CSV or JSON): book, scope, limit, effective_ts"),
+    fmt: str = typer.Option(None, "--input-format", help="csv/json; default from the file extension"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = limits_import.import_limits_file(path, fmt=fmt)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("limits-report")
+def limits_report_cmd(
+    book: str = typer.Option(None, "--book", help="Book code; default all books"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = limits.limit_decay_report(book)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("compute-clv")
+def compute_clv_cmd(
+    reference_book: str = typer.Option(None, "--reference-book", help="Book code; default first sharp_flag book"),
+    full: bool = typer.Option(False, "--full", help="Recompute all bets instead of only new ones"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = clv_engine.compute_clv(reference_book, incremental=not full)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("refresh-fair-prices")
+def refresh_fair_prices_cmd(
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = fair_prices.refresh_fair_prices()
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("scan-arbs")
+def scan_arbs(
+    game_date: str = typer.Option(..., "--date", help="YYYY-MM-DD"),
+    ndjson: str = typer.Option(None, "--ndjson", help="Write opportunities as NDJSON to this path ('-' for stdout)"),
+    min_middle: float = typer.Option(0.5, "--min-middle", help="Smallest middle window to report"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    target_date = datetime.date.fromisoformat(game_date)
+    fh = None
+    sink = None
+    # ndjson/msgpack stream each opportunity as the scan finds it; the summary goes to stderr
+    streamed = out_fmt in (output.OutputFormat.ndjson, output.OutputFormat.msgpack) and not ndjson
+    emitter = output.Emitter(out_fmt, out_path) if streamed else None
+    if ndjson:
+        fh = sys.stdout if ndjson == "-" else open(ndjson, "w", encoding="utf-8")
+        sink = price_board.NdjsonSink(fh)
+    elif emitter is not None:
+        sink = emitter.record
+
+    board = price_board.PriceBoard(on_opportunity=sink, min_middle_window=min_middle)
+    rows = board.load_from_db(target_date)
+    t0 = time.perf_counter()
+    opps = board.scan_all()
+    scan_ms = (time.perf_counter() - t0) * 1000.0
+    if fh is not None and fh is not sys.stdout:
+        fh.close()
+    if emitter is not None:
+        emitter.close()
+
+    summary = {
+        "date": target_date.isoformat(),
+        "rows_loaded": rows,
+        "arbs": sum(1 for o in opps if o["kind"] == "arb"),
+        "middles": sum(1 for o in opps if o["kind"] == "middle"),
+        "scan_ms": round(scan_ms, 3),
+    }
+    if not ndjson and not streamed:
+        summary["opportunities"] = opps
+        output.emit(summary, out_fmt, out_path)
+    elif ndjson == "-" or (streamed and not out_path):
+        # stdout carries the opportunity stream
+        output.emit_status(summary, out_fmt)
+    else:
+        output.emit(summary, out_fmt, None if streamed else out_path)
+
+
+@app.command("replay-line-moves")
+def replay_line_moves(
+    start: str = typer.Option(None, "--start", help="First game date YYYY-MM-DD"),
+    end: str = typer.Option(None, "--end", help="Last game date YYYY-MM-DD"),
+    persist: bool = typer.Option(True, "--persist/--no-persist", help="Write detections to line_move_alerts"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = line_movement.replay_line_movement(
+        start=datetime.date.fromisoformat(start) if start else None,
+        end=datetime.date.fromisoformat(end) if end else None,
+        persist=persist,
+    )
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("derive-schedule-context")
+def derive_schedule_context_cmd(
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = schedule_context.derive_schedule_context()
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("refresh-matchups")
+def refresh_matchups(
+    season: list[int] = typer.Option(None, "--season", help="Season start year (repeatable); default all"),
+    benchmark: bool = typer.Option(False, "--benchmark", help="Time a full-season rebuild vs. an incremental refresh"),
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    if benchmark:
+        result = [matchup_aggregates.benchmark_refresh(y) for y in (season or [])]
+    else:
+        result = matchup_aggregates.refresh_matchup_aggregates(season or None)
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("group-alt-lines")
+def group_alt_lines(
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = alt_ladders.assign_ladder_groups()
+    output.emit(result, out_fmt, out_path)
+
+
+@app.command("rebuild-roster")
+def rebuild_roster_cmd(
+    out_fmt: output.OutputFormat = output.FORMAT_OPTION,
+    out_path: str = output.OUTPUT_OPTION,
+) -> None:
+    result = roster.rebuild_roster()
+    output.emit(result, out_fmt, out_path)
@@ -0,0 +1,277 @@
+﻿from __future__ import annotations
+
+import datetime
+import io
+import json
+import os
+import socketserver
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import typer
+
+from btb.cli import entry
+from btb.core import instrument
+from btb.core.timing import latency_summary
+
+app = typer.Typer(help="Warm research server (keeps the engine and caches loaded)")
+
+# latencies kept per command for percentiles
+LATENCY_WINDOW = 2048
+
+
+def _command_key(argv: List[str]) -> str:
+    return " ".join(argv[:2] if argv and argv[0] == "phase1" else argv[:1])
+
+
+class LatencyStats:
+    """Rolling per-command latency samples (last LATENCY_WINDOW each)."""
+
+    def __init__(self, window: int = LATENCY_WINDOW) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, key: str, ms: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(ms)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            items = [(k, list(v), self._counts[k]) for k, v in self._samples.items()]
+        return {k: {"count": n, **latency_summary(vals)} for k, vals, n in items}
+
+
+def run_cli(argv: List[str]) -> Tuple[int, str, str]:
+    """Run one CLI invocation in this process, capturing its output."""
+    from btb.cli.main import app as cli_app
+
+    out = io.StringIO()
+    err = io.StringIO()
+    code = 0
+    with redirect_stdout(out), redirect_stderr(err):
+        try:
+            cli_app(args=argv, prog_name="btb")
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+        except Exception:
+            traceback.print_exc()
+            code = 1
+    return code, out.getvalue(), err.getvalue()
+
+
+def warm_up() -> Dict[str, Any]:
+    """Import the command tree, open the engine and build the shared registries."""
+    t0 = time.perf_counter()
+    from sqlalchemy import text
+
+    import btb.cli.main  # noqa: F401  (pulls in every command module)
+    from btb.db.connection import get_engine
+    from btb.core.stat_expressions import get_registry
+
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+    get_registry()
+    return {"warm_up_ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "WarmServer"
+
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            req = json.loads(line)
+        except ValueError:
+            self._reply({"ok": False, "error": "bad request"})
+            return
+        self._reply(self.server.dispatch(req))
+
+    def _reply(self, payload: Dict[str, Any]) -> None:
+        self.wfile.write(json.dumps(payload, default=str).encode("utf-8") + b"\n")
+
+
+class WarmServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix-socket server that runs CLI commands in one long-lived process.
+
+    Commands are executed one at a time (they redirect the process-wide stdout);
+    ping/stats/stop are answered concurrently.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.cwd = os.getcwd()
+        # settings and caches (prop types, instrumentation, API key) were loaded from this
+        self.env = entry.settings_env()
+        self.started = time.time()
+        self.stats = LatencyStats()
+        self.requests = 0
+        self._run_lock = threading.Lock()
+        super().__init__(path, _Handler)
+
+    def dispatch(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        op = req.get("op")
+        if op == "ping":
+            return {"ok": True, "pid": os.getpid(), "uptime_s": round(time.time() - self.started, 1)}
+        if op == "stats":
+            from btb.data_sources import change_bus
+
+            out = {
+                "ok": True,
+                "pid": os.getpid(),
+                "uptime_s": round(time.time() - self.started, 1),
+                "requests": self.requests,
+                "latency_ms": self.stats.snapshot(),
+            }
+            if change_bus.has_subscribers():
+                out["recompute"] = change_bus.get_bus().stats()
+            return out
+        if op == "metrics":
+            return {"ok": True, "enabled": instrument.is_enabled(), "text": instrument.prometheus_text()}
+        if op == "trace":
+            return {"ok": True, "enabled": instrument.is_enabled(), "trace": instrument.chrome_trace()}
+        if op == "stop":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"ok": True}
+        if op == "run":
+            # the database and relative paths resolve against the server's cwd, and the
+            # settings against its environment: a caller with other values runs locally
+            if req.get("cwd") != self.cwd or (req.get("env") or {}) != self.env:
+                return {"fallback": True}
+            argv = [str(a) for a in req.get("argv") or []]
+            with self._run_lock:
+                t0 = time.perf_counter()
+                code, out, err = run_cli(argv)
+                ms = (time.perf_counter() - t0) * 1000.0
+                self.requests += 1
+            self.stats.record(_command_key(argv), ms)
+            return {"exit_code": code, "stdout": out, "stderr": err, "elapsed_ms": round(ms, 2)}
+        return {"ok": False, "error": f"unknown op: {op}"}
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _clear_stale_socket(path: str) -> None:
+    if not os.path.exists(path):
+        return
+    try:
+        entry.request({"op": "ping"}, path, timeout=1.0)
+    except OSError:
+        os.unlink(path)
+        return
+    raise RuntimeError(f"a warm server is already listening on {path}")
+
+
+def serve(path: Optional[str] = None, recompute: bool = False, slate_date: Optional[datetime.date] = None, reports_dir: str = "reports") -> None:
+    path = path or entry.socket_path()
+    _clear_stale_socket(path)
+    warm = warm_up()
+    server = WarmServer(path)
+    if recompute:
+        from btb.research import recompute as recompute_mod
+
+        names = recompute_mod.attach(slate_date=slate_date, out_dir=reports_dir)
+        typer.echo(f"incremental recompute on ingest: {', '.join(names)}")
+    typer.echo(f"btb warm server on {path} (pid {os.getpid()}, warm-up {warm['warm_up_ms']} ms)")
+    try:
+        server.serve_forever()
+    finally:
+        if recompute:
+            recompute_mod.detach()
+        server.server_close()
+
+
+@app.command("start")
+def start(
+    socket_path: str = typer.Option(None, "--socket", help="Socket path (default $BTB_SOCKET or .btb.sock)"),
+    instrumented: bool = typer.Option(False, "--instrument", help="Record spans and SQL counters (see metrics/trace)"),
+    recompute: bool = typer.Option(False, "--recompute", help="Recompute fair prices and caches for what each ingest changed"),
+    slate_date: str = typer.Option(None, "--slate-date", help="With --recompute, keep this date's report files current (YYYY-MM-DD)"),
+    reports_dir: str = typer.Option("reports", "--reports-dir"),
+) -> None:
+    """Run the warm server in the foreground."""
+    if instrumented:
+        instrument.enable()
+    serve(socket_path, recompute, datetime.date.fromisoformat(slate_date) if slate_date else None, reports_dir)
+
+
+@app.command("http")
+def http(
+    host: str = typer.Option("127.0.0.1", "--host"),
+    port: int = typer.Option(8765, "--port"),
+    workers: int = typer.Option(8, "--workers", help="Threads (and read-only connections) for DB work"),
+) -> None:
+    """Serve bundles, reports, slates and odds history over HTTP."""
+    from btb.api.http_server import run_api
+
+    typer.echo(f"btb research API on http://{host}:{port}")
+    run_api(host, port, workers)
+
+
+@app.command("stats")
+def stats(socket_path: str = typer.Option(None, "--socket")) -> None:
+    """Per-command latency percentiles from the running server."""
+    try:
+        typer.echo(entry.request({"op": "stats"}, socket_path, timeout=5.0))
+    except OSError as e:
+        typer.echo({"ok": False, "error": f"no warm server: {e}", "reason_code": "SERVER_DOWN"})
+
+
+@app.command("metrics")
+def metrics(
+    socket_path: str = typer.Option(None, "--socket"),
+    out: str = typer.Option(None, "--out", help="Write the Prometheus text here instead of stdout"),
+) -> None:
+    """Prometheus text exposition of the running server's counters."""
+    try:
+        resp = entry.request({"op": "metrics"}, socket_path, timeout=5.0)
+    except OSError as e:
+        typer.echo({"ok": False, "error": f"no warm server: {e}", "reason_code": "SERVER_DOWN"})
+        return
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(resp["text"])
+        typer.echo({"ok": True, "out": out, "enabled": resp["enabled"]})
+    else:
+        typer.echo(resp["text"], nl=False)
+
+
+@app.command("trace")
+def trace(
+    out: str = typer.Option("btb_trace.json", "--out", help="Chrome trace JSON (open in chrome://tracing or Perfetto)"),
+    socket_path: str = typer.Option(None, "--socket"),
+) -> None:
+    """Dump the running server's retained spans and SQL events as a Chrome trace."""
+    try:
+        resp = entry.request({"op": "trace"}, socket_path, timeout=30.0)
+    except OSError as e:
+        typer.echo({"ok": False, "error": f"no warm server: {e}", "reason_code": "SERVER_DOWN"})
+        return
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(resp["trace"], f)
+    typer.echo({"ok": True, "out": out, "events": len(resp["trace"]["traceEvents"]), "enabled": resp["enabled"]})
+
+
+@app.command("stop")
+def stop(socket_path: str = typer.Option(None, "--socket")) -> None:
+    """Ask the running server to shut down."""
+    try:
+        typer.echo(entry.request({"op": "stop"}, socket_path, timeout=5.0))
+    except OSError as e:
+        typer.echo({"ok": False, "error": f"no warm server: {e}", "reason_code": "SERVER_DOWN"})
@@ -7,9 +7,17 @@ from dataclasses import dataclass
 @dataclass
 class Settings:
     odds_api_key: str | None
+    prop_types_path: str | None = None
+    instrument: bool = False
+    trace_file: str | None = None
+    metrics_file: str | None = None
 
 
 def get_settings() -> Settings:
     return Settings(
         odds_api_key=os.getenv("THE_ODDS_API_KEY"),
+        prop_types_path=os.getenv("BTB_PROP_TYPES"),
+        instrument=os.getenv("BTB_INSTRUMENT", "").lower() in ("1", "true", "yes", "on"),
+        trace_file=os.getenv("BTB_TRACE_FILE"),
+        metrics_file=os.getenv("BTB_METRICS_FILE"),
     )
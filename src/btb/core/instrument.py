@@ -0,0 +1,290 @@
+﻿from __future__ import annotations
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from btb.core.config import get_settings
+
+# Disabled by default. span()/count() are a flag check when off, and the
+# SQLAlchemy listeners are only attached while enabled.
+_enabled = False
+_NULL = nullcontext()
+MAX_EVENTS = 100_000
+
+_local = threading.local()
+_lock = threading.Lock()
+_events: Deque[Dict[str, Any]] = deque(maxlen=MAX_EVENTS)
+_span_totals: Dict[str, List[int]] = {}  # name -> [calls, ns]
+_sql_totals: Dict[str, List[int]] = {}  # statement kind -> [statements, ns]
+_row_totals: Dict[str, int] = {}
+_T0 = time.perf_counter_ns()
+_PID = os.getpid()
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+class Collector:
+    """Spans, SQL and row counts seen on one thread while a collect() block is active."""
+
+    __slots__ = ("spans", "sql", "rows")
+
+    def __init__(self) -> None:
+        self.spans: Dict[str, List[int]] = {}
+        self.sql: Dict[str, List[int]] = {}
+        self.rows: Dict[str, int] = {}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "spans_ms": {k: round(v[1] / 1e6, 3) for k, v in self.spans.items()},
+            "sql": {
+                "statements": sum(v[0] for v in self.sql.values()),
+                "ms": round(sum(v[1] for v in self.sql.values()) / 1e6, 3),
+                "by_kind": {k: {"statements": v[0], "ms": round(v[1] / 1e6, 3)} for k, v in self.sql.items()},
+            },
+            "rows": dict(self.rows),
+        }
+
+
+def _collectors() -> List[Collector]:
+    cs = getattr(_local, "collectors", None)
+    if cs is None:
+        cs = _local.collectors = []
+    return cs
+
+
+def _add(totals: Dict[str, List[int]], key: str, ns: int) -> None:
+    t = totals.get(key)
+    if t is None:
+        totals[key] = [1, ns]
+    else:
+        t[0] += 1
+        t[1] += ns
+
+
+def _event(name: str, cat: str, start_ns: int, dur_ns: int, args: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    ev = {"name": name, "cat": cat, "ph": "X", "ts": (start_ns - _T0) / 1000.0, "dur": dur_ns / 1000.0, "pid": _PID, "tid": threading.get_ident()}
+    if args:
+        ev["args"] = args
+    return ev
+
+
+class _Span:
+    __slots__ = ("name", "args", "t0")
+
+    def __init__(self, name: str, args: Dict[str, Any]) -> None:
+        self.name = name
+        self.args = args
+        self.t0 = 0
+
+    def __enter__(self) -> "_Span":
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        dur = time.perf_counter_ns() - self.t0
+        for c in _collectors():
+            _add(c.spans, self.name, dur)
+        with _lock:
+            _add(_span_totals, self.name, dur)
+            _events.append(_event(self.name, "span", self.t0, dur, self.args))
+
+
+def span(name: str, **args: Any):
+    """Time a stage (context manager); a shared no-op when instrumentation is off."""
+    if not _enabled:
+        return _NULL
+    return _Span(name, args)
+
+
+def count(name: str, n: int = 1) -> None:
+    """Add to a row counter."""
+    if not _enabled or not n:
+        return
+    for c in _collectors():
+        c.rows[name] = c.rows.get(name, 0) + n
+    with _lock:
+        _row_totals[name] = _row_totals.get(name, 0) + n
+
+
+@contextmanager
+def collect() -> Iterator[Collector]:
+    """Gather this thread's spans/SQL/rows for the duration of the block (nests)."""
+    c = Collector()
+    cs = _collectors()
+    cs.append(c)
+    try:
+        yield c
+    finally:
+        cs.remove(c)
+
+
+def instrumented(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Wrap an ingest/refresh entry point in a span; when enabled, a dict result
+    gains an "instrumentation" block with the call's spans, SQL and row counts.
+    """
+
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with collect() as c:
+                with _Span(name, {}):
+                    result = fn(*args, **kwargs)
+            if isinstance(result, dict):
+                result["instrumentation"] = c.summary()
+            return result
+
+        return wrapper
+
+    return deco
+
+
+def timed(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Wrap a function in a span (no summary)."""
+
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+# ---- SQLAlchemy engine events ----
+def _sql_kind(statement: str) -> str:
+    head = statement.lstrip()[:6].upper()
+    return head if head in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER"
+
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("btb_sql_t0", []).append(time.perf_counter_ns())
+
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany) -> None:
+    stack = conn.info.get("btb_sql_t0")
+    if not stack:
+        return
+    t0 = stack.pop()
+    dur = time.perf_counter_ns() - t0
+    kind = _sql_kind(statement)
+    for c in _collectors():
+        _add(c.sql, kind, dur)
+    with _lock:
+        _add(_sql_totals, kind, dur)
+        _events.append(_event(kind, "sql", t0, dur, {"sql": statement[:200], "executemany": bool(executemany)}))
+
+
+def enable() -> None:
+    global _enabled
+    if _enabled:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.listen(Engine, "before_cursor_execute", _before_cursor)
+    event.listen(Engine, "after_cursor_execute", _after_cursor)
+    _enabled = True
+
+
+def disable() -> None:
+    global _enabled
+    if not _enabled:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    event.remove(Engine, "before_cursor_execute", _before_cursor)
+    event.remove(Engine, "after_cursor_execute", _after_cursor)
+    _enabled = False
+
+
+def reset() -> None:
+    with _lock:
+        _events.clear()
+        _span_totals.clear()
+        _sql_totals.clear()
+        _row_totals.clear()
+
+
+# ---- exports ----
+def chrome_trace() -> Dict[str, Any]:
+    with _lock:
+        events = list(_events)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def dump_chrome_trace(path: str) -> int:
+    """Write retained events as Chrome trace JSON (chrome://tracing, Perfetto); returns the event count."""
+    trace = chrome_trace()
+    Path(path).write_text(json.dumps(trace), encoding="utf-8")
+    return len(trace["traceEvents"])
+
+
+def _label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    with _lock:
+        spans = {k: list(v) for k, v in _span_totals.items()}
+        sql = {k: list(v) for k, v in _sql_totals.items()}
+        rows = dict(_row_totals)
+    lines = [
+        "# HELP btb_instrumentation_enabled Whether hot-path instrumentation is on.",
+        "# TYPE btb_instrumentation_enabled gauge",
+        f"btb_instrumentation_enabled {1 if _enabled else 0}",
+        "# HELP btb_span_calls_total Completed spans by stage.",
+        "# TYPE btb_span_calls_total counter",
+        *[f'btb_span_calls_total{{span="{_label(k)}"}} {v[0]}' for k, v in sorted(spans.items())],
+        "# HELP btb_span_seconds_total Time spent in spans by stage.",
+        "# TYPE btb_span_seconds_total counter",
+        *[f'btb_span_seconds_total{{span="{_label(k)}"}} {v[1] / 1e9:.6f}' for k, v in sorted(spans.items())],
+        "# HELP btb_sql_statements_total SQL statements executed by kind.",
+        "# TYPE btb_sql_statements_total counter",
+        *[f'btb_sql_statements_total{{kind="{k}"}} {v[0]}' for k, v in sorted(sql.items())],
+        "# HELP btb_sql_seconds_total Time spent executing SQL by kind.",
+        "# TYPE btb_sql_seconds_total counter",
+        *[f'btb_sql_seconds_total{{kind="{k}"}} {v[1] / 1e9:.6f}' for k, v in sorted(sql.items())],
+        "# HELP btb_rows_total Rows handled by counter.",
+        "# TYPE btb_rows_total counter",
+        *[f'btb_rows_total{{counter="{_label(k)}"}} {v}' for k, v in sorted(rows.items())],
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def export_prometheus(path: str) -> None:
+    """Write the Prometheus text exposition atomically (node_exporter textfile collector style)."""
+    target = Path(path)
+    tmp = target.with_name(target.name + ".tmp")
+    tmp.write_text(prometheus_text(), encoding="utf-8")
+    os.replace(tmp, target)
+
+
+def _configure_from_env() -> None:
+    settings = get_settings()
+    if settings.instrument:
+        enable()
+        if settings.trace_file:
+            atexit.register(dump_chrome_trace, settings.trace_file)
+        if settings.metrics_file:
+            atexit.register(export_prometheus, settings.metrics_file)
+
+
+_configure_from_env()
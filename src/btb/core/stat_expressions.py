@@ -0,0 +1,165 @@
+﻿from __future__ import annotations
+
+import ast
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from btb.core.config import get_settings
+
+# numeric StatsPlayerGame columns an expression may reference
+STAT_COLUMNS = ("minutes", "points", "rebounds", "assists", "threes_made", "usage", "ortg", "drtg", "ts_pct", "pace")
+
+DEFAULT_PROP_TYPES: Dict[str, Dict[str, Any]] = {
+    # the provider's *_alternate market keys carry the alt lines of the same prop
+    "points": {"expr": "points", "aliases": ["pts", "player_points", "player_points_alternate"]},
+    "rebounds": {"expr": "rebounds", "aliases": ["reb", "rebs", "player_rebounds", "player_rebounds_alternate"]},
+    "assists": {"expr": "assists", "aliases": ["ast", "asts", "player_assists", "player_assists_alternate"]},
+    "threes": {"expr": "threes_made", "aliases": ["threes_made", "3pm", "fg3m", "player_threes", "player_threes_alternate"]},
+    "pra": {
+        "expr": "points + rebounds + assists",
+        "aliases": ["p+r+a", "pts+rebs+asts", "player_points_rebounds_assists", "player_points_rebounds_assists_alternate"],
+    },
+    "pr": {"expr": "points + rebounds", "aliases": ["p+r", "pts+rebs", "player_points_rebounds", "player_points_rebounds_alternate"]},
+    "pa": {"expr": "points + assists", "aliases": ["p+a", "pts+asts", "player_points_assists", "player_points_assists_alternate"]},
+    "ra": {"expr": "rebounds + assists", "aliases": ["r+a", "rebs+asts", "player_rebounds_assists", "player_rebounds_assists_alternate"]},
+}
+
+_ALLOWED_NODES = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.USub, ast.UAdd, ast.Name, ast.Load, ast.Constant)
+
+Columns = Dict[str, Sequence[Optional[float]]]
+
+
+def _norm(prop_type: str) -> str:
+    return "".join((prop_type or "").lower().split())
+
+
+@dataclass
+class CompiledStat:
+    name: str
+    expr: str
+    columns: List[str]
+    fn: Callable[..., List[Optional[float]]] = field(repr=False)
+    code: Any = field(default=None, repr=False)  # the bare expression, for array operands
+
+    def evaluate(self, cols: Columns) -> List[Optional[float]]:
+        """Evaluate over whole columns in one pass; None in any input or a zero divisor gives None."""
+        return self.fn(*(cols[c] for c in self.columns))
+
+    def evaluate_arrays(self, cols: Dict[str, Any]) -> Any:
+        """Evaluate on array-like columns with elementwise arithmetic (e.g. NumPy arrays)."""
+        return eval(self.code, {"__builtins__": {}}, {c: cols[c] for c in self.columns})
+
+
+def _divisors(node: ast.AST) -> List[ast.AST]:
+    """Right operands of every division under node, innermost first."""
+    out: List[ast.AST] = []
+    for child in ast.iter_child_nodes(node):
+        out.extend(_divisors(child))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Div):
+        out.append(node.right)
+    return out
+
+
+def compile_expression(name: str, expr: str) -> CompiledStat:
+    """
+    Compile an arithmetic expression over stat columns into a column-wise function.
+
+    Only + - * /, unary minus, numbers and STAT_COLUMNS names are accepted; the
+    validated expression is turned into a single list comprehension over zip()
+    of the referenced columns. Rows where a divisor is 0 (e.g. "points / minutes"
+    for a DNP) give None rather than raising.
+    """
+    tree = ast.parse(expr, mode="eval")
+    names: List[str] = []
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"prop type {name!r}: unsupported syntax in {expr!r}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise ValueError(f"prop type {name!r}: only numeric constants allowed in {expr!r}")
+        if isinstance(node, ast.Name):
+            if node.id not in STAT_COLUMNS:
+                raise ValueError(f"prop type {name!r}: unknown stat column {node.id!r}")
+            if node.id not in names:
+                names.append(node.id)
+    if not names:
+        raise ValueError(f"prop type {name!r}: expression references no stat column")
+
+    args = ", ".join(names)
+    # inner divisors first, so the short-circuit never evaluates a division by zero
+    divisors = [ast.unparse(d) for d in _divisors(tree.body)]
+    guard = " or ".join([f"{n} is None" for n in names] + [f"({d}) == 0" for d in dict.fromkeys(divisors)])
+    body = ast.unparse(tree.body)
+    src = f"lambda {args}: [None if {guard} else float({body}) for ({args},) in zip({args})]"
+    fn = eval(compile(src, f"<prop:{name}>", "eval"), {"__builtins__": {"zip": zip, "float": float}})
+    code = compile(ast.Expression(body=tree.body), f"<prop:{name}:arrays>", "eval")
+    return CompiledStat(name=name, expr=expr, columns=names, fn=fn, code=code)
+
+
+class StatExpressionRegistry:
+    """Prop-type aliases -> compiled stat expressions."""
+
+    def __init__(self) -> None:
+        self._compiled: Dict[str, CompiledStat] = {}
+        self._aliases: Dict[str, str] = {}
+
+    def register(self, name: str, expr: str, aliases: Iterable[str] = ()) -> CompiledStat:
+        compiled = compile_expression(name, expr)
+        key = _norm(name)
+        self._compiled[key] = compiled
+        self._aliases[key] = key
+        for a in aliases:
+            self._aliases[_norm(a)] = key
+        return compiled
+
+    def register_many(self, spec: Dict[str, Dict[str, Any]]) -> None:
+        for name, entry in spec.items():
+            self.register(name, str(entry["expr"]), entry.get("aliases") or [])
+
+    def resolve(self, prop_type: str) -> Optional[CompiledStat]:
+        key = self._aliases.get(_norm(prop_type))
+        return self._compiled.get(key) if key else None
+
+    def names(self) -> List[str]:
+        return sorted(self._compiled)
+
+    def evaluate(self, prop_type: str, cols: Columns) -> Optional[List[Optional[float]]]:
+        compiled = self.resolve(prop_type)
+        return compiled.evaluate(cols) if compiled else None
+
+
+def columns_from_rows(rows: Sequence[Any]) -> Dict[str, List[Optional[float]]]:
+    """Transpose StatsPlayerGame-like rows into stat columns."""
+    return {c: [_as_float(getattr(r, c, None)) for r in rows] for c in STAT_COLUMNS}
+
+
+def _as_float(v: Any) -> Optional[float]:
+    return float(v) if v is not None else None
+
+
+def load_prop_types_file(path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Read extra prop types from JSON:
+    {"stocks_pa": {"expr": "points + assists", "aliases": ["pts+asts"]}, ...}
+    """
+    data = json.loads(Path(path).read_text(encoding="utf-8-sig"))
+    if not isinstance(data, dict):
+        raise ValueError("prop types file must be a JSON object")
+    return data
+
+
+_registry: Optional[StatExpressionRegistry] = None
+
+
+def get_registry() -> StatExpressionRegistry:
+    """Default prop types plus any from the file named by BTB_PROP_TYPES."""
+    global _registry
+    if _registry is None:
+        reg = StatExpressionRegistry()
+        reg.register_many(DEFAULT_PROP_TYPES)
+        path = get_settings().prop_types_path
+        if path:
+            reg.register_many(load_prop_types_file(path))
+        _registry = reg
+    return _registry
@@ -0,0 +1,23 @@
+﻿from __future__ import annotations
+
+from typing import Dict, Sequence
+
+
+def percentile(sorted_vals: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending sequence (q in 0..1)."""
+    idx = max(0, min(len(sorted_vals) - 1, int(round(q * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[idx]
+
+
+def latency_summary(values_ms: Sequence[float]) -> Dict[str, float]:
+    """p50/p95/p99/max/mean of latencies in milliseconds (empty -> zeros)."""
+    if not values_ms:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "mean": 0.0}
+    vals = sorted(values_ms)
+    return {
+        "p50": round(percentile(vals, 0.50), 3),
+        "p95": round(percentile(vals, 0.95), 3),
+        "p99": round(percentile(vals, 0.99), 3),
+        "max": round(vals[-1], 3),
+        "mean": round(sum(vals) / len(vals), 3),
+    }
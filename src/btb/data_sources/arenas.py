@@ -0,0 +1,67 @@
+﻿from __future__ import annotations
+
+from typing import Dict, Optional, Tuple
+
+# NBA home arenas: (latitude, longitude, elevation in metres)
+ARENAS: Dict[str, Tuple[float, float, float]] = {
+    "Atlanta Hawks": (33.7573, -84.3963, 320.0),
+    "Boston Celtics": (42.3662, -71.0621, 6.0),
+    "Brooklyn Nets": (40.6826, -73.9754, 15.0),
+    "Charlotte Hornets": (35.2251, -80.8392, 230.0),
+    "Chicago Bulls": (41.8807, -87.6742, 180.0),
+    "Cleveland Cavaliers": (41.4965, -81.6882, 199.0),
+    "Dallas Mavericks": (32.7905, -96.8103, 139.0),
+    "Denver Nuggets": (39.7487, -105.0077, 1609.0),
+    "Detroit Pistons": (42.3411, -83.0553, 190.0),
+    "Golden State Warriors": (37.7680, -122.3877, 3.0),
+    "Houston Rockets": (29.7508, -95.3621, 15.0),
+    "Indiana Pacers": (39.7640, -86.1555, 218.0),
+    "LA Clippers": (33.9450, -118.3411, 30.0),
+    "Los Angeles Lakers": (34.0430, -118.2673, 89.0),
+    "Memphis Grizzlies": (35.1382, -90.0506, 82.0),
+    "Miami Heat": (25.7814, -80.1870, 2.0),
+    "Milwaukee Bucks": (43.0451, -87.9172, 188.0),
+    "Minnesota Timberwolves": (44.9795, -93.2760, 256.0),
+    "New Orleans Pelicans": (29.9490, -90.0821, 1.0),
+    "New York Knicks": (40.7505, -73.9934, 10.0),
+    "Oklahoma City Thunder": (35.4634, -97.5151, 366.0),
+    "Orlando Magic": (28.5392, -81.3839, 29.0),
+    "Philadelphia 76ers": (39.9012, -75.1720, 12.0),
+    "Phoenix Suns": (33.4457, -112.0712, 331.0),
+    "Portland Trail Blazers": (45.5316, -122.6668, 15.0),
+    "Sacramento Kings": (38.5802, -121.4997, 9.0),
+    "San Antonio Spurs": (29.4270, -98.4375, 198.0),
+    "Toronto Raptors": (43.6435, -79.3791, 76.0),
+    "Utah Jazz": (40.7683, -111.9011, 1288.0),
+    "Washington Wizards": (38.8981, -77.0209, 20.0),
+}
+
+_ALIASES: Dict[str, str] = {
+    "los angeles clippers": "LA Clippers",
+    "atl": "Atlanta Hawks", "bos": "Boston Celtics", "bkn": "Brooklyn Nets", "cha": "Charlotte Hornets",
+    "chi": "Chicago Bulls", "cle": "Cleveland Cavaliers", "dal": "Dallas Mavericks", "den": "Denver Nuggets",
+    "det": "Detroit Pistons", "gsw": "Golden State Warriors", "hou": "Houston Rockets", "ind": "Indiana Pacers",
+    "lac": "LA Clippers", "lal": "Los Angeles Lakers", "mem": "Memphis Grizzlies", "mia": "Miami Heat",
+    "mil": "Milwaukee Bucks", "min": "Minnesota Timberwolves", "nop": "New Orleans Pelicans", "nyk": "New York Knicks",
+    "okc": "Oklahoma City Thunder", "orl": "Orlando Magic", "phi": "Philadelphia 76ers", "phx": "Phoenix Suns",
+    "por": "Portland Trail Blazers", "sac": "Sacramento Kings", "sas": "San Antonio Spurs", "tor": "Toronto Raptors",
+    "uta": "Utah Jazz", "was": "Washington Wizards",
+}
+_BY_LOWER = {k.lower(): k for k in ARENAS}
+
+
+def arena_for(name: Optional[str], abbreviation: Optional[str] = None) -> Optional[Tuple[float, float, float]]:
+    for key in (name, abbreviation):
+        k = (key or "").strip().lower()
+        canon = _BY_LOWER.get(k) or _ALIASES.get(k)
+        if canon:
+            return ARENAS[canon]
+    return None
+
+
+def altitude_category(elevation_m: float) -> str:
+    if elevation_m >= 1500.0:
+        return "high"
+    if elevation_m >= 1000.0:
+        return "medium"
+    return "low"
@@ -0,0 +1,454 @@
+﻿from __future__ import annotations
+
+import csv
+import datetime
+import hashlib
+import json
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import aliased
+
+from btb.core import instrument
+from btb.core.stat_expressions import get_registry
+from btb.db.connection import get_session
+from btb.db.schema import Bet, Book, Game, OddsMarket, Player, PropsMarket, Team
+
+# canonical field -> accepted column names (lower-cased, spaces and dashes read as "_")
+FIELD_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "ref": ("ref", "bet_id", "slip_id", "reference", "id"),
+    "placed_ts": ("placed_ts", "placed", "placed_at", "date_placed", "timestamp"),
+    "book": ("book", "bookmaker", "sportsbook"),
+    "stake": ("stake", "amount", "risk", "wager"),
+    "price": ("price", "odds", "decimal_odds"),
+    "game": ("game", "game_id", "event_id", "external_game_id"),
+    "date": ("date", "game_date", "event_date"),
+    "home_team": ("home_team", "home"),
+    "away_team": ("away_team", "away"),
+    "player": ("player", "player_name"),
+    "market": ("market", "prop_type", "market_type", "bet_type"),
+    "side": ("side", "selection", "outcome", "pick"),
+    "line": ("line", "point", "handicap"),
+}
+_COLUMN_TO_FIELD = {alias: field for field, aliases in FIELD_ALIASES.items() for alias in aliases}
+
+_ODDS_MARKETS = {
+    "moneyline": "moneyline", "ml": "moneyline", "h2h": "moneyline", "head_to_head": "moneyline",
+    "spread": "spread", "spreads": "spread", "handicap": "spread", "line": "spread",
+    "total": "total", "totals": "total", "over_under": "total",
+}
+_SIDES = {"over": "over", "o": "over", "under": "under", "u": "under", "home": "home", "away": "away"}
+
+# bets per lookup batch; IN lists are chunked separately for SQLite's parameter limit
+BATCH_SIZE = 2000
+_IN_CHUNK = 500
+MAX_ERRORS_REPORTED = 50
+
+
+class SlipError(ValueError):
+    def __init__(self, reason_code: str, message: str) -> None:
+        super().__init__(message)
+        self.reason_code = reason_code
+
+
+def _chunks(seq: Sequence[Any], n: int = _IN_CHUNK) -> Iterable[Sequence[Any]]:
+    for i in range(0, len(seq), n):
+        yield seq[i : i + n]
+
+
+def _line_key(line: Any) -> Optional[float]:
+    return round(float(line), 2) if line is not None else None
+
+
+def _canon_prop(prop_type: str) -> str:
+    compiled = get_registry().resolve(prop_type)
+    return compiled.name if compiled else "".join((prop_type or "").lower().split())
+
+
+def read_bet_slips(path: str, fmt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rows of a book's bet-slip export: CSV with a header row, or JSON (a list or {"bets": [...]})."""
+    p = Path(path)
+    fmt = (fmt or p.suffix.lstrip(".") or "csv").lower()
+    if fmt == "csv":
+        with p.open(newline="", encoding="utf-8-sig") as fh:
+            return [dict(r) for r in csv.DictReader(fh)]
+    if fmt == "json":
+        data = json.loads(p.read_text(encoding="utf-8-sig"))
+        if isinstance(data, dict):
+            data = data.get("bets") or []
+        if not isinstance(data, list):
+            raise ValueError("bet slip JSON must be a list or an object with a 'bets' list")
+        return [r for r in data if isinstance(r, dict)]
+    raise ValueError(f"unsupported bet slip format: {fmt}")
+
+
+def _canon_columns(raw: Dict[str, Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for k, v in raw.items():
+        field = _COLUMN_TO_FIELD.get(str(k).strip().lower().replace(" ", "_").replace("-", "_"))
+        if field and field not in out and v not in (None, ""):
+            out[field] = v.strip() if isinstance(v, str) else v
+    return out
+
+
+def _parse_price(v: Any) -> float:
+    s = str(v).strip()
+    x = float(s)
+    if x >= 100 or x <= -100:  # American odds
+        return 1.0 + (x / 100.0 if x > 0 else 100.0 / -x)
+    if s.startswith("+") or x <= 1.0:
+        raise ValueError(s)
+    return x
+
+
+def _parse_ts(v: Any) -> datetime.datetime:
+    dt = datetime.datetime.fromisoformat(str(v).strip().replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def parse_slip(raw: Dict[str, Any], default_book: Optional[str] = None) -> Dict[str, Any]:
+    """One export row -> canonical bet fields; raises SlipError with a reason_code."""
+    r = _canon_columns(raw)
+
+    book = str(r.get("book") or default_book or "").strip().lower()
+    if not book:
+        raise SlipError("MISSING_BOOK", "no book column and no default book")
+    try:
+        stake = float(r["stake"])
+        price = _parse_price(r["price"])
+    except (KeyError, ValueError):
+        raise SlipError("BAD_STAKE_OR_PRICE", "stake and price must be numbers (decimal or American odds)")
+    if stake <= 0:
+        raise SlipError("BAD_STAKE_OR_PRICE", "stake must be positive")
+
+    try:
+        placed = _parse_ts(r["placed_ts"]) if r.get("placed_ts") else None
+        game_date = datetime.date.fromisoformat(str(r["date"])[:10]) if r.get("date") else None
+    except ValueError:
+        raise SlipError("BAD_DATE", "placed_ts/date must be ISO-8601")
+
+    market = str(r.get("market") or "").strip()
+    if not market:
+        raise SlipError("MISSING_MARKET", "no market/prop type")
+    side_raw = str(r.get("side") or "").strip()
+    side = _SIDES.get(side_raw.lower())
+    try:
+        line = _line_key(r["line"]) if r.get("line") is not None else None
+    except ValueError:
+        raise SlipError("BAD_LINE", f"line is not a number: {r.get('line')!r}")
+
+    player = str(r.get("player") or "").strip() or None
+    if player:
+        scope = "props"
+        market = _canon_prop(market)
+        if side not in ("over", "under") or line is None:
+            raise SlipError("BAD_SELECTION", "player props need an over/under side and a line")
+    else:
+        scope = "odds"
+        market_key = _ODDS_MARKETS.get(market.lower().replace(" ", "_"))
+        if market_key is None:
+            raise SlipError("UNKNOWN_MARKET", f"unknown market: {market}")
+        market = market_key
+        if market == "total" and side not in ("over", "under"):
+            raise SlipError("BAD_SELECTION", "totals need an over/under side")
+        if market != "total" and side not in ("home", "away"):
+            side = None  # a team name; resolved against the game
+            if not side_raw:
+                raise SlipError("BAD_SELECTION", "no selection")
+        if market == "moneyline":
+            line = None
+        elif line is None:
+            raise SlipError("BAD_SELECTION", f"{market} bets need a line")
+
+    slip = {
+        "scope": scope,
+        "book": book,
+        "stake": stake,
+        "price": round(price, 4),
+        "placed_ts": placed,
+        "game": str(r["game"]) if r.get("game") else None,
+        "date": game_date,
+        "home_team": str(r.get("home_team") or "").strip().lower() or None,
+        "away_team": str(r.get("away_team") or "").strip().lower() or None,
+        "player": player,
+        "market": market,
+        "side": side,
+        "side_raw": side_raw.lower(),
+        "line": line,
+    }
+    if r.get("ref"):
+        slip["ref"] = str(r["ref"])[:64]
+    else:
+        # no slip id: a hash of the selection keeps re-imports idempotent
+        basis = "|".join(str(slip[k]) for k in ("book", "placed_ts", "game", "date", "player", "market", "side_raw", "line", "price", "stake"))
+        slip["ref"] = "h:" + hashlib.sha1(basis.encode("utf-8")).hexdigest()[:40]
+    return slip
+
+
+class _Series:
+    """Snapshot ids for one market key, sorted by collected_ts."""
+
+    __slots__ = ("ts", "ids")
+
+    def __init__(self) -> None:
+        self.ts: List[datetime.datetime] = []
+        self.ids: List[int] = []
+
+    def pick(self, placed: Optional[datetime.datetime]) -> int:
+        """Latest snapshot at or before the bet; the first one if it predates every capture."""
+        if placed is None:
+            return self.ids[-1]
+        i = bisect_right(self.ts, placed)
+        return self.ids[i - 1] if i else self.ids[0]
+
+
+def _build_series(rows: Iterable[Tuple[Any, ...]]) -> Dict[Tuple, _Series]:
+    # rows: (key, collected_ts, id)
+    staged: Dict[Tuple, List[Tuple[datetime.datetime, int]]] = {}
+    for key, ts, mid in rows:
+        staged.setdefault(key, []).append((ts, mid))
+    out: Dict[Tuple, _Series] = {}
+    for key, pts in staged.items():
+        pts.sort()
+        s = _Series()
+        s.ts = [t for t, _ in pts]
+        s.ids = [m for _, m in pts]
+        out[key] = s
+    return out
+
+
+class _BatchLookups:
+    """Every dimension and market a batch of slips can link to, loaded with a few IN queries."""
+
+    def __init__(self, session, slips: List[Dict[str, Any]]) -> None:
+        self.session = session
+        self.books = self._books({s["book"] for s in slips})
+        self.players = self._players({s["player"] for s in slips if s["player"]})
+        self.games: Dict[int, Tuple[str, str]] = {}  # id -> (home name, away name), lower-cased
+        self.by_external: Dict[str, int] = {}
+        self.by_teams: Dict[Tuple[datetime.date, str, str], int] = {}
+        self._games({s["game"] for s in slips if s["game"]}, {s["date"] for s in slips if s["date"]})
+        self.props_games = self._props_games(slips)
+
+        game_ids = sorted(set(self.games) | {g for gs in self.props_games.values() for g in gs})
+        self.props = self._props_index(game_ids, sorted(set(self.players.values())))
+        self.odds = self._odds_index(game_ids)
+        self.existing_refs = self._existing_refs(sorted(set(self.books.values())))
+
+    def _books(self, codes: Set[str]) -> Dict[str, int]:
+        found = {c: i for i, c in self.session.execute(select(Book.id, Book.code).where(Book.code.in_(sorted(codes))))}
+        for code in sorted(codes - set(found)):
+            book = Book(code=code, name=code, is_aussie=False, sharp_flag=False)
+            self.session.add(book)
+            self.session.flush()
+            found[code] = book.id
+        return found
+
+    def _players(self, names: Set[str]) -> Dict[str, int]:
+        out: Dict[str, int] = {}
+        for chunk in _chunks(sorted(names)):
+            for pid, name in self.session.execute(select(Player.id, Player.full_name).where(Player.full_name.in_(chunk)).order_by(Player.id)):
+                out.setdefault(name, pid)
+        return out
+
+    def _games(self, externals: Set[str], dates: Set[datetime.date]) -> None:
+        home, away = aliased(Team), aliased(Team)
+        base = select(Game.id, Game.external_id, Game.game_date, home.name, away.name).join(home, home.id == Game.home_team_id).join(away, away.id == Game.away_team_id)
+        rows: List[Tuple[Any, ...]] = []
+        for chunk in _chunks(sorted(externals)):
+            rows.extend(self.session.execute(base.where(Game.external_id.in_(chunk))).all())
+        for chunk in _chunks(sorted(dates)):
+            rows.extend(self.session.execute(base.where(Game.game_date.in_(chunk))).all())
+        for gid, ext, gdate, hn, an in rows:
+            hn, an = (hn or "").lower(), (an or "").lower()
+            self.games[gid] = (hn, an)
+            if ext:
+                self.by_external[ext] = gid
+            self.by_teams.setdefault((gdate, hn, an), gid)
+
+    def _props_games(self, slips: List[Dict[str, Any]]) -> Dict[Tuple[int, datetime.date], Set[int]]:
+        # props slips with only player + date: the games that player had props for that day
+        wanted = [s for s in slips if s["scope"] == "props" and not s["game"] and not (s["home_team"] and s["away_team"])]
+        pids = sorted({self.players[s["player"]] for s in wanted if s["player"] in self.players})
+        dates = sorted({s["date"] or (s["placed_ts"].date() if s["placed_ts"] else None) for s in wanted} - {None})
+        out: Dict[Tuple[int, datetime.date], Set[int]] = {}
+        if not pids or not dates:
+            return out
+        for chunk in _chunks(pids):
+            q = (
+                select(PropsMarket.player_id, Game.game_date, Game.id)
+                .join(Game, Game.id == PropsMarket.game_id)
+                .where(PropsMarket.player_id.in_(chunk), Game.game_date.in_(dates))
+                .distinct()
+            )
+            for pid, gdate, gid in self.session.execute(q):
+                out.setdefault((pid, gdate), set()).add(gid)
+        return out
+
+    def _props_index(self, game_ids: List[int], player_ids: List[int]) -> Dict[Tuple, _Series]:
+        if not game_ids or not player_ids:
+            return {}
+        canon: Dict[str, str] = {}
+        rows = []
+        for chunk in _chunks(game_ids):
+            q = select(
+                PropsMarket.game_id, PropsMarket.player_id, PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line, PropsMarket.collected_ts, PropsMarket.id
+            ).where(PropsMarket.game_id.in_(chunk), PropsMarket.player_id.in_(player_ids))
+            for gid, pid, bid, pt, side, line, ts, mid in self.session.execute(q):
+                if pt not in canon:
+                    canon[pt] = _canon_prop(pt)
+                rows.append(((gid, pid, bid, canon[pt], side or "over", _line_key(line)), ts, mid))
+        return _build_series(rows)
+
+    def _odds_index(self, game_ids: List[int]) -> Dict[Tuple, _Series]:
+        rows = []
+        for chunk in _chunks(game_ids):
+            q = select(
+                OddsMarket.game_id, OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line, OddsMarket.collected_ts, OddsMarket.id
+            ).where(OddsMarket.game_id.in_(chunk))
+            for gid, bid, mt, oc, line, ts, mid in self.session.execute(q):
+                rows.append(((gid, bid, mt, oc, _line_key(line)), ts, mid))
+        return _build_series(rows)
+
+    def _existing_refs(self, book_ids: List[int]) -> Set[Tuple[int, str]]:
+        if not book_ids:
+            return set()
+        q = select(Bet.book_id, Bet.external_ref).where(Bet.book_id.in_(book_ids), Bet.external_ref.is_not(None))
+        return {(b, r) for b, r in self.session.execute(q)}
+
+    # ---- resolution ----
+    def game_for(self, slip: Dict[str, Any]) -> int:
+        if slip["game"]:
+            gid = self.by_external.get(slip["game"])
+            if gid is None:
+                raise SlipError("GAME_NOT_FOUND", f"no game with external id {slip['game']}")
+            return gid
+        if slip["date"] and slip["home_team"] and slip["away_team"]:
+            gid = self.by_teams.get((slip["date"], slip["home_team"], slip["away_team"]))
+            if gid is None:
+                raise SlipError("GAME_NOT_FOUND", f"no game {slip['away_team']} @ {slip['home_team']} on {slip['date']}")
+            return gid
+        day = slip["date"] or (slip["placed_ts"].date() if slip["placed_ts"] else None)
+        if slip["scope"] == "props" and day and slip["player"] in self.players:
+            gids = self.props_games.get((self.players[slip["player"]], day)) or set()
+            if len(gids) == 1:
+                return next(iter(gids))
+            if len(gids) > 1:
+                raise SlipError("GAME_AMBIGUOUS", f"{slip['player']} has props in {len(gids)} games on {day}")
+        raise SlipError("GAME_NOT_FOUND", "slip names no game (external id, or date + home/away teams)")
+
+    def market_for(self, slip: Dict[str, Any], game_id: int, book_id: int) -> Tuple[Optional[int], Optional[int]]:
+        """(props_market_id, odds_market_id) of the snapshot the bet was taken at."""
+        if slip["scope"] == "props":
+            pid = self.players.get(slip["player"])
+            if pid is None:
+                raise SlipError("PLAYER_NOT_FOUND", f"unknown player: {slip['player']}")
+            series = self.props.get((game_id, pid, book_id, slip["market"], slip["side"], slip["line"]))
+            if series is None:
+                raise SlipError("MARKET_NOT_FOUND", f"no {slip['market']} {slip['side']} {slip['line']} quote for {slip['player']} at this book")
+            return series.pick(slip["placed_ts"]), None
+
+        side = slip["side"]
+        if side is None:
+            home, away = self.games.get(game_id, ("", ""))
+            side = "home" if slip["side_raw"] == home else "away" if slip["side_raw"] == away else None
+            if side is None:
+                raise SlipError("BAD_SELECTION", f"selection {slip['side_raw']!r} is neither team")
+        series = self.odds.get((game_id, book_id, slip["market"], side, slip["line"]))
+        if series is None:
+            raise SlipError("MARKET_NOT_FOUND", f"no {slip['market']} {side} {slip['line']} quote at this book")
+        return None, series.pick(slip["placed_ts"])
+
+
+@instrument.instrumented("ingest.bets")
+def import_bets(raw_rows: List[Dict[str, Any]], default_book: Optional[str] = None, source: str = "slip_import", batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Import bet-slip rows into bets, linked to the props/odds snapshot each bet was taken at.
+
+    Rows are deduplicated on (book, slip ref); without a ref column a hash of the
+    selection stands in, so re-importing an export is a no-op. Rows that cannot be
+    linked to a captured market are reported under "errors" with a reason_code and
+    not imported.
+    """
+    session = get_session()
+    imported = skipped = linked_props = linked_odds = 0
+    errors: List[Dict[str, Any]] = []
+    reason_counts: Dict[str, int] = {}
+
+    def _fail(n: int, e: SlipError) -> None:
+        reason_counts[e.reason_code] = reason_counts.get(e.reason_code, 0) + 1
+        if len(errors) < MAX_ERRORS_REPORTED:
+            errors.append({"row": n, "error": str(e), "reason_code": e.reason_code})
+
+    parsed: List[Tuple[int, Dict[str, Any]]] = []
+    for n, raw in enumerate(raw_rows, start=1):
+        try:
+            parsed.append((n, parse_slip(raw, default_book)))
+        except SlipError as e:
+            _fail(n, e)
+
+    now = datetime.datetime.utcnow()
+    for start in range(0, len(parsed), batch_size):
+        batch = parsed[start : start + batch_size]
+        with instrument.span("ingest.bets.lookups"):
+            lk = _BatchLookups(session, [s for _, s in batch])
+        new_rows: List[Dict[str, Any]] = []
+        for n, slip in batch:
+            book_id = lk.books[slip["book"]]
+            if (book_id, slip["ref"]) in lk.existing_refs:
+                skipped += 1
+                continue
+            try:
+                game_id = lk.game_for(slip)
+                props_id, odds_id = lk.market_for(slip, game_id, book_id)
+            except SlipError as e:
+                _fail(n, e)
+                continue
+            lk.existing_refs.add((book_id, slip["ref"]))
+            linked_props += props_id is not None
+            linked_odds += odds_id is not None
+            new_rows.append(
+                {
+                    "placed_ts": slip["placed_ts"] or now,
+                    "game_id": game_id,
+                    "props_market_id": props_id,
+                    "odds_market_id": odds_id,
+                    "book_id": book_id,
+                    "stake": slip["stake"],
+                    "price": slip["price"],
+                    "external_ref": slip["ref"],
+                    "source": source,
+                }
+            )
+        if new_rows:
+            session.execute(insert(Bet), new_rows)
+            imported += len(new_rows)
+        with instrument.span("ingest.bets.commit"):
+            session.commit()
+    session.close()
+    instrument.count("bets.imported", imported)
+
+    return {
+        "rows": len(raw_rows),
+        "imported": imported,
+        "skipped_duplicates": skipped,
+        "linked_props": linked_props,
+        "linked_odds": linked_odds,
+        "rejected": sum(reason_counts.values()),
+        "reason_codes": reason_counts,
+        "errors": errors,
+    }
+
+
+def import_bet_slips(path: str, fmt: Optional[str] = None, default_book: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        rows = read_bet_slips(path, fmt)
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": str(e), "reason_code": "BAD_FILE", "path": path}
+    summary = import_bets(rows, default_book=default_book, source=f"slip:{Path(path).name}"[:64])
+    summary["path"] = path
+    return summary
@@ -0,0 +1,262 @@
+﻿from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from btb.core import instrument
+
+# (scope, game_id, player_id, book, market): scope is "odds", "props" or "stats";
+# player_id is None for main markets, book and market are None for stats rows
+ChangeKey = Tuple[str, int, Optional[int], Optional[str], Optional[str]]
+
+# maps a change to the key a subscriber recomputes by (None = not its concern)
+Projection = Callable[[ChangeKey], Optional[Hashable]]
+# recomputes the given keys; the return value is kept as the subscriber's last result.
+# A dict result with an int "recomputed" reports the work done when it is not one
+# unit per key (e.g. a game key that fans out to its players).
+Handler = Callable[[Set[Hashable]], Any]
+
+DEBOUNCE_S = 0.5
+MAX_WAIT_S = 5.0
+# consecutive failed runs whose keys are queued again before they are dropped
+MAX_RETRIES = 3
+
+
+class Subscription:
+    """
+    One consumer of change events: pending keys since its last run plus the
+    counters behind the work-avoided metric. full_size() gives the number of keys a
+    full rebuild would recompute at that moment.
+    """
+
+    __slots__ = (
+        "name", "handler", "project", "full_size", "pending", "first_ts", "last_ts",
+        "events", "runs", "keys", "full_keys", "failures", "retries", "dropped", "last_result",
+    )
+
+    def __init__(self, name: str, handler: Handler, project: Optional[Projection] = None, full_size: Optional[Callable[[], int]] = None) -> None:
+        self.name = name
+        self.handler = handler
+        self.project = project
+        self.full_size = full_size
+        self.pending: Set[Hashable] = set()
+        self.first_ts = 0.0
+        self.last_ts = 0.0
+        self.events = 0
+        self.runs = 0
+        self.keys = 0
+        self.full_keys = 0
+        self.failures = 0
+        self.retries = 0  # consecutive failed runs whose keys were queued again
+        self.dropped = 0
+        self.last_result: Any = None
+
+    def offer(self, changes: Iterable[ChangeKey], now: float) -> int:
+        keys = [k for k in map(self.project, changes) if k is not None] if self.project else list(changes)
+        if not keys:
+            return 0
+        if not self.pending:
+            self.first_ts = now
+        self.last_ts = now
+        self.pending.update(keys)
+        self.events += len(keys)
+        return len(keys)
+
+    def requeue(self, keys: Set[Hashable], now: float, max_retries: int) -> bool:
+        """Queue the keys of a failed run again (they are still stale); False once max_retries is used up."""
+        if self.retries >= max_retries:
+            self.retries = 0
+            self.dropped += len(keys)
+            return False
+        self.retries += 1
+        if not self.pending:
+            self.first_ts = now
+        self.last_ts = now
+        self.pending.update(keys)
+        return True
+
+    def due_at(self, debounce_s: float, max_wait_s: float) -> float:
+        """When the pending burst is flushed: quiet for debounce_s, or max_wait_s after it began."""
+        return min(self.last_ts + debounce_s, self.first_ts + max_wait_s)
+
+    def run(self, keys: Set[Hashable]) -> Any:
+        full = self.full_size() if self.full_size is not None else None
+        try:
+            with instrument.span(f"recompute.{self.name}", keys=len(keys)):
+                result = self.handler(keys)
+        except Exception as e:
+            # a failed recompute must not break ingest or the other subscribers (degraded mode)
+            self.failures += 1
+            result = {"ok": False, "error": str(e), "reason_code": "RECOMPUTE_FAILED"}
+        done = result.get("recomputed") if isinstance(result, dict) else None
+        done = done if isinstance(done, int) else len(keys)
+        self.runs += 1
+        self.keys += done
+        instrument.count(f"recompute.{self.name}.keys", done)
+        if full is not None:
+            self.full_keys += full
+            instrument.count(f"recompute.{self.name}.avoided", max(full - done, 0))
+        self.last_result = result
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "events": self.events,
+            "runs": self.runs,
+            "keys_recomputed": self.keys,
+            "pending": len(self.pending),
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+        if self.full_size is not None:
+            avoided = max(self.full_keys - self.keys, 0)
+            out["full_rebuild_keys"] = self.full_keys
+            out["work_avoided"] = avoided
+            out["work_avoided_pct"] = round(100.0 * avoided / self.full_keys, 1) if self.full_keys else None
+        return out
+
+
+class ChangeBus:
+    """
+    In-process bus for "changed" events from the normalizers.
+
+    Each subscription collects the keys it cares about and runs once per burst: a
+    burst ends after debounce_s without new changes for it, or max_wait_s after it
+    began under a steady stream. With auto=True a timer thread does the flushing;
+    otherwise call flush() (flush(force=True) drains everything). debounce_s=0 runs
+    subscribers synchronously inside publish(). The keys of a failed run (e.g. the
+    database was locked) go back to pending, up to max_retries runs in a row.
+    """
+
+    def __init__(
+        self,
+        debounce_s: float = DEBOUNCE_S,
+        max_wait_s: float = MAX_WAIT_S,
+        auto: bool = True,
+        clock: Callable[[], float] = time.monotonic,
+        max_retries: int = MAX_RETRIES,
+    ) -> None:
+        self.debounce_s = debounce_s
+        self.max_wait_s = max_wait_s
+        self.auto = auto
+        self.max_retries = max_retries
+        self.clock = clock
+        self._subs: Dict[str, Subscription] = {}
+        self._lock = threading.Lock()
+        # subscribers run one at a time, whichever thread flushes
+        self._run_lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def subscribe(self, name: str, handler: Handler, project: Optional[Projection] = None, full_size: Optional[Callable[[], int]] = None) -> Subscription:
+        sub = Subscription(name, handler, project, full_size)
+        with self._lock:
+            self._subs[name] = sub
+        return sub
+
+    def unsubscribe(self, name: str) -> None:
+        with self._lock:
+            self._subs.pop(name, None)
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subs)
+
+    def subscribed(self, name: str) -> bool:
+        return name in self._subs
+
+    @instrument.timed("change_bus.publish")
+    def publish(self, changes: Iterable[ChangeKey]) -> int:
+        """Queue changes for every subscription. Returns the number of subscriber failures when run synchronously."""
+        changes = list(changes)
+        if not changes or not self._subs:
+            return 0
+        with self._lock:
+            now = self.clock()
+            for sub in self._subs.values():
+                sub.offer(changes, now)
+        if self.debounce_s <= 0:
+            return sum(1 for r in self.flush().values() if isinstance(r, dict) and r.get("reason_code") == "RECOMPUTE_FAILED")
+        if self.auto:
+            self._schedule()
+        return 0
+
+    def flush(self, force: bool = False) -> Dict[str, Any]:
+        """Run every subscription whose burst is over (all pending ones with force). Returns results by name."""
+        with self._lock:
+            now = self.clock()
+            due: List[Tuple[Subscription, Set[Hashable]]] = []
+            for sub in self._subs.values():
+                if sub.pending and (force or sub.due_at(self.debounce_s, self.max_wait_s) <= now):
+                    due.append((sub, sub.pending))
+                    sub.pending = set()
+        results: Dict[str, Any] = {}
+        requeued = False
+        with self._run_lock:
+            for sub, keys in due:
+                result = results[sub.name] = sub.run(keys)
+                if not (isinstance(result, dict) and result.get("reason_code") == "RECOMPUTE_FAILED"):
+                    sub.retries = 0
+                    continue
+                with self._lock:
+                    requeued = sub.requeue(keys, self.clock(), self.max_retries) or requeued
+        if requeued and self.auto and self.debounce_s > 0:
+            self._schedule()
+        return results
+
+    def next_due(self) -> Optional[float]:
+        with self._lock:
+            times = [s.due_at(self.debounce_s, self.max_wait_s) for s in self._subs.values() if s.pending]
+        return min(times) if times else None
+
+    def _schedule(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.debounce_s, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self) -> None:
+        self.flush()
+        due = self.next_due()
+        with self._lock:
+            self._timer = None
+            if due is None:
+                return
+            # changes arrived during the wait: sleep until the new burst is quiet
+            self._timer = threading.Timer(max(due - self.clock(), 0.0), self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: sub.stats() for name, sub in self._subs.items()}
+
+
+_bus = ChangeBus()
+
+
+def get_bus() -> ChangeBus:
+    return _bus
+
+
+def has_subscribers() -> bool:
+    # normalizers check this before building change keys, so an idle bus costs nothing
+    return _bus.has_subscribers()
+
+
+def publish(changes: Iterable[ChangeKey]) -> int:
+    return _bus.publish(changes)
+
+
+def odds_changes(rows: Iterable[Tuple[Any, str]]) -> Set[ChangeKey]:
+    """Change keys for (OddsMarket, book code) rows; reads only attributes set at construction."""
+    return {("odds", r.game_id, None, code, r.market_type) for r, code in rows}
+
+
+def props_changes(rows: Iterable[Tuple[Any, str]]) -> Set[ChangeKey]:
+    return {("props", r.game_id, r.player_id, code, r.prop_type) for r, code in rows}
+
+
+def stats_changes(rows: Iterable[Any]) -> Set[ChangeKey]:
+    return {("stats", r.game_id, r.player_id, None, None) for r in rows}
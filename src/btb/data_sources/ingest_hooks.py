@@ -0,0 +1,106 @@
+﻿from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from btb.core import instrument
+
+# listener(scope, rows): scope is "odds" or "props"; rows are plain dicts of the
+# snapshot rows a normalizer just committed (ids, book code, line, price, collected_ts)
+SnapshotListener = Callable[[str, List[Dict[str, Any]]], None]
+
+_listeners: List[SnapshotListener] = []
+
+# refresher(changes) -> entry for the ingest summary (None = nothing to report).
+# Derived research tables (fair prices, matchup splits, roster spells) register
+# these when btb.research is imported, so ingest never imports the research layer.
+# changes are change_bus keys: (scope, game_id, player_id, book, market).
+Refresher = Callable[[Iterable[Tuple[Any, ...]]], Any]
+
+_refreshers: Dict[str, Refresher] = {}
+
+
+def add_listener(fn: SnapshotListener) -> None:
+    if fn not in _listeners:
+        _listeners.append(fn)
+
+
+def remove_listener(fn: SnapshotListener) -> None:
+    if fn in _listeners:
+        _listeners.remove(fn)
+
+
+def has_listeners() -> bool:
+    # normalizers check this before building row dicts, so idle hooks cost nothing
+    return bool(_listeners)
+
+
+@instrument.timed("ingest.publish")
+def publish(scope: str, rows: List[Dict[str, Any]]) -> int:
+    """Deliver a committed snapshot batch to every listener. Returns the number of listener failures."""
+    failures = 0
+    if not rows:
+        return failures
+    for fn in list(_listeners):
+        try:
+            fn(scope, rows)
+        except Exception:
+            # a broken consumer must not fail the ingest (degraded mode)
+            failures += 1
+    return failures
+
+
+def add_refresher(name: str, fn: Refresher) -> None:
+    _refreshers[name] = fn
+
+
+def remove_refresher(name: str) -> None:
+    _refreshers.pop(name, None)
+
+
+def refresh(name: str, changes: Iterable[Tuple[Any, ...]] = ()) -> Optional[Any]:
+    """Run one registered refresher; None when none is registered or it had nothing to do."""
+    fn = _refreshers.get(name)
+    if fn is None:
+        return None
+    try:
+        with instrument.span(f"ingest.refresh.{name}"):
+            return fn(changes)
+    except Exception as e:
+        # the rows are committed; a failed derived refresh is reported, not raised (degraded mode)
+        return {"ok": False, "error": str(e), "reason_code": "REFRESH_FAILED"}
+
+
+def with_refresh(name: str, summary: Dict[str, Any], changes: Iterable[Tuple[Any, ...]] = ()) -> Dict[str, Any]:
+    """Run a refresher and add its result to an ingest summary under its name."""
+    result = refresh(name, changes)
+    if result is not None:
+        summary[name] = result
+    return summary
+
+
+def odds_row_dict(row, book_code: str) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "game_id": row.game_id,
+        "book": book_code,
+        "market_type": row.market_type,
+        "player_id": None,
+        "outcome": row.outcome,
+        "line": float(row.line) if row.line is not None else None,
+        "price": float(row.price),
+        "collected_ts": row.collected_ts,
+    }
+
+
+def props_row_dict(row, book_code: str) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "game_id": row.game_id,
+        "book": book_code,
+        "market_type": row.prop_type,
+        "player_id": row.player_id,
+        "outcome": row.side or "over",
+        "line": float(row.line),
+        "price": float(row.price),
+        "collected_ts": row.collected_ts,
+    }
@@ -0,0 +1,140 @@
+﻿from __future__ import annotations
+
+import csv
+import datetime
+import json
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+
+from btb.core import instrument
+from btb.db import limits_index
+from btb.db.connection import get_session
+from btb.db.schema import Book, LimitsSnapshot
+
+_COLUMN_TO_FIELD = {
+    "book": "book", "bookmaker": "book",
+    "scope": "scope", "market_scope": "scope", "market": "scope",
+    "limit": "amount", "limit_amount": "amount", "max_stake": "amount", "amount": "amount",
+    "effective_ts": "ts", "observed_ts": "ts", "ts": "ts", "timestamp": "ts",
+}
+MAX_ERRORS_REPORTED = 50
+
+
+def read_limit_observations(path: str, fmt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """CSV with a header row, or JSON (a list or {"limits": [...]})."""
+    p = Path(path)
+    fmt = (fmt or p.suffix.lstrip(".") or "csv").lower()
+    if fmt == "csv":
+        with p.open(newline="", encoding="utf-8-sig") as fh:
+            return [dict(r) for r in csv.DictReader(fh)]
+    if fmt == "json":
+        data = json.loads(p.read_text(encoding="utf-8-sig"))
+        if isinstance(data, dict):
+            data = data.get("limits") or []
+        if not isinstance(data, list):
+            raise ValueError("limits JSON must be a list or an object with a 'limits' list")
+        return [r for r in data if isinstance(r, dict)]
+    raise ValueError(f"unsupported limits format: {fmt}")
+
+
+def _parse(raw: Dict[str, Any]) -> Tuple[str, str, float, datetime.datetime]:
+    r: Dict[str, Any] = {}
+    for k, v in raw.items():
+        field = _COLUMN_TO_FIELD.get(str(k).strip().lower().replace(" ", "_"))
+        if field and v not in (None, ""):
+            r.setdefault(field, v)
+    book = str(r.get("book") or "").strip().lower()
+    if not book:
+        raise ValueError("missing book")
+    amount = float(r["amount"])
+    if amount < 0:
+        raise ValueError("limit must be >= 0")
+    ts = datetime.datetime.fromisoformat(str(r["ts"]).strip().replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return book, limits_index.canon_scope(str(r.get("scope") or "")), amount, ts
+
+
+@instrument.instrumented("ingest.limits")
+def ingest_limit_observations(raw_rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Bulk-load limit observations into limits_snapshots.
+
+    Only changes are stored: an observation equal to the limit already in force at
+    its timestamp (from the table or earlier in the batch) is skipped, as is a
+    second observation for the same (book, scope, instant). Observations may
+    arrive out of order.
+    """
+    errors: List[Dict[str, Any]] = []
+    parsed: List[Tuple[str, str, float, datetime.datetime]] = []
+    for n, raw in enumerate(raw_rows, start=1):
+        try:
+            parsed.append(_parse(raw))
+        except (KeyError, ValueError) as e:
+            if len(errors) < MAX_ERRORS_REPORTED:
+                errors.append({"row": n, "error": str(e) or f"missing {e}", "reason_code": "BAD_ROW"})
+
+    session = get_session()
+    codes = sorted({p[0] for p in parsed})
+    book_ids = {c: i for i, c in session.execute(select(Book.id, Book.code).where(Book.code.in_(codes)))}
+    for code in codes:
+        if code not in book_ids:
+            b = Book(code=code, name=code, is_aussie=False, sharp_flag=False)
+            session.add(b)
+            session.flush()
+            book_ids[code] = b.id
+
+    # current histories of the touched books; extended as the batch is accepted
+    hist: Dict[limits_index.LimitKey, Tuple[List[datetime.datetime], List[float]]] = {}
+    if book_ids:
+        rows = session.execute(
+            select(LimitsSnapshot.book_id, LimitsSnapshot.market_scope, LimitsSnapshot.effective_ts, LimitsSnapshot.limit_amount)
+            .where(LimitsSnapshot.book_id.in_(sorted(book_ids.values())))
+        )
+        for key, s in limits_index.LimitsIndex.from_rows(rows).series.items():
+            hist[key] = (list(s.ts), list(s.amounts))
+
+    new_rows: List[Dict[str, Any]] = []
+    duplicates = unchanged = 0
+    for code, scope, amount, ts in sorted(parsed, key=lambda p: p[3]):
+        key = (book_ids[code], scope)
+        ts_list, amounts = hist.setdefault(key, ([], []))
+        i = bisect_left(ts_list, ts)
+        if i < len(ts_list) and ts_list[i] == ts:
+            duplicates += 1
+            continue
+        if i and amounts[i - 1] == amount:
+            unchanged += 1
+            continue
+        ts_list.insert(i, ts)
+        amounts.insert(i, amount)
+        new_rows.append({"book_id": key[0], "market_scope": scope, "limit_amount": amount, "effective_ts": ts})
+
+    if new_rows:
+        session.execute(insert(LimitsSnapshot), new_rows)
+    session.commit()
+    session.close()
+    limits_index.invalidate()
+    instrument.count("limits_snapshots.created", len(new_rows))
+
+    return {
+        "rows": len(raw_rows),
+        "created": len(new_rows),
+        "skipped_unchanged": unchanged,
+        "skipped_duplicates": duplicates,
+        "rejected": len(raw_rows) - len(parsed),
+        "errors": errors,
+    }
+
+
+def import_limits_file(path: str, fmt: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        rows = read_limit_observations(path, fmt)
+    except (OSError, ValueError) as e:
+        return {"ok": False, "error": str(e), "reason_code": "BAD_FILE", "path": path}
+    summary = ingest_limit_observations(rows)
+    summary["path"] = path
+    return summary
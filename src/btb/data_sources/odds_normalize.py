@@ -1,12 +1,23 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Optional
 
+from sqlalchemy import select
+
+from btb.core import instrument
+from btb.core.stat_expressions import get_registry
+from btb.data_sources import change_bus, ingest_hooks, schedule_context, validation
+from btb.db import game_calendar
 from btb.db.connection import get_session
-from btb.db.schema import Book, Game, League, OddsMarket, Season, Team
+from btb.db.keys import ladder_group_id
+from btb.db.schema import Book, Game, League, OddsMarket, Player, PropsMarket, RawProvider, Season, Team
+
+# suffix of the provider's alt-line prop market keys (player_points_alternate)
+ALT_SUFFIX = "_alternate"
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_team(session, name: str, abbr: Optional[str] = None, external_id: Optional[str] = None) -> Team:
     team = session.query(Team).filter(Team.name == name).first()
     if team:
@@ -17,26 +28,25 @@ def _get_or_create_team(session, name: str, abbr: Optional[str] = None, external
     return team
 
 
-def _get_or_create_league_season(session, league_code: str, year_start: int, year_end: int) -> tuple[League, Season]:
+@instrument.timed("ingest.dimension_lookup")
+def _get_or_create_league_season(session, cal: game_calendar.GameCalendar, league_code: str, year_start: int, year_end: int) -> tuple[League, Season]:
     league = session.query(League).filter(League.code == league_code).first()
     if not league:
         league = League(code=league_code, name=league_code)
         session.add(league)
         session.flush()
 
-    season = (
-        session.query(Season)
-        .filter(Season.league_id == league.id, Season.year_start == year_start, Season.year_end == year_end)
-        .first()
-    )
-    if not season:
-        season = Season(league_id=league.id, year_start=year_start, year_end=year_end)
-        session.add(season)
-        session.flush()
-
+    season_id = cal.season_id(league.id, year_start, year_end)
+    if season_id is not None:
+        return league, session.get(Season, season_id)
+    season = Season(league_id=league.id, year_start=year_start, year_end=year_end)
+    session.add(season)
+    session.flush()
+    cal.add_season(season)
     return league, season
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_book(session, code: str, name: str) -> Book:
     book = session.query(Book).filter(Book.code == code).first()
     if book:
@@ -47,6 +57,75 @@ def _get_or_create_book(session, code: str, name: str) -> Book:
     return book
 
 
+def _event_game(session, cal: game_calendar.GameCalendar, event: dict[str, Any], league_code: str) -> tuple[Optional[Game], bool, Optional[str]]:
+    """
+    (game, created, reason) for one API event: (None, False, None) without a
+    commence_time, (None, False, TEAMS_SWAPPED) when home/away contradict the
+    stored game.
+    """
+    commence = event.get("commence_time")
+    if not commence:
+        return None, False, None
+
+    commence_dt = datetime.fromisoformat(commence.replace("Z", "+00:00"))
+    year = commence_dt.year
+    year_start = year if commence_dt.month >= 10 else year - 1
+    year_end = year_start + 1
+
+    league, season = _get_or_create_league_season(session, cal, league_code, year_start, year_end)
+
+    home = _get_or_create_team(session, event.get("home_team") or "HOME")
+    away = _get_or_create_team(session, event.get("away_team") or "AWAY")
+
+    external_id = event.get("id")
+    if validation.teams_swapped(session, cal, external_id, commence_dt.date(), home.id, away.id):
+        return None, False, validation.TEAMS_SWAPPED
+    game_id = cal.game_id(external_id)
+    if game_id is not None:
+        return session.get(Game, game_id), False, None
+    game = Game(
+        external_id=external_id,
+        league_id=league.id,
+        season_id=season.id,
+        game_date=commence_dt.date(),
+        commence_ts=commence_dt.astimezone(timezone.utc).replace(tzinfo=None),
+        home_team_id=home.id,
+        away_team_id=away.id,
+        season_type="regular",
+    )
+    session.add(game)
+    session.flush()
+    cal.add_game(game)
+    return game, True, None
+
+
+def _event_header(event: dict[str, Any]) -> dict[str, Any]:
+    # what a quarantined event keeps: identity, not the whole market tree
+    return {"external_id": event.get("id"), "commence_time": event.get("commence_time"), "home_team": event.get("home_team"), "away_team": event.get("away_team")}
+
+
+def _main_outcome(mkey: Optional[str], outcome: dict[str, Any], home_name: str, away_name: str) -> Optional[tuple[str, str, Any]]:
+    """(market_type, outcome, line) for an h2h/spreads/totals outcome; None for anything else."""
+    out_name = outcome.get("name")
+    if mkey in ("h2h", "spreads"):
+        if out_name == home_name:
+            outcome_code = "home"
+        elif out_name == away_name:
+            outcome_code = "away"
+        else:
+            return None
+        if mkey == "h2h":
+            return "moneyline", outcome_code, None
+        return "spread", outcome_code, outcome.get("point")
+    if mkey == "totals":
+        out_name = str(out_name or "").lower()
+        if out_name not in ("over", "under"):
+            return None
+        return "total", out_name, outcome.get("point")
+    return None
+
+
+@instrument.instrumented("ingest.odds")
 def normalize_the_odds_api_odds(payload: list[dict[str, Any]], league_code: str = "NBA") -> dict[str, Any]:
     """
     Normalize The Odds API odds payload into:
@@ -56,45 +135,28 @@ def normalize_the_odds_api_odds(payload: list[dict[str, Any]], league_code: str
     - odds_markets
     """
     session = get_session()
+    last_game_id = schedule_context.latest_game_id(session)
+    cal = game_calendar.get_calendar(session)
+    # one timestamp per collection, so a book's latest snapshot is the rows at its max collected_ts
+    collected_ts = datetime.utcnow()
 
     games_created = 0
-    markets_created = 0
     books_seen: set[str] = set()
+    pending: list[tuple[OddsMarket, str]] = []
+    quoted: set[tuple[Any, ...]] = set()
+    swapped: list[tuple[dict[str, Any], str]] = []
+    external_ids: dict[int, Optional[str]] = {}
 
     for event in payload:
-        commence = event.get("commence_time")
-        if not commence:
+        game, created, reason = _event_game(session, cal, event, league_code)
+        if reason:
+            swapped.append((_event_header(event), reason))
+        if game is None:
             continue
-
-        commence_dt = datetime.fromisoformat(commence.replace("Z", "+00:00"))
-        year = commence_dt.year
-        year_start = year if commence_dt.month >= 10 else year - 1
-        year_end = year_start + 1
-
-        league, season = _get_or_create_league_season(session, league_code, year_start, year_end)
-
+        external_ids[game.id] = game.external_id
+        games_created += int(created)
         home_name = event.get("home_team") or "HOME"
         away_name = event.get("away_team") or "AWAY"
-        home = _get_or_create_team(session, home_name)
-        away = _get_or_create_team(session, away_name)
-
-        game_date = commence_dt.date()
-        external_id = event.get("id")
-
-        game = session.query(Game).filter(Game.external_id == external_id).first() if external_id else None
-        if not game:
-            game = Game(
-                external_id=external_id,
-                league_id=league.id,
-                season_id=season.id,
-                game_date=game_date,
-                home_team_id=home.id,
-                away_team_id=away.id,
-                season_type="regular",
-            )
-            session.add(game)
-            session.flush()
-            games_created += 1
 
         for bookmaker in event.get("bookmakers", []) or []:
             book_key = bookmaker.get("key") or bookmaker.get("title") or "unknown"
@@ -106,45 +168,15 @@ def normalize_the_odds_api_odds(payload: list[dict[str, Any]], league_code: str
                 mkey = market.get("key")  # h2h / spreads / totals
 
                 for outcome in market.get("outcomes", []) or []:
-                    if mkey == "h2h":
-                        market_type = "moneyline"
-                        out_name = outcome.get("name")
-                        if out_name == home_name:
-                            outcome_code = "home"
-                        elif out_name == away_name:
-                            outcome_code = "away"
-                        else:
-                            continue
-                        line = None
-
-                    elif mkey == "spreads":
-                        market_type = "spread"
-                        out_name = outcome.get("name")
-                        if out_name == home_name:
-                            outcome_code = "home"
-                        elif out_name == away_name:
-                            outcome_code = "away"
-                        else:
-                            continue
-                        line = outcome.get("point")
-
-                    elif mkey == "totals":
-                        market_type = "total"
-                        out_name = str(outcome.get("name") or "").lower()
-                        if out_name == "over":
-                            outcome_code = "over"
-                        elif out_name == "under":
-                            outcome_code = "under"
-                        else:
-                            continue
-                        line = outcome.get("point")
-
-                    else:
+                    main = _main_outcome(mkey, outcome, home_name, away_name)
+                    if main is None:
                         continue
+                    market_type, outcome_code, line = main
 
                     price = outcome.get("price")
-                    if price is None:
+                    if price is None or (game.id, book.id, market_type, outcome_code, line) in quoted:
                         continue
+                    quoted.add((game.id, book.id, market_type, outcome_code, line))
 
                     row = OddsMarket(
                         game_id=game.id,
@@ -154,14 +186,220 @@ def normalize_the_odds_api_odds(payload: list[dict[str, Any]], league_code: str
                         line=line,
                         price=float(price),
                         source="the_odds_api",
+                        collected_ts=collected_ts,
                     )
-                    session.add(row)
-                    markets_created += 1
+                    pending.append((row, book.code))
 
-    session.commit()
+    verdicts = validation.validate_odds(session, [r for r, _ in pending])
+    accepted = [p for p, v in zip(pending, verdicts) if v is None]
+    quarantined = validation.quarantine(session, "odds", [(r, v) for (r, _), v in zip(pending, verdicts) if v is not None], external_ids)
+    validation.merge_counts(quarantined, validation.quarantine(session, "odds", swapped))
+    session.add_all([r for r, _ in accepted])
+    markets_created = len(accepted)
+
+    changes = change_bus.odds_changes(accepted) if change_bus.has_subscribers() else set()
+    published: list[dict[str, Any]] = []
+    with instrument.span("ingest.odds.commit"):
+        if accepted and ingest_hooks.has_listeners():
+            session.flush()
+            published = [ingest_hooks.odds_row_dict(r, code) for r, code in accepted]
+        session.commit()
+    instrument.count("odds_markets.created", markets_created)
+    instrument.count("games.created", games_created)
 
-    return {
+    summary: dict[str, Any] = {
         "games_created": games_created,
         "markets_created": markets_created,
         "books_seen": sorted(list(books_seen)),
     }
+    if quarantined:
+        summary["quarantined"] = validation.summarize(quarantined)
+    session.close()
+    ctx = schedule_context.derive_for_new_games(last_game_id)
+    if ctx:
+        summary["schedule_context"] = ctx
+    listener_errors = ingest_hooks.publish("odds", published) + change_bus.publish(changes)
+    if listener_errors:
+        summary["listener_errors"] = listener_errors
+    return summary
+
+
+def prop_type_for_market(market_key: str) -> str:
+    """
+    player_points -> points; player_points_alternate (the alt lines) -> points too.
+    Unknown player_* keys keep the key minus the prefix and the _alternate suffix.
+    """
+    base = market_key[: -len(ALT_SUFFIX)] if market_key.endswith(ALT_SUFFIX) else market_key
+    compiled = get_registry().resolve(market_key) or get_registry().resolve(base)
+    if compiled is not None:
+        return compiled.name
+    return base[len("player_"):] if base.startswith("player_") else base
+
+
+def _players_by_name(session, names: set[str]) -> dict[str, Player]:
+    found: dict[str, Player] = {}
+    ordered = sorted(names)
+    for i in range(0, len(ordered), 500):
+        for p in session.execute(select(Player).where(Player.full_name.in_(ordered[i : i + 500]))).scalars():
+            found.setdefault(p.full_name, p)
+    for name in ordered:
+        if name not in found:
+            p = Player(full_name=name, external_id=None, position=None, team_id=None)
+            session.add(p)
+            found[name] = p
+    session.flush()
+    return found
+
+
+def _existing_prop_quotes(session, game_ids: list[int]) -> set[tuple[Any, ...]]:
+    keys: set[tuple[Any, ...]] = set()
+    for i in range(0, len(game_ids), 500):
+        q = select(
+            PropsMarket.game_id, PropsMarket.player_id, PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line, PropsMarket.price
+        ).where(PropsMarket.game_id.in_(game_ids[i : i + 500]))
+        keys.update((g, p, b, t, s, float(ln), float(px)) for g, p, b, t, s, ln, px in session.execute(q))
+    return keys
+
+
+@instrument.instrumented("ingest.event_odds")
+def normalize_the_odds_api_event_odds(
+    events: list[dict[str, Any]],
+    league_code: str = "NBA",
+    raw_payloads: Optional[list[str]] = None,
+) -> dict[str, Any]:
+    """
+    Normalize event-odds responses carrying main and player-prop markets in one pass.
+
+    h2h/spreads/totals outcomes go to odds_markets as in normalize_the_odds_api_odds;
+    player_* outcomes (name Over/Under, description = player, point = line) go to
+    props_markets grouped into alt-line ladders, skipping quotes already stored
+    with the same line and price.
+    raw_payloads, if given, are stored in raw_provider in the same commit.
+    """
+    session = get_session()
+    last_game_id = schedule_context.latest_game_id(session)
+    cal = game_calendar.get_calendar(session)
+    collected_ts = datetime.utcnow()
+    for raw in raw_payloads or []:
+        session.add(RawProvider(provider_name="the_odds_api", payload_json=raw, scope="event_odds"))
+
+    games_created = 0
+    props_skipped = 0
+    books_seen: set[str] = set()
+    odds_rows: list[tuple[OddsMarket, str]] = []
+    props_rows: list[tuple[PropsMarket, str]] = []
+    quoted: set[tuple[Any, ...]] = set()
+
+    games: list[tuple[Game, dict[str, Any]]] = []
+    names: set[str] = set()
+    swapped: list[tuple[dict[str, Any], str]] = []
+    for event in events:
+        game, created, reason = _event_game(session, cal, event, league_code)
+        if reason:
+            swapped.append((_event_header(event), reason))
+        if game is None:
+            continue
+        games_created += int(created)
+        games.append((game, event))
+        for bookmaker in event.get("bookmakers", []) or []:
+            for market in bookmaker.get("markets", []) or []:
+                if str(market.get("key") or "").startswith("player_"):
+                    names.update(str(o.get("description") or "").strip() for o in market.get("outcomes", []) or [])
+    names.discard("")
+    players = _players_by_name(session, names)
+    seen = _existing_prop_quotes(session, sorted({g.id for g, _ in games}))
+
+    for game, event in games:
+        home_name = event.get("home_team") or "HOME"
+        away_name = event.get("away_team") or "AWAY"
+        for bookmaker in event.get("bookmakers", []) or []:
+            book_key = bookmaker.get("key") or bookmaker.get("title") or "unknown"
+            book_title = bookmaker.get("title") or bookmaker.get("key") or "Unknown"
+            book = _get_or_create_book(session, code=book_key, name=book_title)
+            books_seen.add(book.code)
+
+            for market in bookmaker.get("markets", []) or []:
+                mkey = str(market.get("key") or "")
+                is_prop = mkey.startswith("player_")
+                prop_type = prop_type_for_market(mkey) if is_prop else None
+
+                for outcome in market.get("outcomes", []) or []:
+                    price = outcome.get("price")
+                    if price is None:
+                        continue
+                    if not is_prop:
+                        main = _main_outcome(mkey, outcome, home_name, away_name)
+                        if main is None:
+                            continue
+                        market_type, outcome_code, line = main
+                        if (game.id, book.id, market_type, outcome_code, line) in quoted:
+                            continue
+                        quoted.add((game.id, book.id, market_type, outcome_code, line))
+                        odds_row = OddsMarket(
+                            game_id=game.id, book_id=book.id, market_type=market_type, outcome=outcome_code,
+                            line=line, price=float(price), source="the_odds_api", collected_ts=collected_ts,
+                        )
+                        odds_rows.append((odds_row, book.code))
+                        continue
+
+                    side = str(outcome.get("name") or "").strip().lower()
+                    player_name = str(outcome.get("description") or "").strip()
+                    if side not in ("over", "under") or not player_name or outcome.get("point") is None:
+                        continue
+                    player = players[player_name]
+                    key = (game.id, player.id, book.id, prop_type, side, float(outcome["point"]), float(price))
+                    if key in seen:
+                        props_skipped += 1
+                        continue
+                    seen.add(key)
+                    props_row = PropsMarket(
+                        game_id=game.id, player_id=player.id, book_id=book.id, prop_type=prop_type,
+                        side=side, line=float(outcome["point"]), price=float(price), source="the_odds_api",
+                        collected_ts=collected_ts, alt_line_group_id=ladder_group_id(game.id, player.id, book.id, prop_type, side),
+                    )
+                    props_rows.append((props_row, book.code))
+
+    odds_verdicts = validation.validate_odds(session, [r for r, _ in odds_rows])
+    props_verdicts = validation.validate_props(session, [r for r, _ in props_rows])
+    external_ids = {g.id: g.external_id for g, _ in games}
+    quarantined = validation.quarantine(session, "odds", [(r, v) for (r, _), v in zip(odds_rows, odds_verdicts) if v is not None] + swapped, external_ids)
+    validation.merge_counts(
+        quarantined, validation.quarantine(session, "props", [(r, v) for (r, _), v in zip(props_rows, props_verdicts) if v is not None], external_ids)
+    )
+    odds_rows = [p for p, v in zip(odds_rows, odds_verdicts) if v is None]
+    props_rows = [p for p, v in zip(props_rows, props_verdicts) if v is None]
+    session.add_all([r for r, _ in odds_rows] + [r for r, _ in props_rows])
+
+    odds_created = len(odds_rows)
+    props_created = len(props_rows)
+    changes = change_bus.odds_changes(odds_rows) | change_bus.props_changes(props_rows) if change_bus.has_subscribers() else set()
+    published_odds: list[dict[str, Any]] = []
+    published_props: list[dict[str, Any]] = []
+    with instrument.span("ingest.event_odds.commit"):
+        if ingest_hooks.has_listeners() and (odds_rows or props_rows):
+            session.flush()
+            published_odds = [ingest_hooks.odds_row_dict(r, code) for r, code in odds_rows]
+            published_props = [ingest_hooks.props_row_dict(r, code) for r, code in props_rows]
+        session.commit()
+    session.close()
+    instrument.count("odds_markets.created", odds_created)
+    instrument.count("props_markets.created", props_created)
+    instrument.count("props_markets.skipped_duplicates", props_skipped)
+    instrument.count("games.created", games_created)
+
+    summary: dict[str, Any] = {
+        "games_created": games_created,
+        "markets_created": odds_created,
+        "props_created": props_created,
+        "props_skipped_duplicates": props_skipped,
+        "books_seen": sorted(books_seen),
+    }
+    if quarantined:
+        summary["quarantined"] = validation.summarize(quarantined)
+    ctx = schedule_context.derive_for_new_games(last_game_id)
+    if ctx:
+        summary["schedule_context"] = ctx
+    listener_errors = ingest_hooks.publish("odds", published_odds) + ingest_hooks.publish("props", published_props) + change_bus.publish(changes)
+    if listener_errors:
+        summary["listener_errors"] = listener_errors
+    return summary
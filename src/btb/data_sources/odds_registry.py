@@ -1,11 +1,12 @@
-from __future__ import annotations
+﻿from __future__ import annotations
 
 import datetime as dt
 import json
 from pathlib import Path
 from typing import Any
 
-from btb.data_sources import odds_the_odds_api
+from btb.core import instrument
+from btb.data_sources import ingest_hooks, odds_the_odds_api
 from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
 
 
@@ -39,14 +40,25 @@ def ingest_odds_with_fallbacks(league: str, day: dt.date) -> dict[str, Any]:
     }
 
 
+def ingest_event_odds(league: str, day: dt.date, prop_markets: list[str] | None = None, batch_size: int = odds_the_odds_api.EVENT_BATCH_SIZE) -> dict[str, Any]:
+    """Combined main + player-prop snapshot for a day, then fair prices for what it stored."""
+    r = odds_the_odds_api.ingest_day_event_odds(league, day, prop_markets=prop_markets, batch_size=batch_size)
+    # a day without events is a valid empty snapshot; only a provider failure is not ok
+    if r.get("reason_code"):
+        return {"ok": False, "used_provider": None, "result": r, "degraded_flags": [r["reason_code"]]}
+    return ingest_hooks.with_refresh("fair_prices", {"ok": True, "used_provider": "the_odds_api", "result": r})
+
+
+@instrument.instrumented("ingest.fixture.odds")
 def ingest_odds_from_fixture(path: str, league: str = "NBA") -> dict[str, Any]:
     """
     Load a saved The Odds API payload fixture and normalize it into DB.
     This keeps v1 buildable/testable without live provider access.
     """
     p = Path(path)
-    payload = json.loads(p.read_text(encoding="utf-8-sig"))
+    with instrument.span("json.parse"):
+        payload = json.loads(p.read_text(encoding="utf-8-sig"))
     if not isinstance(payload, list):
         return {"ok": False, "error": "fixture payload must be a JSON list"}
     norm = normalize_the_odds_api_odds(payload, league_code=league)
-    return {"ok": True, "fixture": str(p), "normalized": norm}
+    return ingest_hooks.with_refresh("fair_prices", {"ok": True, "fixture": str(p), "normalized": norm})
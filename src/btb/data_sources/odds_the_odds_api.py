@@ -6,19 +6,33 @@ from typing import Any, Optional
 
 import requests
 
+from btb.core import instrument
 from btb.core.config import get_settings
 from btb.db.connection import get_session
+from btb.data_sources import validation
+from btb.data_sources.odds_normalize import normalize_the_odds_api_event_odds
 from btb.db.schema import RawProvider
 
 
 SPORTS_URL = "https://api.the-odds-api.com/v4/sports"
 ODDS_URL_TMPL = "https://api.the-odds-api.com/v4/sports/{sport_key}/odds"
+EVENTS_URL_TMPL = "https://api.the-odds-api.com/v4/sports/{sport_key}/events"
+EVENT_ODDS_URL_TMPL = "https://api.the-odds-api.com/v4/sports/{sport_key}/events/{event_id}/odds"
+
+MAIN_MARKETS = ("h2h", "spreads", "totals")
+BASE_PROP_MARKETS = ("player_points", "player_rebounds", "player_assists", "player_threes", "player_points_rebounds_assists")
+# alt lines are only served under the *_alternate keys; stored as rungs of the base prop's ladder
+PROP_MARKETS = BASE_PROP_MARKETS + tuple(f"{m}_alternate" for m in BASE_PROP_MARKETS)
+REGIONS = "au,us,uk"
+EVENT_BATCH_SIZE = 10
 
 
 def _discover_sport_keys(api_key: str) -> list[dict[str, Any]]:
-    r = requests.get(SPORTS_URL, params={"apiKey": api_key}, timeout=20)
+    with instrument.span("http.the_odds_api", endpoint="sports"):
+        r = requests.get(SPORTS_URL, params={"apiKey": api_key}, timeout=20)
     r.raise_for_status()
-    return r.json()
+    with instrument.span("json.parse"):
+        return r.json()
 
 
 def resolve_nba_sport_key(api_key: str) -> Optional[str]:
@@ -32,6 +46,7 @@ def resolve_nba_sport_key(api_key: str) -> Optional[str]:
     return None
 
 
+@instrument.instrumented("ingest.the_odds_api")
 def ingest_day_main_markets(league: str, day: dt.date, sport_key: Optional[str] = None) -> dict[str, Any]:
     settings = get_settings()
     if not settings.odds_api_key:
@@ -58,9 +73,11 @@ def ingest_day_main_markets(league: str, day: dt.date, sport_key: Optional[str]
     }
 
     try:
-        resp = requests.get(url, params=params, timeout=20)
+        with instrument.span("http.the_odds_api", endpoint="odds"):
+            resp = requests.get(url, params=params, timeout=20)
         resp.raise_for_status()
-        data = resp.json()
+        with instrument.span("json.parse"):
+            data = resp.json()
     except Exception as e:
         return {"error": f"API request failed: {e}", "reason_code": "ODDS_PROVIDER_DOWN", "sport_key": resolved}
 
@@ -75,3 +92,125 @@ def ingest_day_main_markets(league: str, day: dt.date, sport_key: Optional[str]
     session.commit()
 
     return {"league": league, "scope_date": str(day), "sport_key": resolved, "games_returned": len(data)}
+
+
+def _quota(headers: Any) -> dict[str, Optional[int]]:
+    """Usage headers of one response: credits used so far, remaining, and charged for this call."""
+    out: dict[str, Optional[int]] = {}
+    for key, header in (("used", "x-requests-used"), ("remaining", "x-requests-remaining"), ("last", "x-requests-last")):
+        try:
+            out[key] = int(float(headers.get(header)))
+        except (TypeError, ValueError):
+            out[key] = None
+    return out
+
+
+def _get_json(url: str, params: dict[str, Any], endpoint: str) -> tuple[Any, dict[str, Optional[int]]]:
+    with instrument.span("http.the_odds_api", endpoint=endpoint):
+        resp = requests.get(url, params=params, timeout=20)
+    resp.raise_for_status()
+    with instrument.span("json.parse"):
+        return resp.json(), _quota(resp.headers)
+
+
+def _list_events(api_key: str, sport_key: str, day: dt.date) -> list[dict[str, Any]]:
+    # the events listing is not charged against the quota
+    start = dt.datetime.combine(day, dt.time.min)
+    params = {
+        "apiKey": api_key,
+        "dateFormat": "iso",
+        "commenceTimeFrom": start.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "commenceTimeTo": (start + dt.timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    data, _ = _get_json(EVENTS_URL_TMPL.format(sport_key=sport_key), params, "events")
+    return [e for e in data if isinstance(e, dict) and e.get("id")]
+
+
+@instrument.instrumented("ingest.the_odds_api.events")
+def ingest_day_event_odds(
+    league: str,
+    day: dt.date,
+    sport_key: Optional[str] = None,
+    prop_markets: Optional[list[str]] = None,
+    regions: str = REGIONS,
+    batch_size: int = EVENT_BATCH_SIZE,
+) -> dict[str, Any]:
+    """
+    Main and player-prop markets for every event on a day, one request per event.
+
+    Each event-odds request asks for h2h/spreads/totals and the prop markets
+    together, so a snapshot costs one call per event instead of a main pass plus
+    a props pass. Events are processed in batches: each batch is normalized in a
+    single pass (main -> odds_markets, player_* -> props_markets) and committed
+    once together with one raw_provider row per request. The quota charged
+    (x-requests-last, summed) and the remaining balance are reported.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be >= 1")
+    settings = get_settings()
+    if not settings.odds_api_key:
+        return {"error": "THE_ODDS_API_KEY not set", "reason_code": "ODDS_PROVIDER_DOWN"}
+
+    api_key = settings.odds_api_key
+    resolved = sport_key or resolve_nba_sport_key(api_key)
+    if not resolved:
+        return {"error": "No accessible sport key for NBA event odds.", "reason_code": "ODDS_PROVIDER_DOWN"}
+
+    try:
+        events = _list_events(api_key, resolved, day)
+    except Exception as e:
+        return {"error": f"API request failed: {e}", "reason_code": "ODDS_PROVIDER_DOWN", "sport_key": resolved}
+
+    markets = list(MAIN_MARKETS) + list(prop_markets if prop_markets is not None else PROP_MARKETS)
+    params = {"apiKey": api_key, "regions": regions, "markets": ",".join(markets), "oddsFormat": "decimal", "dateFormat": "iso"}
+
+    summary: dict[str, Any] = {
+        "league": league,
+        "scope_date": str(day),
+        "sport_key": resolved,
+        "events": len(events),
+        "requests": 0,
+        "batches": 0,
+        "games_created": 0,
+        "markets_created": 0,
+        "props_created": 0,
+        "props_skipped_duplicates": 0,
+        "errors": [],
+    }
+    charged = 0
+    remaining: Optional[int] = None
+    quarantined: dict[str, int] = {}
+    for start in range(0, len(events), batch_size):
+        payloads: list[dict[str, Any]] = []
+        raws: list[str] = []
+        for event in events[start : start + batch_size]:
+            try:
+                data, quota = _get_json(EVENT_ODDS_URL_TMPL.format(sport_key=resolved, event_id=event["id"]), params, "event_odds")
+            except Exception as e:
+                summary["errors"].append({"event_id": event["id"], "error": str(e), "reason_code": "ODDS_PROVIDER_DOWN"})
+                continue
+            summary["requests"] += 1
+            charged += quota["last"] or 0
+            remaining = quota["remaining"] if quota["remaining"] is not None else remaining
+            if isinstance(data, dict):
+                payloads.append(data)
+                raws.append(json.dumps(data, ensure_ascii=False))
+        if not raws:
+            continue
+        norm = normalize_the_odds_api_event_odds(payloads, league_code=league, raw_payloads=raws)
+        summary["batches"] += 1
+        for key in ("games_created", "markets_created", "props_created", "props_skipped_duplicates"):
+            summary[key] += norm[key]
+        validation.merge_counts(quarantined, (norm.get("quarantined") or {}).get("reason_counts") or {})
+
+    instrument.count("the_odds_api.credits", charged)
+    summary["quota"] = {
+        "charged": charged,
+        "per_event": round(charged / summary["requests"], 2) if summary["requests"] else None,
+        "remaining": remaining,
+    }
+    if quarantined:
+        summary["quarantined"] = validation.summarize(quarantined)
+    if events and not summary["requests"]:
+        summary["reason_code"] = "ODDS_PROVIDER_DOWN"
+    return summary
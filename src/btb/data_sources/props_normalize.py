@@ -1,14 +1,19 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Optional
 
 from sqlalchemy import and_
 
+from btb.core import instrument
+from btb.data_sources import change_bus, ingest_hooks, schedule_context, validation
+from btb.db import game_calendar
 from btb.db.connection import get_session
+from btb.db.keys import ladder_group_id
 from btb.db.schema import Book, Game, League, Player, PropsMarket, Season, Team
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_book(session, code: str, name: str) -> Book:
     book = session.query(Book).filter(Book.code == code).first()
     if book:
@@ -19,6 +24,7 @@ def _get_or_create_book(session, code: str, name: str) -> Book:
     return book
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_team(session, name: str) -> Team:
     team = session.query(Team).filter(Team.name == name).first()
     if team:
@@ -29,7 +35,8 @@ def _get_or_create_team(session, name: str) -> Team:
     return team
 
 
-def _get_or_create_league_season(session, league_code: str, commence_time: str) -> tuple[League, Season]:
+@instrument.timed("ingest.dimension_lookup")
+def _get_or_create_league_season(session, cal: game_calendar.GameCalendar, league_code: str, commence_time: str) -> tuple[League, Season]:
     commence_dt = datetime.fromisoformat(commence_time.replace("Z", "+00:00"))
     year = commence_dt.year
     year_start = year if commence_dt.month >= 10 else year - 1
@@ -41,33 +48,32 @@ def _get_or_create_league_season(session, league_code: str, commence_time: str)
         session.add(league)
         session.flush()
 
-    season = (
-        session.query(Season)
-        .filter(Season.league_id == league.id, Season.year_start == year_start, Season.year_end == year_end)
-        .first()
-    )
-    if not season:
-        season = Season(league_id=league.id, year_start=year_start, year_end=year_end)
-        session.add(season)
-        session.flush()
-
+    season_id = cal.season_id(league.id, year_start, year_end)
+    if season_id is not None:
+        return league, session.get(Season, season_id)
+    season = Season(league_id=league.id, year_start=year_start, year_end=year_end)
+    session.add(season)
+    session.flush()
+    cal.add_season(season)
     return league, season
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_game(
     session,
+    cal: game_calendar.GameCalendar,
     external_id: str,
     home_team: str,
     away_team: str,
     commence_time: str,
     league_code: str = "NBA",
 ) -> Game:
-    game = session.query(Game).filter(Game.external_id == external_id).first()
-    if game:
-        return game
+    game_id = cal.game_id(external_id)
+    if game_id is not None:
+        return session.get(Game, game_id)
 
     commence_dt = datetime.fromisoformat(commence_time.replace("Z", "+00:00"))
-    league, season = _get_or_create_league_season(session, league_code, commence_time)
+    league, season = _get_or_create_league_season(session, cal, league_code, commence_time)
 
     home = _get_or_create_team(session, home_team)
     away = _get_or_create_team(session, away_team)
@@ -77,15 +83,18 @@ def _get_or_create_game(
         league_id=league.id,
         season_id=season.id,
         game_date=commence_dt.date(),
+        commence_ts=commence_dt.astimezone(timezone.utc).replace(tzinfo=None),
         home_team_id=home.id,
         away_team_id=away.id,
         season_type="regular",
     )
     session.add(game)
     session.flush()
+    cal.add_game(game)
     return game
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_player(session, full_name: str, external_id: Optional[str] = None, team_id: Optional[int] = None) -> Player:
     player = session.query(Player).filter(Player.full_name == full_name).first()
     if player:
@@ -96,7 +105,10 @@ def _get_or_create_player(session, full_name: str, external_id: Optional[str] =
     return player
 
 
-def _props_row_exists(session, game_id: int, player_id: int, book_id: int, prop_type: str, line: float, price: float) -> bool:
+@instrument.timed("ingest.props.dedupe_lookup")
+def _props_row_exists(
+    session, game_id: int, player_id: int, book_id: int, prop_type: str, line: float, price: float, side: Optional[str] = None
+) -> bool:
     existing = (
         session.query(PropsMarket.id)
         .filter(
@@ -105,6 +117,7 @@ def _props_row_exists(session, game_id: int, player_id: int, book_id: int, prop_
                 PropsMarket.player_id == player_id,
                 PropsMarket.book_id == book_id,
                 PropsMarket.prop_type == prop_type,
+                PropsMarket.side.is_(None) if side is None else PropsMarket.side == side,
                 PropsMarket.line == float(line),
                 PropsMarket.price == float(price),
             )
@@ -114,6 +127,7 @@ def _props_row_exists(session, game_id: int, player_id: int, book_id: int, prop_
     return existing is not None
 
 
+@instrument.instrumented("ingest.props")
 def normalize_props_fixture(payload: dict[str, Any]) -> dict[str, Any]:
     """
     Normalize a generic props fixture payload into PropsMarket rows (idempotent).
@@ -125,8 +139,12 @@ def normalize_props_fixture(payload: dict[str, Any]) -> dict[str, Any]:
       "league": "NBA",
       "props": [{"player":"...","prop_type":"points","line":28.5,"price":1.90}, ...]
     }
+
+    Props may carry an optional "side" ("over"/"under"); without it the row is
+    stored as a single quote with side NULL.
     """
     session = get_session()
+    last_game_id = schedule_context.latest_game_id(session)
 
     league_code = str(payload.get("league") or "NBA")
 
@@ -139,12 +157,15 @@ def normalize_props_fixture(payload: dict[str, Any]) -> dict[str, Any]:
     home_team = str(game_obj.get("home_team") or "HOME")
     away_team = str(game_obj.get("away_team") or "AWAY")
 
-    game = _get_or_create_game(session, game_external_id, home_team, away_team, commence_time, league_code=league_code)
+    game = _get_or_create_game(session, game_calendar.get_calendar(session), game_external_id, home_team, away_team, commence_time, league_code=league_code)
     book = _get_or_create_book(session, str(book_obj.get("key") or "unknown"), str(book_obj.get("title") or "Unknown"))
 
-    created = 0
     skipped_duplicates = 0
     players_seen: set[str] = set()
+    pending: list[PropsMarket] = []
+    quoted: set[tuple[Any, ...]] = set()
+    # one timestamp per collection, so a book's latest snapshot is the rows at its max collected_ts
+    collected_ts = datetime.utcnow()
 
     for p in props:
         player_name = str(p.get("player") or "").strip()
@@ -158,30 +179,52 @@ def normalize_props_fixture(payload: dict[str, Any]) -> dict[str, Any]:
         price = p.get("price")
         if line is None or price is None:
             continue
+        side = str(p.get("side") or "").strip().lower() or None
+        if side not in (None, "over", "under"):
+            continue
 
         player = _get_or_create_player(session, player_name)
         players_seen.add(player.full_name)
 
-        if _props_row_exists(session, game.id, player.id, book.id, prop_type, float(line), float(price)):
+        key = (player.id, prop_type, side, float(line), float(price))
+        if key in quoted or _props_row_exists(session, game.id, player.id, book.id, prop_type, float(line), float(price), side):
             skipped_duplicates += 1
             continue
-
-        session.add(
-            PropsMarket(
-                game_id=game.id,
-                player_id=player.id,
-                book_id=book.id,
-                prop_type=prop_type,
-                line=float(line),
-                price=float(price),
-                source="fixture",
-            )
+        quoted.add(key)
+
+        row = PropsMarket(
+            game_id=game.id,
+            player_id=player.id,
+            book_id=book.id,
+            prop_type=prop_type,
+            side=side,
+            line=float(line),
+            price=float(price),
+            alt_line_group_id=ladder_group_id(game.id, player.id, book.id, prop_type, side),
+            source="fixture",
+            collected_ts=collected_ts,
         )
-        created += 1
+        pending.append(row)
 
-    session.commit()
-
-    return {
+    verdicts = validation.validate_props(session, pending)
+    accepted = [r for r, v in zip(pending, verdicts) if v is None]
+    quarantined = validation.quarantine(
+        session, "props", [(r, v) for r, v in zip(pending, verdicts) if v is not None], {game.id: game.external_id}
+    )
+    session.add_all(accepted)
+    created = len(accepted)
+
+    changes = change_bus.props_changes((r, book.code) for r in accepted) if change_bus.has_subscribers() else set()
+    published: list[dict[str, Any]] = []
+    with instrument.span("ingest.props.commit"):
+        if accepted and ingest_hooks.has_listeners():
+            session.flush()
+            published = [ingest_hooks.props_row_dict(r, book.code) for r in accepted]
+        session.commit()
+    instrument.count("props_markets.created", created)
+    instrument.count("props_markets.skipped_duplicates", skipped_duplicates)
+
+    summary: dict[str, Any] = {
         "props_created": created,
         "props_skipped_duplicates": skipped_duplicates,
         "players_seen": sorted(list(players_seen)),
@@ -189,3 +232,13 @@ def normalize_props_fixture(payload: dict[str, Any]) -> dict[str, Any]:
         "game_external_id": game.external_id,
         "league": league_code,
     }
+    if quarantined:
+        summary["quarantined"] = validation.summarize(quarantined)
+    session.close()
+    ctx = schedule_context.derive_for_new_games(last_game_id)
+    if ctx:
+        summary["schedule_context"] = ctx
+    listener_errors = ingest_hooks.publish("props", published) + change_bus.publish(changes)
+    if listener_errors:
+        summary["listener_errors"] = listener_errors
+    return summary
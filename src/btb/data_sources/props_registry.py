@@ -4,13 +4,17 @@ import json
 from pathlib import Path
 from typing import Any
 
+from btb.core import instrument
+from btb.data_sources import ingest_hooks
 from btb.data_sources.props_normalize import normalize_props_fixture
 
 
+@instrument.instrumented("ingest.fixture.props")
 def ingest_props_from_fixture(path: str) -> dict[str, Any]:
     p = Path(path)
-    payload = json.loads(p.read_text(encoding="utf-8-sig"))
+    with instrument.span("json.parse"):
+        payload = json.loads(p.read_text(encoding="utf-8-sig"))
     if not isinstance(payload, dict):
         return {"ok": False, "error": "props fixture payload must be a JSON object"}
     norm = normalize_props_fixture(payload)
-    return {"ok": True, "fixture": str(p), "normalized": norm}
+    return ingest_hooks.with_refresh("fair_prices", {"ok": True, "fixture": str(p), "normalized": norm})
@@ -0,0 +1,118 @@
+﻿from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+
+from btb.core import instrument
+from btb.data_sources.arenas import altitude_category, arena_for
+from btb.db.connection import get_session
+from btb.db.schema import Game, Team
+
+_EARTH_KM = 6371.0088
+_FIELDS = ("home_rest_days", "away_rest_days", "home_travel_km", "away_travel_km", "altitude_category")
+
+
+def _haversine_km(a: Tuple[float, float, float], b: Tuple[float, float, float]) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * _EARTH_KM * math.asin(math.sqrt(h))
+
+
+def compute_schedule_context(
+    games: List[Tuple[int, Any, int, int]],
+    venues: Dict[int, Optional[Tuple[float, float, float]]],
+) -> Dict[int, Dict[str, Any]]:
+    """
+    Derive rest, travel and altitude for one season's games.
+
+    games: (game_id, game_date, home_team_id, away_team_id); venues: team_id -> home arena.
+    Rest days count full days off since the team's previous game date (0 = back-to-back,
+    None for its first game). Travel is the distance from the previous game's arena
+    (the team's own arena before its first game). Duplicate rows of the same game from
+    different providers share a date and are treated as one stop.
+    """
+    out: Dict[int, Dict[str, Any]] = {}
+    by_team: Dict[int, List[Tuple[Any, int, int]]] = {}
+    for gid, gdate, home, away in games:
+        venue = venues.get(home)
+        out[gid] = {
+            "home_rest_days": None,
+            "away_rest_days": None,
+            "home_travel_km": None,
+            "away_travel_km": None,
+            "altitude_category": altitude_category(venue[2]) if venue else None,
+        }
+        by_team.setdefault(home, []).append((gdate, gid, home))
+        by_team.setdefault(away, []).append((gdate, gid, home))
+
+    for team_id, sched in by_team.items():
+        sched.sort()
+        prev_date = None
+        prev_venue = venues.get(team_id)
+        cur_date = None
+        cur_venue = prev_venue
+        for gdate, gid, venue_team in sched:
+            venue = venues.get(venue_team)
+            if gdate != cur_date:
+                prev_date, prev_venue = cur_date, cur_venue
+                cur_date, cur_venue = gdate, venue
+            side = "home" if venue_team == team_id else "away"
+            out[gid][f"{side}_rest_days"] = (gdate - prev_date).days - 1 if prev_date is not None else None
+            if venue is not None and prev_venue is not None:
+                out[gid][f"{side}_travel_km"] = round(_haversine_km(prev_venue, venue), 1)
+    return out
+
+
+@instrument.instrumented("schedule_context.derive")
+def derive_schedule_context(season_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+    """
+    Fill games.home/away_rest_days, home/away_travel_km and altitude_category.
+
+    Each season's schedule is loaded with one query, derived in memory and written
+    back with a single bulk UPDATE of only the rows whose values changed, so rerunning
+    after a normalizer adds games is cheap.
+    """
+    session = get_session()
+
+    venues = {tid: arena_for(name, abbr) for tid, name, abbr in session.execute(select(Team.id, Team.name, Team.abbreviation))}
+
+    q = select(Game.season_id).distinct()
+    if season_ids is not None:
+        q = q.where(Game.season_id.in_(list(season_ids)))
+    seasons = sorted(session.execute(q).scalars())
+
+    games_seen = 0
+    updates: List[Dict[str, Any]] = []
+    for sid in seasons:
+        rows = session.execute(
+            select(Game.id, Game.game_date, Game.home_team_id, Game.away_team_id, *[getattr(Game, f) for f in _FIELDS])
+            .where(Game.season_id == sid)
+        ).all()
+        games_seen += len(rows)
+        derived = compute_schedule_context([tuple(r[:4]) for r in rows], venues)
+        for r in rows:
+            new = derived[r[0]]
+            if tuple(r[4:]) != tuple(new[f] for f in _FIELDS):
+                updates.append({"id": r[0], **new})
+
+    if updates:
+        session.execute(update(Game), updates)
+    session.commit()
+    session.close()
+    return {"seasons": len(seasons), "games_seen": games_seen, "games_updated": len(updates)}
+
+
+def latest_game_id(session) -> int:
+    return session.execute(select(func.max(Game.id))).scalar() or 0
+
+
+def derive_for_new_games(since_game_id: int) -> Optional[Dict[str, Any]]:
+    """Re-derive the seasons that gained games with id > since_game_id (None if there are none)."""
+    session = get_session()
+    seasons = list(session.execute(select(Game.season_id).where(Game.id > since_game_id).distinct()).scalars())
+    session.close()
+    if not seasons:
+        return None
+    return derive_schedule_context(seasons)
@@ -1,14 +1,18 @@
 ﻿from __future__ import annotations
 
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Any, Optional
 
 from sqlalchemy import and_
 
+from btb.core import instrument
+from btb.data_sources import change_bus, ingest_hooks, schedule_context, validation
+from btb.db import game_calendar
 from btb.db.connection import get_session
 from btb.db.schema import Game, League, Player, Season, StatsPlayerGame, Team
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_team(session, name: str) -> Team:
     team = session.query(Team).filter(Team.name == name).first()
     if team:
@@ -19,6 +23,7 @@ def _get_or_create_team(session, name: str) -> Team:
     return team
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_league(session, league_code: str) -> League:
     league = session.query(League).filter(League.code == league_code).first()
     if league:
@@ -29,17 +34,15 @@ def _get_or_create_league(session, league_code: str) -> League:
     return league
 
 
-def _get_or_create_season(session, league_id: int, year_start: int, year_end: int) -> Season:
-    season = (
-        session.query(Season)
-        .filter(and_(Season.league_id == league_id, Season.year_start == year_start, Season.year_end == year_end))
-        .first()
-    )
-    if season:
-        return season
+@instrument.timed("ingest.dimension_lookup")
+def _get_or_create_season(session, cal: game_calendar.GameCalendar, league_id: int, year_start: int, year_end: int) -> Season:
+    season_id = cal.season_id(league_id, year_start, year_end)
+    if season_id is not None:
+        return session.get(Season, season_id)
     season = Season(league_id=league_id, year_start=year_start, year_end=year_end)
     session.add(season)
     session.flush()
+    cal.add_season(season)
     return season
 
 
@@ -49,8 +52,10 @@ def _infer_season_from_commence(commence_time: str) -> tuple[int, int]:
     return year_start, year_start + 1
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_game(
     session,
+    cal: game_calendar.GameCalendar,
     external_id: str,
     league_id: int,
     season_id: int,
@@ -58,9 +63,9 @@ def _get_or_create_game(
     home_team: str,
     away_team: str,
 ) -> Game:
-    g = session.query(Game).filter(Game.external_id == external_id).first()
-    if g:
-        return g
+    game_id = cal.game_id(external_id)
+    if game_id is not None:
+        return session.get(Game, game_id)
 
     dt = datetime.fromisoformat(commence_time.replace("Z", "+00:00"))
     home = _get_or_create_team(session, home_team)
@@ -71,15 +76,18 @@ def _get_or_create_game(
         league_id=league_id,
         season_id=season_id,
         game_date=dt.date(),
+        commence_ts=dt.astimezone(timezone.utc).replace(tzinfo=None),
         home_team_id=home.id,
         away_team_id=away.id,
         season_type="regular",
     )
     session.add(g)
     session.flush()
+    cal.add_game(g)
     return g
 
 
+@instrument.timed("ingest.dimension_lookup")
 def _get_or_create_player(session, full_name: str) -> Player:
     p = session.query(Player).filter(Player.full_name == full_name).first()
     if p:
@@ -90,22 +98,62 @@ def _get_or_create_player(session, full_name: str) -> Player:
     return p
 
 
+def _side_team_id(game: Game, team_name: str, home_team: str, away_team: str) -> Optional[int]:
+    # the player's side, only if the name matches one of the game's teams
+    tn = team_name.strip().lower()
+    if not tn:
+        return None
+    if tn == home_team.strip().lower():
+        return game.home_team_id
+    if tn == away_team.strip().lower():
+        return game.away_team_id
+    return None
+
+
+_GAME_STATUSES = ("scheduled", "final", "postponed", "cancelled")
+
+
+def _apply_result(game: Game, g: dict[str, Any]) -> bool:
+    """Copy optional "status"/"home_score"/"away_score" onto the game; True if anything changed."""
+    changed = False
+    status = str(g.get("status") or "").strip().lower()
+    if status in _GAME_STATUSES and game.status != status:
+        game.status = status
+        changed = True
+    for key in ("home_score", "away_score"):
+        if g.get(key) is not None and getattr(game, key) != int(g[key]):
+            setattr(game, key, int(g[key]))
+            changed = True
+    return changed
+
+
+@instrument.timed("ingest.stats.dedupe_lookup")
 def _stat_row_exists(session, game_id: int, player_id: int) -> bool:
     return session.query(StatsPlayerGame.id).filter(and_(StatsPlayerGame.game_id == game_id, StatsPlayerGame.player_id == player_id)).first() is not None
 
 
+@instrument.instrumented("ingest.stats")
 def normalize_stats_fixture(payload: dict[str, Any]) -> dict[str, Any]:
     """
     Normalize a stats fixture into stats_player_game (idempotent by game_id+player_id).
+
+    A game may also carry "status" (scheduled/final/postponed/cancelled) and
+    "home_score"/"away_score"; these are applied even when its rows already exist.
     """
     session = get_session()
+    last_game_id = schedule_context.latest_game_id(session)
+    cal = game_calendar.get_calendar(session)
 
     league_code = str(payload.get("league") or "NBA")
     league = _get_or_create_league(session, league_code)
 
     games = payload.get("games") or []
-    rows_created = 0
     rows_skipped = 0
+    results_updated = 0
+    sided_players: set[int] = set()
+    pending: list[tuple[StatsPlayerGame, Player, Any]] = []
+    swapped: list[tuple[dict[str, Any], str]] = []
+    external_ids: dict[int, str] = {}
 
     for g in games:
         external_id = str(g.get("external_id") or g.get("id") or "game_fixture")
@@ -113,10 +161,20 @@ def normalize_stats_fixture(payload: dict[str, Any]) -> dict[str, Any]:
         home_team = str(g.get("home_team") or "HOME")
         away_team = str(g.get("away_team") or "AWAY")
 
+        day = datetime.fromisoformat(commence_time.replace("Z", "+00:00")).date()
+        home_id = _get_or_create_team(session, home_team).id
+        away_id = _get_or_create_team(session, away_team).id
+        if validation.teams_swapped(session, cal, external_id, day, home_id, away_id):
+            swapped.append(({"external_id": external_id, "commence_time": commence_time, "home_team": home_team, "away_team": away_team}, validation.TEAMS_SWAPPED))
+            continue
+
         y0, y1 = _infer_season_from_commence(commence_time)
-        season = _get_or_create_season(session, league.id, y0, y1)
+        season = _get_or_create_season(session, cal, league.id, y0, y1)
 
-        game = _get_or_create_game(session, external_id, league.id, season.id, commence_time, home_team, away_team)
+        game = _get_or_create_game(session, cal, external_id, league.id, season.id, commence_time, home_team, away_team)
+        external_ids[game.id] = external_id
+        if _apply_result(game, g):
+            results_updated += 1
 
         for pl in (g.get("players") or []):
             name = str(pl.get("player") or "").strip()
@@ -128,22 +186,61 @@ def normalize_stats_fixture(payload: dict[str, Any]) -> dict[str, Any]:
                 rows_skipped += 1
                 continue
 
+            team_id = _side_team_id(game, str(pl.get("team") or ""), home_team, away_team)
             row = StatsPlayerGame(
                 game_id=game.id,
                 player_id=player.id,
+                team_id=team_id,
                 minutes=float(pl.get("minutes") or 0.0),
                 points=int(pl.get("points") or 0),
                 assists=int(pl.get("assists") or 0),
                 rebounds=int(pl.get("rebounds") or 0),
-                threes_made=None,
+                threes_made=int(pl["threes_made"]) if pl.get("threes_made") is not None else None,
                 usage=None,
                 ortg=None,
                 drtg=None,
                 ts_pct=None,
                 pace=None,
             )
-            session.add(row)
-            rows_created += 1
-
-    session.commit()
-    return {"stats_created": rows_created, "stats_skipped_duplicates": rows_skipped, "league": league_code}
+            pending.append((row, player, pl.get("position")))
+
+    verdicts = validation.validate_stats([r for r, _, _ in pending])
+    quarantined = validation.quarantine(session, "stats", [(r, v) for (r, _, _), v in zip(pending, verdicts) if v is not None], external_ids)
+    validation.merge_counts(quarantined, validation.quarantine(session, "stats", swapped))
+    accepted = [p for p, v in zip(pending, verdicts) if v is None]
+    for row, player, position in accepted:
+        if row.team_id is not None:
+            player.team_id = row.team_id
+            sided_players.add(player.id)
+        if position and not player.position:
+            player.position = str(position).strip().upper()[:16]
+        session.add(row)
+    rows_created = len(accepted)
+    changes = change_bus.stats_changes(r for r, _, _ in accepted)
+    sided_changes = {c for c in changes if c[2] in sided_players}
+
+    with instrument.span("ingest.stats.commit"):
+        session.commit()
+    session.close()
+    instrument.count("stats_player_game.created", rows_created)
+    instrument.count("stats_player_game.skipped_duplicates", rows_skipped)
+    summary: dict[str, Any] = {"stats_created": rows_created, "stats_skipped_duplicates": rows_skipped, "league": league_code}
+    if results_updated:
+        summary["game_results_updated"] = results_updated
+    if quarantined:
+        summary["quarantined"] = validation.summarize(quarantined)
+    ctx = schedule_context.derive_for_new_games(last_game_id)
+    if ctx:
+        summary["schedule_context"] = ctx
+    splits = ingest_hooks.refresh("matchup_aggregates", changes)
+    if splits:
+        summary["matchup_aggregates"] = splits
+    if sided_changes:
+        spells = ingest_hooks.refresh("roster", sided_changes)
+        if spells is not None:
+            summary["roster"] = spells
+    # after the inline refreshes, so subscribers see the rebuilt splits and roster
+    listener_errors = change_bus.publish(changes)
+    if listener_errors:
+        summary["listener_errors"] = listener_errors
+    return summary
@@ -4,12 +4,15 @@ import json
 from pathlib import Path
 from typing import Any, Dict
 
+from btb.core import instrument
 from btb.data_sources.stats_normalize import normalize_stats_fixture
 
 
+@instrument.instrumented("ingest.fixture.stats")
 def ingest_stats_from_fixture(path: str) -> Dict[str, Any]:
     p = Path(path)
-    payload = json.loads(p.read_text(encoding="utf-8-sig"))
+    with instrument.span("json.parse"):
+        payload = json.loads(p.read_text(encoding="utf-8-sig"))
     if not isinstance(payload, dict):
         return {"ok": False, "error": "stats fixture payload must be a JSON object"}
     norm = normalize_stats_fixture(payload)
@@ -0,0 +1,197 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, insert, select
+
+from btb.core import instrument
+from btb.core.stat_expressions import get_registry
+from btb.db.schema import Game, OddsMarket, PropsMarket, QuarantinedRow
+
+MIN_PRICE = 1.01
+MAX_PRICE = 1001.0
+# largest credible move of a main line between two polls, by market type
+MAX_LINE_JUMP = {"total": 20.0, "spread": 15.0}
+# a prop line this far from every line already stored in its ladder is a feed error
+MAX_PROP_LINE_JUMP = 20.0
+MAX_MINUTES = 70.0
+
+PRICE_OUT_OF_RANGE = "PRICE_OUT_OF_RANGE"
+LINE_JUMP = "LINE_JUMP"
+UNKNOWN_PROP_TYPE = "UNKNOWN_PROP_TYPE"
+TEAMS_SWAPPED = "TEAMS_SWAPPED"
+STAT_OUT_OF_RANGE = "STAT_OUT_OF_RANGE"
+
+# one entry per row of a batch: None = accepted, else a reason code
+Verdicts = List[Optional[str]]
+
+_COUNT_STATS = ("points", "rebounds", "assists", "threes_made")
+
+
+def _first(*masks: Verdicts) -> Verdicts:
+    """Per row, the first reason any check gave."""
+    return [next((r for r in reasons if r), None) for reasons in zip(*masks)]
+
+
+def check_prices(prices: Sequence[Optional[float]]) -> Verdicts:
+    return [None if p is not None and MIN_PRICE <= p <= MAX_PRICE else PRICE_OUT_OF_RANGE for p in prices]
+
+
+def check_line_jumps(lines: Sequence[Optional[float]], previous: Sequence[Optional[float]], limits: Sequence[Optional[float]]) -> Verdicts:
+    return [
+        LINE_JUMP if ln is not None and prev is not None and lim is not None and abs(ln - prev) > lim else None
+        for ln, prev, lim in zip(lines, previous, limits)
+    ]
+
+
+def check_prop_types(prop_types: Sequence[str]) -> Verdicts:
+    registry = get_registry()
+    known = {pt: registry.resolve(pt) is not None for pt in set(prop_types)}
+    return [None if known[pt] else UNKNOWN_PROP_TYPE for pt in prop_types]
+
+
+def check_stat_ranges(minutes: Sequence[Optional[float]], counts: Dict[str, Sequence[Optional[float]]]) -> Verdicts:
+    ok_minutes = [m is None or 0.0 <= m <= MAX_MINUTES for m in minutes]
+    ok_counts = [all(v is None or v >= 0 for v in vals) for vals in zip(*counts.values())] if counts else [True] * len(minutes)
+    return [None if a and b else STAT_OUT_OF_RANGE for a, b in zip(ok_minutes, ok_counts)]
+
+
+def _latest_odds_lines(session, game_ids: List[int]) -> Dict[Tuple[int, int, str, str], float]:
+    """(game, book, market_type, outcome) -> line of the most recent stored snapshot."""
+    latest = (
+        select(func.max(OddsMarket.id))
+        .where(OddsMarket.game_id.in_(game_ids), OddsMarket.line.is_not(None))
+        .group_by(OddsMarket.game_id, OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome)
+    )
+    q = select(OddsMarket.game_id, OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line).where(OddsMarket.id.in_(latest))
+    return {(g, b, mt, oc): float(ln) for g, b, mt, oc, ln in session.execute(q)}
+
+
+def _ladder_lines(session, game_ids: List[int]) -> Dict[Tuple[int, int, int, str, str], List[float]]:
+    """(game, player, book, prop_type, side) -> sorted distinct stored lines."""
+    q = (
+        select(PropsMarket.game_id, PropsMarket.player_id, PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line)
+        .where(PropsMarket.game_id.in_(game_ids))
+        .distinct()
+    )
+    out: Dict[Tuple[int, int, int, str, str], List[float]] = {}
+    for g, p, b, pt, side, ln in session.execute(q):
+        out.setdefault((g, p, b, pt, side or "over"), []).append(float(ln))
+    for lines in out.values():
+        lines.sort()
+    return out
+
+
+def _nearest(lines: Optional[List[float]], x: float) -> Optional[float]:
+    if not lines:
+        return None
+    i = bisect_left(lines, x)
+    return min((lines[j] for j in (i - 1, i) if 0 <= j < len(lines)), key=lambda v: abs(v - x))
+
+
+@instrument.timed("ingest.validate.odds")
+def validate_odds(session, rows: Sequence[Any]) -> Verdicts:
+    """Price range and line jumps against the last stored line, for OddsMarket-like rows."""
+    if not rows:
+        return []
+    previous = _latest_odds_lines(session, sorted({r.game_id for r in rows}))
+    lines = [float(r.line) if r.line is not None else None for r in rows]
+    return _first(
+        check_prices([r.price for r in rows]),
+        check_line_jumps(
+            lines,
+            [previous.get((r.game_id, r.book_id, r.market_type, r.outcome)) for r in rows],
+            [MAX_LINE_JUMP.get(r.market_type) for r in rows],
+        ),
+    )
+
+
+@instrument.timed("ingest.validate.props")
+def validate_props(session, rows: Sequence[Any]) -> Verdicts:
+    """Price range, known prop type, and distance to the nearest line already in the ladder, for PropsMarket-like rows."""
+    if not rows:
+        return []
+    ladders = _ladder_lines(session, sorted({r.game_id for r in rows}))
+    lines = [float(r.line) for r in rows]
+    return _first(
+        check_prices([r.price for r in rows]),
+        check_prop_types([r.prop_type for r in rows]),
+        check_line_jumps(
+            lines,
+            [_nearest(ladders.get((r.game_id, r.player_id, r.book_id, r.prop_type, r.side or "over")), ln) for r, ln in zip(rows, lines)],
+            [MAX_PROP_LINE_JUMP] * len(rows),
+        ),
+    )
+
+
+@instrument.timed("ingest.validate.stats")
+def validate_stats(rows: Sequence[Any]) -> Verdicts:
+    """Minutes within 0..MAX_MINUTES and no negative counting stats, for StatsPlayerGame-like rows."""
+    if not rows:
+        return []
+    return check_stat_ranges([r.minutes for r in rows], {c: [getattr(r, c) for r in rows] for c in _COUNT_STATS})
+
+
+def teams_swapped(session, cal, external_id: Optional[str], day: datetime.date, home_id: int, away_id: int) -> bool:
+    """
+    True when an event's home/away are reversed relative to what is stored: the same
+    external id filed the other way round, or (for a new id) only the reversed
+    pairing exists on that date.
+    """
+    game_id = cal.game_id(external_id)
+    if game_id is not None:
+        game = session.get(Game, game_id)
+        return (game.home_team_id, game.away_team_id) == (away_id, home_id) and home_id != away_id
+    return bool(cal.fixture_games(day, away_id, home_id)) and not cal.fixture_games(day, home_id, away_id)
+
+
+def _row_payload(row: Any) -> Dict[str, Any]:
+    if isinstance(row, dict):
+        return row
+    return {c.name: getattr(row, c.name) for c in row.__table__.columns if c.name != "id"}
+
+
+def quarantine(session, scope: str, rejected: Sequence[Tuple[Any, str]], external_ids: Optional[Dict[int, str]] = None) -> Dict[str, int]:
+    """
+    Store refused rows in quarantined_rows within the caller's transaction.
+
+    rejected: (row, reason_code) with ORM objects or plain dicts; external_ids maps
+    game ids to the provider id recorded with each row. Returns the reason counts
+    for the ingest summary.
+    """
+    counts: Dict[str, int] = {}
+    if not rejected:
+        return counts
+    records = []
+    for row, reason in rejected:
+        payload = _row_payload(row)
+        game_id = payload.get("game_id")
+        records.append(
+            {
+                "scope": scope,
+                "reason_code": reason,
+                "game_id": game_id,
+                "game_external_id": (external_ids or {}).get(game_id) if game_id is not None else payload.get("external_id"),
+                "payload_json": json.dumps(payload, default=str, ensure_ascii=False),
+            }
+        )
+        counts[reason] = counts.get(reason, 0) + 1
+    session.execute(insert(QuarantinedRow), records)
+    for reason, n in counts.items():
+        instrument.count(f"quarantine.{scope}.{reason.lower()}", n)
+    return counts
+
+
+def summarize(counts: Dict[str, int]) -> Optional[Dict[str, Any]]:
+    """Ingest summary entry, shaped like the degraded-mode reason counts."""
+    if not counts:
+        return None
+    return {"rows": sum(counts.values()), "reason_counts": dict(sorted(counts.items()))}
+
+
+def merge_counts(into: Dict[str, int], other: Dict[str, int]) -> None:
+    for k, v in other.items():
+        into[k] = into.get(k, 0) + v
@@ -1,19 +1,61 @@
 ﻿from __future__ import annotations
 
-from sqlalchemy import create_engine
+import re
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from pathlib import Path
 
+from btb.db.schema import TableVersion
+
 DB_PATH = Path("btb.db")
 
+# table written by an INSERT/UPDATE/DELETE (ORM flushes, Core DML and raw SQL alike)
+_WRITE_RE = re.compile(r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[\"`\[]?(\w+)", re.IGNORECASE)
+_BUMP_SQL = (
+    f"INSERT INTO {TableVersion.__tablename__} (name, version) VALUES (?, 1) "
+    "ON CONFLICT(name) DO UPDATE SET version = version + 1"
+)
+
 _engine = None
 _SessionLocal = None
+_ro_engine = None
+_ROSessionLocal = None
+
+
+def _note_write(conn, cursor, statement, parameters, context, executemany) -> None:
+    m = _WRITE_RE.match(statement)
+    if m and m.group(1) != TableVersion.__tablename__:
+        conn.info.setdefault("written_tables", set()).add(m.group(1))
+
+
+def _bump_versions(conn) -> None:
+    # runs just before COMMIT, so the bump lands (or rolls back) with the writes themselves
+    tables = conn.info.pop("written_tables", None)
+    if tables:
+        cur = conn.connection.cursor()
+        try:
+            cur.executemany(_BUMP_SQL, [(t,) for t in sorted(tables)])
+        finally:
+            cur.close()
+
+
+def _forget_writes(conn) -> None:
+    conn.info.pop("written_tables", None)
 
 
 def get_engine():
+    """
+    Write engine. Every committed transaction bumps table_versions for the tables it
+    wrote, so readers can tell a table changed even when no row id moved (in-place UPDATEs).
+    """
     global _engine
     if _engine is None:
         _engine = create_engine(f"sqlite:///{DB_PATH}", future=True)
+        event.listen(_engine, "before_cursor_execute", _note_write)
+        event.listen(_engine, "commit", _bump_versions)
+        event.listen(_engine, "rollback", _forget_writes)
+        TableVersion.__table__.create(_engine, checkfirst=True)
     return _engine
 
 
@@ -22,3 +64,35 @@ def get_session():
     if _SessionLocal is None:
         _SessionLocal = sessionmaker(bind=get_engine(), autoflush=False, autocommit=False, future=True)
     return _SessionLocal()
+
+
+def get_readonly_engine(pool_size: int = 8):
+    """Pooled engine that opens the database read-only (for serving queries)."""
+    global _ro_engine
+    if _ro_engine is None:
+        _ro_engine = create_engine(
+            f"sqlite:///file:{DB_PATH.resolve()}?mode=ro&uri=true",
+            future=True,
+            pool_size=pool_size,
+            max_overflow=0,
+        )
+    return _ro_engine
+
+
+def get_readonly_session():
+    global _ROSessionLocal
+    if _ROSessionLocal is None:
+        _ROSessionLocal = sessionmaker(bind=get_readonly_engine(), autoflush=False, autocommit=False, future=True)
+    return _ROSessionLocal()
+
+
+def set_database_path(path) -> Path:
+    """Point every engine/session factory at another SQLite file; returns the previous path."""
+    global DB_PATH, _engine, _SessionLocal, _ro_engine, _ROSessionLocal
+    previous = DB_PATH
+    for eng in (_engine, _ro_engine):
+        if eng is not None:
+            eng.dispose()
+    DB_PATH = Path(path)
+    _engine = _SessionLocal = _ro_engine = _ROSessionLocal = None
+    return previous
@@ -0,0 +1,141 @@
+﻿from __future__ import annotations
+
+import datetime
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.schema import Game, Season
+
+SeasonKey = Tuple[int, int, int]  # (league_id, year_start, year_end)
+
+
+class GameCalendar:
+    """
+    Every game held as parallel arrays (id, date ordinal, home, away; 0 = no team),
+    with hash indexes by external_id, (date, team) and date, plus the season ids
+    by (league, years). Normalizers add games and seasons as they create them, so
+    one load serves a whole ingest.
+    """
+
+    def __init__(self, stamp: Tuple[int, ...] = (0, 0, 0, 0)) -> None:
+        self.ids = array("q")
+        self.days = array("l")
+        self.home = array("q")
+        self.away = array("q")
+        self.by_external: Dict[str, int] = {}
+        self.by_team: Dict[Tuple[int, int], int] = {}
+        self.by_day: Dict[int, List[int]] = {}
+        self.seasons: Dict[SeasonKey, int] = {}
+        self.stamp = stamp
+
+    @classmethod
+    def from_rows(
+        cls,
+        games: Iterable[Tuple[int, Optional[str], datetime.date, Optional[int], Optional[int]]],
+        seasons: Iterable[Tuple[int, int, int, int]] = (),
+        stamp: Tuple[int, ...] = (0, 0, 0, 0),
+    ) -> "GameCalendar":
+        """games: (id, external_id, date, home, away); seasons: (id, league_id, year_start, year_end)."""
+        cal = cls(stamp)
+        for gid, ext, day, home, away in sorted(games, key=lambda g: g[0]):
+            cal._add(gid, ext, day, home, away)
+        for sid, league_id, y0, y1 in seasons:
+            cal.seasons.setdefault((league_id, y0, y1), sid)
+        return cal
+
+    def _add(self, game_id: int, external_id: Optional[str], day: datetime.date, home: Optional[int], away: Optional[int]) -> None:
+        pos = len(self.ids)
+        d = day.toordinal()
+        self.ids.append(game_id)
+        self.days.append(d)
+        self.home.append(home or 0)
+        self.away.append(away or 0)
+        if external_id:
+            self.by_external.setdefault(external_id, pos)
+        for tid in (home, away):
+            if tid:
+                self.by_team.setdefault((d, tid), pos)
+        self.by_day.setdefault(d, []).append(pos)
+
+    def add_game(self, game: Game) -> None:
+        if game.external_id and game.external_id in self.by_external:
+            return
+        self._add(game.id, game.external_id, game.game_date, game.home_team_id, game.away_team_id)
+        g_cnt, g_max, s_cnt, s_max = self.stamp
+        self.stamp = (g_cnt + 1, max(g_max, game.id), s_cnt, s_max)
+
+    def add_season(self, season: Season) -> None:
+        key = (season.league_id, season.year_start, season.year_end)
+        if key in self.seasons:
+            return
+        self.seasons[key] = season.id
+        g_cnt, g_max, s_cnt, s_max = self.stamp
+        self.stamp = (g_cnt, g_max, s_cnt + 1, max(s_max, season.id))
+
+    def game_id(self, external_id: Optional[str]) -> Optional[int]:
+        pos = self.by_external.get(external_id) if external_id else None
+        return self.ids[pos] if pos is not None else None
+
+    def game_on(self, day: datetime.date, team_id: Optional[int]) -> Optional[int]:
+        """The team's game that day (the first created, if a feed filed it twice)."""
+        pos = self.by_team.get((day.toordinal(), team_id)) if team_id else None
+        return self.ids[pos] if pos is not None else None
+
+    def games_on(self, day: datetime.date) -> List[int]:
+        return [self.ids[p] for p in self.by_day.get(day.toordinal(), ())]
+
+    def fixture_games(self, day: datetime.date, home_team_id: Optional[int], away_team_id: Optional[int]) -> List[int]:
+        """Every game filed for this date and pairing (feeds may use different external ids)."""
+        return [
+            self.ids[p]
+            for p in self.by_day.get(day.toordinal(), ())
+            if self.home[p] == (home_team_id or 0) and self.away[p] == (away_team_id or 0)
+        ]
+
+    def season_id(self, league_id: int, year_start: int, year_end: int) -> Optional[int]:
+        return self.seasons.get((league_id, year_start, year_end))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+def _stamp(session) -> Tuple[int, ...]:
+    g_cnt, g_max = session.execute(select(func.count(Game.id), func.max(Game.id))).one()
+    s_cnt, s_max = session.execute(select(func.count(Season.id), func.max(Season.id))).one()
+    return int(g_cnt or 0), int(g_max or 0), int(s_cnt or 0), int(s_max or 0)
+
+
+def load_calendar(session) -> GameCalendar:
+    return GameCalendar.from_rows(
+        session.execute(select(Game.id, Game.external_id, Game.game_date, Game.home_team_id, Game.away_team_id)),
+        session.execute(select(Season.id, Season.league_id, Season.year_start, Season.year_end)),
+        _stamp(session),
+    )
+
+
+_calendar: Optional[GameCalendar] = None
+
+
+@instrument.timed("research.game_calendar")
+def get_calendar(session=None) -> GameCalendar:
+    """Process-wide calendar, reloaded when games or seasons change outside it (count / max id stamp)."""
+    global _calendar
+    own = session is None
+    session = session or get_session()
+    try:
+        stamp = _stamp(session)
+        if _calendar is None or _calendar.stamp != stamp:
+            _calendar = load_calendar(session)
+        return _calendar
+    finally:
+        if own:
+            session.close()
+
+
+def invalidate() -> None:
+    global _calendar
+    _calendar = None
@@ -0,0 +1,8 @@
+﻿from __future__ import annotations
+
+from typing import Optional
+
+
+def ladder_group_id(game_id: int, player_id: int, book_id: int, prop_type: str, side: Optional[str]) -> str:
+    """One ladder per book, player, prop type and side within a game; every alt line of it shares the id."""
+    return f"{game_id}:{player_id}:{book_id}:{prop_type}:{side or 'over'}"
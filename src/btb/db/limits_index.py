@@ -0,0 +1,135 @@
+﻿from __future__ import annotations
+
+import datetime
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.schema import LimitsSnapshot
+
+# scope consulted when a book has no history for the exact market scope
+DEFAULT_SCOPE = "default"
+
+LimitKey = Tuple[int, str]  # (book_id, market_scope)
+
+
+def canon_scope(scope: str) -> str:
+    return "_".join((scope or "").strip().lower().split()) or DEFAULT_SCOPE
+
+
+class LimitSeries:
+    """One (book, scope) history: effective timestamps ascending, amounts aligned."""
+
+    __slots__ = ("ts", "amounts")
+
+    def __init__(self, ts: List[datetime.datetime], amounts: List[float]) -> None:
+        self.ts = ts
+        self.amounts = amounts
+
+    def at(self, when: datetime.datetime) -> Optional[float]:
+        i = bisect_right(self.ts, when)
+        return self.amounts[i - 1] if i else None
+
+
+class LimitsIndex:
+    """
+    Limits in force per (book, scope), as sorted arrays.
+
+    A snapshot holds from its effective_ts until the next one for the same key.
+    Where a scope has no limit in force yet (or no history at all), the book's
+    DEFAULT_SCOPE limit applies.
+    """
+
+    def __init__(self, series: Dict[LimitKey, LimitSeries], stamp: Tuple[int, int] = (0, 0)) -> None:
+        self.series = series
+        self.stamp = stamp
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, str, datetime.datetime, float]], stamp: Tuple[int, int] = (0, 0)) -> "LimitsIndex":
+        staged: Dict[LimitKey, List[Tuple[datetime.datetime, float]]] = {}
+        for book_id, scope, ts, amount in rows:
+            staged.setdefault((book_id, canon_scope(scope)), []).append((ts, float(amount)))
+        series: Dict[LimitKey, LimitSeries] = {}
+        for key, pts in staged.items():
+            pts.sort(key=lambda p: p[0])
+            series[key] = LimitSeries([t for t, _ in pts], [a for _, a in pts])
+        return cls(series, stamp)
+
+    def _series_for(self, book_id: int, scope: str) -> Tuple[Optional[LimitSeries], Optional[LimitSeries]]:
+        """(exact-scope series, book default series)"""
+        default = self.series.get((book_id, DEFAULT_SCOPE))
+        exact = self.series.get((book_id, canon_scope(scope)))
+        return (exact, default) if exact is not default else (None, default)
+
+    def limit_at(self, book_id: int, scope: str, when: datetime.datetime) -> Optional[float]:
+        for s in self._series_for(book_id, scope):
+            v = s.at(when) if s is not None else None
+            if v is not None:
+                return v
+        return None
+
+    def limits_at(self, book_ids: Sequence[int], scopes: Sequence[str], when: Sequence[datetime.datetime]) -> List[Optional[float]]:
+        """
+        As-of limits for many (book, scope, instant) queries at once, aligned to the input.
+
+        Queries are grouped per series and walked in time order against it, so a
+        batch costs one sort plus a linear merge per series rather than a search
+        per query.
+        """
+        out: List[Optional[float]] = [None] * len(book_ids)
+        pairs = [self._series_for(b, sc) for b, sc in zip(book_ids, scopes)]
+        for level in (0, 1):  # exact scope first, then the book default for what is still unknown
+            groups: Dict[int, Tuple[LimitSeries, List[int]]] = {}
+            for i, pair in enumerate(pairs):
+                s = pair[level]
+                if s is not None and out[i] is None:
+                    groups.setdefault(id(s), (s, []))[1].append(i)
+            for s, idx in groups.values():
+                idx.sort(key=when.__getitem__)
+                j, n = 0, len(s.ts)
+                for i in idx:
+                    t = when[i]
+                    while j < n and s.ts[j] <= t:
+                        j += 1
+                    out[i] = s.amounts[j - 1] if j else None
+        return out
+
+    def __len__(self) -> int:
+        return len(self.series)
+
+
+def _stamp(session) -> Tuple[int, int]:
+    cnt, max_id = session.execute(select(func.count(LimitsSnapshot.id), func.max(LimitsSnapshot.id))).one()
+    return int(cnt or 0), int(max_id or 0)
+
+
+def load_limits_index(session) -> LimitsIndex:
+    rows = session.execute(select(LimitsSnapshot.book_id, LimitsSnapshot.market_scope, LimitsSnapshot.effective_ts, LimitsSnapshot.limit_amount))
+    return LimitsIndex.from_rows(rows, _stamp(session))
+
+
+_index: Optional[LimitsIndex] = None
+
+
+@instrument.timed("research.limits_index")
+def get_limits_index(session=None) -> LimitsIndex:
+    """Process-wide index, reloaded when limits_snapshots changes (row count / max id stamp)."""
+    global _index
+    own = session is None
+    session = session or get_session()
+    try:
+        stamp = _stamp(session)
+        if _index is None or _index.stamp != stamp:
+            _index = load_limits_index(session)
+        return _index
+    finally:
+        if own:
+            session.close()
+
+
+def invalidate() -> None:
+    global _index
+    _index = None
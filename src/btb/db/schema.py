@@ -71,6 +71,7 @@ class Game(Base):
     season_id: Mapped[int] = mapped_column(ForeignKey("seasons.id"), index=True)
 
     game_date: Mapped[date] = mapped_column(Date, index=True)
+    commence_ts: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # naive UTC tip-off
 
     home_team_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), index=True)
     away_team_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), index=True)
@@ -88,6 +89,11 @@ class Game(Base):
 
     altitude_category: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)  # low/medium/high
 
+    # result; NULL status = not reported (a box score in stats_player_game implies final)
+    status: Mapped[Optional[str]] = mapped_column(String(16), nullable=True, index=True)  # scheduled/final/postponed/cancelled
+    home_score: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    away_score: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
 
 class Book(Base):
     __tablename__ = "books"
@@ -122,7 +128,7 @@ class OddsMarket(Base):
 class PropsMarket(Base):
     __tablename__ = "props_markets"
     __table_args__ = (
-        UniqueConstraint("game_id", "player_id", "book_id", "prop_type", "line", "price", "collected_ts", name="uq_props_snapshot"),
+        UniqueConstraint("game_id", "player_id", "book_id", "prop_type", "side", "line", "price", "collected_ts", name="uq_props_snapshot"),
     )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
@@ -131,6 +137,7 @@ class PropsMarket(Base):
     book_id: Mapped[int] = mapped_column(ForeignKey("books.id"), index=True)
 
     prop_type: Mapped[str] = mapped_column(String(32))  # points, assists, PRA, etc.
+    side: Mapped[Optional[str]] = mapped_column(String(8), nullable=True)  # over/under; NULL = single quote (over)
     line: Mapped[float] = mapped_column(Float)
     price: Mapped[float] = mapped_column(Float)
 
@@ -139,6 +146,73 @@ class PropsMarket(Base):
     source: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
 
+class FairPrice(Base):
+    """De-vigged probabilities per book (book_id set) and cross-book consensus (book_id NULL)."""
+
+    __tablename__ = "fair_prices"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id"), index=True)
+    scope: Mapped[str] = mapped_column(String(8))  # odds/props
+    market_type: Mapped[str] = mapped_column(String(32))  # moneyline/spread/total or prop type
+    player_id: Mapped[Optional[int]] = mapped_column(ForeignKey("players.id"), nullable=True, index=True)
+    book_id: Mapped[Optional[int]] = mapped_column(ForeignKey("books.id"), nullable=True, index=True)
+
+    outcome: Mapped[str] = mapped_column(String(16))  # home/away/over/under
+    line: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    price: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    implied_prob: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    overround: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    fair_prob: Mapped[float] = mapped_column(Float)
+    books_used: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    method: Mapped[str] = mapped_column(String(16))  # paired/book_margin/raw/consensus
+    as_of_ts: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+
+class EngineCheckpoint(Base):
+    """Last source row id processed by an incremental engine."""
+
+    __tablename__ = "engine_checkpoints"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    last_id: Mapped[int] = mapped_column(Integer, default=0)
+    updated_ts: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+
+class TableVersion(Base):
+    """Count of committed write transactions per table (kept by the write engine, see btb.db.connection)."""
+
+    __tablename__ = "table_versions"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class LineMoveAlert(Base):
+    """Steam / reverse-line-move / stale-book detections from the line movement detector."""
+
+    __tablename__ = "line_move_alerts"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    game_id: Mapped[int] = mapped_column(ForeignKey("games.id"), index=True)
+    scope: Mapped[str] = mapped_column(String(8))  # odds/props
+    market_type: Mapped[str] = mapped_column(String(32))
+    player_id: Mapped[Optional[int]] = mapped_column(ForeignKey("players.id"), nullable=True)
+    outcome: Mapped[str] = mapped_column(String(16))
+    line: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # the prop rung; None for main markets
+
+    kind: Mapped[str] = mapped_column(String(16), index=True)  # steam/reverse/stale_book
+    books: Mapped[Optional[str]] = mapped_column(String(256), nullable=True)  # comma-separated book codes
+    magnitude: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    level_from: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    level_to: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    window_start_ts: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    detected_ts: Mapped[datetime] = mapped_column(DateTime, index=True)  # snapshot time that triggered it
+    mode: Mapped[str] = mapped_column(String(8), default="live")  # live/replay
+
+
 class RawProvider(Base):
     __tablename__ = "raw_provider"
 
@@ -149,14 +223,32 @@ class RawProvider(Base):
     scope: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)  # odds/props/stats/pbp
 
 
+class QuarantinedRow(Base):
+    """Incoming rows the ingest validation stage refused, with the reason and the row as received."""
+
+    __tablename__ = "quarantined_rows"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    scope: Mapped[str] = mapped_column(String(16), index=True)  # odds/props/stats
+    reason_code: Mapped[str] = mapped_column(String(32), index=True)
+    game_id: Mapped[Optional[int]] = mapped_column(ForeignKey("games.id"), nullable=True, index=True)
+    game_external_id: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    payload_json: Mapped[str] = mapped_column(Text)
+    quarantined_ts: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+
 class Bet(Base):
     __tablename__ = "bets"
+    __table_args__ = (
+        UniqueConstraint("book_id", "external_ref", name="uq_bet_book_ref"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     placed_ts: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
 
     game_id: Mapped[Optional[int]] = mapped_column(ForeignKey("games.id"), nullable=True, index=True)
     props_market_id: Mapped[Optional[int]] = mapped_column(ForeignKey("props_markets.id"), nullable=True, index=True)
+    odds_market_id: Mapped[Optional[int]] = mapped_column(ForeignKey("odds_markets.id"), nullable=True, index=True)
 
     book_id: Mapped[int] = mapped_column(ForeignKey("books.id"), index=True)
 
@@ -165,6 +257,10 @@ class Bet(Base):
 
     result: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)  # W/L/PUSH/VOID
     pnl: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    settled_ts: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    external_ref: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # book's slip id (or a row hash)
+    source: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
 
 
 class CLVObservation(Base):
@@ -220,6 +316,7 @@ class StatsPlayerGame(Base):
 
     game_id: Mapped[int] = mapped_column(ForeignKey("games.id"), nullable=False, index=True)
     player_id: Mapped[int] = mapped_column(ForeignKey("players.id"), nullable=False, index=True)
+    team_id: Mapped[Optional[int]] = mapped_column(ForeignKey("teams.id"), nullable=True, index=True)  # side played for
 
     # core box-style fields (extend later)
     minutes: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
@@ -234,3 +331,59 @@ class StatsPlayerGame(Base):
     drtg: Mapped[float | None] = mapped_column(Float, nullable=True)
     ts_pct: Mapped[float | None] = mapped_column(Float, nullable=True)
     pace: Mapped[float | None] = mapped_column(Float, nullable=True)
+
+
+# ----------------------------
+# roster history
+# ----------------------------
+class RosterSpell(Base):
+    """
+    A run of consecutive games a player played for one team (from stats_player_game
+    rows with a known side). The player belongs to the team from from_date until
+    the next spell starts; to_date is the last game seen.
+    """
+
+    __tablename__ = "roster_spells"
+    __table_args__ = (
+        UniqueConstraint("player_id", "from_date", name="uq_roster_spell"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    player_id: Mapped[int] = mapped_column(ForeignKey("players.id"), index=True)
+    team_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), index=True)
+    from_date: Mapped[date] = mapped_column(Date)
+    to_date: Mapped[date] = mapped_column(Date)
+    games: Mapped[int] = mapped_column(Integer, default=0)
+
+
+# ----------------------------
+# materialized matchup aggregates
+# ----------------------------
+class TeamMatchupSplit(Base):
+    """
+    What a team allows to opposing players of a position ("ALL" = every position),
+    per game over a span of its games. Team-level form (points for/against, pace) is
+    repeated on each row so one indexed lookup serves a matchup.
+    """
+
+    __tablename__ = "team_matchup_splits"
+    __table_args__ = (
+        UniqueConstraint("season_id", "team_id", "position", "span", name="uq_team_matchup_split"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    season_id: Mapped[int] = mapped_column(ForeignKey("seasons.id"), index=True)
+    team_id: Mapped[int] = mapped_column(ForeignKey("teams.id"), index=True)
+    position: Mapped[str] = mapped_column(String(16))
+    span: Mapped[str] = mapped_column(String(16))  # season/last10
+
+    games: Mapped[int] = mapped_column(Integer, default=0)
+    pts_allowed: Mapped[float] = mapped_column(Float, default=0.0)
+    reb_allowed: Mapped[float] = mapped_column(Float, default=0.0)
+    ast_allowed: Mapped[float] = mapped_column(Float, default=0.0)
+    threes_allowed: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    points_for: Mapped[float] = mapped_column(Float, default=0.0)
+    points_against: Mapped[float] = mapped_column(Float, default=0.0)
+    pace: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    last_game_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
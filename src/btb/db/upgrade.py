@@ -0,0 +1,29 @@
+﻿from __future__ import annotations
+
+from sqlalchemy import inspect
+
+from btb.db.schema import Base
+
+
+def add_missing_columns(engine) -> list[str]:
+    """
+    Bring an existing SQLite DB up to the current models.
+
+    create_all() only creates missing tables; columns added to existing models
+    later are appended here with ALTER TABLE. Only nullable columns are added
+    (SQLite cannot add NOT NULL columns without a default).
+    """
+    insp = inspect(engine)
+    added: list[str] = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name in existing or not col.nullable:
+                    continue
+                coltype = col.type.compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{col.name}" {coltype}')
+                added.append(f"{table.name}.{col.name}")
+    return added
@@ -0,0 +1,3 @@
+﻿from btb.research import ingest_refresh
+
+ingest_refresh.install()
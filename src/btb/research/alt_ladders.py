@@ -0,0 +1,174 @@
+﻿from __future__ import annotations
+
+import datetime
+import math
+from bisect import bisect_left
+from statistics import median
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, update
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.keys import ladder_group_id
+from btb.db.schema import PropsMarket
+from btb.research.prop_probability import expected_value
+
+# extrapolated probabilities are kept inside this band
+P_FLOOR = 0.001
+P_CEIL = 0.999
+
+# (game_id, player_id, book_id, prop_type)
+MarketKey = Tuple[int, int, int, str]
+
+
+def isotonic(values: Sequence[float], increasing: bool = True) -> List[float]:
+    """Least-squares monotone fit (pool adjacent violators), equal weights."""
+    sign = 1.0 if increasing else -1.0
+    blocks: List[List[float]] = []  # [mean, weight]
+    for v in values:
+        blocks.append([sign * v, 1.0])
+        while len(blocks) > 1 and blocks[-2][0] > blocks[-1][0]:
+            m2, w2 = blocks.pop()
+            m1, w1 = blocks[-1]
+            blocks[-1] = [(m1 * w1 + m2 * w2) / (w1 + w2), w1 + w2]
+    out: List[float] = []
+    for m, w in blocks:
+        out.extend([sign * m] * int(w))
+    return out
+
+
+def _logit(p: float) -> float:
+    p = min(max(p, P_FLOOR), P_CEIL)
+    return math.log(p / (1.0 - p))
+
+
+class Ladder:
+    """
+    One book's alt lines for a player prop, as sorted arrays.
+
+    implied holds 1/price per line; curve is implied / margin made monotone in the
+    line (non-increasing for overs, non-decreasing for unders). Between rungs the
+    curve is interpolated linearly, beyond the ends linearly in log-odds from the
+    end segment, so any line resolves with one bisect.
+    """
+
+    __slots__ = ("key", "side", "group_id", "lines", "prices", "implied", "margin", "curve")
+
+    def __init__(self, key: MarketKey, side: str, lines: List[float], prices: List[float], margin: float = 1.0) -> None:
+        self.key = key
+        self.side = side
+        self.group_id = ladder_group_id(*key, side)
+        self.lines = lines
+        self.prices = prices
+        self.implied = [1.0 / p for p in prices]
+        self.set_margin(margin)
+
+    def set_margin(self, margin: float) -> None:
+        self.margin = margin if margin > 0 else 1.0
+        self.curve = isotonic([p / self.margin for p in self.implied], increasing=self.side == "under")
+
+    def prob_at(self, line: float) -> float:
+        lines, curve = self.lines, self.curve
+        n = len(lines)
+        i = bisect_left(lines, line)
+        if i < n and lines[i] == line:
+            return curve[i]
+        if n == 1:
+            return curve[0]
+        if 0 < i < n:
+            w = (line - lines[i - 1]) / (lines[i] - lines[i - 1])
+            return curve[i - 1] + w * (curve[i] - curve[i - 1])
+        a, b = (0, 1) if i == 0 else (n - 2, n - 1)
+        slope = (_logit(curve[b]) - _logit(curve[a])) / (lines[b] - lines[a])
+        x = _logit(curve[a]) + slope * (line - lines[a])
+        return min(max(1.0 / (1.0 + math.exp(-x)), P_FLOOR), P_CEIL)
+
+    def fair_price(self, line: float) -> float:
+        return 1.0 / self.prob_at(line)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+
+def _pair_margin(over: Ladder, under: Ladder) -> Optional[float]:
+    """Median overround across lines the book quotes on both sides."""
+    under_at = dict(zip(under.lines, under.implied))
+    rounds = [p + under_at[ln] for ln, p in zip(over.lines, over.implied) if ln in under_at]
+    return median(rounds) if rounds else None
+
+
+def build_ladders(rows: Iterable[Tuple[int, int, int, str, Optional[str], float, float, datetime.datetime]]) -> List[Ladder]:
+    """
+    Ladders from (game, player, book, prop_type, side, line, price, collected_ts) quotes.
+
+    Each ladder is the book's latest collection for the market and side (the rows
+    at its max collected_ts): a line the book has moved off is not a rung. An over
+    and under ladder of the same market de-vig each other with their median
+    overround; a one-sided ladder stays raw.
+    """
+    latest: Dict[Tuple[MarketKey, str], Tuple[datetime.datetime, Dict[float, float]]] = {}
+    for gid, pid, bid, pt, side, line, price, ts in rows:
+        if price is None or line is None or float(price) <= 1.0:
+            continue
+        key = ((gid, pid, bid, pt), side or "over")
+        cur = latest.get(key)
+        if cur is None or ts > cur[0]:
+            latest[key] = cur = (ts, {})
+        elif ts < cur[0]:
+            continue
+        cur[1][float(line)] = float(price)
+
+    ladders: Dict[Tuple[MarketKey, str], Ladder] = {}
+    for (key, side), (_, rungs) in latest.items():
+        lines = sorted(rungs)
+        ladders[(key, side)] = Ladder(key, side, lines, [rungs[ln] for ln in lines])
+    for (key, side), over in ladders.items():
+        under = ladders.get((key, "under")) if side == "over" else None
+        margin = _pair_margin(over, under) if under is not None else None
+        if margin:
+            over.set_margin(margin)
+            under.set_margin(margin)
+    return sorted(ladders.values(), key=lambda l: (l.key[3], l.key[2], l.side))
+
+
+def edge_profile(ladder: Ladder, model: Sequence[Dict[str, float]]) -> Dict[str, Any]:
+    """
+    Model vs market along a ladder, computed column-wise over its rungs.
+
+    model: the fit's probabilities() rows for ladder.lines, in the same order.
+    """
+    p_model = [m["p_under"] if ladder.side == "under" else m["p_over"] for m in model]
+    p_push = [m["p_push"] for m in model]
+    edge = [pm - pf for pm, pf in zip(p_model, ladder.curve)]
+    ev = [expected_value(pm, px, pp) for pm, px, pp in zip(p_model, ladder.prices, p_push)]
+    best = max(range(len(ev)), key=ev.__getitem__) if ev else None
+    return {
+        "group_id": ladder.group_id,
+        "side": ladder.side,
+        "margin": round(ladder.margin, 4),
+        "lines": ladder.lines,
+        "prices": ladder.prices,
+        "market_prob": [round(p, 4) for p in ladder.curve],
+        "model_prob": [round(p, 4) for p in p_model],
+        "edge": [round(e, 4) for e in edge],
+        "ev": [round(e, 4) for e in ev],
+        "best_line": ladder.lines[best] if best is not None else None,
+        "best_ev": round(ev[best], 4) if best is not None else None,
+    }
+
+
+@instrument.instrumented("props.group_alt_lines")
+def assign_ladder_groups(batch_size: int = 5000) -> Dict[str, Any]:
+    """Backfill alt_line_group_id on props rows stored before ingest assigned it."""
+    session = get_session()
+    rows = session.execute(
+        select(PropsMarket.id, PropsMarket.game_id, PropsMarket.player_id, PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.side)
+        .where(PropsMarket.alt_line_group_id.is_(None))
+    ).all()
+    updates = [{"id": rid, "alt_line_group_id": ladder_group_id(g, p, b, pt, side)} for rid, g, p, b, pt, side in rows]
+    for i in range(0, len(updates), batch_size):
+        session.execute(update(PropsMarket), updates[i : i + batch_size])
+    session.commit()
+    session.close()
+    return {"rows_updated": len(updates), "ladders": len({u["alt_line_group_id"] for u in updates})}
@@ -0,0 +1,287 @@
+﻿from __future__ import annotations
+
+import datetime
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from btb.core import instrument
+from btb.core.stat_expressions import STAT_COLUMNS, CompiledStat, get_registry
+from btb.db.connection import get_engine, get_session
+from btb.db.schema import Book, Game, PropsMarket, Season, StatsPlayerGame
+from btb.research.queries_props import _bias_and_conf
+from btb.research.roster import resolve_player_games
+
+_BUCKETS = ("low", "medium", "high")
+
+
+class _PlayerHistory:
+    """Per-player game log held as parallel sorted columns; derived prop series carry prefix sums."""
+
+    __slots__ = ("dates", "columns", "index_of", "_series")
+
+    def __init__(self, dates: List[datetime.date], columns: Dict[str, List[Optional[float]]], game_ids: List[int]) -> None:
+        self.dates = dates
+        self.columns = columns
+        self.index_of = {gid: i for i, gid in enumerate(game_ids)}
+        self._series: Dict[str, Tuple[List[Optional[float]], List[float], List[int]]] = {}
+
+    def series(self, stat: CompiledStat) -> Tuple[List[Optional[float]], List[float], List[int]]:
+        """(values, prefix sums, prefix counts) of a prop type, evaluated once per player."""
+        cached = self._series.get(stat.name)
+        if cached is None:
+            vals = stat.evaluate(self.columns)
+            sums, counts = [0.0], [0]
+            for v in vals:
+                sums.append(sums[-1] + (v or 0.0))
+                counts.append(counts[-1] + (v is not None))
+            cached = (vals, sums, counts)
+            self._series[stat.name] = cached
+        return cached
+
+    def window_before(self, day: datetime.date, window: int) -> Tuple[int, int]:
+        """Return [lo, hi) indexes of the last `window` games strictly before `day`."""
+        hi = bisect_left(self.dates, day)
+        return max(0, hi - window), hi
+
+
+def _new_tally() -> Dict[str, float]:
+    return {"n": 0, "wins": 0, "losses": 0, "pushes": 0, "staked": 0.0, "pnl": 0.0, "implied_sum": 0.0, "hr5_sum": 0.0, "hr5_n": 0}
+
+
+def _add(tally: Dict[str, float], outcome: str, price: float, hr5: Optional[float]) -> None:
+    tally["n"] += 1
+    tally["implied_sum"] += 1.0 / price if price > 0 else 0.0
+    if hr5 is not None:
+        tally["hr5_sum"] += hr5
+        tally["hr5_n"] += 1
+    if outcome == "W":
+        tally["wins"] += 1
+        tally["staked"] += 1.0
+        tally["pnl"] += price - 1.0
+    elif outcome == "L":
+        tally["losses"] += 1
+        tally["staked"] += 1.0
+        tally["pnl"] -= 1.0
+    else:
+        tally["pushes"] += 1
+
+
+def _merge(into: Dict[str, float], other: Dict[str, float]) -> None:
+    for k, v in other.items():
+        into[k] = into.get(k, 0) + v
+
+
+def _finish(tally: Dict[str, float]) -> Dict[str, Any]:
+    decided = tally["wins"] + tally["losses"]
+    n = tally["n"]
+    return {
+        "n": int(n),
+        "wins": int(tally["wins"]),
+        "losses": int(tally["losses"]),
+        "pushes": int(tally["pushes"]),
+        "pnl": round(tally["pnl"], 4),
+        "roi": (tally["pnl"] / tally["staked"]) if tally["staked"] else None,
+        "hit_rate": (tally["wins"] / decided) if decided else None,
+        # calibration: realised hit rate vs what the price and the form window implied
+        "avg_implied_prob": (tally["implied_sum"] / n) if n else None,
+        "avg_hit_rate_5": (tally["hr5_sum"] / tally["hr5_n"]) if tally["hr5_n"] else None,
+    }
+
+
+def _settle(bias: str, actual: float, line: float) -> str:
+    if actual == line:
+        return "PUSH"
+    if bias == "over":
+        return "W" if actual > line else "L"
+    return "W" if actual < line else "L"
+
+
+def _load_histories(session, player_ids: Iterable[int], upto: datetime.date) -> Dict[int, _PlayerHistory]:
+    ids = sorted(set(player_ids))
+    stat_cols = [getattr(StatsPlayerGame, c) for c in STAT_COLUMNS]
+    rows = []
+    # chunk the IN list to stay under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 500):
+        rows.extend(
+            session.execute(
+                select(StatsPlayerGame.player_id, StatsPlayerGame.game_id, Game.game_date, *stat_cols)
+                .join(Game, StatsPlayerGame.game_id == Game.id)
+                .where(StatsPlayerGame.player_id.in_(ids[i : i + 500]))
+                .where(Game.game_date <= upto)
+            ).all()
+        )
+    rows.sort(key=lambda r: (r[0], r[2]))
+
+    histories: Dict[int, _PlayerHistory] = {}
+    cur_pid: Optional[int] = None
+    dates: List[datetime.date] = []
+    game_ids: List[int] = []
+    cols: Dict[str, List[Optional[float]]] = {}
+    for r in rows:
+        pid, gid, gdate = r[0], r[1], r[2]
+        if pid != cur_pid:
+            if cur_pid is not None:
+                histories[cur_pid] = _PlayerHistory(dates, cols, game_ids)
+            cur_pid = pid
+            dates, game_ids = [], []
+            cols = {c: [] for c in STAT_COLUMNS}
+        dates.append(gdate)
+        game_ids.append(gid)
+        for c, v in zip(STAT_COLUMNS, r[3:]):
+            cols[c].append(float(v) if v is not None else None)
+    if cur_pid is not None:
+        histories[cur_pid] = _PlayerHistory(dates, cols, game_ids)
+    return histories
+
+
+def _backtest_season(season_id: int, window: int = 5) -> Dict[str, Any]:
+    """Replay every props snapshot of one season. Runs in a worker process."""
+    session = get_session()
+    try:
+        props = session.execute(
+            select(
+                PropsMarket.game_id,
+                PropsMarket.player_id,
+                Book.code,
+                PropsMarket.prop_type,
+                PropsMarket.side,
+                PropsMarket.line,
+                PropsMarket.price,
+                Game.game_date,
+            )
+            .join(Game, PropsMarket.game_id == Game.id)
+            .join(Book, PropsMarket.book_id == Book.id)
+            .where(Game.season_id == season_id)
+        ).all()
+        if not props:
+            return {"season_id": season_id, "props_seen": 0, "overall": _new_tally(), "by_confidence": {}, "by_book": {}, "skipped": {}}
+
+        last_day = max(r[7] for r in props)
+        histories = _load_histories(session, (r[1] for r in props), last_day)
+        # the game each player's result is filed under, when the props feed used another fixture id
+        pairs = sorted({(r[1], r[7]) for r in props})
+        result_games = dict(zip(pairs, resolve_player_games(session, pairs)))
+    finally:
+        session.close()
+
+    overall = _new_tally()
+    by_conf: Dict[str, Dict[str, float]] = {}
+    by_book: Dict[str, Dict[str, float]] = {}
+    skipped = {"unknown_prop_type": 0, "no_history": 0, "no_result": 0, "other_side": 0}
+
+    registry = get_registry()
+    for game_id, player_id, book_code, prop_type, side, line, price, game_date in props:
+        stat = registry.resolve(prop_type)
+        if stat is None:
+            skipped["unknown_prop_type"] += 1
+            continue
+        hist = histories.get(player_id)
+        if hist is None:
+            skipped["no_history"] += 1
+            continue
+        vals, sums, counts = hist.series(stat)
+        lo, hi = hist.window_before(game_date, window)
+        n = counts[hi] - counts[lo]
+        if n == 0:
+            skipped["no_history"] += 1
+            continue
+        idx = hist.index_of.get(game_id)
+        if idx is None:
+            idx = hist.index_of.get(result_games.get((player_id, game_date)))
+        actual = vals[idx] if idx is not None else None
+        if actual is None:
+            skipped["no_result"] += 1
+            continue
+
+        line = float(line)
+        recent_avg = (sums[hi] - sums[lo]) / n
+        window_vals = [v for v in vals[lo:hi] if v is not None]
+        hr5 = sum(1 for v in window_vals if v > line) / len(window_vals)
+        bias, conf = _bias_and_conf(recent_avg - line, hr5)
+        # the quote's price is for its own side (NULL = over); the other side of the market is not the bet
+        if bias != (side or "over"):
+            skipped["other_side"] += 1
+            continue
+
+        outcome = _settle(bias, actual, line)
+        price = float(price)
+        _add(overall, outcome, price, hr5)
+        _add(by_conf.setdefault(conf, _new_tally()), outcome, price, hr5)
+        _add(by_book.setdefault(book_code or "unknown", _new_tally()), outcome, price, hr5)
+
+    return {
+        "season_id": season_id,
+        "props_seen": len(props),
+        "overall": overall,
+        "by_confidence": by_conf,
+        "by_book": by_book,
+        "skipped": skipped,
+    }
+
+
+def _init_worker() -> None:
+    # drop pooled connections inherited from the parent process
+    get_engine().dispose(close=False)
+
+
+@instrument.instrumented("backtest.props")
+def run_props_backtest(
+    season_year_starts: Optional[List[int]] = None,
+    window: int = 5,
+    workers: int = 1,
+) -> Dict[str, Any]:
+    """
+    Backtest the recent-form edge/bias/confidence signal over historical props.
+
+    Every PropsMarket snapshot is scored with the form known strictly before its
+    game date (no lookahead), bet one unit on the bias side at the quoted price,
+    and settled against the player's StatsPlayerGame row for that game.
+    Seasons are processed independently and in parallel when workers > 1.
+    """
+    session = get_session()
+    q = select(Season.id, Season.year_start).order_by(Season.year_start)
+    if season_year_starts:
+        q = q.where(Season.year_start.in_(season_year_starts))
+    seasons = session.execute(q).all()
+    session.close()
+
+    season_ids = [s[0] for s in seasons]
+    if workers > 1 and len(season_ids) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            parts = list(pool.map(_backtest_season, season_ids, [window] * len(season_ids)))
+    else:
+        parts = [_backtest_season(sid, window) for sid in season_ids]
+
+    year_by_id = {s[0]: s[1] for s in seasons}
+    overall = _new_tally()
+    by_conf: Dict[str, Dict[str, float]] = {}
+    by_book: Dict[str, Dict[str, float]] = {}
+    skipped: Dict[str, int] = {}
+    by_season: Dict[str, Any] = {}
+    props_seen = 0
+
+    for part in parts:
+        props_seen += part["props_seen"]
+        _merge(overall, part["overall"])
+        for k, t in part["by_confidence"].items():
+            _merge(by_conf.setdefault(k, _new_tally()), t)
+        for k, t in part["by_book"].items():
+            _merge(by_book.setdefault(k, _new_tally()), t)
+        for k, v in part["skipped"].items():
+            skipped[k] = skipped.get(k, 0) + v
+        by_season[str(year_by_id.get(part["season_id"]))] = _finish(part["overall"])
+
+    return {
+        "ok": True,
+        "window": window,
+        "seasons": [s[1] for s in seasons],
+        "props_seen": props_seen,
+        "overall": _finish(overall),
+        "by_confidence": {k: _finish(by_conf[k]) for k in _BUCKETS if k in by_conf},
+        "by_book": {k: _finish(v) for k, v in sorted(by_book.items())},
+        "by_season": by_season,
+        "skipped": skipped,
+    }
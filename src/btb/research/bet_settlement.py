@@ -0,0 +1,205 @@
+﻿from __future__ import annotations
+
+import datetime
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, exists, or_, select, update
+
+from btb.core import instrument
+from btb.core.stat_expressions import STAT_COLUMNS, get_registry
+from btb.db.connection import get_session
+from btb.db.schema import Bet, Game, OddsMarket, PropsMarket, StatsPlayerGame
+
+FINAL = "final"
+VOID_STATUSES = ("postponed", "cancelled")
+BATCH_SIZE = 5000
+_IN_CHUNK = 500
+
+# columns of one open bet row, in select order
+_BET_COLS = (
+    "id", "game_id", "stake", "price",
+    "player_id", "prop_type", "prop_side", "prop_line",
+    "market_type", "outcome", "odds_line",
+    "status", "home_team_id", "away_team_id", "home_score", "away_score",
+)
+
+
+def _open_settleable(session) -> List[Tuple[Any, ...]]:
+    """
+    Unsettled bets whose game is final (or void): status final/postponed/cancelled,
+    or unreported with box-score rows in for both teams (one team's rows alone can be
+    a partial, in-progress feed).
+    """
+    has_box = and_(_has_team_box(Game.home_team_id), _has_team_box(Game.away_team_id))
+    q = (
+        select(
+            Bet.id, Bet.game_id, Bet.stake, Bet.price,
+            PropsMarket.player_id, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line,
+            OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line,
+            Game.status, Game.home_team_id, Game.away_team_id, Game.home_score, Game.away_score,
+        )
+        .join(Game, Game.id == Bet.game_id)
+        .outerjoin(PropsMarket, PropsMarket.id == Bet.props_market_id)
+        .outerjoin(OddsMarket, OddsMarket.id == Bet.odds_market_id)
+        .where(Bet.result.is_(None))
+        .where(or_(Game.status.in_((FINAL,) + VOID_STATUSES), and_(Game.status.is_(None), has_box)))
+        .order_by(Bet.id)
+    )
+    return session.execute(q).all()
+
+
+def _has_team_box(team_id):
+    return exists().where(StatsPlayerGame.game_id == Game.id, StatsPlayerGame.team_id == team_id)
+
+
+def _box_scores(session, game_ids: Sequence[int]) -> Tuple[Dict[Tuple[int, int], Tuple[Any, ...]], Dict[Tuple[int, int], int]]:
+    """(game, player) -> stat row, and (game, team) -> summed points (score fallback)."""
+    stat_cols = [getattr(StatsPlayerGame, c) for c in STAT_COLUMNS]
+    lines: Dict[Tuple[int, int], Tuple[Any, ...]] = {}
+    team_pts: Dict[Tuple[int, int], int] = {}
+    for i in range(0, len(game_ids), _IN_CHUNK):
+        q = select(StatsPlayerGame.game_id, StatsPlayerGame.player_id, StatsPlayerGame.team_id, *stat_cols).where(StatsPlayerGame.game_id.in_(game_ids[i : i + _IN_CHUNK]))
+        for r in session.execute(q):
+            lines[(r[0], r[1])] = r[3:]
+            if r[2] is not None:
+                team_pts[(r[0], r[2])] = team_pts.get((r[0], r[2]), 0) + int(r[3 + STAT_COLUMNS.index("points")] or 0)
+    return lines, team_pts
+
+
+def grade(actual: Sequence[Optional[float]], lines: Sequence[float], overs: Sequence[bool]) -> List[Optional[str]]:
+    """W/L/PUSH per bet from actual-vs-line columns; None where the actual is unknown."""
+    return [
+        None if a is None else "PUSH" if a == ln else ("W" if (a > ln) == ov else "L")
+        for a, ln, ov in zip(actual, lines, overs)
+    ]
+
+
+def pnl(results: Sequence[Optional[str]], stakes: Sequence[float], prices: Sequence[float]) -> List[Optional[float]]:
+    return [
+        None if r is None else round(s * (p - 1.0), 4) if r == "W" else -s if r == "L" else 0.0
+        for r, s, p in zip(results, stakes, prices)
+    ]
+
+
+def _settle_props(rows: List[Dict[str, Any]], lines: Dict[Tuple[int, int], Tuple[Any, ...]], results: Dict[int, str], counts: Dict[str, int]) -> None:
+    registry = get_registry()
+    by_type: Dict[str, List[Dict[str, Any]]] = {}
+    for r in rows:
+        by_type.setdefault(r["prop_type"], []).append(r)
+    for prop_type, group in by_type.items():
+        compiled = registry.resolve(prop_type)
+        if compiled is None:
+            counts["unsupported_prop_type"] += len(group)
+            continue
+        played = []
+        for r in group:
+            if (r["game_id"], r["player_id"]) in lines:
+                played.append(r)
+            else:
+                results[r["id"]] = "VOID"  # no box-score line: did not play
+        if not played:
+            continue
+        stat_rows = [lines[(r["game_id"], r["player_id"])] for r in played]
+        cols = {c: [float(s[i]) if s[i] is not None else None for s in stat_rows] for i, c in enumerate(STAT_COLUMNS)}
+        graded = grade(compiled.evaluate(cols), [float(r["prop_line"]) for r in played], [(r["prop_side"] or "over") == "over" for r in played])
+        for r, g in zip(played, graded):
+            if g is None:
+                counts["missing_stat"] += 1
+            else:
+                results[r["id"]] = g
+
+
+def _settle_odds(rows: List[Dict[str, Any]], team_pts: Dict[Tuple[int, int], int], results: Dict[int, str], counts: Dict[str, int]) -> None:
+    known = []
+    for r in rows:
+        home, away = r["home_score"], r["away_score"]
+        if home is None or away is None:
+            home = team_pts.get((r["game_id"], r["home_team_id"]))
+            away = team_pts.get((r["game_id"], r["away_team_id"]))
+        if home is None or away is None:
+            counts["awaiting_scores"] += 1
+            continue
+        known.append((r, float(home), float(away)))
+
+    # every main market reduces to "value vs threshold, over or under"
+    actual: List[float] = []
+    thresholds: List[float] = []
+    overs: List[bool] = []
+    for r, home, away in known:
+        mt, oc, line = r["market_type"], r["outcome"], r["odds_line"]
+        if mt == "total":
+            actual.append(home + away)
+            thresholds.append(float(line))
+            overs.append(oc == "over")
+        else:
+            margin = home - away if oc == "home" else away - home
+            actual.append(margin + (float(line) if mt == "spread" and line is not None else 0.0))
+            thresholds.append(0.0)
+            overs.append(True)
+    for (r, _, _), g in zip(known, grade(actual, thresholds, overs)):
+        results[r["id"]] = g
+
+
+def _settle_batch(session, batch: List[Dict[str, Any]], now: datetime.datetime, counts: Dict[str, int]) -> List[Dict[str, Any]]:
+    results: Dict[int, str] = {}
+    live: List[Dict[str, Any]] = []
+    for r in batch:
+        if r["status"] in VOID_STATUSES:
+            results[r["id"]] = "VOID"
+        elif r["prop_type"] is None and r["market_type"] is None:
+            counts["unlinked"] += 1
+        else:
+            live.append(r)
+
+    lines, team_pts = _box_scores(session, sorted({r["game_id"] for r in live}))
+    _settle_props([r for r in live if r["prop_type"] is not None], lines, results, counts)
+    _settle_odds([r for r in live if r["prop_type"] is None], team_pts, results, counts)
+
+    settled = [r for r in batch if r["id"] in results]
+    outcomes = [results[r["id"]] for r in settled]
+    pnls = pnl(outcomes, [float(r["stake"]) for r in settled], [float(r["price"]) for r in settled])
+    return [{"id": r["id"], "result": o, "pnl": p, "settled_ts": now} for r, o, p in zip(settled, outcomes, pnls)]
+
+
+@instrument.instrumented("bets.settle")
+def settle_bets(batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """
+    Settle open bets whose games are final: W/L/PUSH/VOID and PnL.
+
+    Props grade against the player's stats_player_game line (no line = VOID, did
+    not play); main markets against the game's final score, or the box-score
+    points per side when no score was reported. Postponed/cancelled games void
+    their bets. Each batch is graded column-wise per prop type and written with one
+    bulk UPDATE; bets already carrying a result are never revisited.
+    """
+    t0 = time.perf_counter()
+    session = get_session()
+    now = datetime.datetime.utcnow()
+    counts = {"unlinked": 0, "unsupported_prop_type": 0, "missing_stat": 0, "awaiting_scores": 0}
+    by_result = {"W": 0, "L": 0, "PUSH": 0, "VOID": 0}
+    total_pnl = 0.0
+    settled = 0
+
+    with instrument.span("bets.settle.load"):
+        open_rows = [dict(zip(_BET_COLS, r)) for r in _open_settleable(session)]
+    for start in range(0, len(open_rows), batch_size):
+        updates = _settle_batch(session, open_rows[start : start + batch_size], now, counts)
+        if updates:
+            session.execute(update(Bet), updates)
+            session.commit()
+        for u in updates:
+            by_result[u["result"]] += 1
+            total_pnl += u["pnl"]
+        settled += len(updates)
+    session.close()
+    instrument.count("bets.settled", settled)
+
+    return {
+        "candidates": len(open_rows),
+        "settled": settled,
+        "results": by_result,
+        "pnl": round(total_pnl, 4),
+        "left_open": counts,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+    }
@@ -0,0 +1,208 @@
+﻿from __future__ import annotations
+
+import datetime
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, insert, select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.schema import Bet, Book, CLVObservation, Game, OddsMarket, PropsMarket
+
+
+class AsOfIndex:
+    """
+    Price series per market key, sorted by collected_ts, with binary-search lookups.
+
+    Keys are plain tuples, e.g. ("odds", game_id, book_id, market_type, outcome, line)
+    or ("props", game_id, book_id, player_id, prop_type, side, line).
+    """
+
+    def __init__(self) -> None:
+        self._ts: Dict[Hashable, List[datetime.datetime]] = {}
+        self._px: Dict[Hashable, List[float]] = {}
+        self._sorted = True
+
+    def add(self, key: Hashable, ts: datetime.datetime, price: float) -> None:
+        self._ts.setdefault(key, []).append(ts)
+        self._px.setdefault(key, []).append(float(price))
+        self._sorted = False
+
+    def freeze(self) -> None:
+        if self._sorted:
+            return
+        for key, ts in self._ts.items():
+            order = sorted(range(len(ts)), key=ts.__getitem__)
+            self._ts[key] = [ts[i] for i in order]
+            px = self._px[key]
+            self._px[key] = [px[i] for i in order]
+        self._sorted = True
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def price_at(self, key: Hashable, ts: datetime.datetime) -> Optional[float]:
+        """Latest price collected at or before ts."""
+        self.freeze()
+        series = self._ts.get(key)
+        if not series:
+            return None
+        i = bisect_right(series, ts)
+        return self._px[key][i - 1] if i else None
+
+    def last_before(self, key: Hashable, ts: datetime.datetime) -> Optional[float]:
+        """Latest price collected strictly before ts (e.g. the closing line)."""
+        self.freeze()
+        series = self._ts.get(key)
+        if not series:
+            return None
+        i = bisect_left(series, ts)
+        return self._px[key][i - 1] if i else None
+
+
+def _odds_key(game_id: int, book_id: int, market_type: str, outcome: str, line: Optional[float]) -> Tuple:
+    return ("odds", game_id, book_id, market_type, outcome, float(line) if line is not None else None)
+
+
+def _props_key(game_id: int, book_id: int, player_id: int, prop_type: str, side: Optional[str], line: float) -> Tuple:
+    return ("props", game_id, book_id, player_id, prop_type, side, float(line))
+
+
+def _resolve_reference_book(session, reference_book: Optional[str]) -> Optional[Book]:
+    if reference_book:
+        return session.execute(select(Book).where(Book.code == reference_book)).scalars().first()
+    return session.execute(select(Book).where(Book.sharp_flag.is_(True)).order_by(Book.id)).scalars().first()
+
+
+def _commence(game_date: datetime.date, commence_ts: Optional[datetime.datetime]) -> datetime.datetime:
+    if commence_ts is not None:
+        return commence_ts
+    # game_date is the UTC date of tip-off; without a tip-off time, close at the end of that day
+    return datetime.datetime.combine(game_date + datetime.timedelta(days=1), datetime.time.min)
+
+
+def _chunks(ids: List[int], size: int = 500) -> Iterable[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i : i + size]
+
+
+def build_asof_index(session, game_ids: Iterable[int], book_ids: Iterable[int]) -> AsOfIndex:
+    """Load odds and props snapshots for the given games/books into an AsOfIndex."""
+    index = AsOfIndex()
+    gids = sorted(set(game_ids))
+    bids = sorted(set(book_ids))
+    for chunk in _chunks(gids):
+        for gid, bid, mt, oc, line, price, ts in session.execute(
+            select(
+                OddsMarket.game_id, OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome,
+                OddsMarket.line, OddsMarket.price, OddsMarket.collected_ts,
+            )
+            .where(OddsMarket.game_id.in_(chunk))
+            .where(OddsMarket.book_id.in_(bids))
+        ):
+            index.add(_odds_key(gid, bid, mt, oc, line), ts, price)
+        for gid, bid, pid, pt, side, line, price, ts in session.execute(
+            select(
+                PropsMarket.game_id, PropsMarket.book_id, PropsMarket.player_id, PropsMarket.prop_type,
+                PropsMarket.side, PropsMarket.line, PropsMarket.price, PropsMarket.collected_ts,
+            )
+            .where(PropsMarket.game_id.in_(chunk))
+            .where(PropsMarket.book_id.in_(bids))
+        ):
+            index.add(_props_key(gid, bid, pid, pt, side, line), ts, price)
+    index.freeze()
+    return index
+
+
+@instrument.instrumented("clv.compute")
+def compute_clv(reference_book: Optional[str] = None, incremental: bool = True) -> Dict[str, Any]:
+    """
+    Populate clv_observations for bets against a reference book's closing line.
+
+    For every bet linked to a props or odds market row, the reference book's price
+    for the same market is looked up at placed_ts (open_price) and as the last
+    snapshot before commence (closing_price); calculated_clv = bet price / closing - 1.
+    Incremental runs only consider bets without an observation for the reference book;
+    bets whose closing price is not yet known are left for a later run.
+    """
+    session = get_session()
+
+    ref = _resolve_reference_book(session, reference_book)
+    if ref is None:
+        return {"ok": False, "error": "No reference book (pass a code or flag a book sharp_flag)", "reason_code": "NO_REFERENCE_BOOK"}
+
+    if not incremental:
+        session.execute(delete(CLVObservation).where(CLVObservation.reference_book_id == ref.id))
+
+    done = select(CLVObservation.bet_id).where(CLVObservation.reference_book_id == ref.id)
+
+    props_bets = session.execute(
+        select(
+            Bet.id, Bet.placed_ts, Bet.price, PropsMarket.game_id, PropsMarket.player_id,
+            PropsMarket.prop_type, PropsMarket.side, PropsMarket.line, Game.game_date, Game.commence_ts,
+        )
+        .join(PropsMarket, Bet.props_market_id == PropsMarket.id)
+        .join(Game, PropsMarket.game_id == Game.id)
+        .where(Bet.id.not_in(done))
+    ).all()
+
+    odds_bets = session.execute(
+        select(
+            Bet.id, Bet.placed_ts, Bet.price, OddsMarket.game_id, OddsMarket.market_type,
+            OddsMarket.outcome, OddsMarket.line, Game.game_date, Game.commence_ts,
+        )
+        .join(OddsMarket, Bet.odds_market_id == OddsMarket.id)
+        .join(Game, OddsMarket.game_id == Game.id)
+        .where(Bet.props_market_id.is_(None))
+        .where(Bet.id.not_in(done))
+    ).all()
+
+    unlinked = session.execute(
+        select(Bet.id)
+        .where(Bet.props_market_id.is_(None))
+        .where(Bet.odds_market_id.is_(None))
+        .where(Bet.id.not_in(done))
+    ).all()
+
+    game_ids = [r[3] for r in props_bets] + [r[3] for r in odds_bets]
+    index = build_asof_index(session, game_ids, [ref.id])
+
+    rows: List[Dict[str, Any]] = []
+    for bet_id, placed_ts, bet_price, gid, pid, pt, side, line, gdate, cts in props_bets:
+        key = _props_key(gid, ref.id, pid, pt, side, line)
+        rows.append(_observation(bet_id, ref.id, bet_price, index.price_at(key, placed_ts), index.last_before(key, _commence(gdate, cts))))
+    for bet_id, placed_ts, bet_price, gid, mt, oc, line, gdate, cts in odds_bets:
+        key = _odds_key(gid, ref.id, mt, oc, line)
+        rows.append(_observation(bet_id, ref.id, bet_price, index.price_at(key, placed_ts), index.last_before(key, _commence(gdate, cts))))
+    # without a closing price the bet stays pending and is retried by the next incremental run
+    no_close = sum(1 for r in rows if r["closing_price"] is None)
+    rows = [r for r in rows if r["closing_price"] is not None]
+
+    if rows:
+        session.execute(insert(CLVObservation), rows)
+    session.commit()
+
+    return {
+        "ok": True,
+        "reference_book": ref.code,
+        "incremental": incremental,
+        "bets_considered": len(props_bets) + len(odds_bets),
+        "observations_written": len(rows),
+        "missing_closing_price": no_close,
+        "bets_unlinked": len(unlinked),
+        "series_indexed": len(index),
+    }
+
+
+def _observation(bet_id: int, ref_id: int, bet_price: float, open_price: Optional[float], closing_price: Optional[float]) -> Dict[str, Any]:
+    clv = None
+    if closing_price and bet_price:
+        clv = float(bet_price) / float(closing_price) - 1.0
+    return {
+        "bet_id": bet_id,
+        "reference_book_id": ref_id,
+        "open_price": open_price,
+        "closing_price": closing_price,
+        "calculated_clv": clv,
+    }
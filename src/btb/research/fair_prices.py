@@ -0,0 +1,227 @@
+﻿from __future__ import annotations
+
+import datetime
+from statistics import median
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.schema import Book, EngineCheckpoint, FairPrice, OddsMarket, PropsMarket
+
+# consensus weight of a sharp_flag book relative to a recreational one
+SHARP_WEIGHT = 3.0
+
+_ODDS_CHECKPOINT = "fair_prices.odds"
+_PROPS_CHECKPOINT = "fair_prices.props"
+
+# (scope, book_id, market_type, player_id, outcome, line) -> (price, collected_ts)
+Quote = Tuple[str, int, str, Optional[int], str, Optional[float]]
+
+
+def _pair_line(market_type: str, outcome: str, line: Optional[float]) -> Optional[float]:
+    # both sides of a proposition share this value (spreads are quoted from each side)
+    if market_type == "spread" and line is not None and outcome == "away":
+        return -float(line)
+    return float(line) if line is not None else None
+
+
+def _latest_quotes(session, game_id: int) -> Dict[Quote, Tuple[float, datetime.datetime]]:
+    """
+    What each book offers now: its latest collection per market and side (outcome).
+    A line it has moved off since is not a quote, neither here nor in the consensus.
+    """
+    latest: Dict[Tuple, Tuple[datetime.datetime, Dict[Quote, float]]] = {}
+
+    def keep(key: Quote, price: float, ts: datetime.datetime) -> None:
+        market = key[:5]
+        cur = latest.get(market)
+        if cur is None or ts > cur[0]:
+            latest[market] = cur = (ts, {})
+        elif ts < cur[0]:
+            return
+        cur[1][key] = float(price)
+
+    for bid, mt, oc, line, price, ts in session.execute(
+        select(OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line, OddsMarket.price, OddsMarket.collected_ts)
+        .where(OddsMarket.game_id == game_id)
+    ):
+        keep(("odds", bid, mt, None, oc, float(line) if line is not None else None), price, ts)
+
+    for bid, pt, pid, side, line, price, ts in session.execute(
+        select(PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.player_id, PropsMarket.side, PropsMarket.line, PropsMarket.price, PropsMarket.collected_ts)
+        .where(PropsMarket.game_id == game_id)
+    ):
+        keep(("props", bid, pt, pid, side or "over", float(line)), price, ts)
+
+    return {key: (price, ts) for ts, quotes in latest.values() for key, price in quotes.items()}
+
+
+def devig_game(
+    game_id: int,
+    quotes: Dict[Quote, Tuple[float, datetime.datetime]],
+    sharp_book_ids: Set[int],
+) -> List[Dict[str, Any]]:
+    """
+    Turn the latest quotes of one game into fair_prices rows.
+
+    Two-sided quotes are de-vigged multiplicatively (implied / overround). A one-sided
+    quote (typical for props) is scaled by the median overround of the same book's
+    two-sided markets in the game, or kept raw when there is none. Consensus rows
+    average book fair probabilities with sharp books weighted SHARP_WEIGHT.
+    """
+    pairs: Dict[Tuple, Dict[str, Tuple[Optional[float], float, datetime.datetime]]] = {}
+    for (scope, bid, mt, pid, oc, line), (price, ts) in quotes.items():
+        if price <= 1.0:
+            continue
+        pkey = (scope, bid, mt, pid, _pair_line(mt, oc, line))
+        pairs.setdefault(pkey, {})[oc] = (line, price, ts)
+
+    book_overrounds: Dict[int, List[float]] = {}
+    for (scope, bid, mt, pid, _), sides in pairs.items():
+        if len(sides) == 2:
+            book_overrounds.setdefault(bid, []).append(sum(1.0 / p for _, p, _ in sides.values()))
+    book_margin = {bid: median(v) for bid, v in book_overrounds.items()}
+
+    rows: List[Dict[str, Any]] = []
+    for (scope, bid, mt, pid, _), sides in pairs.items():
+        if len(sides) == 2:
+            overround = sum(1.0 / p for _, p, _ in sides.values())
+            method = "paired"
+        elif bid in book_margin:
+            overround = book_margin[bid]
+            method = "book_margin"
+        else:
+            overround = None
+            method = "raw"
+        for oc, (line, price, ts) in sides.items():
+            implied = 1.0 / price
+            rows.append(
+                {
+                    "game_id": game_id,
+                    "scope": scope,
+                    "market_type": mt,
+                    "player_id": pid,
+                    "book_id": bid,
+                    "outcome": oc,
+                    "line": line,
+                    "price": price,
+                    "implied_prob": implied,
+                    "overround": overround,
+                    "fair_prob": implied / overround if overround else implied,
+                    "books_used": None,
+                    "method": method,
+                    "as_of_ts": ts,
+                }
+            )
+
+    consensus: Dict[Tuple, List[Any]] = {}
+    for r in rows:
+        ckey = (r["scope"], r["market_type"], r["player_id"], r["outcome"], r["line"])
+        w = SHARP_WEIGHT if r["book_id"] in sharp_book_ids else 1.0
+        acc = consensus.setdefault(ckey, [0.0, 0.0, 0, None])
+        acc[0] += w * r["fair_prob"]
+        acc[1] += w
+        acc[2] += 1
+        acc[3] = r["as_of_ts"] if acc[3] is None else max(acc[3], r["as_of_ts"])
+
+    for (scope, mt, pid, oc, line), (wsum, wtot, n, ts) in consensus.items():
+        rows.append(
+            {
+                "game_id": game_id,
+                "scope": scope,
+                "market_type": mt,
+                "player_id": pid,
+                "book_id": None,
+                "outcome": oc,
+                "line": line,
+                "price": None,
+                "implied_prob": None,
+                "overround": None,
+                "fair_prob": wsum / wtot,
+                "books_used": n,
+                "method": "consensus",
+                "as_of_ts": ts,
+            }
+        )
+    return rows
+
+
+def _checkpoint(session, name: str) -> EngineCheckpoint:
+    cp = session.get(EngineCheckpoint, name)
+    if cp is None:
+        cp = EngineCheckpoint(name=name, last_id=0)
+        session.add(cp)
+    return cp
+
+
+def _count_ids(session, model, after: int, upto: int) -> int:
+    return session.execute(select(func.count(model.id)).where(model.id > after).where(model.id <= upto)).scalar() or 0
+
+
+@instrument.instrumented("fair_prices.refresh")
+def refresh_fair_prices(game_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+    """
+    Recompute fair_prices for games touched since the last run.
+
+    New odds_markets/props_markets rows are found through id checkpoints, so each
+    run only re-derives the games those rows belong to; rows_processed/rows_skipped
+    count the rows past and behind the checkpoints. Pass game_ids to force a
+    recompute of specific games.
+    """
+    session = get_session()
+
+    odds_cp = _checkpoint(session, _ODDS_CHECKPOINT)
+    props_cp = _checkpoint(session, _PROPS_CHECKPOINT)
+
+    max_odds = session.execute(select(func.max(OddsMarket.id))).scalar() or 0
+    max_props = session.execute(select(func.max(PropsMarket.id))).scalar() or 0
+
+    touched: Set[int] = set(game_ids or [])
+    counts: Dict[str, int] = {}
+    if game_ids is None:
+        counts["rows_processed"] = _count_ids(session, OddsMarket, odds_cp.last_id, max_odds) + _count_ids(session, PropsMarket, props_cp.last_id, max_props)
+        counts["rows_skipped"] = _count_ids(session, OddsMarket, 0, odds_cp.last_id) + _count_ids(session, PropsMarket, 0, props_cp.last_id)
+        touched.update(
+            session.execute(
+                select(OddsMarket.game_id).where(OddsMarket.id > odds_cp.last_id).where(OddsMarket.id <= max_odds).distinct()
+            ).scalars()
+        )
+        touched.update(
+            session.execute(
+                select(PropsMarket.game_id).where(PropsMarket.id > props_cp.last_id).where(PropsMarket.id <= max_props).distinct()
+            ).scalars()
+        )
+
+    sharp_ids = set(session.execute(select(Book.id).where(Book.sharp_flag.is_(True))).scalars())
+
+    rows_written = 0
+    for gid in sorted(touched):
+        rows = devig_game(gid, _latest_quotes(session, gid), sharp_ids)
+        session.execute(delete(FairPrice).where(FairPrice.game_id == gid))
+        if rows:
+            session.execute(insert(FairPrice), rows)
+        rows_written += len(rows)
+
+    if game_ids is None:
+        now = datetime.datetime.utcnow()
+        odds_cp.last_id, odds_cp.updated_ts = max_odds, now
+        props_cp.last_id, props_cp.updated_ts = max_props, now
+    session.commit()
+
+    return {"games_recomputed": len(touched), "fair_rows_written": rows_written, **counts}
+
+
+@instrument.timed("research.fair_lookup")
+def load_fair_lookup(session, game_id: int, scope: str, player_id: Optional[int] = None) -> Dict[Tuple, float]:
+    """
+    One indexed query for a game's fair probabilities, keyed by
+    (book_id or None, market_type, outcome, line) for joining onto research rows.
+    """
+    q = select(FairPrice.book_id, FairPrice.market_type, FairPrice.outcome, FairPrice.line, FairPrice.fair_prob).where(
+        FairPrice.game_id == game_id, FairPrice.scope == scope
+    )
+    if player_id is not None:
+        q = q.where(FairPrice.player_id == player_id)
+    return {(bid, mt, oc, line): fp for bid, mt, oc, line, fp in session.execute(q)}
@@ -0,0 +1,31 @@
+﻿from __future__ import annotations
+
+from typing import Any, Iterable, Optional, Tuple
+
+from btb.data_sources import change_bus, ingest_hooks
+from btb.research import matchup_aggregates, recompute, roster
+from btb.research.fair_prices import refresh_fair_prices
+
+
+def _fair_prices(changes: Iterable[Tuple[Any, ...]]) -> Any:
+    if change_bus.get_bus().subscribed(recompute.FAIR_PRICES):
+        # recompute.attach() re-devigs the changed games off the bus; doing it here too would double the work
+        return {"deferred": "change_bus"}
+    # checkpoint-driven: finds the new odds/props rows itself
+    return refresh_fair_prices()
+
+
+def _matchup_aggregates(changes: Iterable[Tuple[Any, ...]]) -> Optional[Any]:
+    return matchup_aggregates.refresh_for_games(c[1] for c in changes)
+
+
+def _roster(changes: Iterable[Tuple[Any, ...]]) -> Optional[Any]:
+    players = {c[2] for c in changes if c[2] is not None}
+    return roster.rebuild_roster(players) if players else None
+
+
+def install() -> None:
+    """Register the post-ingest refreshes of the derived research tables."""
+    ingest_hooks.add_refresher("fair_prices", _fair_prices)
+    ingest_hooks.add_refresher("matchup_aggregates", _matchup_aggregates)
+    ingest_hooks.add_refresher("roster", _roster)
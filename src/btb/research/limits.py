@@ -0,0 +1,71 @@
+﻿from __future__ import annotations
+
+import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import select
+
+from btb.db.connection import get_session
+from btb.db.limits_index import get_limits_index
+from btb.db.schema import Book
+
+
+def _month_starts(first: datetime.datetime, last: datetime.datetime) -> List[datetime.datetime]:
+    out = []
+    y, m = first.year, first.month
+    while (y, m) <= (last.year, last.month):
+        out.append(datetime.datetime(y, m, 1))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+
+def limit_decay_report(book: Optional[str] = None, until: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """
+    How each book's limits moved over time.
+
+    Per (book, scope): first and latest limit, percent change, number of cuts and
+    raises, the deepest single cut, and the limit in force at the start of every
+    month from the first observation to `until` (default now). Per book: the
+    combined change across its scopes.
+    """
+    session = get_session()
+    try:
+        q = select(Book.id, Book.code)
+        if book:
+            q = q.where(Book.code == book)
+        codes = {bid: code for bid, code in session.execute(q)}
+        if book and not codes:
+            return {"ok": False, "error": f"unknown book: {book}", "reason_code": "BOOK_NOT_FOUND"}
+        index = get_limits_index(session)
+    finally:
+        session.close()
+
+    until = until or datetime.datetime.utcnow()
+    books: Dict[str, Dict[str, Any]] = {}
+    for (book_id, scope), s in sorted(index.series.items()):
+        if book_id not in codes:
+            continue
+        amounts = s.amounts
+        steps = [(b - a) / a for a, b in zip(amounts, amounts[1:]) if a > 0]
+        months = _month_starts(s.ts[0], max(until, s.ts[-1]))
+        monthly = index.limits_at([book_id] * len(months), [scope] * len(months), months)
+        entry = books.setdefault(codes[book_id], {"scopes": {}, "first_total": 0.0, "last_total": 0.0})
+        entry["scopes"][scope] = {
+            "observations": len(amounts),
+            "first_ts": s.ts[0].isoformat(),
+            "first": amounts[0],
+            "last_ts": s.ts[-1].isoformat(),
+            "last": amounts[-1],
+            "change_pct": round((amounts[-1] - amounts[0]) / amounts[0] * 100.0, 2) if amounts[0] else None,
+            "cuts": sum(1 for x in steps if x < 0),
+            "raises": sum(1 for x in steps if x > 0),
+            "deepest_cut_pct": round(min(steps) * 100.0, 2) if steps and min(steps) < 0 else None,
+            "monthly": [{"month": m.strftime("%Y-%m"), "limit": v} for m, v in zip(months, monthly)],
+        }
+        entry["first_total"] += amounts[0]
+        entry["last_total"] += amounts[-1]
+
+    for entry in books.values():
+        first, last = entry.pop("first_total"), entry.pop("last_total")
+        entry["change_pct"] = round((last - first) / first * 100.0, 2) if first else None
+    return {"ok": True, "books": books}
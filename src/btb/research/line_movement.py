@@ -0,0 +1,285 @@
+﻿from __future__ import annotations
+
+import datetime
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import insert, select
+
+from btb.data_sources import ingest_hooks
+from btb.db.connection import get_session
+from btb.db.schema import Book, Game, LineMoveAlert, OddsMarket, PropsMarket
+
+# (game_id, scope, market_type, player_id, outcome, rung). For main markets the line
+# itself is the thing that moves and rung is None; a book quotes a prop at several
+# alt lines at once, so each prop line is its own market (rung) and moves in price.
+MoveKey = Tuple[int, str, str, Optional[int], str, Optional[float]]
+
+Alert = Dict[str, Any]
+
+
+def _priced(scope: str, market_type: str, line: Optional[float]) -> bool:
+    return scope == "props" or market_type == "moneyline" or line is None
+
+
+def _level(scope: str, market_type: str, line: Optional[float], price: float) -> Optional[float]:
+    # moneylines and prop rungs move in implied probability, spreads and totals in points
+    if _priced(scope, market_type, line):
+        return 1.0 / price if price > 0 else None
+    return float(line)
+
+
+def _threshold(scope: str, market_type: str, line: Optional[float], prob_move: float, line_move: float) -> float:
+    return prob_move if _priced(scope, market_type, line) else line_move
+
+
+class _MarketState:
+    __slots__ = ("books", "moves", "consensus", "last_alert")
+
+    def __init__(self, max_points: int) -> None:
+        self.books: Dict[str, Tuple[float, datetime.datetime]] = {}  # book -> (level, last change ts)
+        self.moves: Deque[Tuple[datetime.datetime, str, float]] = deque(maxlen=max_points)  # (ts, book, delta)
+        self.consensus: Deque[Tuple[datetime.datetime, float]] = deque(maxlen=max_points)
+        self.last_alert: Dict[Tuple[str, str], datetime.datetime] = {}
+
+
+class LineMovementDetector:
+    """
+    Sliding-window detector over snapshot batches.
+
+    - steam: at least `steam_books` books move the same way by the threshold inside the window
+    - reverse: the cross-book consensus moves by the threshold and then back by the threshold
+    - stale_book: a book sits the threshold away from the other books' consensus and has
+      not changed for `stale_after` while the others have
+
+    Thresholds are `prob_move` (implied probability) for moneylines and prop rungs
+    and `line_move` (points) for spreads and totals. State is bounded: every market keeps at most
+    `max_points` moves and at most `max_markets` markets are tracked (least recently
+    updated evicted first).
+    """
+
+    def __init__(
+        self,
+        window: datetime.timedelta = datetime.timedelta(minutes=15),
+        steam_books: int = 3,
+        prob_move: float = 0.03,
+        line_move: float = 1.0,
+        stale_after: datetime.timedelta = datetime.timedelta(minutes=10),
+        max_points: int = 64,
+        max_markets: int = 50_000,
+    ) -> None:
+        self.window = window
+        self.steam_books = steam_books
+        self.prob_move = prob_move
+        self.line_move = line_move
+        self.stale_after = stale_after
+        self.max_points = max_points
+        self.max_markets = max_markets
+        self._state: "OrderedDict[MoveKey, _MarketState]" = OrderedDict()
+        self.persist = False
+        self.mode = "live"
+
+    def _get_state(self, key: MoveKey) -> _MarketState:
+        st = self._state.get(key)
+        if st is None:
+            st = _MarketState(self.max_points)
+            self._state[key] = st
+            if len(self._state) > self.max_markets:
+                self._state.popitem(last=False)
+        else:
+            self._state.move_to_end(key)
+        return st
+
+    def __len__(self) -> int:
+        return len(self._state)
+
+    def process(self, scope: str, rows: List[Dict[str, Any]]) -> List[Alert]:
+        """Feed one snapshot batch (ingest_hooks row dicts) and return new alerts."""
+        touched: Dict[MoveKey, Tuple[datetime.datetime, float]] = {}
+        for r in rows:
+            level = _level(scope, r["market_type"], r["line"], float(r["price"]))
+            if level is None:
+                continue
+            rung = r["line"] if scope == "props" else None
+            key = (r["game_id"], scope, r["market_type"], r.get("player_id"), r["outcome"], rung)
+            ts = r.get("collected_ts") or datetime.datetime.utcnow()
+            st = self._get_state(key)
+            prev = st.books.get(r["book"])
+            if prev is None:
+                st.books[r["book"]] = (level, ts)
+            elif level != prev[0]:
+                st.moves.append((ts, r["book"], level - prev[0]))
+                st.books[r["book"]] = (level, ts)
+            thr = _threshold(scope, r["market_type"], r["line"], self.prob_move, self.line_move)
+            cur = touched.get(key)
+            touched[key] = (max(ts, cur[0]) if cur else ts, thr)
+
+        alerts: List[Alert] = []
+        for key, (now, thr) in touched.items():
+            st = self._state.get(key)
+            if st is None:
+                continue
+            levels = [lv for lv, _ in st.books.values()]
+            st.consensus.append((now, sum(levels) / len(levels)))
+            while st.moves and now - st.moves[0][0] > self.window:
+                st.moves.popleft()
+            while st.consensus and now - st.consensus[0][0] > self.window:
+                st.consensus.popleft()
+            alerts.extend(self._check(key, st, now, thr))
+
+        if alerts and self.persist:
+            persist_alerts(alerts, self.mode)
+        return alerts
+
+    def _fire(self, st: _MarketState, kind: str, tag: str, now: datetime.datetime) -> bool:
+        # one alert per kind/tag per window
+        last = st.last_alert.get((kind, tag))
+        if last is not None and now - last <= self.window:
+            return False
+        st.last_alert[(kind, tag)] = now
+        return True
+
+    def _check(self, key: MoveKey, st: _MarketState, now: datetime.datetime, thr: float) -> List[Alert]:
+        gid, scope, mt, pid, oc, rung = key
+        base = {"game_id": gid, "scope": scope, "market_type": mt, "player_id": pid, "outcome": oc, "line": rung, "detected_ts": now}
+        out: List[Alert] = []
+
+        # steam
+        net: Dict[str, float] = {}
+        for _, book, delta in st.moves:
+            net[book] = net.get(book, 0.0) + delta
+        for sign, tag in ((1.0, "up"), (-1.0, "down")):
+            movers = sorted(b for b, d in net.items() if d * sign >= thr)
+            if len(movers) >= self.steam_books and self._fire(st, "steam", tag, now):
+                out.append({
+                    **base, "kind": "steam", "books": movers,
+                    "magnitude": sum(net[b] for b in movers) / len(movers),
+                    "level_from": None, "level_to": None,
+                    "window_start_ts": st.moves[0][0],
+                })
+
+        # reverse line move on the consensus
+        if len(st.consensus) >= 3:
+            first = st.consensus[0][1]
+            last = st.consensus[-1][1]
+            peak = max((c for _, c in st.consensus), key=lambda c: abs(c - first))
+            out_leg = peak - first
+            back_leg = last - peak
+            if abs(out_leg) >= thr and abs(back_leg) >= thr and out_leg * back_leg < 0 and self._fire(st, "reverse", "", now):
+                out.append({
+                    **base, "kind": "reverse", "books": sorted(st.books),
+                    "magnitude": back_leg, "level_from": peak, "level_to": last,
+                    "window_start_ts": st.consensus[0][0],
+                })
+
+        # stale books
+        if len(st.books) >= 3:
+            for book, (lv, changed) in st.books.items():
+                others = [o for b, (o, _) in st.books.items() if b != book]
+                fresh = any(now - ts < self.stale_after for b, (_, ts) in st.books.items() if b != book)
+                cons = sum(others) / len(others)
+                if abs(lv - cons) >= thr and now - changed >= self.stale_after and fresh and self._fire(st, "stale_book", book, now):
+                    out.append({
+                        **base, "kind": "stale_book", "books": [book],
+                        "magnitude": lv - cons, "level_from": lv, "level_to": cons,
+                        "window_start_ts": changed,
+                    })
+        return out
+
+    def attach(self, persist: bool = True) -> None:
+        """Run live: consume every batch the normalizers commit."""
+        self.persist = persist
+        self.mode = "live"
+        ingest_hooks.add_listener(self.process)
+
+    def detach(self) -> None:
+        ingest_hooks.remove_listener(self.process)
+
+
+def persist_alerts(alerts: List[Alert], mode: str = "live") -> int:
+    if not alerts:
+        return 0
+    session = get_session()
+    session.execute(
+        insert(LineMoveAlert),
+        [
+            {
+                "game_id": a["game_id"], "scope": a["scope"], "market_type": a["market_type"],
+                "player_id": a["player_id"], "outcome": a["outcome"], "line": a.get("line"), "kind": a["kind"],
+                "books": ",".join(a["books"])[:256], "magnitude": a["magnitude"],
+                "level_from": a["level_from"], "level_to": a["level_to"],
+                "window_start_ts": a["window_start_ts"], "detected_ts": a["detected_ts"], "mode": mode,
+            }
+            for a in alerts
+        ],
+    )
+    session.commit()
+    session.close()
+    return len(alerts)
+
+
+def replay_line_movement(
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    persist: bool = True,
+    detector: Optional[LineMovementDetector] = None,
+) -> Dict[str, Any]:
+    """
+    Run the detector over historical odds/props snapshots in collected_ts order.
+
+    Snapshots are streamed (no full materialisation) and cut into batches at each
+    new collected_ts, mirroring how the live feed delivers them.
+    """
+    det = detector or LineMovementDetector()
+    det.persist = False
+
+    session = get_session()
+    codes = dict(session.execute(select(Book.id, Book.code)).all())
+
+    def _window(q, game_col, ts_col):
+        q = q.join(Game, Game.id == game_col)
+        if start is not None:
+            q = q.where(Game.game_date >= start)
+        if end is not None:
+            q = q.where(Game.game_date <= end)
+        return q.order_by(ts_col)
+
+    odds_q = _window(
+        select(OddsMarket.game_id, OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line, OddsMarket.price, OddsMarket.collected_ts),
+        OddsMarket.game_id,
+        OddsMarket.collected_ts,
+    )
+    props_q = _window(
+        select(PropsMarket.game_id, PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line, PropsMarket.price, PropsMarket.collected_ts, PropsMarket.player_id),
+        PropsMarket.game_id,
+        PropsMarket.collected_ts,
+    )
+
+    alerts: List[Alert] = []
+    rows_seen = 0
+    for scope, q in (("odds", odds_q), ("props", props_q)):
+        batch: List[Dict[str, Any]] = []
+        batch_ts = None
+        for r in session.execute(q.execution_options(yield_per=5000)):
+            gid, bid, mt, oc, line, price, ts = r[:7]
+            row = {
+                "game_id": gid, "book": codes.get(bid), "market_type": mt,
+                "player_id": r[7] if scope == "props" else None,
+                "outcome": (oc or "over") if scope == "props" else oc,
+                "line": float(line) if line is not None else None, "price": price, "collected_ts": ts,
+            }
+            if batch and ts != batch_ts:
+                alerts.extend(det.process(scope, batch))
+                batch = []
+            batch.append(row)
+            batch_ts = ts
+            rows_seen += 1
+        if batch:
+            alerts.extend(det.process(scope, batch))
+    session.close()
+
+    written = persist_alerts(alerts, "replay") if persist else 0
+    counts: Dict[str, int] = {}
+    for a in alerts:
+        counts[a["kind"]] = counts.get(a["kind"], 0) + 1
+    return {"rows_replayed": rows_seen, "alerts": counts, "alerts_written": written, "markets_tracked": len(det)}
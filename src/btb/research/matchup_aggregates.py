@@ -0,0 +1,243 @@
+﻿from __future__ import annotations
+
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, insert, or_, select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.schema import Game, Player, Season, StatsPlayerGame, TeamMatchupSplit
+
+# span name -> number of most recent games (None = whole season)
+SPANS: Dict[str, Optional[int]] = {"season": None, "last10": 10}
+ALL_POSITIONS = "ALL"
+UNKNOWN_POSITION = "UNK"
+
+# per (game, side) totals: {position: [pts, reb, ast, threes, threes_rows]}, pace sum, pace rows
+_Side = Tuple[Dict[str, List[float]], float, int]
+
+
+def _position_key(position: Optional[str]) -> str:
+    return (position or "").strip().upper() or UNKNOWN_POSITION
+
+
+def _load_sides(session, game_ids: List[int]) -> Dict[Tuple[int, int], _Side]:
+    """One GROUP BY over the games' stats rows -> per-(game, team, position) sums."""
+    sides: Dict[Tuple[int, int], _Side] = {}
+    if not game_ids:
+        return sides
+    q = (
+        select(
+            StatsPlayerGame.game_id,
+            StatsPlayerGame.team_id,
+            Player.position,
+            func.sum(StatsPlayerGame.points),
+            func.sum(StatsPlayerGame.rebounds),
+            func.sum(StatsPlayerGame.assists),
+            func.sum(StatsPlayerGame.threes_made),
+            func.count(StatsPlayerGame.threes_made),
+            func.sum(StatsPlayerGame.pace),
+            func.count(StatsPlayerGame.pace),
+        )
+        .join(Player, Player.id == StatsPlayerGame.player_id)
+        .where(StatsPlayerGame.team_id.is_not(None))
+        .group_by(StatsPlayerGame.game_id, StatsPlayerGame.team_id, Player.position)
+    )
+    for i in range(0, len(game_ids), 500):
+        chunk = game_ids[i : i + 500]
+        for gid, tid, pos, pts, reb, ast, thr, thr_n, pace, pace_n in session.execute(q.where(StatsPlayerGame.game_id.in_(chunk))):
+            by_pos, pace_sum, pace_rows = sides.get((gid, tid), ({}, 0.0, 0))
+            acc = by_pos.setdefault(_position_key(pos), [0.0, 0.0, 0.0, 0.0, 0])
+            acc[0] += float(pts or 0)
+            acc[1] += float(reb or 0)
+            acc[2] += float(ast or 0)
+            acc[3] += float(thr or 0)
+            acc[4] += int(thr_n or 0)
+            sides[(gid, tid)] = (by_pos, pace_sum + float(pace or 0.0), pace_rows + int(pace_n or 0))
+    return sides
+
+
+def compute_team_splits(
+    season_id: int,
+    team_id: int,
+    schedule: List[Tuple[int, Any, int]],
+    sides: Dict[Tuple[int, int], _Side],
+) -> List[Dict[str, Any]]:
+    """
+    Aggregate rows for one team.
+
+    schedule: (game_id, game_date, opponent_id) for the team's games, oldest first.
+    Only games with stats on both sides count. Per-position figures are averaged over
+    all counted games in the span, so a position the team never faced reads 0.
+    """
+    played = [(gid, gdate, opp) for gid, gdate, opp in schedule if (gid, team_id) in sides and (gid, opp) in sides]
+    out: List[Dict[str, Any]] = []
+    for span, last_n in SPANS.items():
+        games = played[-last_n:] if last_n else played
+        if not games:
+            continue
+        n = len(games)
+        allowed: Dict[str, List[float]] = {}
+        pts_for = 0.0
+        pts_against = 0.0
+        pace_sum = 0.0
+        pace_rows = 0
+        for gid, _, opp in games:
+            own_pos, own_pace, own_pace_n = sides[(gid, team_id)]
+            opp_pos, opp_pace, opp_pace_n = sides[(gid, opp)]
+            pts_for += sum(a[0] for a in own_pos.values())
+            pace_sum += own_pace + opp_pace
+            pace_rows += own_pace_n + opp_pace_n
+            total = allowed.setdefault(ALL_POSITIONS, [0.0, 0.0, 0.0, 0.0, 0])
+            for pos, a in opp_pos.items():
+                acc = allowed.setdefault(pos, [0.0, 0.0, 0.0, 0.0, 0])
+                for i in range(5):
+                    acc[i] += a[i]
+                    total[i] += a[i]
+            pts_against += sum(a[0] for a in opp_pos.values())
+
+        team_level = {
+            "points_for": pts_for / n,
+            "points_against": pts_against / n,
+            "pace": pace_sum / pace_rows if pace_rows else None,
+            "last_game_date": games[-1][1],
+        }
+        for pos, acc in sorted(allowed.items()):
+            out.append({
+                "season_id": season_id,
+                "team_id": team_id,
+                "position": pos,
+                "span": span,
+                "games": n,
+                "pts_allowed": acc[0] / n,
+                "reb_allowed": acc[1] / n,
+                "ast_allowed": acc[2] / n,
+                "threes_allowed": acc[3] / n if acc[4] else None,
+                **team_level,
+            })
+    return out
+
+
+def _refresh_season(session, season_id: int, team_ids: Optional[Set[int]]) -> Tuple[int, int]:
+    q = select(Game.id, Game.game_date, Game.home_team_id, Game.away_team_id).where(Game.season_id == season_id)
+    if team_ids is not None:
+        ids = list(team_ids)
+        q = q.where(or_(Game.home_team_id.in_(ids), Game.away_team_id.in_(ids)))
+    games = session.execute(q.order_by(Game.game_date, Game.id)).all()
+
+    schedules: Dict[int, List[Tuple[int, Any, int]]] = {}
+    for gid, gdate, home, away in games:
+        if home is None or away is None:
+            continue
+        schedules.setdefault(home, []).append((gid, gdate, away))
+        schedules.setdefault(away, []).append((gid, gdate, home))
+    teams = set(schedules) if team_ids is None else (set(schedules) & team_ids)
+
+    sides = _load_sides(session, [g[0] for g in games])
+    rows: List[Dict[str, Any]] = []
+    for tid in sorted(teams):
+        rows.extend(compute_team_splits(season_id, tid, schedules[tid], sides))
+
+    stmt = delete(TeamMatchupSplit).where(TeamMatchupSplit.season_id == season_id)
+    if team_ids is not None:
+        stmt = stmt.where(TeamMatchupSplit.team_id.in_(list(team_ids)))
+    session.execute(stmt)
+    if rows:
+        session.execute(insert(TeamMatchupSplit), rows)
+    return len(teams), len(rows)
+
+
+@instrument.instrumented("matchups.refresh")
+def refresh_matchup_aggregates(
+    season_year_starts: Optional[List[int]] = None,
+    season_teams: Optional[Dict[int, Set[int]]] = None,
+) -> Dict[str, Any]:
+    """
+    Rebuild team_matchup_splits.
+
+    With season_teams (season_id -> team ids) only those teams are recomputed (what an
+    ingest of new games touches); otherwise every team of the given (or all) seasons.
+    """
+    t0 = time.perf_counter()
+    session = get_session()
+    if season_teams is not None:
+        work: Dict[int, Optional[Set[int]]] = {sid: set(tids) for sid, tids in season_teams.items()}
+    else:
+        q = select(Game.season_id).distinct()
+        if season_year_starts:
+            q = q.join(Season, Season.id == Game.season_id).where(Season.year_start.in_(season_year_starts))
+        work = {sid: None for sid in session.execute(q).scalars()}
+
+    teams = 0
+    rows = 0
+    for sid in sorted(work):
+        t, r = _refresh_season(session, sid, work[sid])
+        teams += t
+        rows += r
+    session.commit()
+    session.close()
+    return {"seasons": len(work), "teams": teams, "rows": rows, "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+
+
+def refresh_for_games(game_ids: Iterable[int]) -> Optional[Dict[str, Any]]:
+    """Incremental refresh for games that just gained stats: both teams of each game."""
+    ids = list(set(game_ids))
+    if not ids:
+        return None
+    session = get_session()
+    season_teams: Dict[int, Set[int]] = {}
+    for i in range(0, len(ids), 500):
+        for sid, home, away in session.execute(
+            select(Game.season_id, Game.home_team_id, Game.away_team_id).where(Game.id.in_(ids[i : i + 500]))
+        ):
+            season_teams.setdefault(sid, set()).update(t for t in (home, away) if t is not None)
+    session.close()
+    return refresh_matchup_aggregates(season_teams=season_teams)
+
+
+def benchmark_refresh(season_year_start: int) -> Dict[str, Any]:
+    """Time a full-season rebuild against an incremental refresh of its latest game."""
+    full = refresh_matchup_aggregates([season_year_start])
+    session = get_session()
+    last_gid = session.execute(
+        select(Game.id)
+        .join(Season, Season.id == Game.season_id)
+        .where(Season.year_start == season_year_start)
+        .order_by(Game.game_date.desc(), Game.id.desc())
+        .limit(1)
+    ).scalar()
+    session.close()
+    incremental = refresh_for_games([last_gid]) if last_gid is not None else None
+    return {"season": season_year_start, "full": full, "incremental_last_game": incremental}
+
+
+@instrument.timed("research.matchup_lookup")
+def load_matchup(session, season_id: int, opponent_id: int, position: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Opponent splits for the player's position and all positions, by span (one indexed query)."""
+    pos = _position_key(position)
+    rows = session.execute(
+        select(TeamMatchupSplit)
+        .where(TeamMatchupSplit.season_id == season_id)
+        .where(TeamMatchupSplit.team_id == opponent_id)
+        .where(TeamMatchupSplit.position.in_([pos, ALL_POSITIONS]))
+    ).scalars().all()
+    if not rows:
+        return None
+
+    out: Dict[str, Any] = {"position": pos, "spans": {}}
+    for r in rows:
+        span = out["spans"].setdefault(r.span, {
+            "games": r.games,
+            "points_for": r.points_for,
+            "points_against": r.points_against,
+            "pace": r.pace,
+            "as_of": r.last_game_date.isoformat() if r.last_game_date else None,
+        })
+        span["vs_position" if r.position == pos and pos != ALL_POSITIONS else "vs_all"] = {
+            "pts_allowed": r.pts_allowed,
+            "reb_allowed": r.reb_allowed,
+            "ast_allowed": r.ast_allowed,
+            "threes_allowed": r.threes_allowed,
+        }
+    return out
@@ -0,0 +1,194 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+from typing import IO, Any, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from btb.data_sources import ingest_hooks
+from btb.db.connection import get_session
+from btb.db.game_calendar import get_calendar
+from btb.db.schema import Book, OddsMarket, PropsMarket
+from btb.research.fair_prices import _pair_line
+
+# (game_id, scope, market_type, player_id) -> one proposition family, e.g. a game's totals
+GroupKey = Tuple[int, str, str, Optional[int]]
+# (outcome, line) within a group
+SideKey = Tuple[str, Optional[float]]
+
+Opportunity = Dict[str, Any]
+
+_OPPOSITE = {"home": "away", "away": "home", "over": "under", "under": "over"}
+
+
+class PriceBoard:
+    """
+    In-memory order book of current prices across books.
+
+    Each (game, scope, market, player) group holds, per (outcome, line), the latest
+    price of every book plus the best of them. Updates only mark their group dirty,
+    so scan_dirty() after a poll touches just the markets that moved.
+    """
+
+    def __init__(self, on_opportunity: Optional[Callable[[Opportunity], None]] = None, min_middle_window: float = 0.5) -> None:
+        self.on_opportunity = on_opportunity
+        self.min_middle_window = min_middle_window
+        # group -> side -> book -> (price, collected_ts)
+        self._quotes: Dict[GroupKey, Dict[SideKey, Dict[str, Tuple[float, datetime.datetime]]]] = {}
+        # group -> side -> (best price, book)
+        self._best: Dict[GroupKey, Dict[SideKey, Tuple[float, str]]] = {}
+        self._dirty: Set[GroupKey] = set()
+
+    # ---- updates ----
+
+    def update(self, scope: str, rows: List[Dict[str, Any]]) -> None:
+        """Apply snapshot rows (ingest_hooks row dicts); also usable as an ingest listener."""
+        for r in rows:
+            group = (r["game_id"], scope, r["market_type"], r.get("player_id"))
+            side = (r["outcome"], r["line"])
+            books = self._quotes.setdefault(group, {}).setdefault(side, {})
+            ts = r.get("collected_ts") or datetime.datetime.min
+            cur = books.get(r["book"])
+            if cur is not None and cur[1] > ts:
+                continue
+            books[r["book"]] = (float(r["price"]), ts)
+            best_book = max(books, key=lambda b: books[b][0])
+            self._best.setdefault(group, {})[side] = (books[best_book][0], best_book)
+            self._dirty.add(group)
+
+    def attach(self) -> None:
+        """Receive every odds/props batch the normalizers commit from now on."""
+        ingest_hooks.add_listener(self._on_snapshot)
+
+    def detach(self) -> None:
+        ingest_hooks.remove_listener(self._on_snapshot)
+
+    def _on_snapshot(self, scope: str, rows: List[Dict[str, Any]]) -> None:
+        self.update(scope, rows)
+        self.scan_dirty()
+
+    def load_from_db(self, game_date: datetime.date) -> int:
+        """Seed the board with every snapshot for games on a date (latest per book wins)."""
+        session = get_session()
+        game_ids = get_calendar(session).games_on(game_date)
+        codes = dict(session.execute(select(Book.id, Book.code)).all())
+        n = 0
+        if game_ids:
+            odds = session.execute(
+                select(OddsMarket.game_id, OddsMarket.book_id, OddsMarket.market_type, OddsMarket.outcome, OddsMarket.line, OddsMarket.price, OddsMarket.collected_ts)
+                .where(OddsMarket.game_id.in_(game_ids))
+            ).all()
+            self.update("odds", [
+                {"game_id": g, "book": codes.get(b), "market_type": mt, "player_id": None, "outcome": oc,
+                 "line": float(line) if line is not None else None, "price": px, "collected_ts": ts}
+                for g, b, mt, oc, line, px, ts in odds
+            ])
+            props = session.execute(
+                select(PropsMarket.game_id, PropsMarket.book_id, PropsMarket.prop_type, PropsMarket.player_id, PropsMarket.side, PropsMarket.line, PropsMarket.price, PropsMarket.collected_ts)
+                .where(PropsMarket.game_id.in_(game_ids))
+            ).all()
+            self.update("props", [
+                {"game_id": g, "book": codes.get(b), "market_type": pt, "player_id": pid, "outcome": side or "over",
+                 "line": float(line), "price": px, "collected_ts": ts}
+                for g, b, pt, pid, side, line, px, ts in props
+            ])
+            n = len(odds) + len(props)
+        session.close()
+        return n
+
+    # ---- queries ----
+
+    def best(self, game_id: int, scope: str, market_type: str, outcome: str, line: Optional[float] = None, player_id: Optional[int] = None) -> Optional[Tuple[float, str]]:
+        return self._best.get((game_id, scope, market_type, player_id), {}).get((outcome, line))
+
+    def best_prices(self) -> List[Dict[str, Any]]:
+        out: List[Dict[str, Any]] = []
+        for (gid, scope, mt, pid), sides in self._best.items():
+            for (oc, line), (price, book) in sides.items():
+                out.append({"game_id": gid, "scope": scope, "market_type": mt, "player_id": pid, "outcome": oc, "line": line, "price": price, "book": book})
+        return out
+
+    # ---- scanning ----
+
+    def scan_dirty(self) -> List[Opportunity]:
+        groups, self._dirty = self._dirty, set()
+        return self._scan(groups)
+
+    def scan_all(self) -> List[Opportunity]:
+        self._dirty = set()
+        return self._scan(self._best.keys())
+
+    def _scan(self, groups) -> List[Opportunity]:
+        found: List[Opportunity] = []
+        for group in groups:
+            found.extend(self._scan_group(group))
+        if self.on_opportunity is not None:
+            for opp in found:
+                self.on_opportunity(opp)
+        return found
+
+    def _scan_group(self, group: GroupKey) -> List[Opportunity]:
+        gid, scope, mt, pid = group
+        sides = self._best.get(group) or {}
+        out: List[Opportunity] = []
+
+        # arbitrage: both sides of the same proposition from the best books
+        by_prop: Dict[Optional[float], Dict[str, Tuple[Optional[float], float, str]]] = {}
+        for (oc, line), (price, book) in sides.items():
+            by_prop.setdefault(_pair_line(mt, oc, line), {})[oc] = (line, price, book)
+        for pair_line, legs in by_prop.items():
+            if len(legs) != 2:
+                continue
+            total = sum(1.0 / px for _, px, _ in legs.values())
+            if total < 1.0:
+                out.append(
+                    {
+                        "kind": "arb",
+                        "game_id": gid, "scope": scope, "market_type": mt, "player_id": pid,
+                        "margin": 1.0 - total,
+                        "legs": [
+                            {"outcome": oc, "line": line, "price": px, "book": book, "stake_share": (1.0 / px) / total}
+                            for oc, (line, px, book) in sorted(legs.items())
+                        ],
+                    }
+                )
+
+        # middles: e.g. over 220.5 at one book and under 222.5 at another
+        if mt == "moneyline":
+            return out
+        first = "home" if mt == "spread" else "over"
+        lows = [(line, px, book) for (oc, line), (px, book) in sides.items() if oc == first and line is not None]
+        highs = [(line, px, book) for (oc, line), (px, book) in sides.items() if oc == _OPPOSITE[first] and line is not None]
+        for l1, p1, b1 in lows:
+            for l2, p2, b2 in highs:
+                # spreads: home +h and away a overlap when h + a > 0; totals/props: over l1 < under l2
+                window = (l1 + l2) if mt == "spread" else (l2 - l1)
+                if window < self.min_middle_window:
+                    continue
+                out.append(
+                    {
+                        "kind": "middle",
+                        "game_id": gid, "scope": scope, "market_type": mt, "player_id": pid,
+                        "window": window,
+                        "cost": 1.0 / p1 + 1.0 / p2 - 1.0,
+                        "legs": [
+                            {"outcome": first, "line": l1, "price": p1, "book": b1},
+                            {"outcome": _OPPOSITE[first], "line": l2, "price": p2, "book": b2},
+                        ],
+                    }
+                )
+        return out
+
+
+class NdjsonSink:
+    """Opportunity callback that writes one JSON object per line."""
+
+    def __init__(self, fh: IO[str]) -> None:
+        self.fh = fh
+        self.count = 0
+
+    def __call__(self, opp: Opportunity) -> None:
+        self.fh.write(json.dumps(opp, default=str) + "\n")
+        self.fh.flush()
+        self.count += 1
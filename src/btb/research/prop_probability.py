@@ -0,0 +1,237 @@
+﻿from __future__ import annotations
+
+import datetime
+import math
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+
+from btb.core import instrument
+from btb.core.stat_expressions import STAT_COLUMNS, get_registry
+from btb.db.schema import Game, StatsPlayerGame
+
+# recency weighting of past games (in games) and how many recent games set expected minutes
+HALF_LIFE_GAMES = 20.0
+MINUTES_WINDOW = 10
+# LRU bounds of the shared fit cache: fits are small, loaded stat columns hold a whole game log
+MAX_CACHED_FITS = 20_000
+MAX_CACHED_COLUMNS = 2_000
+
+
+@dataclass
+class CountFit:
+    """Poisson or negative-binomial fit of a per-game count, scaled to expected minutes."""
+
+    dist: str  # poisson/negbin
+    mean: float
+    var: float
+    n_games: int
+    expected_minutes: Optional[float]
+    r: Optional[float] = None  # negbin size
+    p: Optional[float] = None  # negbin success probability
+    # (CDF table, pmf of its last entry), replaced whole when extended
+    _table: Tuple[List[float], float] = field(default_factory=lambda: ([], 0.0), repr=False)
+
+    def _cdf_table(self, k_max: int) -> List[float]:
+        """
+        The CDF table through k_max. Cached fits are shared across threads, so the
+        table is extended on a copy and swapped in as one attribute; a reader keeps
+        the table it got, never one another thread is still appending to.
+        """
+        cdf, pmf = self._table
+        if len(cdf) > k_max:
+            return cdf
+        cdf = list(cdf)
+        if not cdf:
+            if self.dist == "poisson":
+                pmf = math.exp(-self.mean)
+            else:
+                pmf = self.p ** self.r
+            cdf.append(pmf)
+        for k in range(len(cdf), k_max + 1):
+            if self.dist == "poisson":
+                pmf = pmf * self.mean / k
+            else:
+                pmf = pmf * (k - 1 + self.r) / k * (1.0 - self.p)
+            cdf.append(min(1.0, cdf[-1] + pmf))
+        self._table = (cdf, pmf)
+        return cdf
+
+    def cdf(self, k: int) -> float:
+        if k < 0:
+            return 0.0
+        return self._cdf_table(k)[k]
+
+    def probabilities(self, lines: Sequence[float]) -> List[Dict[str, float]]:
+        """P(over), P(under), P(push) for every line, from one shared CDF table."""
+        if not lines:
+            return []
+        table = self._cdf_table(int(math.floor(max(lines))) + 1)
+
+        def cdf(k: int) -> float:
+            return table[k] if k >= 0 else 0.0
+
+        out: List[Dict[str, float]] = []
+        for line in lines:
+            fl = math.floor(line)
+            if fl == line:
+                k = int(line)
+                push = cdf(k) - cdf(k - 1)
+                under = cdf(k - 1)
+            else:
+                push = 0.0
+                under = cdf(int(fl))
+            out.append({"line": float(line), "p_over": max(0.0, 1.0 - under - push), "p_under": under, "p_push": push})
+        return out
+
+
+def fit_counts(
+    values: Sequence[Optional[float]],
+    minutes: Sequence[Optional[float]],
+    half_life: float = HALF_LIFE_GAMES,
+    minutes_window: int = MINUTES_WINDOW,
+) -> Optional[CountFit]:
+    """
+    Fit a count distribution to a player's game log (oldest first).
+
+    Each game's value is rescaled from its minutes to the expected minutes (average
+    of the last `minutes_window` games) and weighted by minutes x recency decay.
+    Over-dispersed samples get a negative binomial, the rest a Poisson.
+    """
+    games = [(v, m) for v, m in zip(values, minutes) if v is not None]
+    if not games:
+        return None
+
+    played = [m for _, m in games if m]
+    exp_min = sum(played[-minutes_window:]) / len(played[-minutes_window:]) if played else None
+
+    decay = 0.5 ** (1.0 / half_life)
+    n = len(games)
+    w_sum = 0.0
+    x_sum = 0.0
+    xx_sum = 0.0
+    for i, (v, m) in enumerate(games):
+        age = n - 1 - i
+        if exp_min and m:
+            x = v * exp_min / m
+            w = m * decay ** age
+        else:
+            x = v
+            w = decay ** age
+        w_sum += w
+        x_sum += w * x
+        xx_sum += w * x * x
+    mean = x_sum / w_sum
+    var = max(0.0, xx_sum / w_sum - mean * mean)
+    mean = max(mean, 1e-6)
+
+    if var > mean * 1.05 and n >= 3:
+        r = mean * mean / (var - mean)
+        return CountFit(dist="negbin", mean=mean, var=var, n_games=n, expected_minutes=exp_min, r=r, p=r / (r + mean))
+    return CountFit(dist="poisson", mean=mean, var=var, n_games=n, expected_minutes=exp_min)
+
+
+class FitCache:
+    """
+    Per-(player, prop type, as-of date) fits, refitted only when the player's
+    stats rows change (row count / max id stamp).
+
+    Least recently used entries are dropped past max_fits / max_columns. The lock
+    only guards the dicts; stamps, column loads and fits run outside it, so
+    threads sharing the cache (HTTP API workers) do not queue behind each other's
+    queries. Two threads missing the same key both fit it; the last one is kept.
+    """
+
+    def __init__(self, max_fits: int = MAX_CACHED_FITS, max_columns: int = MAX_CACHED_COLUMNS) -> None:
+        self.max_fits = max_fits
+        self.max_columns = max_columns
+        self._fits: "OrderedDict[Tuple[int, str, datetime.date], Tuple[Tuple[int, int], Optional[CountFit]]]" = OrderedDict()
+        self._columns: "OrderedDict[Tuple[int, datetime.date], Tuple[Tuple[int, int], Dict[str, List[Optional[float]]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self, session, player_id: int, upto: datetime.date) -> Tuple[int, int]:
+        cnt, max_id = session.execute(
+            select(func.count(StatsPlayerGame.id), func.max(StatsPlayerGame.id))
+            .join(Game, StatsPlayerGame.game_id == Game.id)
+            .where(StatsPlayerGame.player_id == player_id)
+            .where(Game.game_date <= upto)
+        ).one()
+        return int(cnt or 0), int(max_id or 0)
+
+    def _load_columns(self, session, player_id: int, upto: datetime.date) -> Dict[str, List[Optional[float]]]:
+        rows = session.execute(
+            select(*[getattr(StatsPlayerGame, c) for c in STAT_COLUMNS])
+            .join(Game, StatsPlayerGame.game_id == Game.id)
+            .where(StatsPlayerGame.player_id == player_id)
+            .where(Game.game_date <= upto)
+            .order_by(Game.game_date)
+        ).all()
+        return {c: [float(r[i]) if r[i] is not None else None for r in rows] for i, c in enumerate(STAT_COLUMNS)}
+
+    @instrument.timed("research.fit")
+    def get(self, session, player_id: int, prop_type: str, upto: datetime.date) -> Optional[CountFit]:
+        stat = get_registry().resolve(prop_type)
+        if stat is None:
+            return None
+        stamp = self._stamp(session, player_id, upto)
+        key = (player_id, stat.name, upto)
+        ckey = (player_id, upto)
+        with self._lock:
+            cached = self._fits.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._fits.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+            cols_entry = self._columns.get(ckey)
+            if cols_entry is not None and cols_entry[0] == stamp:
+                self._columns.move_to_end(ckey)
+
+        if cols_entry is None or cols_entry[0] != stamp:
+            cols_entry = (stamp, self._load_columns(session, player_id, upto))
+            with self._lock:
+                self._put(self._columns, ckey, cols_entry, self.max_columns)
+        cols = cols_entry[1]
+
+        fit = fit_counts(stat.evaluate(cols), cols["minutes"])
+        with self._lock:
+            self._put(self._fits, key, (stamp, fit), self.max_fits)
+        return fit
+
+    @staticmethod
+    def _put(entries: "OrderedDict[Any, Any]", key: Any, value: Any, limit: int) -> None:
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > limit:
+            entries.popitem(last=False)
+
+    def player_ids(self) -> Set[int]:
+        with self._lock:
+            return {k[0] for k in self._columns}
+
+    def invalidate(self, player_id: Optional[int] = None) -> None:
+        with self._lock:
+            if player_id is None:
+                self._fits.clear()
+                self._columns.clear()
+                return
+            for entries in (self._fits, self._columns):
+                for k in [k for k in entries if k[0] == player_id]:
+                    del entries[k]
+
+
+_cache = FitCache()
+
+
+def get_fit_cache() -> FitCache:
+    return _cache
+
+
+def expected_value(p_win: float, price: float, p_push: float = 0.0) -> float:
+    """EV per unit staked at decimal `price`; pushes return the stake."""
+    return p_win * (price - 1.0) - (1.0 - p_win - p_push)
@@ -5,14 +5,23 @@ from typing import Any, Dict, List, Optional, Tuple
 
 from sqlalchemy import select
 
+from btb.core import instrument
+from btb.core.stat_expressions import columns_from_rows, get_registry
 from btb.db.connection import get_session
+from btb.db.game_calendar import get_calendar
 from btb.db.schema import Book, Game, OddsMarket, Player, PropsMarket, StatsPlayerGame, Team
+from btb.research.alt_ladders import build_ladders, edge_profile
+from btb.research.fair_prices import load_fair_lookup
+from btb.research.matchup_aggregates import load_matchup
+from btb.research.prop_probability import expected_value, get_fit_cache
+from btb.research.roster import get_roster_index, resolve_player_games
 
 
 def _norm_name(s: str) -> str:
     return " ".join((s or "").strip().lower().split())
 
 
+@instrument.timed("research.player_lookup")
 def _get_player_by_name(session, player_name: str) -> Optional[Player]:
     pn = _norm_name(player_name)
     if not pn:
@@ -31,23 +40,27 @@ def _get_player_by_name(session, player_name: str) -> Optional[Player]:
     return None
 
 
+@instrument.timed("research.game_lookup")
 def _get_game_for_player_on_date(session, player_id: int, game_date: datetime.date) -> Optional[Game]:
-    player = session.get(Player, player_id)
-    if player is None:
-        return None
-
-    games = session.execute(select(Game).where(Game.game_date == game_date)).scalars().all()
-    if not games:
-        return None
+    # listed on a game that day, else the roster team's game, else the day's only game
+    game_id = resolve_player_games(session, [(player_id, game_date)])[0]
+    return session.get(Game, game_id) if game_id is not None else None
 
-    if player.team_id:
-        for g in games:
-            if g.home_team_id == player.team_id or g.away_team_id == player.team_id:
-                return g
 
-    return games[0]
+def _main_markets_game_id(session, game: Game) -> int:
+    # props and main-market feeds may file the same fixture under different external ids
+    ids = get_calendar(session).fixture_games(game.game_date, game.home_team_id, game.away_team_id)
+    if len(ids) < 2:
+        return game.id
+    return session.execute(
+        select(OddsMarket.game_id)
+        .where(OddsMarket.game_id.in_(ids))
+        .order_by(OddsMarket.game_id != game.id, OddsMarket.game_id)
+        .limit(1)
+    ).scalar() or game.id
 
 
+@instrument.timed("research.recent_stats")
 def _load_recent_stats(session, player_id: int, upto_date: datetime.date, max_games: int = 10) -> List[StatsPlayerGame]:
     rows = session.execute(
         select(StatsPlayerGame)
@@ -71,28 +84,12 @@ def _avg_from_stats(rows: List[StatsPlayerGame]) -> Dict[str, float]:
     return {"minutes": mins, "points": pts, "rebounds": reb, "assists": ast}
 
 
-def _stat_value_for_prop(row: StatsPlayerGame, prop_type: str) -> Optional[float]:
-    pt = (prop_type or "").lower().strip()
-    if pt in ("points", "pts"):
-        return float(row.points or 0.0)
-    if pt in ("rebounds", "rebs", "reb"):
-        return float(row.rebounds or 0.0)
-    if pt in ("assists", "asts", "ast"):
-        return float(row.assists or 0.0)
-    return None
-
-
-def _hit_rate(rows: List[StatsPlayerGame], prop_type: str, line: float) -> Optional[float]:
-    vals: List[float] = []
-    for r in rows:
-        v = _stat_value_for_prop(r, prop_type)
-        if v is None:
-            continue
-        vals.append(v)
-    if not vals:
+def _hit_rate_from_values(vals: List[Optional[float]], line: float) -> Optional[float]:
+    present = [v for v in vals if v is not None]
+    if not present:
         return None
-    hits = sum(1 for v in vals if v > float(line))
-    return hits / len(vals)
+    hits = sum(1 for v in present if v > float(line))
+    return hits / len(present)
 
 
 def _bias_and_conf(edge: float, hit_rate_5: Optional[float]) -> Tuple[str, str]:
@@ -111,21 +108,38 @@ def _bias_and_conf(edge: float, hit_rate_5: Optional[float]) -> Tuple[str, str]:
     return bias, conf
 
 
-def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict[str, Any]:
+@instrument.timed("research.bundle")
+def get_player_prop_research(
+    player_name: str, game_date: datetime.date, session=None, player_id: Optional[int] = None, game_id: Optional[int] = None
+) -> Dict[str, Any]:
     """
     Structured research bundle for a player's props on a date.
 
     Test contract expectations:
     - Each prop includes: recent_avg, edge, bias, confidence
     - recent_form includes top-level keys: n, avg
+
+    A known player_id skips the name lookup and a game_id already resolved in a
+    batch (roster.resolve_player_games) skips the per-player one. A caller-supplied
+    session is left open; otherwise one is opened and closed here.
     """
+    if session is not None:
+        return _research_bundle(session, player_name, game_date, player_id, game_id)
     session = get_session()
+    try:
+        return _research_bundle(session, player_name, game_date, player_id, game_id)
+    finally:
+        session.close()
+
 
-    player = _get_player_by_name(session, player_name)
+def _research_bundle(
+    session, player_name: str, game_date: datetime.date, player_id: Optional[int] = None, game_id: Optional[int] = None
+) -> Dict[str, Any]:
+    player = session.get(Player, player_id) if player_id is not None else _get_player_by_name(session, player_name)
     if player is None:
         return {"ok": False, "error": f"Player not found: {player_name}"}
 
-    game = _get_game_for_player_on_date(session, player.id, game_date)
+    game = session.get(Game, game_id) if game_id is not None else _get_game_for_player_on_date(session, player.id, game_date)
     if game is None:
         return {"ok": False, "error": f"No game found on {game_date.isoformat()} for {player.full_name}"}
 
@@ -162,16 +176,31 @@ def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict
         select(PropsMarket).where(PropsMarket.game_id == game.id).where(PropsMarket.player_id == player.id)
     ).scalars().all()
 
+    props_fair = load_fair_lookup(session, game.id, "props", player.id)
+
+    # one column-wise evaluation per prop type over the recent window
+    registry = get_registry()
+    cols_5 = columns_from_rows(recent_rows_5)
+    series_5: Dict[str, List[Optional[float]]] = {}
+
+    # distribution model: one cached fit per prop type, all of its lines in one pass
+    fit_cache = get_fit_cache()
+    models: Dict[str, Any] = {}
+    line_probs: Dict[str, Dict[float, Dict[str, float]]] = {}
+    for pt in sorted({p.prop_type for p in props}):
+        fit = fit_cache.get(session, player.id, pt, game_date)
+        models[pt] = fit
+        lines = sorted({float(p.line) for p in props if p.prop_type == pt and p.line is not None})
+        line_probs[pt] = {r["line"]: r for r in fit.probabilities(lines)} if fit else {}
+
     props_out: List[Dict[str, Any]] = []
     for p in props:
         book_obj = session.get(Book, p.book_id) if p.book_id is not None else None
         book_code = book_obj.code if book_obj is not None else None
 
-        stat_vals_5: List[float] = []
-        for r in recent_rows_5:
-            v = _stat_value_for_prop(r, p.prop_type)
-            if v is not None:
-                stat_vals_5.append(v)
+        if p.prop_type not in series_5:
+            series_5[p.prop_type] = registry.evaluate(p.prop_type, cols_5) or []
+        stat_vals_5 = [v for v in series_5[p.prop_type] if v is not None]
 
         recent_avg_5: Optional[float] = None
         if stat_vals_5:
@@ -183,19 +212,30 @@ def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict
 
         hr5: Optional[float] = None
         if p.line is not None:
-            hr5 = _hit_rate(recent_rows_5, p.prop_type, float(p.line))
+            hr5 = _hit_rate_from_values(stat_vals_5, float(p.line))
 
         bias: Optional[str] = None
         confidence: Optional[str] = None
         if edge is not None:
             bias, confidence = _bias_and_conf(edge, hr5)
 
+        fair_key = (p.prop_type, p.side or "over", float(p.line) if p.line is not None else None)
+
+        probs = line_probs[p.prop_type].get(float(p.line)) if p.line is not None else None
+        ev: Optional[float] = None
+        if probs is not None and p.price is not None:
+            p_side = probs["p_under"] if p.side == "under" else probs["p_over"]
+            ev = expected_value(p_side, float(p.price), probs["p_push"])
+
         props_out.append(
             {
                 "book": book_code,
                 "prop_type": p.prop_type,
+                "side": p.side,
                 "line": float(p.line) if p.line is not None else None,
                 "price": float(p.price) if p.price is not None else None,
+                "fair_prob": props_fair.get((p.book_id, *fair_key)),
+                "consensus_prob": props_fair.get((None, *fair_key)),
 
                 # tests expect this key
                 "recent_avg": float(recent_avg_5) if recent_avg_5 is not None else None,
@@ -206,11 +246,40 @@ def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict
                 "hit_rate_5": float(hr5) if hr5 is not None else None,
                 "bias": bias,
                 "confidence": confidence,
+                "model": models[p.prop_type].dist if models[p.prop_type] else None,
+                "model_mean": models[p.prop_type].mean if models[p.prop_type] else None,
+                "p_over": probs["p_over"] if probs else None,
+                "p_under": probs["p_under"] if probs else None,
+                "p_push": probs["p_push"] if probs else None,
+                "ev": ev,
                 "source": p.source,
+                "collected_ts": p.collected_ts.isoformat() if p.collected_ts is not None else None,
             }
         )
 
-    main = session.execute(select(OddsMarket).where(OddsMarket.game_id == game.id)).scalars().all()
+    # alt lines of one book/prop/side as a ladder; model probabilities come from the same per-type fit
+    ladders_out: List[Dict[str, Any]] = []
+    ladder_rows = [(p.game_id, p.player_id, p.book_id, p.prop_type, p.side, p.line, p.price, p.collected_ts) for p in props]
+    for ladder in build_ladders(ladder_rows):
+        fit = models.get(ladder.key[3])
+        if len(ladder) < 2 or fit is None:
+            continue
+        profile = edge_profile(ladder, fit.probabilities(ladder.lines))
+        book_obj = session.get(Book, ladder.key[2])
+        ladders_out.append({"book": book_obj.code if book_obj else None, "prop_type": ladder.key[3], **profile})
+
+    matchup: Optional[Dict[str, Any]] = None
+    team_id = get_roster_index(session).team_on(player.id, game.game_date) or player.team_id
+    if team_id in (game.home_team_id, game.away_team_id) and game.home_team_id and game.away_team_id:
+        opponent_id = game.away_team_id if team_id == game.home_team_id else game.home_team_id
+        matchup = load_matchup(session, game.season_id, opponent_id, player.position)
+        if matchup is not None:
+            opponent = away_team if opponent_id == game.away_team_id else home_team
+            matchup["opponent"] = opponent.name if opponent else None
+
+    main_game_id = _main_markets_game_id(session, game)
+    main = session.execute(select(OddsMarket).where(OddsMarket.game_id == main_game_id)).scalars().all()
+    main_fair = load_fair_lookup(session, main_game_id, "odds")
 
     seen_main = set()
     main_out: List[Dict[str, Any]] = []
@@ -230,6 +299,7 @@ def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict
             continue
         seen_main.add(key)
 
+        fair_key = (m.market_type, m.outcome, float(m.line) if m.line is not None else None)
         main_out.append(
             {
                 "book": book_code,
@@ -237,6 +307,8 @@ def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict
                 "outcome": m.outcome,
                 "line": float(m.line) if m.line is not None else None,
                 "price": float(m.price) if m.price is not None else None,
+                "fair_prob": main_fair.get((m.book_id, *fair_key)),
+                "consensus_prob": main_fair.get((None, *fair_key)),
                 "source": m.source,
             }
         )
@@ -253,6 +325,8 @@ def get_player_prop_research(player_name: str, game_date: datetime.date) -> Dict
             "season_type": game.season_type,
         },
         "props": props_out,
+        "ladders": ladders_out,
         "main_odds": main_out,
         "recent_form": recent_form,
+        "matchup": matchup,
     }
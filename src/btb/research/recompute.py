@@ -0,0 +1,109 @@
+﻿from __future__ import annotations
+
+import datetime
+from typing import Any, Dict, Hashable, List, Optional, Set
+
+from sqlalchemy import func, select, union
+
+from btb.data_sources.change_bus import ChangeBus, ChangeKey, get_bus
+from btb.db.connection import get_session
+from btb.db.game_calendar import get_calendar
+from btb.db.schema import OddsMarket, PropsMarket
+from btb.research import slate_reports
+from btb.research.fair_prices import refresh_fair_prices
+from btb.research.prop_probability import get_fit_cache
+
+FAIR_PRICES = "fair_prices"
+FIT_CACHE = "fit_cache"
+SLATE_REPORTS = "slate_reports"
+
+
+def _quote_game(change: ChangeKey) -> Optional[Hashable]:
+    return change[1] if change[0] in ("odds", "props") else None
+
+
+def _quoted_games() -> int:
+    """Games a full fair-price rebuild would recompute: every game with a quote."""
+    session = get_session()
+    games = union(select(OddsMarket.game_id), select(PropsMarket.game_id)).subquery()
+    n = session.execute(select(func.count()).select_from(games)).scalar() or 0
+    session.close()
+    return int(n)
+
+
+def _refresh_fair_prices(game_ids: Set[Hashable]) -> Dict[str, Any]:
+    return refresh_fair_prices(sorted(game_ids))
+
+
+def _stats_player(change: ChangeKey) -> Optional[Hashable]:
+    return change[2] if change[0] == "stats" else None
+
+
+def _invalidate_fits(player_ids: Set[Hashable]) -> Dict[str, Any]:
+    cache = get_fit_cache()
+    for pid in player_ids:
+        cache.invalidate(pid)
+    return {"players_invalidated": len(player_ids)}
+
+
+def _report_key(change: ChangeKey) -> Optional[Hashable]:
+    scope, game_id, player_id = change[0], change[1], change[2]
+    if scope == "odds":
+        return ("game", game_id)  # main markets appear in every report of the game
+    if scope == "props":
+        return ("props", game_id, player_id)
+    return ("player", player_id)  # new box scores move recent form
+
+
+def _report_players(game_date: datetime.date, keys: Set[Hashable]) -> Set[int]:
+    """Slate players whose reports a batch of report keys touches."""
+    session = get_session()
+    day_games = set(get_calendar(session).games_on(game_date))
+    players = {k[2] for k in keys if k[0] == "props" and k[1] in day_games}
+    players.update(k[1] for k in keys if k[0] == "player")
+    games = sorted(k[1] for k in keys if k[0] == "game" and k[1] in day_games)
+    if games:
+        players.update(session.execute(select(PropsMarket.player_id).where(PropsMarket.game_id.in_(games)).distinct()).scalars())
+    session.close()
+    return players
+
+
+def attach(bus: Optional[ChangeBus] = None, slate_date: Optional[datetime.date] = None, out_dir: str = "reports") -> List[str]:
+    """
+    Subscribe the research recomputes to ingest changes:
+
+    - fair_prices: re-devig only the games whose quotes changed
+    - fit_cache: drop cached distribution fits of players with new box scores
+    - slate_reports (with slate_date): re-render only the affected players' report files
+
+    Returns the subscription names.
+    """
+    bus = bus or get_bus()
+    bus.subscribe(FAIR_PRICES, _refresh_fair_prices, project=_quote_game, full_size=_quoted_games)
+    cache = get_fit_cache()
+    bus.subscribe(FIT_CACHE, _invalidate_fits, project=_stats_player, full_size=lambda: len(cache.player_ids()))
+    names = [FAIR_PRICES, FIT_CACHE]
+    if slate_date is not None:
+
+        def render(keys: Set[Hashable]) -> Dict[str, Any]:
+            out = slate_reports.render_players(slate_date, _report_players(slate_date, keys), out_dir=out_dir)
+            return {**out, "recomputed": out["players"]}
+
+        bus.subscribe(
+            SLATE_REPORTS,
+            render,
+            project=_report_key,
+            full_size=lambda: len(slate_reports.slate_players(slate_date)),
+        )
+        names.append(SLATE_REPORTS)
+    return names
+
+
+def detach(bus: Optional[ChangeBus] = None) -> Dict[str, Any]:
+    """Run whatever is still pending, then unsubscribe. Returns the final work-avoided stats."""
+    bus = bus or get_bus()
+    bus.flush(force=True)
+    stats = bus.stats()
+    for name in (FAIR_PRICES, FIT_CACHE, SLATE_REPORTS):
+        bus.unsubscribe(name)
+    return stats
@@ -2,6 +2,8 @@
 
 from typing import Any, Dict, List, Optional
 
+from btb.core import instrument
+
 
 def _fmt_float(x: Any, nd: int = 2) -> str:
     try:
@@ -59,6 +61,7 @@ def _render_total(rows: List[Dict[str, Any]]) -> List[str]:
     return out
 
 
+@instrument.timed("report.render")
 def render_prop_report(bundle: Dict[str, Any]) -> str:
     """
     Render a simple markdown-ish trader report from the research bundle.
@@ -68,6 +71,7 @@ def render_prop_report(bundle: Dict[str, Any]) -> str:
     - Recent form summary (if present)
     - Main markets (if present)
     - Props list (with any computed edge fields)
+    - Alt-line ladders (model edge per rung)
     """
     if not bundle or not bundle.get("ok"):
         return str(bundle)
@@ -148,4 +152,14 @@ def render_prop_report(bundle: Dict[str, Any]) -> str:
             lines.append(" | ".join(detail_parts))
         lines.append("")
 
+    for ladder in bundle.get("ladders") or []:
+        prop_type = str(ladder.get("prop_type") or "").title()
+        side = str(ladder.get("side") or "over").upper()
+        lines.append(f"{prop_type} {side} Ladder ({ladder.get('book') or 'book'})")
+        for ln, price, edge in zip(ladder.get("lines") or [], ladder.get("prices") or [], ladder.get("edge") or []):
+            lines.append(f"{ln} @ {_fmt_float(price)} | Edge: {edge:+.3f}")
+        if ladder.get("best_line") is not None:
+            lines.append(f"Best: {ladder['best_line']} (EV {ladder['best_ev']:+.3f})")
+        lines.append("")
+
     return "\n".join(lines).rstrip() + "\n"
@@ -0,0 +1,215 @@
+﻿from __future__ import annotations
+
+import datetime
+import time
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.game_calendar import get_calendar
+from btb.db.schema import Game, Player, PropsMarket, RosterSpell, StatsPlayerGame
+
+_IN_CHUNK = 500
+
+# (team_id, from_date, to_date, games)
+Spell = Tuple[int, datetime.date, datetime.date, int]
+PlayerDate = Tuple[int, datetime.date]
+
+
+def compress_spells(appearances: Iterable[Tuple[datetime.date, int]]) -> List[Spell]:
+    """Collapse (game_date, team_id) appearances, oldest first, into runs per team."""
+    spells: List[Spell] = []
+    for day, team_id in appearances:
+        if spells and spells[-1][0] == team_id:
+            tid, start, _, n = spells[-1]
+            spells[-1] = (tid, start, day, n + 1)
+        else:
+            spells.append((team_id, day, day, 1))
+    return spells
+
+
+@instrument.instrumented("roster.rebuild")
+def rebuild_roster(player_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+    """
+    Rebuild roster_spells from stats rows that know the player's side.
+
+    With player_ids only those players' spells are replaced (what a stats ingest
+    touches); otherwise the whole table.
+    """
+    t0 = time.perf_counter()
+    ids = sorted(set(player_ids)) if player_ids is not None else None
+    session = get_session()
+    q = (
+        select(StatsPlayerGame.player_id, Game.game_date, StatsPlayerGame.team_id)
+        .join(Game, Game.id == StatsPlayerGame.game_id)
+        .where(StatsPlayerGame.team_id.is_not(None))
+        .order_by(StatsPlayerGame.player_id, Game.game_date, Game.id)
+    )
+    chunks = [ids[i : i + _IN_CHUNK] for i in range(0, len(ids), _IN_CHUNK)] if ids is not None else [None]
+
+    players = 0
+    rows: List[Dict[str, Any]] = []
+    for chunk in chunks:
+        appearances: Dict[int, List[Tuple[datetime.date, int]]] = {}
+        for pid, day, tid in session.execute(q if chunk is None else q.where(StatsPlayerGame.player_id.in_(chunk))):
+            appearances.setdefault(pid, []).append((day, tid))
+        stmt = delete(RosterSpell)
+        if chunk is not None:
+            stmt = stmt.where(RosterSpell.player_id.in_(chunk))
+        session.execute(stmt)
+        for pid, apps in appearances.items():
+            players += 1
+            rows.extend(
+                {"player_id": pid, "team_id": tid, "from_date": start, "to_date": end, "games": n}
+                for tid, start, end, n in compress_spells(apps)
+            )
+    if rows:
+        session.execute(insert(RosterSpell), rows)
+    session.commit()
+    session.close()
+    invalidate()
+    instrument.count("roster_spells.rebuilt", len(rows))
+    return {"players": players, "spells": len(rows), "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2)}
+
+
+class RosterIndex:
+    """
+    Player -> team resolution held in memory.
+
+    Each player's spells are kept as sorted start dates with aligned team ids; a
+    spell holds from its start until the next one begins, and the latest stays open
+    (a future slate resolves to the current team). Dates before a player's first
+    spell take that spell's team. Players with no spells fall back to
+    players.team_id. A lookup is a bisect over a handful of spells; the game then
+    comes from the calendar's (date, team) index.
+    """
+
+    def __init__(
+        self,
+        starts: Dict[int, List[datetime.date]],
+        teams: Dict[int, List[int]],
+        fallback: Dict[int, int],
+        stamp: Tuple[int, ...] = (),
+    ) -> None:
+        self.starts = starts
+        self.teams = teams
+        self.fallback = fallback
+        self.stamp = stamp
+
+    @classmethod
+    def from_rows(
+        cls,
+        spells: Iterable[Tuple[int, int, datetime.date]],
+        player_teams: Iterable[Tuple[int, int]],
+        stamp: Tuple[int, ...] = (),
+    ) -> "RosterIndex":
+        """spells: (player_id, team_id, from_date); player_teams: (player_id, team_id)."""
+        staged: Dict[int, List[Tuple[datetime.date, int]]] = {}
+        for pid, tid, start in spells:
+            staged.setdefault(pid, []).append((start, tid))
+        starts: Dict[int, List[datetime.date]] = {}
+        teams: Dict[int, List[int]] = {}
+        for pid, pts in staged.items():
+            pts.sort()
+            starts[pid] = [d for d, _ in pts]
+            teams[pid] = [t for _, t in pts]
+        fallback = {pid: tid for pid, tid in player_teams if tid is not None and pid not in staged}
+        return cls(starts, teams, fallback, stamp)
+
+    def team_on(self, player_id: int, day: datetime.date) -> Optional[int]:
+        starts = self.starts.get(player_id)
+        if not starts:
+            return self.fallback.get(player_id)
+        i = bisect_right(starts, day)
+        return self.teams[player_id][i - 1 if i else 0]
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+
+def _stamp(session) -> Tuple[int, ...]:
+    s_cnt, s_max = session.execute(select(func.count(RosterSpell.id), func.max(RosterSpell.id))).one()
+    p_cnt = session.execute(select(func.count(Player.id)).where(Player.team_id.is_not(None))).scalar()
+    return int(s_cnt or 0), int(s_max or 0), int(p_cnt or 0)
+
+
+def load_roster_index(session) -> RosterIndex:
+    return RosterIndex.from_rows(
+        session.execute(select(RosterSpell.player_id, RosterSpell.team_id, RosterSpell.from_date)),
+        session.execute(select(Player.id, Player.team_id).where(Player.team_id.is_not(None))),
+        _stamp(session),
+    )
+
+
+_index: Optional[RosterIndex] = None
+
+
+@instrument.timed("research.roster_index")
+def get_roster_index(session=None) -> RosterIndex:
+    """Process-wide index, reloaded when roster_spells or player teams change (count / max id stamp)."""
+    global _index
+    own = session is None
+    session = session or get_session()
+    try:
+        stamp = _stamp(session)
+        if _index is None or _index.stamp != stamp:
+            _index = load_roster_index(session)
+        return _index
+    finally:
+        if own:
+            session.close()
+
+
+def invalidate() -> None:
+    global _index
+    _index = None
+
+
+def _listed_games(session, pairs: Sequence[PlayerDate]) -> Dict[PlayerDate, int]:
+    """(player, date) -> game for pairs where the player has a props or stats row on a game that day."""
+    wanted = set(pairs)
+    ids = sorted({pid for pid, _ in wanted})
+    first = min(d for _, d in wanted)
+    last = max(d for _, d in wanted)
+    out: Dict[PlayerDate, int] = {}
+    for model in (StatsPlayerGame, PropsMarket):
+        for i in range(0, len(ids), _IN_CHUNK):
+            q = (
+                select(model.player_id, Game.game_date, Game.id)
+                .join(Game, Game.id == model.game_id)
+                .where(model.player_id.in_(ids[i : i + _IN_CHUNK]))
+                .where(Game.game_date.between(first, last))
+                .distinct()
+                .order_by(Game.id)
+            )
+            for pid, day, gid in session.execute(q):
+                if (pid, day) in wanted:
+                    out.setdefault((pid, day), gid)
+    return out
+
+
+@instrument.timed("research.resolve_player_games")
+def resolve_player_games(session, pairs: Sequence[PlayerDate]) -> List[Optional[int]]:
+    """
+    Game id per (player_id, date), aligned to the input.
+
+    A game the player is listed on that day (stats or props row) wins; then the
+    roster team's game; then the day's only game. Ambiguous or unknown -> None.
+    Costs one query per 500 players plus index probes, whatever the batch size.
+    """
+    if not pairs:
+        return []
+    listed = _listed_games(session, pairs)
+    index = get_roster_index(session)
+    cal = get_calendar(session)
+    out: List[Optional[int]] = []
+    for pid, day in pairs:
+        gid = listed.get((pid, day)) or cal.game_on(day, index.team_on(pid, day))
+        if gid is None:
+            day_games = cal.games_on(day)
+            gid = day_games[0] if len(day_games) == 1 else None
+        out.append(gid)
+    return out
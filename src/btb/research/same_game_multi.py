@@ -0,0 +1,319 @@
+﻿from __future__ import annotations
+
+import datetime
+import math
+import random
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+
+from btb.core import instrument
+from btb.core.stat_expressions import get_registry
+from btb.db.connection import get_session
+from btb.db.schema import Game, Player, PropsMarket, StatsPlayerGame
+
+try:  # optional: pip install btb[sim]
+    import numpy as np
+except ImportError:  # pragma: no cover - depends on environment
+    np = None
+
+BACKEND = "numpy" if np is not None else "python"
+
+# columns the simulation produces; prop types built from anything else cannot be priced
+SIM_STATS = ("points", "rebounds", "assists", "threes_made")
+HISTORY_GAMES = 30
+HALF_LIFE_GAMES = 20.0
+PACE_SIGMA = 0.06  # game-to-game pace variation, shared by everyone in the game
+MINUTES_FACTOR_WEIGHT = 0.3  # share of minutes variance from the game-level (blowout) factor
+STARTER_MINUTES = 24.0  # above: the game factor cuts minutes in a blowout; below: it adds them
+MAX_MINUTES = 48.0
+DEFAULT_DRAWS = 1_000_000 if np is not None else 20_000
+MAX_CACHED_GAMES = 4
+
+
+@dataclass(frozen=True)
+class Leg:
+    player_id: int
+    prop_type: str
+    side: str  # over/under
+    line: float
+    price: Optional[float] = None  # the single's price, when the leg came from props_markets
+
+
+@dataclass
+class PlayerModel:
+    """Recency-weighted history of one player's per-minute rates, for smoothed bootstrap draws."""
+
+    player_id: int
+    rates: List[Tuple[float, ...]]  # per past game, SIM_STATS per minute
+    weights: List[float]
+    mean_minutes: float
+    minutes_cv: float
+
+    @property
+    def loading(self) -> float:
+        return -1.0 if self.mean_minutes >= STARTER_MINUTES else 1.0
+
+
+def load_player_model(session, player_id: int, before: datetime.date, history: int = HISTORY_GAMES) -> Optional[PlayerModel]:
+    rows = session.execute(
+        select(StatsPlayerGame.minutes, *[getattr(StatsPlayerGame, c) for c in SIM_STATS])
+        .join(Game, Game.id == StatsPlayerGame.game_id)
+        .where(StatsPlayerGame.player_id == player_id, Game.game_date < before, StatsPlayerGame.minutes > 0)
+        .order_by(Game.game_date.desc())
+        .limit(history)
+    ).all()
+    if not rows:
+        return None
+    rows = rows[::-1]  # oldest first
+    minutes = [float(r[0]) for r in rows]
+    rates = [tuple(float(v or 0) / m for v in r[1:]) for r, m in zip(rows, minutes)]
+    decay = 0.5 ** (1.0 / HALF_LIFE_GAMES)
+    n = len(rows)
+    weights = [decay ** (n - 1 - i) for i in range(n)]
+    mean_m = sum(minutes) / n
+    var_m = sum((m - mean_m) ** 2 for m in minutes) / n
+    return PlayerModel(player_id, rates, weights, mean_m, math.sqrt(var_m) / mean_m if mean_m else 0.0)
+
+
+class GameSimulation:
+    """
+    Simulated stat lines for one game, `draws` wide.
+
+    Pace and the game-level minutes factor are drawn once per game; each player's
+    row is drawn lazily on first use from a generator seeded by (seed, game,
+    player), so results do not depend on which legs were priced first. A draw
+    picks one of the player's past games (recency-weighted), scales its per-minute
+    rates by simulated minutes and pace, and rounds stochastically to counts.
+    """
+
+    def __init__(self, game_id: int, game_date: datetime.date, draws: int, seed: int, stamp: int) -> None:
+        self.game_id = game_id
+        self.game_date = game_date
+        self.draws = draws
+        self.seed = seed
+        self.stamp = stamp
+        self.rows: Dict[int, Optional[Dict[str, Any]]] = {}
+        s = PACE_SIGMA
+        if np is not None:
+            rng = np.random.default_rng([seed, game_id])
+            self.pace = np.exp(s * rng.standard_normal(draws) - s * s / 2.0)
+            self.z_game = rng.standard_normal(draws)
+        else:
+            rng = random.Random(f"{seed}:{game_id}")
+            self.pace = [math.exp(rng.gauss(0.0, s) - s * s / 2.0) for _ in range(draws)]
+            self.z_game = [rng.gauss(0.0, 1.0) for _ in range(draws)]
+
+    def player(self, session, player_id: int) -> Optional[Dict[str, Any]]:
+        if player_id not in self.rows:
+            model = load_player_model(session, player_id, self.game_date)
+            with instrument.span("sgm.simulate_player", draws=self.draws):
+                self.rows[player_id] = self._draw(model) if model is not None else None
+        return self.rows[player_id]
+
+    def _draw(self, m: PlayerModel) -> Dict[str, Any]:
+        a = math.sqrt(MINUTES_FACTOR_WEIGHT) * m.loading
+        b = math.sqrt(1.0 - MINUTES_FACTOR_WEIGHT)
+        n = self.draws
+        if np is not None:
+            rng = np.random.default_rng([self.seed, self.game_id, m.player_id])
+            w = np.asarray(m.weights)
+            idx = rng.choice(len(m.rates), size=n, p=w / w.sum())
+            minutes = np.clip(m.mean_minutes * (1.0 + m.minutes_cv * (a * self.z_game + b * rng.standard_normal(n))), 0.0, MAX_MINUTES)
+            scale = minutes * self.pace
+            rates = np.asarray(m.rates)
+            cols: Dict[str, Any] = {"minutes": minutes}
+            for j, stat in enumerate(SIM_STATS):
+                x = rates[idx, j] * scale
+                base = np.floor(x)
+                cols[stat] = (base + (rng.random(n) < x - base)).astype(np.int16)
+            return cols
+
+        rng = random.Random(f"{self.seed}:{self.game_id}:{m.player_id}")
+        cum = list(accumulate(m.weights))
+        total = cum[-1]
+        last = len(cum) - 1
+        cols = {"minutes": [0.0] * n, **{s: [0] * n for s in SIM_STATS}}
+        stat_cols = [cols[s] for s in SIM_STATS]
+        mins = cols["minutes"]
+        for d in range(n):
+            rates = m.rates[min(bisect_right(cum, rng.random() * total), last)]
+            mn = m.mean_minutes * (1.0 + m.minutes_cv * (a * self.z_game[d] + b * rng.gauss(0.0, 1.0)))
+            mn = MAX_MINUTES if mn > MAX_MINUTES else 0.0 if mn < 0.0 else mn
+            mins[d] = mn
+            scale = mn * self.pace[d]
+            for col, r in zip(stat_cols, rates):
+                x = r * scale
+                v = int(x)
+                col[d] = v + 1 if rng.random() < x - v else v
+        return cols
+
+
+class SimulationCache:
+    """Most recently used game simulations, keyed by (game, draws, seed) and checked against the stats stamp."""
+
+    def __init__(self, max_games: int = MAX_CACHED_GAMES) -> None:
+        self.max_games = max_games
+        self._sims: "OrderedDict[Tuple[int, int, int], GameSimulation]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, game_id: int, game_date: datetime.date, draws: int, seed: int, stamp: int) -> Tuple[GameSimulation, bool]:
+        key = (game_id, draws, seed)
+        sim = self._sims.get(key)
+        if sim is not None and sim.stamp == stamp:
+            self._sims.move_to_end(key)
+            self.hits += 1
+            return sim, True
+        self.misses += 1
+        sim = GameSimulation(game_id, game_date, draws, seed, stamp)
+        self._sims[key] = sim
+        self._sims.move_to_end(key)
+        while len(self._sims) > self.max_games:
+            self._sims.popitem(last=False)
+        return sim, False
+
+    def invalidate(self) -> None:
+        self._sims.clear()
+
+
+_cache = SimulationCache()
+
+
+def get_simulation_cache() -> SimulationCache:
+    return _cache
+
+
+def _leg_outcomes(sim_cols: Dict[str, Any], leg: Leg) -> Tuple[Any, Any]:
+    """Per-draw (win, push) flags for one leg."""
+    compiled = get_registry().resolve(leg.prop_type)
+    if np is not None:
+        v = compiled.evaluate_arrays(sim_cols)
+        win = v > leg.line if leg.side == "over" else v < leg.line
+        return win, v == leg.line
+    v = compiled.evaluate(sim_cols)
+    if leg.side == "over":
+        win = [x > leg.line for x in v]
+    else:
+        win = [x < leg.line for x in v]
+    return win, [x == leg.line for x in v]
+
+
+def legs_from_markets(session, market_ids: Sequence[int]) -> Tuple[Optional[int], List[Leg]]:
+    """(game_id, legs) for props_markets rows; game_id None when they span games."""
+    rows = session.execute(
+        select(PropsMarket.id, PropsMarket.game_id, PropsMarket.player_id, PropsMarket.prop_type, PropsMarket.side, PropsMarket.line, PropsMarket.price)
+        .where(PropsMarket.id.in_(list(market_ids)))
+    ).all()
+    by_id = {r[0]: r for r in rows}
+    legs = [Leg(r[2], r[3], r[4] or "over", float(r[5]), float(r[6])) for r in (by_id[i] for i in market_ids if i in by_id)]
+    games = {r[1] for r in rows}
+    return (games.pop() if len(games) == 1 else None), legs
+
+
+@instrument.timed("research.sgm")
+def price_same_game_multi(
+    game_id: int,
+    legs: Sequence[Leg],
+    offered_price: Optional[float] = None,
+    draws: Optional[int] = None,
+    seed: int = 0,
+    session=None,
+) -> Dict[str, Any]:
+    """
+    Joint probability that every leg of a same-game multi wins, by Monte Carlo.
+
+    Returns the fair price, the price the legs would make as independent singles
+    (correlation_lift = joint / product of marginals) and, given the book's
+    offered price, the EV per unit. A pushed leg counts as not winning here;
+    p_any_push reports how often that happens.
+    """
+    t0 = time.perf_counter()
+    draws = draws or DEFAULT_DRAWS
+    own = session is None
+    session = session or get_session()
+    try:
+        game = session.get(Game, game_id)
+        if game is None:
+            return {"ok": False, "error": f"unknown game id {game_id}", "reason_code": "GAME_NOT_FOUND"}
+        if not legs:
+            return {"ok": False, "error": "no legs", "reason_code": "NO_LEGS"}
+        registry = get_registry()
+        for leg in legs:
+            compiled = registry.resolve(leg.prop_type)
+            if compiled is None or any(c not in SIM_STATS and c != "minutes" for c in compiled.columns):
+                return {"ok": False, "error": f"prop type {leg.prop_type!r} is not simulated", "reason_code": "UNSUPPORTED_PROP"}
+            if leg.side not in ("over", "under"):
+                return {"ok": False, "error": f"leg side must be over/under: {leg.side!r}", "reason_code": "BAD_LEG"}
+
+        stamp = int(session.execute(select(func.max(StatsPlayerGame.id))).scalar() or 0)
+        sim, cached = _cache.get(game.id, game.game_date, draws, seed, stamp)
+
+        names = dict(session.execute(select(Player.id, Player.full_name).where(Player.id.in_({leg.player_id for leg in legs}))).all())
+        wins: List[Any] = []
+        pushes: List[Any] = []
+        for leg in legs:
+            cols = sim.player(session, leg.player_id)
+            if cols is None:
+                return {"ok": False, "error": f"no stats history for {names.get(leg.player_id, leg.player_id)} before {game.game_date}", "reason_code": "NO_HISTORY"}
+            w, p = _leg_outcomes(cols, leg)
+            wins.append(w)
+            pushes.append(p)
+    finally:
+        if own:
+            session.close()
+
+    with instrument.span("sgm.combine", legs=len(legs)):
+        if np is not None:
+            joint = float(np.logical_and.reduce(wins).mean())
+            any_push = float(np.logical_or.reduce(pushes).mean())
+            marginals = [float(w.mean()) for w in wins]
+        else:
+            joint = sum(1 for flags in zip(*wins) if all(flags)) / draws
+            any_push = sum(1 for flags in zip(*pushes) if any(flags)) / draws
+            marginals = [sum(w) / draws for w in wins]
+
+    independent = math.prod(marginals)
+    singles_price = math.prod(leg.price for leg in legs) if all(leg.price for leg in legs) else None
+    out: Dict[str, Any] = {
+        "ok": True,
+        "game_id": game_id,
+        "backend": BACKEND,
+        "draws": draws,
+        "seed": seed,
+        "cache": "hit" if cached else "miss",
+        "legs": [
+            {"player": names.get(leg.player_id), "prop_type": leg.prop_type, "side": leg.side, "line": leg.line, "price": leg.price, "p_win": round(p, 5)}
+            for leg, p in zip(legs, marginals)
+        ],
+        "p_joint": round(joint, 6),
+        "std_error": round(math.sqrt(joint * (1.0 - joint) / draws), 6),
+        "p_independent": round(independent, 6),
+        "correlation_lift": round(joint / independent, 4) if independent > 0 else None,
+        "p_any_push": round(any_push, 6),
+        "fair_price": round(1.0 / joint, 3) if joint > 0 else None,
+        "singles_multi_price": round(singles_price, 3) if singles_price else None,
+        "offered_price": offered_price,
+        "ev": round(joint * offered_price - 1.0, 4) if offered_price else None,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+    }
+    return out
+
+
+def price_market_multi(market_ids: Sequence[int], offered_price: Optional[float] = None, draws: Optional[int] = None, seed: int = 0) -> Dict[str, Any]:
+    """Price a multi whose legs are props_markets rows (all from one game)."""
+    session = get_session()
+    try:
+        game_id, legs = legs_from_markets(session, market_ids)
+        if len(legs) != len(market_ids):
+            return {"ok": False, "error": "unknown props market id", "reason_code": "MARKET_NOT_FOUND"}
+        if game_id is None:
+            return {"ok": False, "error": "legs must come from one game", "reason_code": "LEGS_SPAN_GAMES"}
+        return price_same_game_multi(game_id, legs, offered_price, draws, seed, session=session)
+    finally:
+        session.close()
@@ -0,0 +1,226 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import select
+
+from btb.db.connection import get_engine, get_session
+from btb.db.schema import Game, Player, PropsMarket
+from btb.research.queries_props import get_player_prop_research
+from btb.research.reports_explain import render_prop_report
+from btb.research.roster import resolve_player_games
+
+
+def _init_worker() -> None:
+    # drop pooled connections inherited from the parent process
+    get_engine().dispose(close=False)
+
+
+def slate_players(game_date: datetime.date, session=None) -> List[Tuple[int, str]]:
+    """(player_id, full_name) of every player with props on games that day."""
+    own = session is None
+    session = session or get_session()
+    rows = session.execute(
+        select(Player.id, Player.full_name)
+        .join(PropsMarket, PropsMarket.player_id == Player.id)
+        .join(Game, Game.id == PropsMarket.game_id)
+        .where(Game.game_date == game_date)
+        .distinct()
+        .order_by(Player.full_name)
+    ).all()
+    if own:
+        session.close()
+    return [(int(pid), str(name)) for pid, name in rows]
+
+
+def slate_games(game_date: datetime.date, session=None) -> List[Tuple[int, str, Optional[int]]]:
+    """slate_players() plus each player's game that day, resolved in one batch."""
+    own = session is None
+    session = session or get_session()
+    try:
+        players = slate_players(game_date, session)
+        game_ids = resolve_player_games(session, [(pid, game_date) for pid, _ in players])
+    finally:
+        if own:
+            session.close()
+    return [(pid, name, gid) for (pid, name), gid in zip(players, game_ids)]
+
+
+def _render_player(player_name: str, date_iso: str, player_id: Optional[int] = None, game_id: Optional[int] = None) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    bundle = get_player_prop_research(player_name, datetime.date.fromisoformat(date_iso), player_id=player_id, game_id=game_id)
+    t1 = time.perf_counter()
+    markdown = render_prop_report(bundle)
+    t2 = time.perf_counter()
+    return {
+        "bundle": bundle,
+        "markdown": markdown,
+        "query_ms": round((t1 - t0) * 1000.0, 2),
+        "render_ms": round((t2 - t1) * 1000.0, 2),
+    }
+
+
+def iter_slate_bundles(game_date: datetime.date) -> Iterator[Dict[str, Any]]:
+    """Research bundles for a date's slate, yielded as each is built (one session for all)."""
+    session = get_session()
+    try:
+        for pid, name, gid in slate_games(game_date, session):
+            yield get_player_prop_research(name, game_date, session=session, player_id=pid, game_id=gid)
+    finally:
+        session.close()
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or "player"
+
+
+def _bundle_line(bundle: Dict[str, Any]) -> str:
+    return json.dumps(bundle, separators=(",", ":"), default=str) + "\n"
+
+
+def _write_player(target: Path, slug: str, pid: int, name: str, res: Dict[str, Any], line: int) -> Dict[str, Any]:
+    """Write one player's .md/.json and return its index entry (line: its slate.ndjson line, from 0)."""
+    bundle = res["bundle"]
+    (target / f"{slug}.md").write_text(res["markdown"] + "\n", encoding="utf-8")
+    (target / f"{slug}.json").write_text(json.dumps(bundle, indent=2, default=str), encoding="utf-8")
+    entry: Dict[str, Any] = {
+        "player": name,
+        "player_id": pid,
+        "ok": bool(bundle.get("ok")),
+        "files": {"md": f"{slug}.md", "json": f"{slug}.json"},
+        "ndjson_line": line,
+        "props": len(bundle.get("props") or []),
+        "query_ms": res["query_ms"],
+        "render_ms": res["render_ms"],
+    }
+    if not bundle.get("ok"):
+        entry["error"] = bundle.get("error")
+    return entry
+
+
+def render_slate(game_date: datetime.date, out_dir: str = "reports", workers: int = 1) -> Dict[str, Any]:
+    """
+    Render every player on a date's slate into <out_dir>/<date>/.
+
+    Writes one <player>.md and <player>.json per player, slate.ndjson (one bundle per
+    line) and index.json with per-player query/render timings, slowest first. Bundles
+    are built and rendered in worker processes; only the parent writes files.
+    """
+    t0 = time.perf_counter()
+    players = slate_games(game_date)
+    date_iso = game_date.isoformat()
+    target = Path(out_dir) / date_iso
+    target.mkdir(parents=True, exist_ok=True)
+
+    names = [name for _, name, _ in players]
+    if workers > 1 and len(names) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            results = list(
+                pool.map(
+                    _render_player,
+                    names,
+                    [date_iso] * len(names),
+                    [pid for pid, _, _ in players],
+                    [gid for _, _, gid in players],
+                    chunksize=max(1, len(names) // (workers * 4)),
+                )
+            )
+    else:
+        results = [_render_player(name, date_iso, pid, gid) for pid, name, gid in players]
+
+    entries: List[Dict[str, Any]] = []
+    used: set[str] = set()
+    with open(target / "slate.ndjson", "w", encoding="utf-8") as nd:
+        for line, ((pid, name, _), res) in enumerate(zip(players, results)):
+            slug = _slug(name)
+            if slug in used:
+                slug = f"{slug}-{pid}"
+            used.add(slug)
+            nd.write(_bundle_line(res["bundle"]))
+            entries.append(_write_player(target, slug, pid, name, res, line))
+
+    entries.sort(key=lambda e: e["query_ms"] + e["render_ms"], reverse=True)
+    elapsed_ms = round((time.perf_counter() - t0) * 1000.0, 2)
+    index = {
+        "date": date_iso,
+        "generated_ts": datetime.datetime.utcnow().isoformat(timespec="seconds"),
+        "workers": workers,
+        "elapsed_ms": elapsed_ms,
+        "ndjson": "slate.ndjson",
+        "players": entries,
+    }
+    (target / "index.json").write_text(json.dumps(index, indent=2), encoding="utf-8")
+
+    return {
+        "ok": True,
+        "dir": str(target),
+        "players": len(entries),
+        "failed": sum(1 for e in entries if not e["ok"]),
+        "elapsed_ms": elapsed_ms,
+        "slowest": [e["player"] for e in entries[:5]],
+    }
+
+
+def render_players(game_date: datetime.date, player_ids: Iterable[int], out_dir: str = "reports") -> Dict[str, Any]:
+    """
+    Re-render only some players of an already rendered slate.
+
+    Their .md/.json files, slate.ndjson lines and index entries are replaced in
+    place (lines by the index entry's ndjson_line, since a failed bundle has no
+    player to match on); players new to the slate are appended. Without an
+    index.json for the date the whole slate is rendered.
+    """
+    t0 = time.perf_counter()
+    date_iso = game_date.isoformat()
+    target = Path(out_dir) / date_iso
+    index_path = target / "index.json"
+    if not index_path.exists():
+        return render_slate(game_date, out_dir=out_dir)
+    index = json.loads(index_path.read_text(encoding="utf-8"))
+    entries: Dict[int, Dict[str, Any]] = {e["player_id"]: e for e in index["players"]}
+    used = {e["files"]["md"][: -len(".md")] for e in entries.values()}
+
+    nd_path = target / "slate.ndjson"
+    lines = nd_path.read_text(encoding="utf-8").splitlines(keepends=True) if nd_path.exists() else []
+
+    wanted = set(player_ids)
+    rendered: List[int] = []
+    for pid, name, gid in slate_games(game_date):
+        if pid not in wanted:
+            continue
+        old = entries.get(pid)
+        line = old.get("ndjson_line") if old is not None else None
+        if line is None or line >= len(lines):
+            line = len(lines)
+            lines.append("")
+        if old is not None:
+            slug = old["files"]["md"][: -len(".md")]
+        else:
+            slug = _slug(name)
+            if slug in used:
+                slug = f"{slug}-{pid}"
+            used.add(slug)
+        res = _render_player(name, date_iso, pid, gid)
+        entries[pid] = _write_player(target, slug, pid, name, res, line)
+        lines[line] = _bundle_line(res["bundle"])
+        rendered.append(pid)
+
+    if rendered:
+        nd_path.write_text("".join(lines), encoding="utf-8")
+        index["players"] = sorted(entries.values(), key=lambda e: e["query_ms"] + e["render_ms"], reverse=True)
+        index["updated_ts"] = datetime.datetime.utcnow().isoformat(timespec="seconds")
+        index_path.write_text(json.dumps(index, indent=2), encoding="utf-8")
+
+    return {
+        "ok": True,
+        "dir": str(target),
+        "players": len(rendered),
+        "rendered": sorted(rendered),
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 2),
+    }
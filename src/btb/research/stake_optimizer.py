@@ -0,0 +1,325 @@
+﻿from __future__ import annotations
+
+import datetime
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from btb.core import instrument
+from btb.db.connection import get_session
+from btb.db.limits_index import get_limits_index
+from btb.db.schema import Book
+from btb.research.prop_probability import expected_value
+from btb.research.queries_props import get_player_prop_research
+from btb.research.slate_reports import slate_games
+
+
+@dataclass
+class Candidate:
+    """One bettable prop quote with model probabilities."""
+
+    game_id: int
+    player_id: int
+    player: str
+    book: str
+    prop_type: str
+    side: str  # over/under
+    line: float
+    price: float
+    p_win: float
+    p_push: float = 0.0
+    max_stake: Optional[float] = None  # the book's limit for this bet, if known
+
+    @property
+    def ev(self) -> float:
+        return expected_value(self.p_win, self.price, self.p_push)
+
+    def kelly(self) -> float:
+        """Full-Kelly fraction for this bet alone (pushes return the stake)."""
+        b = self.price - 1.0
+        q = 1.0 - self.p_win - self.p_push
+        if b <= 0 or self.p_win + q <= 0:
+            return 0.0
+        return max(0.0, (self.p_win * b - q) / (b * (self.p_win + q)))
+
+    def sd(self) -> float:
+        """Standard deviation of the return per unit staked."""
+        b = self.price - 1.0
+        q = 1.0 - self.p_win - self.p_push
+        mu = self.p_win * b - q
+        return math.sqrt(max(self.p_win * b * b + q - mu * mu, 1e-12))
+
+
+@dataclass
+class Correlation:
+    """Assumed outcome correlations between props of one game (same direction; opposite sides flip the sign)."""
+
+    same_stat: float = 0.8  # same player and prop type (alt lines)
+    same_player: float = 0.4  # same player, different prop types
+    same_game: float = 0.1  # different players in one game
+
+    def between(self, a: Candidate, b: Candidate) -> float:
+        if a.game_id != b.game_id:
+            return 0.0
+        if a.player_id == b.player_id:
+            rho = self.same_stat if a.prop_type == b.prop_type else self.same_player
+        else:
+            rho = self.same_game
+        return rho if a.side == b.side else -rho
+
+
+@dataclass
+class StakeLimits:
+    bankroll: float = 1000.0
+    kelly_fraction: float = 0.25
+    max_exposure: float = 0.25  # total staked / bankroll
+    max_game_exposure: float = 0.10
+    max_bet_fraction: float = 0.05  # single bet / bankroll
+    min_stake: float = 1.0
+    stake_step: float = 0.5
+    min_ev: float = 0.0
+    correlation: Correlation = field(default_factory=Correlation)
+
+
+def _solve(a: List[List[float]], b: List[float]) -> Optional[List[float]]:
+    """Gaussian elimination with partial pivoting; None if singular."""
+    n = len(b)
+    m = [row[:] + [b[i]] for i, row in enumerate(a)]
+    for c in range(n):
+        p = max(range(c, n), key=lambda r: abs(m[r][c]))
+        if abs(m[p][c]) < 1e-12:
+            return None
+        m[c], m[p] = m[p], m[c]
+        piv = m[c][c]
+        for r in range(c + 1, n):
+            f = m[r][c] / piv
+            if f:
+                row_r, row_c = m[r], m[c]
+                for k in range(c, n + 1):
+                    row_r[k] -= f * row_c[k]
+    x = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        x[r] = (m[r][n] - sum(m[r][k] * x[k] for k in range(r + 1, n))) / m[r][r]
+    return x
+
+
+def correlated_kelly(cands: Sequence[Candidate], corr: Correlation) -> List[float]:
+    """
+    Joint Kelly fractions for one game's candidates.
+
+    Gaussian approximation f = S^-1 C^-1 S k, where k are the single-bet Kelly
+    fractions, S the per-unit return deviations and C the assumed correlation
+    matrix; with no correlation it reduces to k. Bets whose joint fraction comes
+    out non-positive are dropped and the rest re-solved.
+    """
+    k = [c.kelly() for c in cands]
+    sd = [c.sd() for c in cands]
+    active = [i for i, v in enumerate(k) if v > 0]
+    out = [0.0] * len(cands)
+    while active:
+        cm = [[1.0 if i == j else corr.between(cands[i], cands[j]) for j in active] for i in active]
+        y = None
+        ridge = 0.0
+        while y is None and ridge <= 1.0:
+            y = _solve([[v + (ridge if i == j else 0.0) for j, v in enumerate(row)] for i, row in enumerate(cm)], [sd[i] * k[i] for i in active])
+            ridge = ridge * 2 if ridge else 1e-3
+        if y is None:
+            break
+        f = [y[n] / sd[i] for n, i in enumerate(active)]
+        keep = [i for n, i in enumerate(active) if f[n] > 1e-9]
+        if len(keep) == len(active):
+            for n, i in enumerate(active):
+                out[i] = f[n]
+            break
+        active = keep
+    return out
+
+
+def _dedupe(cands: Iterable[Candidate]) -> List[Candidate]:
+    # one quote per selection: the best price across books
+    best: Dict[Tuple[int, int, str, str, float], Candidate] = {}
+    for c in cands:
+        key = (c.game_id, c.player_id, c.prop_type, c.side, c.line)
+        cur = best.get(key)
+        if cur is None or c.price > cur.price:
+            best[key] = c
+    return list(best.values())
+
+
+def _round_down(x: float, step: float) -> float:
+    return math.floor(x / step + 1e-9) * step if step > 0 else x
+
+
+@instrument.timed("research.optimize_stakes")
+def optimize_stakes(candidates: Sequence[Candidate], limits: Optional[StakeLimits] = None) -> Dict[str, Any]:
+    """
+    Size stakes across a slate of candidate props.
+
+    Fractional Kelly on the correlated per-game solution, then caps in order: the
+    book's limit and max_bet_fraction per bet, max_game_exposure per game and
+    max_exposure overall (each scales its group down proportionally), then stakes
+    are rounded down to stake_step and those under min_stake dropped. Returns the
+    bets ranked by expected profit.
+    """
+    t0 = time.perf_counter()
+    lim = limits or StakeLimits()
+    pool = [c for c in _dedupe(candidates) if c.ev > lim.min_ev and 0 < c.p_win < 1 and c.price > 1]
+
+    by_game: Dict[int, List[int]] = {}
+    for i, c in enumerate(pool):
+        by_game.setdefault(c.game_id, []).append(i)
+
+    fractions = [0.0] * len(pool)
+    for idx in by_game.values():
+        for i, f in zip(idx, correlated_kelly([pool[i] for i in idx], lim.correlation)):
+            fractions[i] = f
+
+    stakes = [f * lim.kelly_fraction * lim.bankroll for f in fractions]
+    capped: List[List[str]] = [[] for _ in pool]
+    for i, c in enumerate(pool):
+        cap = lim.max_bet_fraction * lim.bankroll
+        reason = "max_bet"
+        if c.max_stake is not None and c.max_stake < cap:
+            cap, reason = c.max_stake, "book_limit"
+        if stakes[i] > cap:
+            stakes[i] = cap
+            capped[i].append(reason)
+
+    game_cap = lim.max_game_exposure * lim.bankroll
+    for idx in by_game.values():
+        total = sum(stakes[i] for i in idx)
+        if total > game_cap:
+            for i in idx:
+                stakes[i] *= game_cap / total
+                if stakes[i]:
+                    capped[i].append("game_exposure")
+
+    total = sum(stakes)
+    max_total = lim.max_exposure * lim.bankroll
+    if total > max_total:
+        for i in range(len(pool)):
+            stakes[i] *= max_total / total
+            if stakes[i]:
+                capped[i].append("bankroll_exposure")
+
+    bets: List[Dict[str, Any]] = []
+    below_min = 0
+    for i, c in enumerate(pool):
+        stake = round(_round_down(stakes[i], lim.stake_step), 2)
+        if fractions[i] <= 0:
+            continue
+        if stake < lim.min_stake:
+            below_min += 1
+            continue
+        bets.append(
+            {
+                "game_id": c.game_id,
+                "player": c.player,
+                "book": c.book,
+                "prop_type": c.prop_type,
+                "side": c.side,
+                "line": c.line,
+                "price": c.price,
+                "p_win": round(c.p_win, 4),
+                "ev": round(c.ev, 4),
+                "kelly_single": round(c.kelly(), 4),
+                "kelly_joint": round(fractions[i], 4),
+                "stake": stake,
+                "expected_profit": round(stake * c.ev, 2),
+                "capped_by": capped[i],
+            }
+        )
+    bets.sort(key=lambda b: (-b["expected_profit"], -b["ev"]))
+    for rank, b in enumerate(bets, start=1):
+        b["rank"] = rank
+
+    return {
+        "ok": True,
+        "bankroll": lim.bankroll,
+        "candidates": len(candidates),
+        "positive_ev": len(pool),
+        "bets": bets,
+        "total_stake": round(sum(b["stake"] for b in bets), 2),
+        "expected_profit": round(sum(b["expected_profit"] for b in bets), 2),
+        "dropped_below_min_stake": below_min,
+        "elapsed_ms": round((time.perf_counter() - t0) * 1000.0, 3),
+    }
+
+
+def _latest_quotes(props: Iterable[Dict[str, Any]], as_of: Optional[datetime.datetime]) -> List[Dict[str, Any]]:
+    # the bundle holds every snapshot; what a book offers is its last collection by as_of
+    # (naive UTC) for the prop type and side, so a line it has moved off is not bettable
+    latest: Dict[Tuple[Any, ...], Tuple[datetime.datetime, List[Dict[str, Any]]]] = {}
+    for p in props:
+        ts = datetime.datetime.fromisoformat(p["collected_ts"]) if p.get("collected_ts") else datetime.datetime.min
+        if as_of is not None and ts > as_of:
+            continue
+        key = (p.get("book"), p.get("prop_type"), p.get("side") or "over")
+        cur = latest.get(key)
+        if cur is None or ts > cur[0]:
+            latest[key] = (ts, [p])
+        elif ts == cur[0]:
+            cur[1].append(p)
+    return [p for _, quotes in latest.values() for p in quotes]
+
+
+def candidates_from_bundle(bundle: Dict[str, Any], as_of: Optional[datetime.datetime] = None) -> List[Candidate]:
+    """The current prop quotes (each book's latest collection per type/side as of as_of) that have model probabilities and a price."""
+    if not bundle.get("ok"):
+        return []
+    out: List[Candidate] = []
+    for p in _latest_quotes(bundle.get("props") or [], as_of):
+        side = p.get("side") or "over"
+        p_win = p.get("p_under") if side == "under" else p.get("p_over")
+        if p_win is None or p.get("price") is None or p.get("line") is None:
+            continue
+        out.append(
+            Candidate(
+                game_id=int(bundle["game"]["id"]),
+                player_id=int(bundle["player"]["id"]),
+                player=str(bundle["player"]["name"]),
+                book=str(p.get("book") or ""),
+                prop_type=str(p["prop_type"]),
+                side=side,
+                line=float(p["line"]),
+                price=float(p["price"]),
+                p_win=float(p_win),
+                p_push=float(p.get("p_push") or 0.0),
+            )
+        )
+    return out
+
+
+def attach_book_limits(session, cands: Sequence[Candidate], when: datetime.datetime) -> None:
+    """Fill max_stake from the limits history (scope player_<prop type>), in one batched lookup."""
+    codes = sorted({c.book for c in cands})
+    ids = {code: bid for bid, code in session.execute(select(Book.id, Book.code).where(Book.code.in_(codes)))}
+    known = [c for c in cands if c.book in ids]
+    values = get_limits_index(session).limits_at([ids[c.book] for c in known], [f"player_{c.prop_type}" for c in known], [when] * len(known))
+    for c, v in zip(known, values):
+        c.max_stake = v
+
+
+def optimize_slate(game_date: datetime.date, limits: Optional[StakeLimits] = None, as_of: Optional[datetime.datetime] = None) -> Dict[str, Any]:
+    """Research every player on the slate, then size stakes across all of their props."""
+    when = as_of or datetime.datetime.utcnow()
+    session = get_session()
+    try:
+        t0 = time.perf_counter()
+        cands: List[Candidate] = []
+        for pid, name, gid in slate_games(game_date, session):
+            bundle = get_player_prop_research(name, game_date, session=session, player_id=pid, game_id=gid)
+            cands.extend(candidates_from_bundle(bundle, as_of))
+        attach_book_limits(session, cands, when)
+        research_ms = (time.perf_counter() - t0) * 1000.0
+    finally:
+        session.close()
+    if not cands:
+        return {"ok": False, "error": f"no priced props with model probabilities on {game_date.isoformat()}", "reason_code": "NO_CANDIDATES"}
+    result = optimize_stakes(cands, limits)
+    result["date"] = game_date.isoformat()
+    result["research_ms"] = round(research_ms, 3)
+    return result
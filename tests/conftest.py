@@ -0,0 +1,31 @@
+﻿from __future__ import annotations
+
+import pytest
+
+from btb.db import connection, game_calendar, limits_index
+from btb.db.schema import Base
+from btb.research import roster
+from btb.research.prop_probability import get_fit_cache
+from btb.research.same_game_multi import get_simulation_cache
+
+
+def _invalidate_caches() -> None:
+    # process-wide indexes are keyed by table stamps, which can repeat across DB files
+    game_calendar.invalidate()
+    roster.invalidate()
+    limits_index.invalidate()
+    get_fit_cache().invalidate()
+    get_simulation_cache().invalidate()
+
+
+@pytest.fixture
+def isolated_db(tmp_path):
+    """A fresh SQLite file for one test, so reruns never see rows from an earlier run."""
+    previous = connection.set_database_path(tmp_path / "btb.db")
+    _invalidate_caches()
+    Base.metadata.create_all(connection.get_engine())
+    try:
+        yield connection.DB_PATH
+    finally:
+        connection.set_database_path(previous)
+        _invalidate_caches()
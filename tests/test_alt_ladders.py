@@ -0,0 +1,116 @@
+﻿from __future__ import annotations
+
+import datetime
+
+import pytest
+
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Player, PropsMarket
+from btb.research.alt_ladders import Ladder, build_ladders, isotonic
+from btb.research.queries_props import get_player_prop_research
+from btb.research.reports_explain import render_prop_report
+
+T0 = datetime.datetime(2008, 11, 1)
+HOME, AWAY = "Ladder Hosts", "Ladder Guests"
+
+
+def test_isotonic_and_curve_lookups() -> None:
+    assert isotonic([0.9, 0.7, 0.75, 0.4], increasing=False) == pytest.approx([0.9, 0.725, 0.725, 0.4])
+    assert isotonic([0.1, 0.3, 0.2], increasing=True) == pytest.approx([0.1, 0.25, 0.25])
+
+    over = Ladder((1, 1, 1, "points"), "over", [15.5, 20.5, 25.5], [1.25, 1.9, 3.2])
+    assert over.prob_at(20.5) == pytest.approx(1 / 1.9)
+    assert over.prob_at(18.0) == pytest.approx((0.8 + 1 / 1.9) / 2)
+    probs = [over.prob_at(x) for x in (5.0, 15.5, 23.0, 30.5, 60.0)]
+    assert probs == sorted(probs, reverse=True) and 0.001 <= probs[-1] < probs[-2]
+    assert over.fair_price(25.5) == pytest.approx(3.2)
+
+    later = T0 + datetime.timedelta(hours=1)
+    rows = [
+        (1, 1, 1, "points", "over", 20.5, 1.9, T0),
+        (1, 1, 1, "points", "under", 20.5, 1.9, T0),
+        (1, 1, 1, "points", None, 22.5, 2.4, T0),  # not in the later collection
+        (1, 1, 1, "points", "over", 20.5, 2.0, later),
+        (1, 1, 1, "points", "over", 25.5, 3.0, later),
+    ]
+    ladders = {l.side: l for l in build_ladders(rows)}
+    assert ladders["over"].lines == [20.5, 25.5] and ladders["over"].prices == [2.0, 3.0]
+    assert ladders["over"].margin == pytest.approx(1 / 2.0 + 1 / 1.9)
+    assert ladders["under"].prob_at(20.5) == pytest.approx((1 / 1.9) / (1 / 2.0 + 1 / 1.9))
+
+
+def test_ingest_groups_alt_lines_and_bundle_shows_ladder(isolated_db) -> None:
+    normalize_stats_fixture(
+        {
+            "games": [
+                {
+                    "external_id": f"lad_{d}",
+                    "commence_time": f"2008-11-{d:02d}T00:00:00Z",
+                    "home_team": HOME,
+                    "away_team": AWAY,
+                    "players": [{"player": "Lad Star", "team": HOME, "minutes": 34, "points": pts, "rebounds": 5, "assists": 4}],
+                }
+                for d, pts in ((1, 18), (3, 24), (5, 21), (7, 27), (9, 19))
+            ]
+        }
+    )
+    normalize_props_fixture(
+        {
+            "game": {"id": "lad_11", "commence_time": "2008-11-11T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+            "book": {"key": "ladbook", "title": "Lad Book"},
+            "props": [
+                {"player": "Lad Star", "prop_type": "points", "side": "over", "line": ln, "price": px}
+                for ln, px in ((15.5, 1.2), (19.5, 1.6), (22.5, 2.1), (27.5, 3.6))
+            ]
+            + [{"player": "Lad Star", "prop_type": "rebounds", "side": "over", "line": 4.5, "price": 1.8}],
+        }
+    )
+
+    s = get_session()
+    groups = {
+        pt: gid
+        for pt, gid in s.query(PropsMarket.prop_type, PropsMarket.alt_line_group_id)
+        .join(Player, Player.id == PropsMarket.player_id)
+        .filter(Player.full_name == "Lad Star")
+        .distinct()
+    }
+    s.close()
+    assert len(groups) == 2 and groups["points"] == "6:1:1:points:over" and groups["rebounds"] == "6:1:1:rebounds:over"
+
+    bundle = get_player_prop_research("Lad Star", datetime.date(2008, 11, 11))
+    (ladder,) = bundle["ladders"]  # the single rebounds line is not a ladder
+    assert (ladder["book"], ladder["prop_type"], ladder["side"]) == ("ladbook", "points", "over")
+    assert ladder["lines"] == [15.5, 19.5, 22.5, 27.5]
+    assert ladder["market_prob"] == sorted(ladder["market_prob"], reverse=True)
+    assert len(ladder["edge"]) == len(ladder["ev"]) == 4 and ladder["best_line"] == 15.5
+    assert "Points OVER Ladder (ladbook)" in render_prop_report(bundle)
+
+
+def test_moved_line_leaves_no_stale_rung(isolated_db) -> None:
+    normalize_stats_fixture(
+        {
+            "games": [
+                {
+                    "external_id": f"mv_{d}",
+                    "commence_time": f"2008-12-{d:02d}T00:00:00Z",
+                    "home_team": HOME,
+                    "away_team": AWAY,
+                    "players": [{"player": "Mv Star", "team": HOME, "minutes": 34, "points": pts}],
+                }
+                for d, pts in ((1, 18), (3, 24), (5, 21), (7, 27), (9, 19))
+            ]
+        }
+    )
+    for rungs in (((19.5, 1.6), (22.5, 2.1), (27.5, 3.6)), ((19.5, 1.55), (23.5, 2.2), (27.5, 3.5))):
+        normalize_props_fixture(
+            {
+                "game": {"id": "mv_11", "commence_time": "2008-12-11T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+                "book": {"key": "ladbook", "title": "Lad Book"},
+                "props": [{"player": "Mv Star", "prop_type": "points", "side": "over", "line": ln, "price": px} for ln, px in rungs],
+            }
+        )
+
+    (ladder,) = get_player_prop_research("Mv Star", datetime.date(2008, 12, 11))["ladders"]
+    assert ladder["lines"] == [19.5, 23.5, 27.5] and ladder["prices"] == [1.55, 2.2, 3.5]
@@ -0,0 +1,38 @@
+﻿from __future__ import annotations
+
+import json
+
+from btb.bench.suite import compare_results, run_benchmarks
+from btb.bench.synthetic import SyntheticConfig, SyntheticLeague
+from btb.db import connection
+
+
+def _tiny() -> SyntheticConfig:
+    return SyntheticConfig(teams=4, games_per_team=4, players_per_team=4, books=2, snapshots_per_game=2, prop_players_per_team=2, prop_types=("points",))
+
+
+def test_generator_is_deterministic() -> None:
+    a = list(SyntheticLeague(_tiny()).props_payloads())
+    b = list(SyntheticLeague(_tiny()).props_payloads())
+    assert a == b
+    assert len(a) == 8 * 2  # games x books
+    assert len(list(SyntheticLeague(_tiny()).odds_payloads())) == 8 * 2  # one game a day x snapshots
+
+
+def test_benchmark_suite_writes_comparable_results(tmp_path) -> None:
+    before = connection.DB_PATH
+    out = tmp_path / "results.json"
+    res = run_benchmarks(_tiny(), db_path=str(tmp_path / "bench.db"), out_path=str(out), research_samples=5)
+    assert connection.DB_PATH == before
+
+    saved = json.loads(out.read_text(encoding="utf-8"))
+    stats = saved["benchmarks"]["normalize_stats_fixture"]
+    assert stats["rows"] == 8 * 2 * 4
+    assert stats["latency_ms"]["p50"] > 0 and stats["peak_mem_kb"] > 0
+    assert saved["benchmarks"]["get_player_prop_research"]["calls"] == 5
+    assert "matchup_refresh_full_season" in saved["benchmarks"]
+
+    assert compare_results(res, saved)["regressions"] == []
+    slower = json.loads(json.dumps(saved))
+    slower["benchmarks"]["render_prop_report"]["latency_ms"]["p95"] *= 2
+    assert compare_results(saved, slower)["regressions"][0]["metric"] == "latency_ms.p95"
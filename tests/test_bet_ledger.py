@@ -0,0 +1,135 @@
+﻿from __future__ import annotations
+
+import csv
+
+from btb.data_sources.bet_slips import import_bet_slips
+from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Bet
+from btb.research.bet_settlement import settle_bets
+
+HOME, AWAY = "Ledger Hosts", "Ledger Guests"
+
+
+def _seed() -> None:
+    normalize_stats_fixture(
+        {
+            "league": "NBA",
+            "games": [
+                {
+                    "external_id": "bl_1",
+                    "commence_time": "2014-11-05T00:00:00Z",
+                    "home_team": HOME,
+                    "away_team": AWAY,
+                    "status": "final",
+                    "home_score": 110,
+                    "away_score": 100,
+                    "players": [{"player": "Bl Star", "team": HOME, "minutes": 36, "points": 25, "rebounds": 6, "assists": 4}],
+                }
+            ],
+        }
+    )
+    for ext, day in (("bl_1", "2014-11-05"), ("bl_2", "2014-11-07")):
+        normalize_props_fixture(
+            {
+                "game": {"id": ext, "commence_time": f"{day}T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+                "book": {"key": "ledgerbook", "title": "Ledger Book"},
+                "props": [
+                    {"player": "Bl Star", "prop_type": "points", "side": "over", "line": 20.5, "price": 1.9},
+                    {"player": "Bl Star", "prop_type": "rebounds", "side": "under", "line": 5.5, "price": 1.8},
+                    {"player": "Bl Bench", "prop_type": "points", "line": 10.5, "price": 1.95},
+                ],
+            }
+        )
+    normalize_the_odds_api_odds(
+        [
+            {
+                "id": "bl_1",
+                "commence_time": "2014-11-05T00:00:00Z",
+                "home_team": HOME,
+                "away_team": AWAY,
+                "bookmakers": [
+                    {
+                        "key": "ledgerbook",
+                        "title": "Ledger Book",
+                        "markets": [
+                            {"key": "h2h", "outcomes": [{"name": HOME, "price": 1.8}, {"name": AWAY, "price": 2.1}]},
+                            {"key": "totals", "outcomes": [{"name": "Over", "price": 1.9, "point": 210}, {"name": "Under", "price": 1.9, "point": 210}]},
+                        ],
+                    }
+                ],
+            }
+        ]
+    )
+
+
+def test_import_links_slips_and_settlement_is_incremental(isolated_db, tmp_path) -> None:
+    _seed()
+
+    path = tmp_path / "slips.csv"
+    rows = [
+        # ref, book, placed, game, date, player, market, side, line, price, stake
+        ["s1", "ledgerbook", "2014-11-04T20:00:00Z", "bl_1", "", "Bl Star", "pts", "Over", "20.5", "1.90", "10"],
+        ["s2", "ledgerbook", "2014-11-04T20:00:00Z", "", "2014-11-05", "Bl Star", "Rebounds", "under", "5.5", "-125", "10"],
+        ["s3", "ledgerbook", "2014-11-04T20:00:00Z", "bl_1", "", "Bl Bench", "points", "over", "10.5", "1.95", "5"],
+        ["s4", "ledgerbook", "2014-11-04T20:00:00Z", "bl_1", "", "", "h2h", HOME, "", "+125", "20"],
+        ["s5", "ledgerbook", "2014-11-04T20:00:00Z", "bl_1", "", "", "total", "over", "210", "1.90", "10"],
+        ["s6", "ledgerbook", "2014-11-06T20:00:00Z", "bl_2", "", "Bl Star", "points", "over", "20.5", "1.90", "10"],
+        ["s7", "ledgerbook", "2014-11-04T20:00:00Z", "bl_1", "", "", "corners", "over", "9.5", "1.90", "10"],
+        ["s8", "ledgerbook", "2014-11-04T20:00:00Z", "bl_1", "", "Bl Star", "assists", "over", "3.5", "1.90", "10"],
+    ]
+    with path.open("w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh)
+        w.writerow(["Bet ID", "Book", "Placed At", "Event ID", "Game Date", "Player", "Market", "Selection", "Line", "Odds", "Stake"])
+        w.writerows(rows)
+
+    out = import_bet_slips(str(path))
+    assert out["imported"] == 6
+    assert out["linked_props"] == 4 and out["linked_odds"] == 2
+    assert out["reason_codes"] == {"UNKNOWN_MARKET": 1, "MARKET_NOT_FOUND": 1}
+    assert import_bet_slips(str(path))["skipped_duplicates"] == 6
+
+    first = settle_bets()
+    assert first["settled"] == 5
+    assert first["results"] == {"W": 2, "L": 1, "PUSH": 1, "VOID": 1}
+
+    s = get_session()
+    by_ref = {b.external_ref: b for b in s.query(Bet).filter(Bet.source.like("slip:%"))}
+    assert by_ref["s1"].result == "W" and by_ref["s1"].pnl == 9.0
+    assert by_ref["s2"].result == "L" and by_ref["s2"].pnl == -10.0 and by_ref["s2"].price == 1.8
+    assert by_ref["s3"].result == "VOID" and by_ref["s3"].pnl == 0.0
+    assert by_ref["s4"].result == "W" and by_ref["s4"].pnl == 25.0
+    assert by_ref["s5"].result == "PUSH"
+    assert by_ref["s6"].result is None  # game not final yet
+    s.close()
+
+    assert settle_bets()["settled"] == 0
+
+
+def test_unreported_game_waits_for_both_teams_box_scores(isolated_db, tmp_path) -> None:
+    def box(players) -> None:
+        game = {"external_id": "bl_3", "commence_time": "2014-11-09T00:00:00Z", "home_team": HOME, "away_team": AWAY, "players": players}
+        normalize_stats_fixture({"league": "NBA", "games": [game]})
+
+    # no status from the feed and only the home side reported so far
+    box([{"player": "Bl Star", "team": HOME, "minutes": 30, "points": 22}])
+    normalize_props_fixture(
+        {
+            "game": {"id": "bl_3", "commence_time": "2014-11-09T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+            "book": {"key": "ledgerbook", "title": "Ledger Book"},
+            "props": [{"player": "Bl Star", "prop_type": "points", "side": "over", "line": 20.5, "price": 1.9}],
+        }
+    )
+    path = tmp_path / "slips.csv"
+    with path.open("w", newline="", encoding="utf-8") as fh:
+        w = csv.writer(fh)
+        w.writerow(["Bet ID", "Book", "Placed At", "Event ID", "Player", "Market", "Selection", "Line", "Odds", "Stake"])
+        w.writerow(["p1", "ledgerbook", "2014-11-08T20:00:00Z", "bl_3", "Bl Star", "points", "over", "20.5", "1.90", "10"])
+    assert import_bet_slips(str(path))["linked_props"] == 1
+
+    assert settle_bets()["settled"] == 0
+
+    box([{"player": "Bl Guest", "team": AWAY, "minutes": 32, "points": 18}])
+    assert settle_bets()["results"]["W"] == 1
@@ -0,0 +1,161 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+
+from btb.data_sources import change_bus
+from btb.data_sources.change_bus import ChangeBus
+from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.props_registry import ingest_props_from_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.research import recompute
+from btb.research.slate_reports import render_slate
+
+HOME, AWAY = "Bus Hosts", "Bus Guests"
+DAY = datetime.date(2006, 11, 10)
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.t = 0.0
+
+    def __call__(self) -> float:
+        return self.t
+
+
+def test_bursts_are_debounced_and_work_avoided_is_counted() -> None:
+    clock = _Clock()
+    bus = ChangeBus(debounce_s=0.5, max_wait_s=2.0, auto=False, clock=clock)
+    runs = []
+    bus.subscribe("games", lambda keys: runs.append(sorted(keys)), project=lambda c: c[1] if c[0] == "odds" else None, full_size=lambda: 10)
+
+    for i in range(5):  # five ticks for one game inside the window
+        bus.publish([("odds", 7, None, "b1", "total"), ("stats", 9, 1, None, None)])
+        clock.t += 0.1
+    assert bus.flush() == {} and runs == []
+    clock.t += 0.5
+    bus.flush()
+    assert runs == [[7]]
+    assert bus.stats()["games"] == {
+        "events": 5, "runs": 1, "keys_recomputed": 1, "pending": 0, "failures": 0, "dropped": 0,
+        "full_rebuild_keys": 10, "work_avoided": 9, "work_avoided_pct": 90.0,
+    }
+
+    # a steady stream still flushes once max_wait_s has passed
+    for i in range(25):
+        bus.publish([("odds", 8 + i % 2, None, "b1", "total")])
+        clock.t += 0.1
+        bus.flush()
+    assert runs[1] == [8, 9] and len(runs) == 2
+
+    def broken(keys):
+        raise RuntimeError("boom")
+
+    bus.subscribe("broken", broken)
+    bus.flush(force=True)
+    assert bus.publish([("odds", 1, None, "b1", "h2h")]) == 0
+    assert bus.flush(force=True)["broken"]["reason_code"] == "RECOMPUTE_FAILED"
+    assert bus.stats()["broken"]["failures"] == 1
+
+
+def test_failed_recompute_keeps_its_keys_until_the_retry_cap() -> None:
+    clock = _Clock()
+    bus = ChangeBus(debounce_s=0.5, auto=False, clock=clock, max_retries=2)
+    seen = []
+
+    def locked_once(keys):
+        seen.append(sorted(keys))
+        if len(seen) == 1:
+            raise RuntimeError("database is locked")
+
+    bus.subscribe("fair", locked_once, project=lambda c: c[1])
+    bus.publish([("odds", 7, None, "b1", "h2h")])
+    assert bus.flush(force=True)["fair"]["reason_code"] == "RECOMPUTE_FAILED"
+    assert bus.stats()["fair"]["pending"] == 1  # queued again, not lost
+
+    bus.publish([("odds", 8, None, "b1", "h2h")])
+    clock.t += 0.5
+    bus.flush()
+    assert seen == [[7], [7, 8]] and bus.stats()["fair"]["pending"] == 0
+
+    def broken(keys):
+        raise RuntimeError("boom")
+
+    bus.subscribe("broken", broken, project=lambda c: c[1])
+    bus.publish([("odds", 9, None, "b1", "h2h")])
+    for _ in range(3):  # the first run and two retries
+        bus.flush(force=True)
+    assert bus.stats()["broken"] == {"events": 1, "runs": 3, "keys_recomputed": 3, "pending": 0, "failures": 3, "dropped": 1}
+
+
+def _props_payload(players: list[tuple[str, float]]) -> dict:
+    return {
+        "game": {"id": "bus_1", "commence_time": "2006-11-10T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+        "book": {"key": "busbook", "title": "Bus Book"},
+        "props": [{"player": name, "prop_type": "points", "side": "over", "line": line, "price": 1.9} for name, line in players],
+    }
+
+
+def _props(players: list[tuple[str, float]]) -> None:
+    normalize_props_fixture(_props_payload(players))
+
+
+def test_ingest_recomputes_only_affected_keys(isolated_db, monkeypatch, tmp_path) -> None:
+    normalize_stats_fixture(
+        {
+            "games": [
+                {
+                    "external_id": "bus_0",
+                    "commence_time": "2006-11-08T00:00:00Z",
+                    "home_team": HOME,
+                    "away_team": AWAY,
+                    "players": [
+                        {"player": "Bus Wing", "team": HOME, "minutes": 32, "points": 20, "rebounds": 5, "assists": 3},
+                        {"player": "Bus Big", "team": AWAY, "minutes": 30, "points": 14, "rebounds": 10, "assists": 2},
+                    ],
+                }
+            ]
+        }
+    )
+    _props([("Bus Wing", 19.5), ("Bus Big", 13.5)])
+    render_slate(DAY, out_dir=str(tmp_path))
+
+    bus = ChangeBus(auto=False)
+    monkeypatch.setattr(change_bus, "_bus", bus)
+    assert recompute.attach(bus, slate_date=DAY, out_dir=str(tmp_path)) == ["fair_prices", "fit_cache", "slate_reports"]
+
+    _props([("Bus Wing", 20.5), ("Bus Wing", 21.5)])
+    out = bus.flush(force=True)
+    assert out["fair_prices"]["games_recomputed"] == 1
+    assert out["slate_reports"]["players"] == 1 and "fit_cache" not in out
+    index = json.loads((tmp_path / DAY.isoformat() / "index.json").read_text(encoding="utf-8"))
+    assert {e["player"]: e["props"] for e in index["players"]} == {"Bus Wing": 3, "Bus Big": 1}
+    lines = (tmp_path / DAY.isoformat() / "slate.ndjson").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2 and sum(len(json.loads(l)["props"]) for l in lines) == 4
+
+    # a main-market move touches every report of the game
+    normalize_the_odds_api_odds(
+        [
+            {
+                "id": "bus_1",
+                "commence_time": "2006-11-10T00:00:00Z",
+                "home_team": HOME,
+                "away_team": AWAY,
+                "bookmakers": [{"key": "busbook", "title": "Bus Book", "markets": [{"key": "h2h", "outcomes": [{"name": HOME, "price": 1.6}, {"name": AWAY, "price": 2.4}]}]}],
+            }
+        ]
+    )
+    assert bus.flush(force=True)["slate_reports"]["players"] == 2
+
+    # with the bus subscriber attached, ingest leaves fair prices to it instead of doing them twice
+    path = tmp_path / "props.json"
+    path.write_text(json.dumps(_props_payload([("Bus Big", 14.5)])), encoding="utf-8")
+    assert ingest_props_from_fixture(str(path))["fair_prices"] == {"deferred": "change_bus"}
+    assert bus.flush(force=True)["fair_prices"]["games_recomputed"] == 1
+
+    stats = recompute.detach(bus)
+    assert stats["slate_reports"]["keys_recomputed"] == 4 and stats["slate_reports"]["full_rebuild_keys"] == 6
+    assert stats["fair_prices"]["runs"] == 3 and stats["fair_prices"]["work_avoided"] >= 0
+    assert not bus.has_subscribers()
+    assert "games_recomputed" in ingest_props_from_fixture(str(path))["fair_prices"]
@@ -0,0 +1,123 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+
+import pytest
+import typer
+from typer.testing import CliRunner
+
+from btb.api import serialize
+from btb.cli import output
+from btb.cli.main import app
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_engine, get_session
+from btb.db.schema import Base, LimitsSnapshot
+
+
+def test_stream_flushes_each_record(tmp_path) -> None:
+    path = tmp_path / "out.json"
+    seen = []
+
+    def records():
+        for i in range(3):
+            yield {"i": i, "ts": datetime.datetime(2005, 11, 1, i)}
+            seen.append(path.read_bytes())  # what a consumer sees mid-stream
+
+    assert output.stream(records(), "json", str(path)) == 3
+    assert seen[0] == b'[{"i":0,"ts":"2005-11-01T00:00:00"}'
+    assert [r["i"] for r in json.loads(path.read_bytes())] == [0, 1, 2]
+
+    output.stream(iter(()), "json", str(path))
+    assert json.loads(path.read_bytes()) == []
+
+    output.stream(({"i": i} for i in range(2)), "ndjson", str(path))
+    assert path.read_text().splitlines() == ['{"i":0}', '{"i":1}']
+
+    output.emit({"a": 1}, "text", str(path))
+    assert path.read_text() == "{'a': 1}\n"
+
+    with pytest.raises(typer.BadParameter):
+        output.Emitter("yaml")
+    if serialize.msgpack is None:
+        with pytest.raises(typer.BadParameter):
+            output.Emitter("msgpack", str(path))
+    else:
+        output.emit({"a": [1, 2]}, "msgpack", str(path))
+        assert serialize.msgpack.unpackb(path.read_bytes()) == {"a": [1, 2]}
+
+
+def test_phase1_commands_write_structured_output() -> None:
+    Base.metadata.create_all(get_engine())
+    game = {"commence_time": "2005-11-03T00:00:00Z", "home_team": "Out Hosts", "away_team": "Out Guests"}
+    normalize_stats_fixture(
+        {
+            "games": [
+                {
+                    "external_id": "out_0",
+                    **game,
+                    "commence_time": "2005-11-01T00:00:00Z",
+                    "players": [
+                        {"player": "Out Wing", "team": "Out Hosts", "minutes": 31, "points": 18, "rebounds": 4, "assists": 5},
+                        {"player": "Out Big", "team": "Out Guests", "minutes": 29, "points": 12, "rebounds": 9, "assists": 1},
+                    ],
+                }
+            ]
+        }
+    )
+    normalize_props_fixture(
+        {
+            "game": {"id": "out_1", **game},
+            "book": {"key": "outbook", "title": "Out Book"},
+            "props": [
+                {"player": "Out Wing", "prop_type": "points", "line": 17.5, "price": 1.9},
+                {"player": "Out Big", "prop_type": "rebounds", "line": 8.5, "price": 1.85},
+            ],
+        }
+    )
+    runner = CliRunner()
+
+    res = runner.invoke(app, ["phase1", "player-prop-research", "Out Wing", "--date", "2005-11-03", "--format", "json"])
+    assert res.exit_code == 0, res.output
+    bundle = json.loads(res.stdout)
+    assert bundle["ok"] is True and bundle["player"]["name"] == "Out Wing"
+
+    res = runner.invoke(app, ["phase1", "slate-research", "--date", "2005-11-03"])
+    assert res.exit_code == 0, res.output
+    names = [json.loads(line)["player"]["name"] for line in res.stdout.splitlines()]
+    assert names == ["Out Big", "Out Wing"]
+
+    res = runner.invoke(app, ["phase1", "report-prop", "Out Wing", "--date", "2005-11-03", "--format", "ndjson"])
+    assert json.loads(res.stdout)["markdown"].startswith("OUT WING")
+
+
+def test_unusable_format_is_rejected_before_the_command_runs(isolated_db, tmp_path) -> None:
+    path = tmp_path / "limits.json"
+    path.write_text(json.dumps([{"book": "fmtbook", "scope": "default", "limit": 100, "effective_ts": "2005-01-01T00:00:00Z"}]), encoding="utf-8")
+    runner = CliRunner()
+    bad = ["yaml"] if serialize.msgpack is not None else ["yaml", "msgpack"]
+    for fmt in bad:
+        res = runner.invoke(app, ["phase1", "import-limits", str(path), "--format", fmt])
+        assert res.exit_code == 2
+    s = get_session()
+    assert s.query(LimitsSnapshot).count() == 0  # nothing was imported
+    s.close()
+
+    res = runner.invoke(app, ["phase1", "import-limits", str(path), "--input-format", "json", "--format", "json"])
+    assert res.exit_code == 0, res.output
+    assert json.loads(res.stdout)["created"] == 1
+
+
+def test_scan_arbs_summary_follows_the_format(isolated_db) -> None:
+    runner = CliRunner()
+    res = runner.invoke(app, ["phase1", "scan-arbs", "--date", "2005-11-03", "--format", "json"])
+    assert res.exit_code == 0, res.output
+    summary = json.loads(res.stdout)
+    assert (summary["rows_loaded"], summary["arbs"], summary["opportunities"]) == (0, 0, [])
+
+    # the opportunity stream owns stdout, so the summary goes to stderr
+    res = runner.invoke(app, ["phase1", "scan-arbs", "--date", "2005-11-03", "--format", "ndjson"])
+    assert res.exit_code == 0, res.output
+    assert res.stdout == ""
+    assert json.loads(res.stderr)["middles"] == 0
@@ -0,0 +1,73 @@
+﻿from __future__ import annotations
+
+import datetime
+
+from btb.db.connection import get_session
+from btb.db.schema import Bet, Book, CLVObservation, Game, League, PropsMarket, Season, Team, Player
+from btb.research.clv_engine import AsOfIndex, compute_clv
+
+
+def test_asof_index_lookups() -> None:
+    idx = AsOfIndex()
+    t0 = datetime.datetime(2025, 1, 1, 12, 0)
+    idx.add("k", t0 + datetime.timedelta(minutes=10), 1.80)
+    idx.add("k", t0, 2.00)
+    idx.add("k", t0 + datetime.timedelta(minutes=20), 1.70)
+
+    assert idx.price_at("k", t0 - datetime.timedelta(minutes=1)) is None
+    assert idx.price_at("k", t0 + datetime.timedelta(minutes=10)) == 1.80
+    assert idx.last_before("k", t0 + datetime.timedelta(minutes=10)) == 2.00
+    assert idx.last_before("missing", t0) is None
+
+
+def test_compute_clv_writes_observations_incrementally(isolated_db) -> None:
+    s = get_session()
+
+    league = League(code="NBA", name="NBA")
+    s.add(league)
+    s.flush()
+    season = Season(league_id=league.id, year_start=2019, year_end=2020)
+    home, away = Team(name="CLV Home"), Team(name="CLV Away")
+    player = Player(full_name="CLV Wing")
+    sharp = Book(code="clvsharp", name="CLV Sharp", sharp_flag=True)
+    soft = Book(code="clvsoft", name="CLV Soft")
+    s.add_all([season, home, away, player, sharp, soft])
+    s.flush()
+
+    tip = datetime.datetime(2019, 12, 1, 0, 30)
+    game = Game(
+        league_id=league.id, season_id=season.id, game_date=tip.date(), commence_ts=tip,
+        home_team_id=home.id, away_team_id=away.id,
+    )
+    s.add(game)
+    s.flush()
+
+    def snap(book: Book, price: float, minutes_before: int) -> PropsMarket:
+        row = PropsMarket(
+            game_id=game.id, player_id=player.id, book_id=book.id, prop_type="points", line=20.5,
+            price=price, collected_ts=tip - datetime.timedelta(minutes=minutes_before),
+        )
+        s.add(row)
+        return row
+
+    taken = snap(soft, 2.10, 300)
+    snap(sharp, 1.95, 300)
+    snap(sharp, 1.80, 5)
+    snap(sharp, 1.50, -30)  # in-play, after commence
+    s.flush()
+
+    bet = Bet(placed_ts=tip - datetime.timedelta(minutes=240), game_id=game.id, props_market_id=taken.id, book_id=soft.id, stake=10, price=2.10)
+    s.add(bet)
+    s.commit()
+
+    out = compute_clv("clvsharp")
+    assert out["ok"] is True
+    assert out["observations_written"] == 1
+
+    obs = get_session().query(CLVObservation).filter_by(bet_id=bet.id).one()
+    assert obs.open_price == 1.95
+    assert obs.closing_price == 1.80
+    assert round(obs.calculated_clv, 4) == round(2.10 / 1.80 - 1.0, 4)
+
+    again = compute_clv("clvsharp")
+    assert again["observations_written"] == 0
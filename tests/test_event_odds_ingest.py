@@ -0,0 +1,136 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+
+import pytest
+
+from btb.data_sources import odds_registry, odds_the_odds_api
+from btb.db.connection import get_session
+from btb.db.schema import Game, OddsMarket, PropsMarket, RawProvider
+
+HOME, AWAY = "Event Hosts", "Event Guests"
+
+
+def _event(eid: str) -> dict:
+    return {
+        "id": eid,
+        "commence_time": "2009-11-04T00:30:00Z",
+        "home_team": HOME,
+        "away_team": AWAY,
+        "bookmakers": [
+            {
+                "key": "evbook",
+                "title": "Ev Book",
+                "markets": [
+                    {"key": "h2h", "outcomes": [{"name": HOME, "price": 1.7}, {"name": AWAY, "price": 2.2}]},
+                    {"key": "totals", "outcomes": [{"name": "Over", "price": 1.9, "point": 215.5}, {"name": "Under", "price": 1.9, "point": 215.5}]},
+                    {
+                        "key": "player_points",
+                        "outcomes": [
+                            {"name": "Over", "description": "Ev Star", "price": 1.87, "point": 24.5},
+                            {"name": "Under", "description": "Ev Star", "price": 1.93, "point": 24.5},
+                        ],
+                    },
+                    {"key": "player_points_rebounds_assists", "outcomes": [{"name": "Over", "description": "Ev Star", "price": 1.8, "point": 35.5}]},
+                ],
+            }
+        ],
+    }
+
+
+class _Resp:
+    def __init__(self, data, headers) -> None:
+        self._data = data
+        self.headers = headers
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def json(self):
+        return self._data
+
+
+def test_event_odds_routes_main_and_props_in_one_pass(isolated_db, monkeypatch) -> None:
+    calls = []
+
+    def fake_get(url, params=None, timeout=None):
+        calls.append((url, dict(params or {})))
+        if url.endswith("/events"):
+            return _Resp([{"id": "ev_1"}, {"id": "ev_2"}, {"id": "ev_3"}], {})
+        eid = url.rsplit("/", 2)[-2]
+        if eid == "ev_3":
+            raise RuntimeError("boom")
+        return _Resp(_event(eid), {"x-requests-used": "40", "x-requests-remaining": "460", "x-requests-last": "15"})
+
+    monkeypatch.setenv("THE_ODDS_API_KEY", "test")
+    monkeypatch.setattr(odds_the_odds_api.requests, "get", fake_get)
+    s = get_session()
+    raw_before = s.query(RawProvider).filter_by(scope="event_odds").count()
+    s.close()
+
+    out = odds_the_odds_api.ingest_day_event_odds("NBA", datetime.date(2009, 11, 4), sport_key="basketball_nba", batch_size=2)
+    assert (out["events"], out["requests"], out["batches"], out["games_created"]) == (3, 2, 1, 2)
+    assert (out["markets_created"], out["props_created"]) == (8, 6)
+    assert out["quota"] == {"charged": 30, "per_event": 15.0, "remaining": 460}
+    assert out["errors"][0]["event_id"] == "ev_3"
+    markets = calls[1][1]["markets"].split(",")
+    assert markets[:3] == ["h2h", "spreads", "totals"] and "player_points" in markets
+
+    s = get_session()
+    game = s.query(Game).filter_by(external_id="ev_1").one()
+    assert s.query(OddsMarket).filter_by(game_id=game.id).count() == 4
+    props = s.query(PropsMarket).filter_by(game_id=game.id).order_by(PropsMarket.prop_type, PropsMarket.side).all()
+    assert [(p.prop_type, p.side, p.line, p.source) for p in props] == [
+        ("points", "over", 24.5, "the_odds_api"),
+        ("points", "under", 24.5, "the_odds_api"),
+        ("pra", "over", 35.5, "the_odds_api"),
+    ]
+    raws = s.query(RawProvider).filter_by(scope="event_odds").all()
+    assert len(raws) - raw_before == 2 and json.loads(raws[-1].payload_json)["id"] in ("ev_1", "ev_2")
+    s.close()
+
+    again = odds_the_odds_api.ingest_day_event_odds("NBA", datetime.date(2009, 11, 4), sport_key="basketball_nba")
+    assert (again["props_created"], again["props_skipped_duplicates"], again["games_created"]) == (0, 6, 0)
+
+
+def test_event_odds_day_without_events_is_ok(isolated_db, monkeypatch) -> None:
+    monkeypatch.setenv("THE_ODDS_API_KEY", "test")
+    monkeypatch.setattr(odds_the_odds_api.requests, "get", lambda url, params=None, timeout=None: _Resp([], {}))
+    monkeypatch.setattr(odds_the_odds_api, "resolve_nba_sport_key", lambda api_key: "basketball_nba")
+
+    out = odds_registry.ingest_event_odds("NBA", datetime.date(2009, 11, 5))
+    assert out["ok"] is True and out["used_provider"] == "the_odds_api"
+    assert (out["result"]["events"], out["result"]["requests"]) == (0, 0)
+
+    with pytest.raises(ValueError):
+        odds_registry.ingest_event_odds("NBA", datetime.date(2009, 11, 5), batch_size=0)
+
+
+def test_alternate_markets_are_requested_and_join_the_base_ladder(isolated_db, monkeypatch) -> None:
+    event = _event("ev_alt")
+    event["bookmakers"][0]["markets"].append(
+        {
+            "key": "player_points_alternate",
+            "outcomes": [
+                {"name": "Over", "description": "Ev Star", "price": 1.4, "point": 19.5},
+                {"name": "Over", "description": "Ev Star", "price": 2.6, "point": 29.5},
+            ],
+        }
+    )
+    calls = []
+
+    def fake_get(url, params=None, timeout=None):
+        calls.append(dict(params or {}))
+        return _Resp([{"id": "ev_alt"}] if url.endswith("/events") else event, {})
+
+    monkeypatch.setenv("THE_ODDS_API_KEY", "test")
+    monkeypatch.setattr(odds_the_odds_api.requests, "get", fake_get)
+    out = odds_the_odds_api.ingest_day_event_odds("NBA", datetime.date(2009, 11, 4), sport_key="basketball_nba")
+    assert "player_points_alternate" in calls[1]["markets"].split(",")
+    assert out["props_created"] == 5 and "quarantined" not in out
+
+    s = get_session()
+    rows = s.query(PropsMarket.line, PropsMarket.alt_line_group_id).filter_by(prop_type="points", side="over").order_by(PropsMarket.line).all()
+    s.close()
+    assert [ln for ln, _ in rows] == [19.5, 24.5, 29.5] and len({g for _, g in rows}) == 1
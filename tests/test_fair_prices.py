@@ -0,0 +1,71 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+from pathlib import Path
+
+from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Book, FairPrice
+from btb.research.fair_prices import SHARP_WEIGHT, devig_game, refresh_fair_prices
+
+
+def test_devig_pairs_and_sharp_weighted_consensus() -> None:
+    ts = datetime.datetime(2026, 1, 1, 12, 0)
+    quotes = {
+        ("odds", 1, "moneyline", None, "home", None): (1.90, ts),
+        ("odds", 1, "moneyline", None, "away", None): (1.90, ts),
+        ("odds", 2, "moneyline", None, "home", None): (1.80, ts),
+        ("odds", 2, "moneyline", None, "away", None): (2.00, ts),
+        ("props", 2, "points", 7, "over", 20.5): (1.87, ts),
+    }
+    rows = devig_game(99, quotes, sharp_book_ids={1})
+    by_key = {(r["book_id"], r["market_type"], r["outcome"]): r for r in rows}
+
+    assert round(by_key[(1, "moneyline", "home")]["fair_prob"], 4) == 0.5
+    soft_home = (1 / 1.80) / (1 / 1.80 + 1 / 2.00)
+    assert round(by_key[(2, "moneyline", "home")]["fair_prob"], 4) == round(soft_home, 4)
+
+    cons = by_key[(None, "moneyline", "home")]
+    assert cons["books_used"] == 2
+    assert round(cons["fair_prob"], 4) == round((SHARP_WEIGHT * 0.5 + soft_home) / (SHARP_WEIGHT + 1), 4)
+
+    prop = by_key[(2, "points", "over")]
+    assert prop["method"] == "book_margin"
+    assert prop["fair_prob"] < 1 / 1.87
+
+
+def test_refresh_is_incremental(isolated_db) -> None:
+    payload = json.loads(Path("tests/fixtures/the_odds_api_sample.json").read_text(encoding="utf-8-sig"))
+    markets = normalize_the_odds_api_odds(payload)["markets_created"]
+    assert markets > 0
+
+    first = refresh_fair_prices()
+    assert first["games_recomputed"] == 1
+    assert first["rows_processed"] == markets and first["rows_skipped"] == 0
+
+    again = refresh_fair_prices()
+    assert again["games_recomputed"] == 0 and again["fair_rows_written"] == 0
+    assert again["rows_processed"] == 0 and again["rows_skipped"] == markets
+
+
+def test_a_line_the_book_moved_off_is_not_priced(isolated_db) -> None:
+    def quote(book: str, line: float) -> None:
+        normalize_props_fixture(
+            {
+                "game": {"id": "fp_move", "commence_time": "2026-01-02T00:00:00Z", "home_team": "Fp Hosts", "away_team": "Fp Guests"},
+                "book": {"key": book, "title": book},
+                "props": [{"player": "Fp Star", "prop_type": "points", "side": side, "line": line, "price": 1.9} for side in ("over", "under")],
+            }
+        )
+
+    quote("fpmover", 22.5)
+    quote("fpsteady", 22.5)
+    quote("fpmover", 23.5)
+    refresh_fair_prices()
+
+    s = get_session()
+    rows = s.query(Book.code, FairPrice.line).outerjoin(Book, Book.id == FairPrice.book_id).filter(FairPrice.scope == "props", FairPrice.outcome == "over").all()
+    s.close()
+    assert sorted(rows, key=lambda r: (r[0] or "", r[1])) == [(None, 22.5), (None, 23.5), ("fpmover", 23.5), ("fpsteady", 22.5)]
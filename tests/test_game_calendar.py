@@ -0,0 +1,56 @@
+﻿from __future__ import annotations
+
+import datetime
+
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db import game_calendar
+from btb.db.connection import get_engine, get_session
+from btb.db.game_calendar import GameCalendar, get_calendar
+from btb.db.schema import Base, Game
+
+D = datetime.date
+
+
+def test_calendar_lookups_from_rows() -> None:
+    cal = GameCalendar.from_rows(
+        [(2, "b", D(2010, 11, 2), 10, 11), (1, "a", D(2010, 11, 2), 12, 13), (3, None, D(2010, 11, 3), 10, None)],
+        [(7, 1, 2010, 2011)],
+    )
+    assert cal.game_id("b") == 2 and cal.game_id("zzz") is None and cal.game_id(None) is None
+    assert cal.game_on(D(2010, 11, 2), 11) == 2 and cal.game_on(D(2010, 11, 3), 10) == 3
+    assert cal.game_on(D(2010, 11, 4), 10) is None and cal.game_on(D(2010, 11, 2), None) is None
+    assert cal.games_on(D(2010, 11, 2)) == [1, 2]
+    assert cal.fixture_games(D(2010, 11, 3), 10, None) == [3]
+    assert cal.season_id(1, 2010, 2011) == 7 and len(cal) == 3
+
+
+def test_normalizers_keep_shared_calendar_in_sync() -> None:
+    Base.metadata.create_all(get_engine())
+    s = get_session()
+    cal = get_calendar(s)
+    s.close()
+
+    normalize_stats_fixture(
+        {"games": [{"external_id": "cal_1", "commence_time": "2010-11-05T00:00:00Z", "home_team": "Cal Hosts", "away_team": "Cal Guests"}]}
+    )
+    normalize_props_fixture(
+        {
+            "game": {"id": "cal_2", "commence_time": "2010-11-05T00:00:00Z", "home_team": "Cal Hosts", "away_team": "Cal Guests"},
+            "book": {"key": "calbook", "title": "Cal Book"},
+            "props": [{"player": "Cal Star", "prop_type": "points", "line": 20.5, "price": 1.9}],
+        }
+    )
+
+    s = get_session()
+    assert get_calendar(s) is cal  # registered by the normalizers, no reload
+    g1 = s.query(Game).filter_by(external_id="cal_1").one()
+    g2 = s.query(Game).filter_by(external_id="cal_2").one()
+    assert cal.game_id("cal_2") == g2.id
+    assert cal.game_on(D(2010, 11, 5), g1.home_team_id) == g1.id
+    assert cal.fixture_games(D(2010, 11, 5), g1.home_team_id, g1.away_team_id) == [g1.id, g2.id]
+    assert cal.season_id(g1.league_id, 2010, 2011) == g1.season_id
+
+    game_calendar.invalidate()
+    assert len(get_calendar(s)) == len(cal)
+    s.close()
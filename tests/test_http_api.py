@@ -0,0 +1,118 @@
+﻿from __future__ import annotations
+
+import asyncio
+import http.client
+import json
+import threading
+
+from btb.api.http_server import ResearchAPI, data_version
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_engine, get_readonly_session, get_session
+from btb.db.schema import Base, Game
+
+
+def _seed() -> None:
+    Base.metadata.create_all(get_engine())
+    normalize_stats_fixture(
+        {
+            "league": "NBA",
+            "games": [
+                {
+                    "external_id": "api_game_0",
+                    "commence_time": "2016-11-08T00:00:00Z",
+                    "home_team": "Api Home",
+                    "away_team": "Api Away",
+                    "players": [{"player": "Api Shooter", "team": "Api Home", "minutes": 33, "points": 24, "rebounds": 5, "assists": 4}],
+                }
+            ],
+        }
+    )
+    normalize_props_fixture(
+        {
+            "game": {"id": "api_game_1", "commence_time": "2016-11-10T00:00:00Z", "home_team": "Api Home", "away_team": "Api Away"},
+            "book": {"key": "apibook", "title": "Api Book"},
+            "props": [{"player": "Api Shooter", "prop_type": "points", "line": 22.5, "price": 1.90}],
+        }
+    )
+
+
+def test_http_api_serves_bundles_with_etags() -> None:
+    _seed()
+    api = ResearchAPI(workers=2)
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(api.start("127.0.0.1", 0))
+    port = server.sockets[0].getsockname()[1]
+    t = threading.Thread(target=loop.run_forever, daemon=True)
+    t.start()
+    try:
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.request("GET", "/bundle?player=Api%20Shooter&date=2016-11-10")
+        r = conn.getresponse()
+        body = json.loads(r.read())
+        assert r.status == 200 and body["ok"] and body["props"][0]["line"] == 22.5
+        etag = r.getheader("ETag")
+        assert etag
+
+        # same connection (keep-alive), unchanged data -> 304
+        conn.request("GET", "/bundle?player=Api%20Shooter&date=2016-11-10", headers={"If-None-Match": etag})
+        r = conn.getresponse()
+        assert r.status == 304 and r.read() == b""
+
+        conn.request("GET", "/report?player=Api%20Shooter&date=2016-11-10")
+        r = conn.getresponse()
+        assert r.status == 200 and "API SHOOTER" in r.read().decode("utf-8")
+
+        conn.request("GET", "/slate?date=2016-11-10")
+        r = conn.getresponse()
+        assert [b["player"]["name"] for b in json.loads(r.read())["players"]] == ["Api Shooter"]
+
+        game_id = body["game"]["id"]
+        conn.request("GET", f"/odds-history?game_id={game_id}&scope=props")
+        r = conn.getresponse()
+        assert json.loads(r.read())["rows"][0]["price"] == 1.90
+
+        conn.request("GET", "/bundle?date=2016-11-10")
+        r = conn.getresponse()
+        assert r.status == 400 and json.loads(r.read())["reason_code"] == "BAD_REQUEST"
+        conn.close()
+    finally:
+        server.close()
+        loop.call_soon_threadsafe(loop.stop)
+        t.join(timeout=5)
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            # gather() with no tasks would bind to the default loop, not this one
+            loop.run_until_complete(asyncio.wait(pending))
+        loop.close()
+        api.close()
+
+
+def test_data_version_moves_on_in_place_updates(isolated_db) -> None:
+    _seed()
+    s = get_readonly_session()
+    before = data_version(s)
+    s.close()
+
+    w = get_session()
+    game = w.query(Game).filter_by(external_id="api_game_1").one()
+    game.status = "final"  # an UPDATE: no table's max(id) moves
+    w.commit()
+    w.close()
+
+    s = get_readonly_session()
+    after = data_version(s)
+    assert after != before
+    assert data_version(s) == after  # reads alone do not bump it
+    s.close()
+
+    w = get_session()
+    w.query(Game).filter_by(external_id="api_game_1").one().status = "cancelled"
+    w.flush()
+    w.rollback()  # a rolled-back write does not bump it either
+    w.close()
+    s = get_readonly_session()
+    assert data_version(s) == after
+    s.close()
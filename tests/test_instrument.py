@@ -0,0 +1,58 @@
+﻿from __future__ import annotations
+
+import json
+
+from btb.core import instrument
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+
+
+def _payload(ext: str, when: str) -> dict:
+    return {
+        "league": "NBA",
+        "games": [
+            {
+                "external_id": ext,
+                "commence_time": when,
+                "home_team": "Trace Hosts",
+                "away_team": "Trace Guests",
+                "players": [
+                    {"player": "Tr Host Wing", "team": "Trace Hosts", "position": "F", "minutes": 31, "points": 18, "rebounds": 6, "assists": 3},
+                    {"player": "Tr Guest Wing", "team": "Trace Guests", "position": "F", "minutes": 29, "points": 14, "rebounds": 5, "assists": 4},
+                ],
+            }
+        ],
+    }
+
+
+def test_instrumented_ingest_reports_spans_sql_and_exports(isolated_db, tmp_path) -> None:
+    off = normalize_stats_fixture(_payload("tr_1", "2015-11-01T00:00:00Z"))
+    assert "instrumentation" not in off
+
+    instrument.reset()
+    instrument.enable()
+    try:
+        out = normalize_stats_fixture(_payload("tr_2", "2015-11-03T00:00:00Z"))
+    finally:
+        instrument.disable()
+
+    inst = out["instrumentation"]
+    assert inst["sql"]["statements"] > 0
+    assert inst["sql"]["by_kind"]["INSERT"]["statements"] >= 2
+    assert "ingest.stats" in inst["spans_ms"]
+    assert "ingest.dimension_lookup" in inst["spans_ms"]
+    assert inst["rows"]["stats_player_game.created"] == out["stats_created"]
+
+    trace_path = tmp_path / "trace.json"
+    n = instrument.dump_chrome_trace(str(trace_path))
+    events = json.loads(trace_path.read_text(encoding="utf-8"))["traceEvents"]
+    assert n == len(events) and n > 0
+    assert {e["cat"] for e in events} == {"span", "sql"}
+    assert all(e["ph"] == "X" and e["dur"] >= 0 for e in events)
+
+    metrics_path = tmp_path / "btb.prom"
+    instrument.export_prometheus(str(metrics_path))
+    text = metrics_path.read_text(encoding="utf-8")
+    assert 'btb_span_calls_total{span="ingest.stats"} 1' in text
+    assert "btb_instrumentation_enabled 0" in text
+    assert 'btb_sql_statements_total{kind="SELECT"}' in text
+    instrument.reset()
@@ -0,0 +1,52 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+import random
+
+from btb.data_sources.limits_import import import_limits_file, ingest_limit_observations
+from btb.db.connection import get_session
+from btb.db.limits_index import get_limits_index
+from btb.db.schema import Book
+from btb.research.limits import limit_decay_report
+
+T = datetime.datetime
+
+
+def test_limits_ingest_as_of_lookups_and_decay_report(isolated_db, tmp_path) -> None:
+    obs = [
+        {"book": "capbook", "scope": "player_points", "limit": 500, "effective_ts": "2013-01-10T00:00:00Z"},
+        {"book": "capbook", "scope": "player_points", "limit": 500, "effective_ts": "2013-01-20T00:00:00Z"},  # unchanged
+        {"book": "capbook", "scope": "player_points", "limit": 100, "effective_ts": "2013-03-05T00:00:00Z"},
+        {"book": "capbook", "scope": "Player Points", "limit": 250, "effective_ts": "2013-02-01T00:00:00Z"},  # out of order
+        {"book": "capbook", "scope": "default", "limit": 1000, "effective_ts": "2013-01-01T00:00:00Z"},
+        {"book": "capbook", "scope": "player_points", "limit": "lots", "effective_ts": "2013-03-06T00:00:00Z"},
+    ]
+    path = tmp_path / "limits.json"
+    path.write_text(json.dumps(obs), encoding="utf-8")
+    out = import_limits_file(str(path))
+    assert (out["created"], out["skipped_unchanged"], out["rejected"]) == (4, 1, 1)
+    assert ingest_limit_observations(obs[:1])["skipped_duplicates"] == 1
+
+    s = get_session()
+    book_id = s.query(Book).filter_by(code="capbook").one().id
+    s.close()
+
+    index = get_limits_index()
+    assert index.limit_at(book_id, "player_points", T(2013, 1, 5)) == 1000  # before its first cap
+    assert index.limit_at(book_id, "player_points", T(2012, 12, 5)) is None
+    assert index.limit_at(book_id, "player_points", T(2013, 2, 15)) == 250
+    assert index.limit_at(book_id, "player_rebounds", T(2013, 2, 15)) == 1000  # book default
+
+    rng = random.Random(7)
+    when = [T(2012, 12, 1) + datetime.timedelta(hours=rng.randrange(24 * 150)) for _ in range(2000)]
+    scopes = [rng.choice(["player_points", "player_assists"]) for _ in when]
+    batch = index.limits_at([book_id] * len(when), scopes, when)
+    assert batch == [index.limit_at(book_id, sc, t) for sc, t in zip(scopes, when)]
+
+    report = limit_decay_report("capbook", until=T(2013, 4, 15))
+    pts = report["books"]["capbook"]["scopes"]["player_points"]
+    assert (pts["first"], pts["last"], pts["cuts"], pts["change_pct"]) == (500.0, 100.0, 2, -80.0)
+    assert pts["deepest_cut_pct"] == -60.0
+    assert [m["limit"] for m in pts["monthly"]] == [1000.0, 250.0, 250.0, 100.0]
+    assert limit_decay_report("nobook")["reason_code"] == "BOOK_NOT_FOUND"
@@ -0,0 +1,82 @@
+﻿from __future__ import annotations
+
+import datetime
+
+from btb.db.connection import get_session
+from btb.db.schema import Book, Game, League, LineMoveAlert, OddsMarket, Season, Team
+from btb.research.line_movement import LineMovementDetector, replay_line_movement
+
+T0 = datetime.datetime(2022, 1, 5, 20, 0)
+
+
+def _tot(book: str, line: float, minutes: int) -> dict:
+    return {"game_id": 1, "book": book, "market_type": "total", "player_id": None, "outcome": "over",
+            "line": line, "price": 1.91, "collected_ts": T0 + datetime.timedelta(minutes=minutes)}
+
+
+def test_detects_steam_and_stale_book() -> None:
+    det = LineMovementDetector()
+    assert det.process("odds", [_tot(b, 220.5, 0) for b in "abcd"]) == []
+
+    alerts = det.process("odds", [_tot("a", 222.5, 11), _tot("b", 222.5, 11), _tot("c", 223.0, 12)])
+    kinds = {a["kind"]: a for a in alerts}
+    assert kinds["steam"]["books"] == ["a", "b", "c"]
+    assert kinds["stale_book"]["books"] == ["d"]
+
+    # the same steam is not re-alerted inside the window
+    again = det.process("odds", [_tot("a", 222.5, 13)])
+    assert not [a for a in again if a["kind"] == "steam"]
+
+
+def _rung(book: str, line: float, price: float, minutes: int) -> dict:
+    return {"game_id": 1, "book": book, "market_type": "points", "player_id": 5, "outcome": "over",
+            "line": line, "price": price, "collected_ts": T0 + datetime.timedelta(minutes=minutes)}
+
+
+def test_alt_line_rungs_are_separate_markets() -> None:
+    det = LineMovementDetector()
+    ladder = ((19.5, 1.5), (22.5, 1.9), (27.5, 3.4))
+    for minutes in (0, 5, 11):  # the same ladder again is no movement
+        assert det.process("props", [_rung(b, ln, px, minutes) for b in "abcd" for ln, px in ladder]) == []
+
+    # three books shorten the 22.5 over: steam on that rung only, and the fourth is stale there
+    alerts = det.process("props", [_rung(b, 22.5, 1.7, 13) for b in "abc"])
+    assert [(a["kind"], a["line"], a["books"]) for a in alerts] == [("steam", 22.5, ["a", "b", "c"]), ("stale_book", 22.5, ["d"])]
+
+
+def test_detects_reverse_move() -> None:
+    det = LineMovementDetector(steam_books=10)
+    det.process("odds", [_tot(b, 220.5, 0) for b in "ab"])
+    det.process("odds", [_tot(b, 222.5, 2) for b in "ab"])
+    alerts = det.process("odds", [_tot(b, 220.5, 4) for b in "ab"])
+    assert [a["kind"] for a in alerts] == ["reverse"]
+
+
+def test_replay_persists_alerts(isolated_db) -> None:
+    s = get_session()
+    league = League(code="NBA", name="NBA")
+    s.add(league)
+    s.flush()
+    season = Season(league_id=league.id, year_start=2021, year_end=2022)
+    home, away = Team(name="Steam Home"), Team(name="Steam Away")
+    s.add_all([season, home, away])
+    s.flush()
+    game = Game(league_id=league.id, season_id=season.id, game_date=T0.date(), home_team_id=home.id, away_team_id=away.id)
+    s.add(game)
+    books = []
+    for code in ("steama", "steamb", "steamc"):
+        b = Book(code=code, name=code)
+        s.add(b)
+        books.append(b)
+    s.flush()
+    for b in books:
+        s.add(OddsMarket(game_id=game.id, book_id=b.id, market_type="spread", outcome="home", line=-3.5, price=1.91, collected_ts=T0))
+        s.add(OddsMarket(game_id=game.id, book_id=b.id, market_type="spread", outcome="home", line=-5.0, price=1.91, collected_ts=T0 + datetime.timedelta(minutes=3)))
+    s.commit()
+    gid = game.id
+
+    out = replay_line_movement(start=T0.date(), end=T0.date())
+    assert out["rows_replayed"] == 6
+    assert out["alerts"] == {"steam": 1} and out["alerts_written"] == 1
+    alert = get_session().query(LineMoveAlert).filter_by(game_id=gid).one()
+    assert (alert.kind, alert.mode) == ("steam", "replay")
@@ -0,0 +1,57 @@
+﻿from __future__ import annotations
+
+import datetime
+
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Game, TeamMatchupSplit, Team
+from btb.research.matchup_aggregates import benchmark_refresh, load_matchup
+
+
+def _pl(name: str, team: str, pos: str, pts: int, reb: int, ast: int) -> dict:
+    return {"player": name, "team": team, "position": pos, "minutes": 30, "points": pts, "rebounds": reb, "assists": ast}
+
+
+def _game(ext: str, when: str, home_pts: int) -> dict:
+    return {
+        "external_id": ext,
+        "commence_time": when,
+        "home_team": "Matchup Hosts",
+        "away_team": "Matchup Guests",
+        "players": [
+            _pl("Mu Host Guard", "Matchup Hosts", "G", home_pts, 4, 8),
+            _pl("Mu Host Center", "Matchup Hosts", "C", 10, 12, 2),
+            _pl("Mu Guest Guard", "Matchup Guests", "G", 20, 3, 6),
+            _pl("Mu Guest Center", "Matchup Guests", "C", 14, 10, 1),
+        ],
+    }
+
+
+def test_matchup_splits_refresh_on_ingest_and_feed_lookup(isolated_db) -> None:
+    out = normalize_stats_fixture({"league": "NBA", "games": [_game("mu_1", "2018-11-01T00:00:00Z", 30)]})
+    assert out["stats_created"] == 4
+    splits = out["matchup_aggregates"]
+    assert (splits["seasons"], splits["teams"]) == (1, 2)
+    again = normalize_stats_fixture({"league": "NBA", "games": [_game("mu_2", "2018-11-03T00:00:00Z", 20)]})
+    # both teams re-derived in place: same row count, no duplicates
+    assert again["matchup_aggregates"]["teams"] == 2 and again["matchup_aggregates"]["rows"] == splits["rows"]
+
+    s = get_session()
+    g = s.query(Game).filter_by(external_id="mu_2").one()
+    guests = s.query(Team).filter_by(name="Matchup Guests").one()
+
+    # what the guests allow to guards: host guard scored 30 then 20
+    m = load_matchup(s, g.season_id, guests.id, "G")
+    season = m["spans"]["season"]
+    assert season["games"] == 2
+    assert season["vs_position"]["pts_allowed"] == 25.0
+    assert season["vs_all"]["pts_allowed"] == 35.0
+    assert season["points_for"] == 34.0 and season["points_against"] == 35.0
+    assert season["as_of"] == "2018-11-03"
+
+    n_rows = s.query(TeamMatchupSplit).filter_by(season_id=g.season_id).count()
+    assert n_rows == splits["rows"]
+    bench = benchmark_refresh(2018)
+    assert bench["full"]["rows"] == n_rows
+    assert bench["incremental_last_game"]["teams"] == 2
+    assert g.game_date == datetime.date(2018, 11, 3)
@@ -0,0 +1,65 @@
+﻿from __future__ import annotations
+
+import datetime
+
+from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
+from btb.db.connection import get_engine
+from btb.db.schema import Base
+from btb.research.price_board import PriceBoard
+
+
+def _row(book: str, mt: str, outcome: str, line, price: float) -> dict:
+    return {"game_id": 1, "book": book, "market_type": mt, "player_id": None, "outcome": outcome,
+            "line": line, "price": price, "collected_ts": datetime.datetime(2026, 1, 1)}
+
+
+def test_board_finds_arbs_and_middles() -> None:
+    seen = []
+    board = PriceBoard(on_opportunity=seen.append)
+    board.update("odds", [
+        _row("a", "moneyline", "home", None, 2.10),
+        _row("b", "moneyline", "away", None, 2.05),
+        _row("b", "moneyline", "home", None, 1.80),
+        _row("a", "total", "over", 220.5, 1.91),
+        _row("b", "total", "under", 222.5, 1.91),
+    ])
+    opps = board.scan_dirty()
+
+    assert board.best(1, "odds", "moneyline", "home") == (2.10, "a")
+    kinds = sorted(o["kind"] for o in opps)
+    assert kinds == ["arb", "middle"]
+    arb = [o for o in opps if o["kind"] == "arb"][0]
+    assert {leg["book"] for leg in arb["legs"]} == {"a", "b"}
+    assert [o for o in opps if o["kind"] == "middle"][0]["window"] == 2.0
+    assert len(seen) == 2
+
+    # nothing moved, nothing rescanned
+    assert board.scan_dirty() == []
+
+
+def test_board_follows_normalizer_writes() -> None:
+    Base.metadata.create_all(get_engine())
+    board = PriceBoard()
+    board.attach()
+    try:
+        normalize_the_odds_api_odds([
+            {
+                "id": "board_game_1",
+                "commence_time": "2023-11-02T00:00:00Z",
+                "home_team": "Board Home",
+                "away_team": "Board Away",
+                "bookmakers": [
+                    {"key": "boarda", "title": "Board A", "markets": [{"key": "h2h", "outcomes": [
+                        {"name": "Board Home", "price": 2.20}, {"name": "Board Away", "price": 1.60}]}]},
+                    {"key": "boardb", "title": "Board B", "markets": [{"key": "h2h", "outcomes": [
+                        {"name": "Board Home", "price": 1.70}, {"name": "Board Away", "price": 2.00}]}]},
+                ],
+            }
+        ])
+    finally:
+        board.detach()
+
+    best = {(p["outcome"], p["book"]) for p in board.best_prices()}
+    assert ("home", "boarda") in best
+    assert ("away", "boardb") in best
+    assert any(o["kind"] == "arb" for o in board.scan_all())
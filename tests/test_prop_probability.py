@@ -0,0 +1,116 @@
+﻿from __future__ import annotations
+
+import datetime
+import math
+import threading
+
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Player
+from btb.research.prop_probability import CountFit, FitCache, expected_value, fit_counts
+
+
+def test_poisson_probabilities_across_alt_lines() -> None:
+    fit = CountFit(dist="poisson", mean=2.0, var=2.0, n_games=10, expected_minutes=30.0)
+    half, whole = fit.probabilities([1.5, 2.0])
+
+    p_le_1 = math.exp(-2.0) * (1 + 2.0)
+    assert abs(half["p_under"] - p_le_1) < 1e-9
+    assert abs(half["p_over"] - (1 - p_le_1)) < 1e-9
+    assert abs(whole["p_push"] - math.exp(-2.0) * 2.0) < 1e-9
+    assert abs(whole["p_over"] + whole["p_under"] + whole["p_push"] - 1.0) < 1e-9
+
+
+def test_fit_picks_negbin_for_volatile_scorer() -> None:
+    steady = fit_counts([20, 21, 19, 20, 22, 18], [34] * 6)
+    volatile = fit_counts([5, 38, 12, 35, 8, 30], [34] * 6)
+    assert steady.dist == "poisson"
+    assert volatile.dist == "negbin"
+
+    # same mean-ish line, but the volatile player's over is far less certain
+    p_steady = steady.probabilities([15.5])[0]["p_over"]
+    p_volatile = volatile.probabilities([15.5])[0]["p_over"]
+    assert p_steady > 0.8 > p_volatile
+
+
+def test_fit_scales_to_expected_minutes() -> None:
+    fit = fit_counts([10, 20], [20, 40])
+    assert abs(fit.expected_minutes - 30.0) < 1e-9
+    assert abs(fit.mean - 15.0) < 1e-9
+
+
+def test_expected_value() -> None:
+    assert abs(expected_value(0.5, 2.10) - 0.05) < 1e-9
+
+
+def test_fit_cache_is_bounded_and_thread_safe(isolated_db) -> None:
+    normalize_stats_fixture(
+        {
+            "games": [
+                {
+                    "external_id": f"fc_{d}",
+                    "commence_time": f"2004-11-0{d}T00:00:00Z",
+                    "home_team": "Fit Hosts",
+                    "away_team": "Fit Guests",
+                    "players": [{"player": f"Fit P{i}", "minutes": 30, "points": 10 + i + d, "rebounds": 4, "assists": 2} for i in range(4)],
+                }
+                for d in (1, 2, 3)
+            ]
+        }
+    )
+    s = get_session()
+    pids = [pid for (pid,) in s.query(Player.id).filter(Player.full_name.like("Fit P%")).order_by(Player.full_name)]
+    s.close()
+    day = datetime.date(2004, 11, 5)
+
+    cache = FitCache(max_fits=3, max_columns=2)
+    errors = []
+
+    def work(pid: int) -> None:
+        session = get_session()
+        try:
+            for _ in range(5):
+                for prop in ("points", "pra"):
+                    assert cache.get(session, pid, prop, day) is not None
+        except Exception as e:  # surfaced below; a thread's assert would otherwise be lost
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=work, args=(pid,)) for pid in pids]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert cache.hits + cache.misses == len(pids) * 5 * 2
+    assert len(cache._fits) <= 3 and len(cache._columns) <= 2
+
+    # least recently used goes first
+    s = get_session()
+    cache.invalidate()
+    for pid in pids[:3]:
+        cache.get(s, pid, "points", day)
+    cache.get(s, pids[0], "points", day)  # touch the oldest
+    cache.get(s, pids[3], "points", day)
+    assert {k[0] for k in cache._fits} == {pids[0], pids[2], pids[3]}
+    s.close()
+
+
+def test_shared_fit_gives_the_same_probabilities_from_every_thread() -> None:
+    lines = [x + 0.5 for x in range(60)] + [float(x) for x in range(60)]
+    expected = fit_counts([5, 38, 12, 35, 8, 30], [34] * 6).probabilities(lines)
+    shared = fit_counts([5, 38, 12, 35, 8, 30], [34] * 6)
+    results = []
+
+    def work(i: int) -> None:
+        # each thread grows the table to a different length first
+        shared.probabilities(lines[: 5 + i * 7])
+        results.append(shared.probabilities(lines))
+
+    threads = [threading.Thread(target=work, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 8 and all(r == expected for r in results)
@@ -0,0 +1,73 @@
+﻿from __future__ import annotations
+
+import datetime
+
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Game, Player, RosterSpell, Team
+from btb.research.queries_props import get_player_prop_research
+from btb.research.roster import compress_spells, get_roster_index, rebuild_roster, resolve_player_games
+from btb.research.slate_reports import slate_games
+
+D = datetime.date
+A, B, C, E = "Roster Alphas", "Roster Betas", "Roster Gammas", "Roster Deltas"
+
+
+def _game(ext: str, day: str, home: str, away: str, players: list) -> dict:
+    return {"external_id": ext, "commence_time": f"{day}T00:00:00Z", "home_team": home, "away_team": away, "players": players}
+
+
+def test_roster_spells_and_batch_resolution(isolated_db) -> None:
+    line = {"minutes": 30, "points": 15, "rebounds": 5, "assists": 3}
+    out = normalize_stats_fixture(
+        {
+            "league": "NBA",
+            "games": [
+                _game("ro_1", "2011-11-01", A, C, [{"player": "Ro Traded", "team": A, **line}]),
+                _game("ro_2", "2011-11-03", E, A, [{"player": "Ro Traded", "team": A, **line}]),
+                _game("ro_3", "2011-11-10", B, C, [{"player": "Ro Traded", "team": B, **line}, {"player": "Ro Nobody", **line}]),
+                # busy slate: both of the traded player's teams play
+                _game("ro_4", "2011-11-12", A, C, []),
+                _game("ro_5", "2011-11-12", E, B, []),
+                _game("ro_6", "2011-11-20", C, E, []),
+            ],
+        }
+    )
+    assert out["roster"]["spells"] == 2
+
+    s = get_session()
+    traded = s.query(Player).filter_by(full_name="Ro Traded").one().id
+    nobody = s.query(Player).filter_by(full_name="Ro Nobody").one().id
+    team = {t.name: t.id for t in s.query(Team).filter(Team.name.in_([A, B]))}
+    gid = {g.external_id: g.id for g in s.query(Game).filter(Game.external_id.like("ro_%"))}
+    spells = s.query(RosterSpell).filter_by(player_id=traded).order_by(RosterSpell.from_date).all()
+    assert [(r.team_id, r.from_date, r.to_date, r.games) for r in spells] == [
+        (team[A], D(2011, 11, 1), D(2011, 11, 3), 2),
+        (team[B], D(2011, 11, 10), D(2011, 11, 10), 1),
+    ]
+
+    index = get_roster_index(s)
+    assert index.team_on(traded, D(2011, 11, 5)) == team[A]
+    assert index.team_on(traded, D(2011, 12, 25)) == team[B]  # latest spell stays open
+
+    pairs = [(traded, D(2011, 11, 12)), (traded, D(2011, 11, 3)), (nobody, D(2011, 11, 10)), (nobody, D(2011, 11, 12)), (nobody, D(2011, 11, 20))]
+    assert resolve_player_games(s, pairs * 1000)[:5] == [gid["ro_5"], gid["ro_2"], gid["ro_3"], None, gid["ro_6"]]
+    s.close()
+
+    bundle = get_player_prop_research("Ro Traded", D(2011, 11, 12))
+    assert bundle["game"]["id"] == gid["ro_5"]
+    assert not get_player_prop_research("Ro Nobody", D(2011, 11, 12))["ok"]  # ambiguous slate, no team
+
+    # slate paths resolve every player's game in one batch and hand it to the bundle
+    normalize_props_fixture(
+        {
+            "game": {"id": "ro_5", "commence_time": "2011-11-12T00:00:00Z", "home_team": E, "away_team": B},
+            "book": {"key": "robook", "title": "Roster Book"},
+            "props": [{"player": "Ro Traded", "prop_type": "points", "line": 14.5, "price": 1.9}],
+        }
+    )
+    assert slate_games(D(2011, 11, 12)) == [(traded, "Ro Traded", gid["ro_5"])]
+
+    assert rebuild_roster()["spells"] >= 2
+    assert compress_spells([(D(2011, 1, 1), 1), (D(2011, 1, 2), 2), (D(2011, 1, 3), 1)])[-1] == (1, D(2011, 1, 3), D(2011, 1, 3), 1)
@@ -0,0 +1,106 @@
+﻿from __future__ import annotations
+
+import math
+
+import pytest
+
+from btb.core.stat_expressions import get_registry
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Game, PropsMarket
+from btb.research import same_game_multi
+from btb.research.same_game_multi import Leg, get_simulation_cache, price_market_multi, price_same_game_multi
+
+HOME, AWAY = "Multi Hosts", "Multi Guests"
+
+
+def _seed() -> None:
+    games = []
+    for i in range(12):
+        games.append(
+            {
+                "external_id": f"sgm_h{i}",
+                "commence_time": f"2012-11-{i + 1:02d}T00:00:00Z",
+                "home_team": HOME,
+                "away_team": AWAY,
+                "players": [
+                    {"player": "Sgm Guard", "team": HOME, "minutes": 30 + i % 5, "points": 18 + (i * 7) % 11, "rebounds": 4 + i % 3, "assists": 6 + i % 4, "threes_made": 2 + i % 3},
+                    {"player": "Sgm Big", "team": HOME, "minutes": 28 + i % 4, "points": 12 + (i * 5) % 9, "rebounds": 9 + i % 5, "assists": 2 + i % 2, "threes_made": 0},
+                ],
+            }
+        )
+    normalize_stats_fixture({"league": "NBA", "games": games})
+    normalize_props_fixture(
+        {
+            "game": {"id": "sgm_next", "commence_time": "2012-11-20T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+            "book": {"key": "multibook", "title": "Multi Book"},
+            "props": [
+                {"player": "Sgm Guard", "prop_type": "points", "side": "over", "line": 20.5, "price": 1.9},
+                {"player": "Sgm Big", "prop_type": "rebounds", "side": "over", "line": 9.5, "price": 1.85},
+                {"player": "Sgm Big", "prop_type": "pra", "side": "under", "line": 26.5, "price": 1.9},
+            ],
+        }
+    )
+
+
+def test_sgm_pricing_is_seeded_cached_and_order_independent(isolated_db, monkeypatch) -> None:
+    # the pure-Python sampler, so the seeded estimates are the same with or without numpy
+    monkeypatch.setattr(same_game_multi, "np", None)
+    monkeypatch.setattr(same_game_multi, "BACKEND", "python")
+    _seed()
+    s = get_session()
+    game = s.query(Game).filter_by(external_id="sgm_next").one()
+    ids = [m.id for m in s.query(PropsMarket).filter_by(game_id=game.id).order_by(PropsMarket.id)]
+    s.close()
+
+    first = price_market_multi(ids[:2], offered_price=3.6, draws=4000, seed=11)
+    assert first["ok"] and first["cache"] == "miss"
+    assert [leg["p_win"] for leg in first["legs"]] == [0.6725, 0.72425] and first["p_joint"] == 0.5135
+    assert first["fair_price"] == round(1.0 / first["p_joint"], 3)
+    assert first["singles_multi_price"] == round(1.9 * 1.85, 3)
+    assert first["ev"] == round(first["p_joint"] * 3.6 - 1.0, 4)
+
+    again = price_market_multi(list(reversed(ids[:2])), offered_price=3.6, draws=4000, seed=11)
+    assert again["cache"] == "hit" and again["p_joint"] == first["p_joint"]
+
+    get_simulation_cache().invalidate()
+    fresh = price_market_multi(ids[:2], draws=4000, seed=11)
+    assert fresh["p_joint"] == first["p_joint"]  # same seed, rebuilt matrices
+
+    three = price_market_multi(ids, draws=4000, seed=11)
+    assert three["cache"] == "hit" and len(three["legs"]) == 3
+    assert three["legs"][2]["p_win"] == 0.30175 and three["p_joint"] == 0.093
+
+    bad = price_same_game_multi(first["game_id"], [Leg(1, "usage", "over", 20.5)], draws=100)
+    assert bad["reason_code"] == "UNSUPPORTED_PROP"
+    assert price_market_multi([ids[0], 10**9])["reason_code"] == "MARKET_NOT_FOUND"
+
+
+def test_numpy_backend_is_seeded_and_agrees_with_the_python_path(isolated_db, monkeypatch) -> None:
+    np = pytest.importorskip("numpy")
+    pra = get_registry().resolve("pra")
+    cols = {"points": [20, 31], "rebounds": [5, 9], "assists": [7, 2]}
+    assert pra.evaluate_arrays({k: np.asarray(v) for k, v in cols.items()}).tolist() == pra.evaluate(cols) == [32, 42]
+
+    _seed()
+    s = get_session()
+    game = s.query(Game).filter_by(external_id="sgm_next").one()
+    ids = [m.id for m in s.query(PropsMarket).filter_by(game_id=game.id).order_by(PropsMarket.id)]
+    s.close()
+
+    first = price_market_multi(ids, draws=20000, seed=3)
+    get_simulation_cache().invalidate()
+    again = price_market_multi(ids, draws=20000, seed=3)
+    assert first["backend"] == "numpy" and again["cache"] == "miss"
+    assert again["p_joint"] == first["p_joint"] and again["legs"] == first["legs"]
+
+    monkeypatch.setattr(same_game_multi, "np", None)
+    monkeypatch.setattr(same_game_multi, "BACKEND", "python")
+    get_simulation_cache().invalidate()
+    py = price_market_multi(ids, draws=20000, seed=3)
+    assert py["backend"] == "python"
+    # independent streams: the estimates agree within sampling error
+    assert abs(first["p_joint"] - py["p_joint"]) <= 4 * math.hypot(first["std_error"], py["std_error"])
+    for a, b in zip(first["legs"], py["legs"]):
+        assert abs(a["p_win"] - b["p_win"]) <= 4 * math.sqrt(2 * a["p_win"] * (1 - a["p_win"]) / 20000)
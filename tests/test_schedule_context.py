@@ -0,0 +1,46 @@
+﻿from __future__ import annotations
+
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import Game
+
+
+def _game(ext: str, when: str, home: str, away: str) -> dict:
+    return {"external_id": ext, "commence_time": when, "home_team": home, "away_team": away, "players": []}
+
+
+def test_stats_ingest_derives_rest_travel_and_altitude(isolated_db) -> None:
+    out = normalize_stats_fixture(
+        {
+            "league": "NBA",
+            "games": [
+                _game("sched_1", "2020-12-01T00:00:00Z", "Boston Celtics", "Miami Heat"),
+                _game("sched_2", "2020-12-02T00:00:00Z", "Denver Nuggets", "Boston Celtics"),
+                _game("sched_3", "2020-12-05T00:00:00Z", "Miami Heat", "Denver Nuggets"),
+            ],
+        }
+    )
+    assert out["schedule_context"] == {"seasons": 1, "games_seen": 3, "games_updated": 3}
+
+    s = get_session()
+    g1 = s.query(Game).filter_by(external_id="sched_1").one()
+    g2 = s.query(Game).filter_by(external_id="sched_2").one()
+    g3 = s.query(Game).filter_by(external_id="sched_3").one()
+
+    assert (g1.home_rest_days, g1.away_rest_days) == (None, None)
+    assert g1.home_travel_km == 0.0
+    assert 1900 < g1.away_travel_km < 2100  # Miami -> Boston
+    assert g1.altitude_category == "low"
+
+    assert g2.away_rest_days == 0  # Boston back-to-back
+    assert g2.home_rest_days is None
+    assert g2.home_travel_km == 0.0
+    assert 2700 < g2.away_travel_km < 2900  # Boston -> Denver
+    assert g2.altitude_category == "high"
+
+    assert g3.home_rest_days == 3  # Miami: Dec 1 -> Dec 5
+    assert g3.away_rest_days == 2  # Denver: Dec 2 -> Dec 5
+    assert g3.home_travel_km == g1.away_travel_km  # Miami back from Boston
+    assert 2700 < g3.away_travel_km < 2850  # Denver -> Miami
+    assert g3.altitude_category == "low"
+    s.close()
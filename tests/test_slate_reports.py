@@ -0,0 +1,73 @@
+﻿from __future__ import annotations
+
+import datetime
+import json
+
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.research.slate_reports import render_players, render_slate
+
+
+def _seed() -> None:
+    game = {"id": "slate_game_1", "commence_time": "2017-11-10T00:00:00Z", "home_team": "Slate Home", "away_team": "Slate Away"}
+    normalize_stats_fixture(
+        {
+            "league": "NBA",
+            "games": [
+                {
+                    "external_id": "slate_game_0",
+                    "commence_time": "2017-11-08T00:00:00Z",
+                    "home_team": "Slate Home",
+                    "away_team": "Slate Away",
+                    "players": [
+                        {"player": "Slate Wing", "minutes": 32, "points": 21, "rebounds": 6, "assists": 3},
+                        {"player": "Slate Big", "minutes": 28, "points": 12, "rebounds": 11, "assists": 2},
+                    ],
+                }
+            ],
+        }
+    )
+    normalize_props_fixture(
+        {
+            "game": game,
+            "book": {"key": "slatebook", "title": "Slate Book"},
+            "props": [
+                {"player": "Slate Wing", "prop_type": "points", "line": 19.5, "price": 1.90},
+                {"player": "Slate Big", "prop_type": "rebounds", "line": 10.5, "price": 1.85},
+            ],
+        }
+    )
+
+
+def test_render_slate_writes_reports_and_index(isolated_db, tmp_path) -> None:
+    _seed()
+    out = render_slate(datetime.date(2017, 11, 10), out_dir=str(tmp_path), workers=2)
+
+    assert out["ok"] is True
+    assert out["players"] == 2
+    day = tmp_path / "2017-11-10"
+    index = json.loads((day / "index.json").read_text(encoding="utf-8"))
+    assert {e["player"] for e in index["players"]} == {"Slate Wing", "Slate Big"}
+    for e in index["players"]:
+        assert e["ok"] and e["query_ms"] >= 0 and e["render_ms"] >= 0
+        assert "SLATE" in (day / e["files"]["md"]).read_text(encoding="utf-8")
+        assert json.loads((day / e["files"]["json"]).read_text(encoding="utf-8"))["player"]["name"] == e["player"]
+    assert len((day / "slate.ndjson").read_text(encoding="utf-8").splitlines()) == 2
+
+
+def test_render_players_replaces_failed_lines_in_place(isolated_db, tmp_path) -> None:
+    _seed()
+    game_date = datetime.date(2017, 11, 10)
+    render_slate(game_date, out_dir=str(tmp_path))
+    day = tmp_path / "2017-11-10"
+    big = next(e for e in json.loads((day / "index.json").read_text(encoding="utf-8"))["players"] if e["player"] == "Slate Big")
+
+    # a failed bundle has no "player" to match on; its line is found through the index
+    lines = (day / "slate.ndjson").read_text(encoding="utf-8").splitlines()
+    lines[big["ndjson_line"]] = json.dumps({"ok": False, "error": "research failed"})
+    (day / "slate.ndjson").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    assert render_players(game_date, [big["player_id"]], out_dir=str(tmp_path))["rendered"] == [big["player_id"]]
+    bundles = [json.loads(line) for line in (day / "slate.ndjson").read_text(encoding="utf-8").splitlines()]
+    assert len(bundles) == 2 and all(b["ok"] for b in bundles)
+    assert bundles[big["ndjson_line"]]["player"]["name"] == "Slate Big"
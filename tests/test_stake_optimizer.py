@@ -0,0 +1,95 @@
+﻿from __future__ import annotations
+
+import datetime
+import random
+
+import pytest
+
+from btb.research.stake_optimizer import Candidate, Correlation, StakeLimits, candidates_from_bundle, correlated_kelly, optimize_stakes
+
+
+def _cand(game: int, player: int, prop: str = "points", side: str = "over", line: float = 20.5, price: float = 2.0, p: float = 0.55, **kw) -> Candidate:
+    return Candidate(game_id=game, player_id=player, player=f"P{player}", book=kw.pop("book", "optbook"), prop_type=prop, side=side, line=line, price=price, p_win=p, **kw)
+
+
+def test_joint_kelly_reduces_to_single_kelly_and_shrinks_correlated_bets() -> None:
+    a, b = _cand(1, 1), _cand(2, 2)
+    assert correlated_kelly([a], Correlation()) == [a.kelly()]
+    assert abs(a.kelly() - 0.10) < 1e-9  # (0.55 * 1 - 0.45) / 1
+
+    independent = correlated_kelly([a, b], Correlation())
+    assert all(abs(f - 0.10) < 1e-9 for f in independent)
+
+    same_player = correlated_kelly([a, _cand(1, 1, prop="pra", line=35.5)], Correlation())
+    assert same_player == pytest.approx([0.5 / 7, 0.5 / 7])
+    # an opposite-side correlated bet is a hedge, so both grow
+    hedge = correlated_kelly([a, _cand(1, 1, prop="rebounds", side="under", line=5.5)], Correlation())
+    assert hedge == pytest.approx([1 / 6, 1 / 6])
+
+
+def test_optimizer_applies_caps_and_ranks() -> None:
+    lim = StakeLimits(bankroll=1000.0, kelly_fraction=0.5, max_exposure=0.08, max_game_exposure=0.05, max_bet_fraction=0.04, min_stake=2.0)
+    cands = [
+        _cand(1, 1, p=0.60),
+        _cand(1, 1, p=0.60, price=1.9, book="otherbook"),  # same selection, worse price: deduped
+        _cand(2, 2, p=0.58, max_stake=10.0),
+        _cand(3, 3, p=0.45),  # negative EV
+    ]
+    out = optimize_stakes(cands, lim)
+    assert out["positive_ev"] == 2
+    by_player = {b["player"]: b for b in out["bets"]}
+    assert by_player["P1"]["stake"] == 40.0 and by_player["P1"]["capped_by"] == ["max_bet"]
+    assert by_player["P2"]["stake"] == 10.0 and by_player["P2"]["capped_by"] == ["book_limit"]
+    assert [b["rank"] for b in out["bets"]] == [1, 2]
+    assert out["bets"][0]["player"] == "P1"
+
+    tight = optimize_stakes(cands, StakeLimits(bankroll=1000.0, kelly_fraction=0.5, max_exposure=0.02, max_game_exposure=0.05, max_bet_fraction=0.04))
+    assert tight["total_stake"] == 20.0 and [b["stake"] for b in tight["bets"]] == [16.0, 4.0]
+    assert all("bankroll_exposure" in b["capped_by"] for b in tight["bets"])
+
+
+def test_hundreds_of_candidates_size_quickly() -> None:
+    rng = random.Random(3)
+    props = ["points", "rebounds", "assists", "pra", "threes"]
+    cands = [
+        _cand(g, g * 100 + rng.randrange(8), prop=rng.choice(props), side=rng.choice(["over", "under"]), line=rng.choice([4.5, 9.5, 19.5, 29.5]), price=round(rng.uniform(1.7, 2.3), 2), p=rng.uniform(0.45, 0.62))
+        for g in range(10)
+        for _ in range(50)
+    ]
+    out = optimize_stakes(cands, StakeLimits(bankroll=5000.0))
+    assert out["elapsed_ms"] < 1000.0
+    assert (out["positive_ev"], len(out["bets"]), out["dropped_below_min_stake"]) == (316, 265, 12)
+    assert out["total_stake"] == 1174.5 and min(b["stake"] for b in out["bets"]) == 1.0
+
+
+def test_candidates_from_bundle() -> None:
+    bundle = {
+        "ok": True,
+        "player": {"id": 7, "name": "Opt Guard"},
+        "game": {"id": 70},
+        "props": [
+            {"book": "optbook", "prop_type": "points", "side": None, "line": 22.5, "price": 1.95, "p_over": 0.57, "p_under": 0.43, "p_push": 0.0},
+            {"book": "optbook", "prop_type": "assists", "side": "under", "line": 6.5, "price": 1.8, "p_over": None, "p_under": None, "p_push": None},
+        ],
+    }
+    cands = candidates_from_bundle(bundle)
+    assert len(cands) == 1 and cands[0].side == "over" and cands[0].p_win == 0.57
+    assert candidates_from_bundle({"ok": False}) == []
+
+    # a stale better price is not the book's quote: latest collection per book/type/side
+    snap = {"book": "optbook", "prop_type": "points", "side": "over", "line": 22.5, "p_over": 0.57, "p_under": 0.43, "p_push": 0.0}
+    bundle["props"] = [
+        {**snap, "price": 2.10, "collected_ts": "2026-01-01T09:00:00"},
+        {**snap, "price": 1.85, "collected_ts": "2026-01-01T12:00:00"},
+    ]
+    assert [c.price for c in candidates_from_bundle(bundle)] == [1.85]
+    assert [c.price for c in candidates_from_bundle(bundle, as_of=datetime.datetime(2026, 1, 1, 10))] == [2.10]
+
+    # nor is a line the book has moved off; alt lines of its latest collection all stay
+    bundle["props"] = [
+        {**snap, "line": 22.5, "price": 1.9, "collected_ts": "2026-01-01T10:00:00"},
+        {**snap, "line": 23.5, "price": 1.9, "collected_ts": "2026-01-01T13:00:00"},
+        {**snap, "line": 27.5, "price": 3.1, "collected_ts": "2026-01-01T13:00:00"},
+        {**snap, "side": "under", "line": 22.5, "price": 1.9, "collected_ts": "2026-01-01T10:00:00"},
+    ]
+    assert sorted((c.side, c.line) for c in candidates_from_bundle(bundle)) == [("over", 23.5), ("over", 27.5), ("under", 22.5)]
@@ -0,0 +1,45 @@
+﻿from __future__ import annotations
+
+import json
+
+import pytest
+
+from btb.core.stat_expressions import StatExpressionRegistry, compile_expression, get_registry, load_prop_types_file
+
+
+def test_default_registry_resolves_combo_aliases() -> None:
+    reg = get_registry()
+    cols = {
+        "points": [30.0, 20.0],
+        "rebounds": [9.0, 5.0],
+        "assists": [6.0, 4.0],
+        "threes_made": [4.0, None],
+    }
+    assert reg.evaluate("PRA", cols) == [45.0, 29.0]
+    assert reg.evaluate("pts+rebs", cols) == [39.0, 25.0]
+    assert reg.evaluate("player_rebounds_assists", cols) == [15.0, 9.0]
+    assert reg.evaluate("threes", cols) == [4.0, None]
+    assert reg.evaluate("steals", cols) is None
+
+
+def test_compile_rejects_unsafe_or_unknown_names() -> None:
+    with pytest.raises(ValueError):
+        compile_expression("bad", "__import__('os')")
+    with pytest.raises(ValueError):
+        compile_expression("bad", "points + blocks")
+
+
+def test_zero_divisor_gives_none() -> None:
+    per_min = compile_expression("ppm", "points / minutes")
+    assert per_min.evaluate({"points": [20.0, 0.0], "minutes": [40.0, 0.0]}) == [0.5, None]
+    nested = compile_expression("nested", "points / (rebounds / assists)")
+    assert nested.evaluate({"points": [12.0, 12.0, 12.0], "rebounds": [6.0, 0.0, 6.0], "assists": [3.0, 3.0, 0.0]}) == [6.0, None, None]
+
+
+def test_prop_types_registered_from_config(tmp_path) -> None:
+    path = tmp_path / "prop_types.json"
+    path.write_text(json.dumps({"fantasy": {"expr": "points + 1.2 * rebounds + 1.5 * assists", "aliases": ["fpts"]}}))
+
+    reg = StatExpressionRegistry()
+    reg.register_many(load_prop_types_file(str(path)))
+    assert reg.evaluate("FPTS", {"points": [10.0], "rebounds": [5.0], "assists": [2.0]}) == [19.0]
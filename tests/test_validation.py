@@ -0,0 +1,111 @@
+﻿from __future__ import annotations
+
+import json
+
+from btb.data_sources import validation
+from btb.data_sources.odds_normalize import normalize_the_odds_api_odds
+from btb.data_sources.props_normalize import normalize_props_fixture
+from btb.data_sources.stats_normalize import normalize_stats_fixture
+from btb.db.connection import get_session
+from btb.db.schema import OddsMarket, PropsMarket, QuarantinedRow, StatsPlayerGame
+
+HOME, AWAY = "Check Hosts", "Check Guests"
+
+
+def _quarantined(scope: str, reason: str) -> list[QuarantinedRow]:
+    s = get_session()
+    rows = s.query(QuarantinedRow).filter_by(scope=scope, reason_code=reason).all()
+    s.close()
+    return [r for r in rows if (r.game_external_id or "").startswith("chk_")]
+
+
+def test_column_checks() -> None:
+    assert validation.check_prices([1.9, 1.005, None, 2000.0]) == [None, "PRICE_OUT_OF_RANGE", "PRICE_OUT_OF_RANGE", "PRICE_OUT_OF_RANGE"]
+    assert validation.check_line_jumps([215.5, 240.0, 8.5], [214.5, 215.5, None], [20.0, 20.0, 15.0]) == [None, "LINE_JUMP", None]
+    assert validation.check_prop_types(["points", "steals", "points"]) == [None, "UNKNOWN_PROP_TYPE", None]
+    assert validation.check_stat_ranges([30.0, 75.0, 20.0], {"points": [10, 5, -2]}) == [None, "STAT_OUT_OF_RANGE", "STAT_OUT_OF_RANGE"]
+    assert validation.summarize({"B": 1, "A": 2}) == {"rows": 3, "reason_counts": {"A": 2, "B": 1}}
+    assert validation.summarize({}) is None
+
+
+def _event(eid: str, home: str, away: str, total: float) -> dict:
+    return {
+        "id": eid,
+        "commence_time": "2007-11-03T00:00:00Z",
+        "home_team": home,
+        "away_team": away,
+        "bookmakers": [
+            {
+                "key": "chkbook",
+                "title": "Check Book",
+                "markets": [
+                    {"key": "totals", "outcomes": [{"name": "Over", "price": 1.9, "point": total}, {"name": "Under", "price": 1.9, "point": total}]},
+                ],
+            }
+        ],
+    }
+
+
+def test_ingest_quarantines_bad_rows(isolated_db) -> None:
+
+    first = normalize_the_odds_api_odds([_event("chk_1", HOME, AWAY, 210.5)])
+    assert first["markets_created"] == 2 and "quarantined" not in first
+
+    # the total jumps 30 points and a second id files the same fixture the other way round
+    out = normalize_the_odds_api_odds([_event("chk_1", HOME, AWAY, 240.5), _event("chk_2", AWAY, HOME, 210.5)])
+    assert (out["games_created"], out["markets_created"]) == (0, 0)
+    assert out["quarantined"] == {"rows": 3, "reason_counts": {"LINE_JUMP": 2, "TEAMS_SWAPPED": 1}}
+    (swapped,) = _quarantined("odds", "TEAMS_SWAPPED")
+    assert swapped.game_id is None and json.loads(swapped.payload_json)["home_team"] == AWAY
+    jumps = _quarantined("odds", "LINE_JUMP")
+    assert {json.loads(r.payload_json)["line"] for r in jumps} == {240.5}
+
+    props = normalize_props_fixture(
+        {
+            "game": {"id": "chk_1", "commence_time": "2007-11-03T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+            "book": {"key": "chkbook", "title": "Check Book"},
+            "props": [
+                {"player": "Check Star", "prop_type": "points", "side": "over", "line": 22.5, "price": 1.87},
+                {"player": "Check Star", "prop_type": "points", "side": "over", "line": 24.5, "price": 1.005},
+                {"player": "Check Star", "prop_type": "steals", "side": "over", "line": 1.5, "price": 1.9},
+            ],
+        }
+    )
+    assert props["props_created"] == 1
+    assert props["quarantined"]["reason_counts"] == {"PRICE_OUT_OF_RANGE": 1, "UNKNOWN_PROP_TYPE": 1}
+
+    jump = normalize_props_fixture(
+        {
+            "game": {"id": "chk_1", "commence_time": "2007-11-03T00:00:00Z", "home_team": HOME, "away_team": AWAY},
+            "book": {"key": "chkbook", "title": "Check Book"},
+            "props": [{"player": "Check Star", "prop_type": "points", "side": "over", "line": 225.0, "price": 1.9}],
+        }
+    )
+    assert jump["props_created"] == 0 and jump["quarantined"]["reason_counts"] == {"LINE_JUMP": 1}
+
+    stats = normalize_stats_fixture(
+        {
+            "games": [
+                {
+                    "external_id": "chk_1",
+                    "commence_time": "2007-11-03T00:00:00Z",
+                    "home_team": HOME,
+                    "away_team": AWAY,
+                    "players": [
+                        {"player": "Check Star", "team": HOME, "minutes": 33, "points": 25, "rebounds": 6, "assists": 5},
+                        {"player": "Check Bench", "team": AWAY, "minutes": 12, "points": -4, "rebounds": 1, "assists": 0},
+                    ],
+                }
+            ]
+        }
+    )
+    assert stats["stats_created"] == 1 and stats["quarantined"]["reason_counts"] == {"STAT_OUT_OF_RANGE": 1}
+    (bad,) = _quarantined("stats", "STAT_OUT_OF_RANGE")
+    assert bad.game_external_id == "chk_1" and json.loads(bad.payload_json)["points"] == -4
+
+    s = get_session()
+    game_id = bad.game_id
+    assert s.query(OddsMarket).filter_by(game_id=game_id).count() == 2
+    assert s.query(PropsMarket).filter_by(game_id=game_id).count() == 1
+    assert s.query(StatsPlayerGame).filter_by(game_id=game_id).count() == 1
+    s.close()
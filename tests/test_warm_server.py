@@ -0,0 +1,46 @@
+﻿from __future__ import annotations
+
+import os
+import threading
+
+from btb.cli import entry
+from btb.cli.server import WarmServer, warm_up
+
+
+def test_warm_server_runs_commands_and_reports_latency(tmp_path, monkeypatch) -> None:
+    path = str(tmp_path / "btb.sock")
+    monkeypatch.setenv("BTB_SOCKET", path)
+    assert entry.forward(["version"]) is None  # nothing listening -> run locally
+
+    warm_up()
+    server = WarmServer(path)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    try:
+        for _ in range(3):
+            resp = entry.request(entry.run_request(["version"]))
+            assert resp["exit_code"] == 0
+            assert resp["stdout"] == "btb 0.1.0\n"
+
+        bad = entry.request(entry.run_request(["no-such-command"]))
+        assert bad["exit_code"] != 0 and bad["stderr"]
+
+        assert entry.request({**entry.run_request(["version"]), "cwd": "/elsewhere"}) == {"fallback": True}
+
+        # settings from the caller's environment the server was not started with
+        monkeypatch.setenv("THE_ODDS_API_KEY", "caller-key")
+        monkeypatch.setenv("BTB_PROP_TYPES", str(tmp_path / "props.json"))
+        assert entry.request(entry.run_request(["version"])) == {"fallback": True}
+        assert entry.forward(["version"]) is None
+        monkeypatch.delenv("THE_ODDS_API_KEY")
+        monkeypatch.delenv("BTB_PROP_TYPES")
+
+        stats = entry.request({"op": "stats"})
+        assert stats["requests"] == 4
+        v = stats["latency_ms"]["version"]
+        assert v["count"] == 3 and v["p50"] <= v["p99"] <= v["max"]
+    finally:
+        entry.request({"op": "stop"})
+        t.join(timeout=5)
+        server.server_close()
+    assert not os.path.exists(path)